@@ -0,0 +1,50 @@
+#ifndef COMPILER_H
+#define COMPILER_H
+
+#include "tensor.h"
+#include "graph.h"
+
+//generated kernels of a fused region, in and grad follow the order of fused_group.inputs
+typedef void (*fused_forward_func)(lemur_float *out, lemur_float *const *in);
+typedef void (*fused_backward_func)(const lemur_float *seed, lemur_float *const *in, lemur_float *const *grad);
+
+//region of elementwise ops (optionally closed by a sum/mean) computed by one generated loop,
+//owned by the expression of its output. the loop reads every input once and writes the output once,
+//the intermediates are never materialized (and are recomputed per element by the backward kernel)
+typedef struct fused_library fused_library; //shared object with the kernels of one compile()
+
+typedef struct fused_group {
+    tensor **nodes;       //fused nodes in topological order, the output is last
+    size_t num_nodes;
+    tensor **inputs;      //tensors read by the region, their layouts are baked into the kernels
+    bool *input_grad;     //the backward kernel writes the gradient of inputs[i]
+    size_t num_inputs;
+    fused_forward_func forward;   //NULL until the library is loaded
+    fused_backward_func backward;
+    fused_library *library;
+    size_t index;                 //of the region's kernels in library
+} fused_group;
+
+//the last elementwise node, its shape is the region's loop
+tensor * fused_element_root(fused_group *f);
+//arena layout of the intermediates compute() materializes for one graph, owned by the expression
+//of its root (see plan_memory)
+typedef struct memory_plan {
+    tensor **nodes;       //the graph it was made for, in the order compute() runs it
+    size_t num_nodes;
+    size_t *offsets;      //of each node's buffer in the arena, SIZE_MAX if it has none
+    lemur_float *arena;
+    size_t arena_length;  //elements
+} memory_plan;
+
+void free_memory_plan(memory_plan **p);
+
+//edges from the region's nodes that are in g to t
+size_t fused_edges_to(fused_group *f, tensor *t, graph *g);
+//true once the kernels are loaded, false while they are being built or if the build failed
+bool fused_kernels_ready(fused_group *f);
+void free_fused_group(fused_group **f);
+//mkdir -p, used for the kernel cache and the files kept next to it
+bool create_directories(const char *dir_name);
+
+#endif
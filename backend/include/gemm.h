@@ -0,0 +1,23 @@
+#ifndef GEMM_H
+#define GEMM_H
+
+#include "tensor.h"
+
+//C[b] = A[b] @ B[b] (or C[b] += ... when accumulate) for b < batch, A[b] is m x k, B[b] is k x n
+//every matrix is described by its strides so transposed (rs = 1) and broadcast (batch stride 0)
+//operands are read where they are, only C must have unit column stride
+typedef struct gemm_matrix {
+    const lemur_float *data;
+    int64_t batch_stride;
+    int64_t row_stride;
+    int64_t col_stride;
+} gemm_matrix;
+
+void gemm(size_t batch, size_t m, size_t n, size_t k,
+          gemm_matrix a, gemm_matrix b,
+          lemur_float *c, int64_t c_batch_stride, int64_t c_row_stride,
+          bool accumulate);
+
+double gemm_peak_gflops(void);
+
+#endif
@@ -0,0 +1,35 @@
+#ifndef GRAPH_H
+#define GRAPH_H
+
+#include "tensor.h"
+
+#define GRAPH_NOT_FOUND SIZE_MAX
+
+//expression DAG below a root tensor, every tensor appears exactly once
+//nodes are in topological order: inputs always come before the tensors computed from them,
+//so the root is the last node
+typedef struct graph {
+    tensor **nodes;
+    size_t num_nodes;
+
+    //open addressing tensor pointer -> node index
+    tensor **keys;
+    size_t *values;
+    size_t num_keys;
+    size_t capacity;
+} graph;
+
+//which children build_graph follows
+enum {
+    GRAPH_ALL = 0,
+    GRAPH_REQUIRES_GRAD,  //only tensors that require grad
+    GRAPH_UNCOMPUTED,     //computed tensors are included but their inputs are not visited
+};
+
+graph * build_graph(tensor *root, int mode);
+size_t graph_index(graph *g, tensor *t);
+//consumers[i] is the number of operand edges from nodes of the graph into node i
+void graph_count_consumers(graph *g, size_t *consumers);
+void free_graph(graph **g);
+
+#endif
@@ -11,6 +11,19 @@
 #define DOUBLE_INPUT_FUNC_DEF(name)      \
     tensor * name(tensor *t0, tensor *t1, bool retain_grad) 
 
+#define SCALAR_INPUT_FUNC_DEF(name)     \
+    tensor * name(tensor *t0, lemur_float scalar, bool retain_grad)
+
+//in-place and out= forms write into out (out may be t0), see kernel_forward_into
+#define SINGLE_INPUT_INTO_DEF(name)     \
+    int name##_into(tensor *out, tensor *t0)
+
+#define DOUBLE_INPUT_INTO_DEF(name)     \
+    int name##_into(tensor *out, tensor *t0, tensor *t1)
+
+#define SCALAR_INPUT_INTO_DEF(name)     \
+    int name##_into(tensor *out, tensor *t0, lemur_float scalar)
+
 
 //external functions
 
@@ -18,20 +31,35 @@
 extern "C" {
 #endif
 
-void backward(tensor * t);
+bool backward(tensor * t);
+size_t tensor_version(tensor *t);
+bool mark_modified(tensor *t);
+bool can_write_into(tensor *out, tensor *t0, tensor *t1);
 
 void free_tensor(tensor **t);
 void free_kernel_tensor(kernel_tensor **k);
 
 tensor * empty_tensor(size_t shape[5], bool requires_grad, bool retains_grad);
 tensor * tensor_from(kernel_tensor *k, expression *comes_from, bool requires_grad, kernel_tensor* grad);
+void empty_cache(void);
+void set_cache_limit(size_t bytes);
+size_t get_cache_limit(void);
+size_t get_cached_bytes(void);
+
 void memset_kernel_tensor(kernel_tensor * k, lemur_float val);
 bool is_contiguous(kernel_tensor *k);
 kernel_tensor * empty_contiguous_kernel_tensor_like(kernel_tensor *k);
+kernel_tensor * kernel_tensor_from_array(lemur_float *array, size_t shape[5]);
+kernel_tensor * mmap_kernel_tensor(const char *path, size_t shape[5], size_t offset, int mode);
 
 void random_uniform_kernel_tensor(kernel_tensor * k, lemur_float min, lemur_float max);
 void random_normal_kernel_tensor(kernel_tensor * k, lemur_float mean, lemur_float std);
+bool random_dropout_mask_kernel_tensor(kernel_tensor *k, lemur_float p);
+bool random_int_kernel_tensor(kernel_tensor *k, int64_t low, int64_t high);
 void init_seed(unsigned int seed);
+unsigned int get_seed(void);
+uint64_t get_random_offset(void);
+void set_random_offset(uint64_t offset);
 
 void linspace_kernel_tensor(kernel_tensor *k, lemur_float start, lemur_float end);
 void init_random(void); 
@@ -57,11 +85,45 @@ SINGLE_INPUT_FUNC_DEF(square_root);
 SINGLE_INPUT_FUNC_DEF(absolute);
 tensor * sign(tensor *t0); //no retains grad
 SINGLE_INPUT_FUNC_DEF(reciprocal);
+SINGLE_INPUT_FUNC_DEF(contiguous);
+
+//scalar ops
+SCALAR_INPUT_FUNC_DEF(add_scalar);
+SCALAR_INPUT_FUNC_DEF(mul_scalar);
+SCALAR_INPUT_FUNC_DEF(div_scalar);
+SCALAR_INPUT_FUNC_DEF(rsub_scalar);
+SCALAR_INPUT_FUNC_DEF(rdiv_scalar);
+SCALAR_INPUT_FUNC_DEF(pow_scalar);
+SCALAR_INPUT_FUNC_DEF(rpow_scalar);
+
+//in-place and out= ops
+DOUBLE_INPUT_INTO_DEF(add);
+DOUBLE_INPUT_INTO_DEF(sub);
+DOUBLE_INPUT_INTO_DEF(mul);
+DOUBLE_INPUT_INTO_DEF(division);
+DOUBLE_INPUT_INTO_DEF(power);
+SINGLE_INPUT_INTO_DEF(exponential);
+SINGLE_INPUT_INTO_DEF(relu);
+SINGLE_INPUT_INTO_DEF(sigmoid);
+SINGLE_INPUT_INTO_DEF(logarithm);
+SINGLE_INPUT_INTO_DEF(neg);
+SINGLE_INPUT_INTO_DEF(square_root);
+SINGLE_INPUT_INTO_DEF(absolute);
+SINGLE_INPUT_INTO_DEF(reciprocal);
+SCALAR_INPUT_INTO_DEF(add_scalar);
+SCALAR_INPUT_INTO_DEF(mul_scalar);
+SCALAR_INPUT_INTO_DEF(div_scalar);
+SCALAR_INPUT_INTO_DEF(pow_scalar);
 
 //reduce ops
 DOUBLE_INPUT_FUNC_DEF(sum);
 tensor * all(tensor *t0, tensor *t1);
 tensor * any(tensor *t0, tensor *t1);
+DOUBLE_INPUT_FUNC_DEF(maximum);
+DOUBLE_INPUT_FUNC_DEF(minimum);
+DOUBLE_INPUT_FUNC_DEF(mean);
+tensor * argmax(tensor *t0, tensor *t1);
+tensor * argmin(tensor *t0, tensor *t1);
 
 
 //shape ops
@@ -74,9 +136,49 @@ DOUBLE_INPUT_FUNC_DEF(bmm);
 DOUBLE_INPUT_FUNC_DEF(bcmm);
 DOUBLE_INPUT_FUNC_DEF(bmm_fast);
 DOUBLE_INPUT_FUNC_DEF(bcmm_fast);
+double gemm_peak_gflops(void);
 
 //compiler
 void compile(tensor *root_node);
+void compile_wait(void);
+void set_kernel_cache_dir(const char *path);
+const char * get_kernel_cache_dir(void);
+bool compute(tensor *t);
+size_t plan_memory(tensor *root);
+void invalidate(tensor *root);
+void set_lazy_mode(bool lazy);
+bool get_lazy_mode(void);
+
+//memory accounting
+const char * get_memory_origin_name(int origin);
+int get_num_memory_origins(void);
+memory_counters get_memory_counters(void);
+memory_counters get_origin_memory_counters(int origin, bool backward);
+void reset_peak_memory(void);
+void set_memory_tracking(bool enabled);
+bool get_memory_tracking(void);
+size_t memory_snapshot(memory_block *out, size_t max_blocks);
+
+//profiler
+void profile_start(void);
+void profile_stop(void);
+void profile_clear(void);
+size_t get_profile_num_events(void);
+profile_event * get_profile_events(void);
+
+//parallelism
+void set_num_threads(int num_threads);
+int get_num_threads(void);
+const char * get_parallel_class_name(int op_class);
+bool set_parallel_threshold(int op_class, size_t threshold);
+size_t get_parallel_threshold(int op_class);
+bool save_parallel_thresholds(const char *path);
+bool load_parallel_thresholds(const char *path);
+bool calibrate_parallel_thresholds(void);
+
+//checkpoint
+int save_checkpoint(const char *path, char **names, kernel_tensor **ks, size_t n);
+int load_checkpoint_payloads(const char *path, kernel_tensor **ks, size_t *offsets, size_t n);
 
 //otherops
 tensor *isclose(tensor *a, tensor *b, lemur_float rtol, lemur_float atol);
@@ -11,6 +11,8 @@
 #include <math.h>
 #include <omp.h>
 
+#include "simdmath.h"
+
 
 #if defined(__FLT32_MANT_DIG__) 
     typedef _Float32 lemur_float;
@@ -38,7 +40,24 @@ typedef kernel_tensor * (*backward_func)(   kernel_tensor *kr,
 
 
 tensor * kernel_forward(int func, tensor * t0, tensor * t1, bool retain_grad);
-void kernel_backward(tensor *tr, kernel_tensor *seed);
+tensor * kernel_forward_scalar(int func, tensor *t0, lemur_float scalar, bool retain_grad);
+int kernel_forward_into(int func, tensor *out, tensor *t0, tensor *t1);
+int kernel_forward_scalar_into(int func, tensor *out, tensor *t0, lemur_float scalar);
+void forward_kernel(int func, kernel_tensor *k, kernel_tensor *k0, kernel_tensor *k1);
+void save_versions(tensor *t);
+bool operands_modified(tensor *t);
+bool kernel_backward(tensor *tr, kernel_tensor *seed);
+
+//status of kernel_forward_into
+enum {
+    INTO_OK = 0,
+    INTO_UNSUPPORTED_OP,      //only elementwise (binary and unary) ops write into out
+    INTO_SHAPE_MISMATCH,      //out does not have the (broadcast) shape of the result
+    INTO_NOT_CONTIGUOUS,
+    INTO_OUT_IN_GRAPH,        //out is a result that autograd differentiates through
+    INTO_INPUT_REQUIRES_GRAD, //the write would not be recorded for autograd
+    INTO_READ_ONLY,           //out is a read only mapping of a file
+};
 
 #define FORWARD_FUNC_DEF(name)            \
     void name(kernel_tensor *kr, kernel_tensor *k0, kernel_tensor *k1)
@@ -97,6 +116,28 @@ FORWARD_FUNC_DEF(u_op_sign_forward);
 FORWARD_FUNC_DEF(u_op_reciprocal_forward);
 BACKWARD_FUNC_DEF(u_op_reciprocal_backward);
 
+FORWARD_FUNC_DEF(u_op_contiguous_forward);
+BACKWARD_FUNC_DEF(u_op_contiguous_backward);
+
+//scalar ops (k1 is the immediate, pow with a scalar uses the pow kernels)
+FORWARD_FUNC_DEF(u_op_add_scalar_forward);
+BACKWARD_FUNC_DEF(u_op_add_scalar_backward);
+
+FORWARD_FUNC_DEF(u_op_mul_scalar_forward);
+BACKWARD_FUNC_DEF(u_op_mul_scalar_backward);
+
+FORWARD_FUNC_DEF(u_op_div_scalar_forward);
+BACKWARD_FUNC_DEF(u_op_div_scalar_backward);
+
+FORWARD_FUNC_DEF(u_op_rsub_scalar_forward);
+BACKWARD_FUNC_DEF(u_op_rsub_scalar_backward);
+
+FORWARD_FUNC_DEF(u_op_rdiv_scalar_forward);
+BACKWARD_FUNC_DEF(u_op_rdiv_scalar_backward);
+
+FORWARD_FUNC_DEF(u_op_rpow_scalar_forward);
+BACKWARD_FUNC_DEF(u_op_rpow_scalar_backward);
+
 //reduce ops
 FORWARD_FUNC_DEF(r_op_sum_forward);
 BACKWARD_FUNC_DEF(r_op_sum_backward);
@@ -105,6 +146,19 @@ FORWARD_FUNC_DEF(r_op_all_forward);
 
 FORWARD_FUNC_DEF(r_op_any_forward);
 
+FORWARD_FUNC_DEF(r_op_max_forward);
+BACKWARD_FUNC_DEF(r_op_max_backward);
+
+FORWARD_FUNC_DEF(r_op_min_forward);
+BACKWARD_FUNC_DEF(r_op_min_backward);
+
+FORWARD_FUNC_DEF(r_op_mean_forward);
+BACKWARD_FUNC_DEF(r_op_mean_backward);
+
+FORWARD_FUNC_DEF(r_op_argmax_forward);
+
+FORWARD_FUNC_DEF(r_op_argmin_forward);
+
 //shape ops
 FORWARD_FUNC_DEF(s_op_view_forward);
 BACKWARD_FUNC_DEF(s_op_view_backward);
@@ -156,10 +210,24 @@ enum OPS {
   OP_ABS,
   OP_SIGN,
   OP_RECIPROCAL,
+  OP_CONTIGUOUS,
+  //scalar ops (unary, the other operand is an immediate kept in the expression)
+  OP_ADD_SCALAR,
+  OP_MUL_SCALAR,
+  OP_DIV_SCALAR,
+  OP_RSUB_SCALAR,
+  OP_RDIV_SCALAR,
+  OP_POW_SCALAR,
+  OP_RPOW_SCALAR,
   //reduce ops
   OP_SUM,
   OP_ALL,
   OP_ANY,
+  OP_MAX,
+  OP_MIN,
+  OP_MEAN,
+  OP_ARGMAX,
+  OP_ARGMIN,
   //shape ops
   OP_VIEW,
   OP_EXPAND,
@@ -173,14 +241,41 @@ enum OPS {
   TOTAL_OPS,
 };
 
+//what the backward kernel of an op reads besides the seed, checked against in-place writes
+enum {
+    SAVES_T0 = 1,
+    SAVES_T1 = 2,
+    SAVES_RESULT = 4,
+};
+
+#define IS_SCALAR_OP(func) (((func) >= OP_ADD_SCALAR) && ((func) <= OP_RPOW_SCALAR))
+
 extern int type_table[TOTAL_OPS];
+extern int saved_table[TOTAL_OPS];
 extern forward_func forward_func_table[TOTAL_OPS];
 extern backward_func backward_func_table[TOTAL_OPS];
 
 //helper macros
 
-#define KERNEL_TENSOR_5D_LOOP_START(k)                     \
-  _Pragma("omp parallel for collapse(5)")                  \
+//parallel regions are only opened when the work of a kernel exceeds the threshold of its class,
+//below it the fork/join costs more than the loop itself. the defaults can be replaced by
+//set_parallel_threshold or measured on the machine by calibrate_parallel_thresholds
+enum {
+    PARALLEL_ELEMENTWISE, //elements of the result
+    PARALLEL_REDUCE,      //elements read
+    PARALLEL_GEMM,        //multiply-adds
+    PARALLEL_FUSED,       //elements of the loop of a generated kernel
+    TOTAL_PARALLEL_CLASSES,
+};
+
+extern size_t parallel_threshold_table[TOTAL_PARALLEL_CLASSES];
+
+#define USE_PARALLEL(op_class, work) \
+    (((size_t) (work) > parallel_threshold_table[op_class]) && (omp_get_max_threads() > 1))
+
+#define KERNEL_TENSOR_5D_LOOP_START(k)                                              \
+  for (int _once = 1, _par = USE_PARALLEL(PARALLEL_ELEMENTWISE, (k)->length); _once; _once = 0) \
+  _Pragma("omp parallel for collapse(5) if(_par)")         \
   for (size_t d0 = 0; d0 < (k)->shape[0]; d0++)            \
     for (size_t d1 = 0; d1 < (k)->shape[1]; d1++)          \
       for (size_t d2 = 0; d2 < (k)->shape[2]; d2++)        \
@@ -195,35 +290,93 @@ extern backward_func backward_func_table[TOTAL_OPS];
       d3*(k)->stride[3] +    \
       d4*(k)->stride[4] )
 
-#define BINARY_CONTIGUOUS_ELEMENTWISE_OP_SIMD(kr, k0, k1, operation) \
-do {                                                                             \
-    if ((kr)->length > 1<<17) {                                                 \
-        _Pragma("omp parallel for simd")                                       \
-          for (size_t _i = 0; _i < (kr)->length; _i++) {                       \
-              (kr)->array[_i] = operation((k0)->array[_i], (k1)->array[_i]);   \
-          }                                                                    \
-    } else {                                                                     \
-        _Pragma("omp simd")                                                      \
-        for (size_t _i = 0; _i < (kr)->length; _i++) {                           \
-            (kr)->array[_i] = operation((k0)->array[_i], (k1)->array[_i]);       \
-        }                                                                        \
-    }                                                                            \
+//elementwise loops over strided operands of the same shape as kr (broadcast views have stride 0),
+//dims are coalesced by make_strided_loop and the innermost dim is split into chunks so that
+//few long rows still spread over the threads. unit stride chunks get a plain simd loop
+#define STRIDED_LOOP_CHUNK 4096
+
+#define _BINARY_ELEMENTWISE_TASK(kr, k0, k1, operation)                                         \
+{                                                                                               \
+    int64_t _off[3];                                                                            \
+    strided_loop_offsets(&_l, _t / _chunks, 3, _off);                                           \
+    size_t _lo = (_t % _chunks) * STRIDED_LOOP_CHUNK;                                           \
+    size_t _len = ((_n - _lo) < STRIDED_LOOP_CHUNK) ? (_n - _lo) : STRIDED_LOOP_CHUNK;          \
+    lemur_float *_r = (kr)->array + _off[0] + (int64_t) _lo * _sr;                              \
+    const lemur_float *_a = (k0)->array + _off[1] + (int64_t) _lo * _s0;                        \
+    const lemur_float *_b = (k1)->array + _off[2] + (int64_t) _lo * _s1;                        \
+    if ((_sr == 1) && (_s0 == 1) && (_s1 == 1)) {                                               \
+        _Pragma("omp simd")                                                                     \
+        for (size_t _i = 0; _i < _len; _i++) {                                                  \
+            _r[_i] = operation(_a[_i], _b[_i]);                                                 \
+        }                                                                                       \
+    } else {                                                                                    \
+        _Pragma("omp simd")                                                                     \
+        for (size_t _i = 0; _i < _len; _i++) {                                                  \
+            _r[(int64_t) _i * _sr] = operation(_a[(int64_t) _i * _s0], _b[(int64_t) _i * _s1]); \
+        }                                                                                       \
+    }                                                                                           \
+}
+
+//small loops never enter an omp region, even if(0) costs a runtime call per kernel
+#define BINARY_ELEMENTWISE_OP_SIMD(kr, k0, k1, operation)                                       \
+do {                                                                                            \
+    kernel_tensor *_ks[3] = {(kr), (k0), (k1)};                                                 \
+    strided_loop _l;                                                                            \
+    make_strided_loop(&_l, (kr)->shape, _ks, 3);                                                \
+    if (_l.length == 0) break;                                                                  \
+    size_t _n = _l.shape[_l.ndim - 1];                                                          \
+    size_t _chunks = (_n + STRIDED_LOOP_CHUNK - 1) / STRIDED_LOOP_CHUNK;                        \
+    size_t _tasks = (_l.length / _n) * _chunks;                                                 \
+    int64_t _sr = _l.stride[0][_l.ndim - 1];                                                    \
+    int64_t _s0 = _l.stride[1][_l.ndim - 1];                                                    \
+    int64_t _s1 = _l.stride[2][_l.ndim - 1];                                                    \
+    if (USE_PARALLEL(PARALLEL_ELEMENTWISE, _l.length)) {                                        \
+        _Pragma("omp parallel for")                                                             \
+        for (size_t _t = 0; _t < _tasks; _t++) _BINARY_ELEMENTWISE_TASK(kr, k0, k1, operation)  \
+    } else {                                                                                    \
+        for (size_t _t = 0; _t < _tasks; _t++) _BINARY_ELEMENTWISE_TASK(kr, k0, k1, operation)  \
+    }                                                                                           \
 } while(0)
 
 
-#define UNARY_CONTIGUOUS_ELEMENTWISE_OP_SIMD(kr, k0, operation) \
-do {                                                                             \
-    if ((kr)->length > 1<<17) {                                                 \
-        _Pragma("omp parallel for simd")                                       \
-          for (size_t _i = 0; _i < (kr)->length; _i++) {                       \
-              (kr)->array[_i] = operation((k0)->array[_i]);   \
-          }                                                                    \
-    } else {                                                                     \
-        _Pragma("omp simd")                                                      \
-        for (size_t _i = 0; _i < (kr)->length; _i++) {                           \
-            (kr)->array[_i] = operation((k0)->array[_i]);       \
-        }                                                                        \
-    }                                                                            \
+#define _UNARY_ELEMENTWISE_TASK(kr, k0, operation)                                              \
+{                                                                                               \
+    int64_t _off[2];                                                                            \
+    strided_loop_offsets(&_l, _t / _chunks, 2, _off);                                           \
+    size_t _lo = (_t % _chunks) * STRIDED_LOOP_CHUNK;                                           \
+    size_t _len = ((_n - _lo) < STRIDED_LOOP_CHUNK) ? (_n - _lo) : STRIDED_LOOP_CHUNK;          \
+    lemur_float *_r = (kr)->array + _off[0] + (int64_t) _lo * _sr;                              \
+    const lemur_float *_a = (k0)->array + _off[1] + (int64_t) _lo * _s0;                        \
+    if ((_sr == 1) && (_s0 == 1)) {                                                             \
+        _Pragma("omp simd")                                                                     \
+        for (size_t _i = 0; _i < _len; _i++) {                                                  \
+            _r[_i] = operation(_a[_i]);                                                         \
+        }                                                                                       \
+    } else {                                                                                    \
+        _Pragma("omp simd")                                                                     \
+        for (size_t _i = 0; _i < _len; _i++) {                                                  \
+            _r[(int64_t) _i * _sr] = operation(_a[(int64_t) _i * _s0]);                         \
+        }                                                                                       \
+    }                                                                                           \
+}
+
+#define UNARY_ELEMENTWISE_OP_SIMD(kr, k0, operation)                                            \
+do {                                                                                            \
+    kernel_tensor *_ks[2] = {(kr), (k0)};                                                       \
+    strided_loop _l;                                                                            \
+    make_strided_loop(&_l, (kr)->shape, _ks, 2);                                                \
+    if (_l.length == 0) break;                                                                  \
+    size_t _n = _l.shape[_l.ndim - 1];                                                          \
+    size_t _chunks = (_n + STRIDED_LOOP_CHUNK - 1) / STRIDED_LOOP_CHUNK;                        \
+    size_t _tasks = (_l.length / _n) * _chunks;                                                 \
+    int64_t _sr = _l.stride[0][_l.ndim - 1];                                                    \
+    int64_t _s0 = _l.stride[1][_l.ndim - 1];                                                    \
+    if (USE_PARALLEL(PARALLEL_ELEMENTWISE, _l.length)) {                                        \
+        _Pragma("omp parallel for")                                                             \
+        for (size_t _t = 0; _t < _tasks; _t++) _UNARY_ELEMENTWISE_TASK(kr, k0, operation)       \
+    } else {                                                                                    \
+        for (size_t _t = 0; _t < _tasks; _t++) _UNARY_ELEMENTWISE_TASK(kr, k0, operation)       \
+    }                                                                                           \
 } while(0)
 
 #define _add(a, b) a + b
@@ -233,7 +386,10 @@ do {
 #define _eq(x, y) ((x) == (y) ? 1.0 : 0.0)
 #define _neg(a) -1.0 * a
 #define _relu(v) ((v) > 0.0) ? (v) : 0.0
-#define _sigmoid(x) 1.0 / (1.0 + expf(-1.0 * x))
+#define _sigmoid(x) lemur_sigmoidf(x)
 #define _sigmoid_grad(s) s * (1.0 - s)
+#define _copy(a) (a)
+#define _sign(v) (lemur_float) (((v) > 0) - ((v) < 0))
+#define _reciprocal(a) (1.0 / (a))
 
 #endif 
@@ -0,0 +1,213 @@
+#ifndef SIMDMATH_H
+#define SIMDMATH_H
+
+#include <stdbool.h>
+#include <stdint.h>
+#include <string.h>
+#include <math.h>
+
+//branch free float math for the elementwise kernels. libm calls are opaque to the vectorizer unless
+//the compiler knows a vector libm, these are plain arithmetic on the lanes (range reduction +
+//polynomial, special cases picked with selects) so the omp simd loops that inline them run full width.
+//the kernels call lemur_expf, lemur_logf and lemur_powf, which are libm or these (see below).
+//max error over sampled finite floats against libm in double (test_simd_math in tests.c):
+//  simd_expf       1 ulp     (0 below -103.97, inf above 88.72)
+//  simd_logf       2 ulp     (-inf at 0, nan below 0)
+//  simd_powf       1 ulp     (computed in double, powf conventions for zero, negative and inf bases)
+//  lemur_sigmoidf  3 ulp
+//  lemur_tanhf     2 ulp
+//nan inputs are not guaranteed to propagate when compiled with -ffast-math, as with libm
+
+#define SIMD_LOG2E 1.44269504088896341f
+#define SIMD_LN2_HI 0.693359375f //exact in 9 bits, n * SIMD_LN2_HI is exact
+#define SIMD_LN2_LO -2.12194440e-4f
+#define SIMD_SQRTHF 0.707106781186547524f
+#define SIMD_EXP_MAX 88.7228317f //largest float whose exp is finite
+#define SIMD_EXP_MIN -103.972084f //below, exp rounds to 0
+#define SIMD_INF_BITS 0x7f800000u //inf and nan are made from bits and tested on bits, -ffast-math
+#define SIMD_NAN_BITS 0x7fc00000u //folds the comparisons with INFINITY away
+
+//a * b + c. the reductions below must not be reassociated, which -ffast-math allows on plain
+//expressions but never across an fma. without hardware fma fmaf is a libm call, so it is not used
+#if defined(__FMA__) || defined(__ARM_FEATURE_FMA)
+    #define SIMD_FMA(a, b, c) fmaf((a), (b), (c))
+#else
+    #define SIMD_FMA(a, b, c) ((a) * (b) + (c))
+#endif
+
+//inlined into the kernel loops whatever the optimizer thinks of their size, a call does not vectorize
+#define SIMD_INLINE static inline __attribute__((always_inline))
+
+SIMD_INLINE float simd_as_float(uint32_t u){
+    float f;
+    memcpy(&f, &u, sizeof(f));
+    return f;
+}
+
+SIMD_INLINE uint32_t simd_as_uint(float f){
+    uint32_t u;
+    memcpy(&u, &f, sizeof(u));
+    return u;
+}
+
+SIMD_INLINE double simd_as_double(uint64_t u){
+    double d;
+    memcpy(&d, &u, sizeof(d));
+    return d;
+}
+
+SIMD_INLINE uint64_t simd_as_uint64(double d){
+    uint64_t u;
+    memcpy(&u, &d, sizeof(u));
+    return u;
+}
+
+//p * 2^n for p in [sqrt(0.5), sqrt(2)] and -151 <= n <= 128 with a finite result, the exponent is
+//added to the bits of p, denormal results are shifted up first and rounded by one multiply
+SIMD_INLINE float simd_scale(float p, int32_t n){
+    bool denormal = (n < -125);
+    uint32_t bits = simd_as_uint(p) + ((uint32_t) (n + (denormal ? 64 : 0)) << 23);
+    return simd_as_float(bits) * (denormal ? 5.42101086e-20f : 1.0f); //2^-64
+}
+
+SIMD_INLINE float simd_expf(float x){
+    bool overflow = (x > SIMD_EXP_MAX);
+    bool underflow = (x < SIMD_EXP_MIN);
+    x = fminf(fmaxf(x, SIMD_EXP_MIN), SIMD_EXP_MAX);
+    float z = x * SIMD_LOG2E;
+    int32_t n = (int32_t) (z + ((z >= 0.0f) ? 0.5f : -0.5f));
+    float nf = (float) n;
+    float r = SIMD_FMA(-nf, SIMD_LN2_LO, SIMD_FMA(-nf, SIMD_LN2_HI, x)); //|r| <= ln2 / 2
+    float p = 1.9875691500e-4f;
+    p = p * r + 1.3981999507e-3f;
+    p = p * r + 8.3334519073e-3f;
+    p = p * r + 4.1665795894e-2f;
+    p = p * r + 1.6666665459e-1f;
+    p = p * r + 5.0000001201e-1f;
+    p = p * r * r + r + 1.0f;
+    float result = simd_scale(p, n);
+    result = underflow ? 0.0f : result;
+    return overflow ? simd_as_float(SIMD_INF_BITS) : result;
+}
+
+SIMD_INLINE float simd_logf(float x){
+    bool denormal = (x < 1.17549435e-38f);
+    float xs = denormal ? x * 8388608.0f : x; //2^23
+    uint32_t bits = simd_as_uint(xs);
+    int32_t e = (int32_t) ((bits >> 23) & 0xff) - 126 - (denormal ? 23 : 0);
+    float m = simd_as_float((bits & 0x007fffff) | 0x3f000000); //[0.5, 1)
+    bool low = (m < SIMD_SQRTHF);
+    e -= low ? 1 : 0;
+    float f = low ? (m + m - 1.0f) : (m - 1.0f); //[sqrt(0.5) - 1, sqrt(2) - 1]
+    float ef = (float) e;
+    float z = f * f;
+    float p = 7.0376836292e-2f;
+    p = p * f - 1.1514610310e-1f;
+    p = p * f + 1.1676998740e-1f;
+    p = p * f - 1.2420140846e-1f;
+    p = p * f + 1.4249322787e-1f;
+    p = p * f - 1.6668057665e-1f;
+    p = p * f + 2.0000714765e-1f;
+    p = p * f - 2.4999993993e-1f;
+    p = p * f + 3.3333331174e-1f;
+    float y = p * f * z + ef * SIMD_LN2_LO - 0.5f * z;
+    float r = SIMD_FMA(ef, SIMD_LN2_HI, f + y);
+    r = (simd_as_uint(x) == SIMD_INF_BITS) ? x : r;
+    r = (x == 0.0f) ? -simd_as_float(SIMD_INF_BITS) : r;
+    return (x < 0.0f) ? simd_as_float(SIMD_NAN_BITS) : r;
+}
+
+//log and exp in double for pow: exp(x * log(a)) rounded to float is then within an ulp for any
+//exponent, the error of a float log would be scaled by x * log(a)
+SIMD_INLINE double simd_log_double(double a){
+    uint64_t bits = simd_as_uint64(a); //a float is never denormal as a double
+    int64_t e = (int64_t) ((bits >> 52) & 0x7ff) - 1023;
+    double m = simd_as_double((bits & 0x000fffffffffffffULL) | 0x3ff0000000000000ULL); //[1, 2)
+    bool high = (m > 1.41421356237309505);
+    m = high ? 0.5 * m : m;
+    e += high ? 1 : 0;
+    double f = (m - 1.0) / (m + 1.0); //log m = 2 atanh f, |f| <= 0.1716
+    double f2 = f * f;
+    double s = 1.0 / 13.0;
+    s = s * f2 + 1.0 / 11.0;
+    s = s * f2 + 1.0 / 9.0;
+    s = s * f2 + 1.0 / 7.0;
+    s = s * f2 + 1.0 / 5.0;
+    s = s * f2 + 1.0 / 3.0;
+    s = s * f2 + 1.0;
+    return 2.0 * f * s + (double) e * 0.693147180559945309;
+}
+
+//for results in float range, y is clamped to where the float result is 0 or inf anyway
+SIMD_INLINE double simd_exp_double(double y){
+    y = fmin(fmax(y, -745.0), 710.0);
+    double z = y * 1.44269504088896341;
+    int64_t n = (int64_t) (z + ((z >= 0.0) ? 0.5 : -0.5));
+    double r = y - (double) n * 0.693147180559945309; //|r| <= ln2 / 2
+    double p = 1.0 / 40320.0;
+    p = p * r + 1.0 / 5040.0;
+    p = p * r + 1.0 / 720.0;
+    p = p * r + 1.0 / 120.0;
+    p = p * r + 1.0 / 24.0;
+    p = p * r + 1.0 / 6.0;
+    p = p * r + 0.5;
+    p = p * r + 1.0;
+    p = p * r + 1.0;
+    int64_t n1 = n / 2;
+    int64_t n2 = n - n1;
+    return p * simd_as_double((uint64_t) (n1 + 1023) << 52) * simd_as_double((uint64_t) (n2 + 1023) << 52);
+}
+
+//the special cases adjust the input and scale the result instead of replacing it: a result picked
+//over the computation lets the compiler move the computation into a branch, which does not vectorize
+SIMD_INLINE float simd_powf(float a, float x){
+    float inf = simd_as_float(SIMD_INF_BITS);
+    float abs_a = fabsf(a);
+    bool a_inf = (simd_as_uint(abs_a) == SIMD_INF_BITS);
+    bool special = (abs_a == 0.0f) || a_inf; //log |a| is not finite, the result is 0, 1 or inf
+    float r = (float) simd_exp_double((double) x * simd_log_double(special ? 1.0 : (double) abs_a));
+    float limit = ((x > 0.0f) == a_inf) ? inf : 0.0f;
+    float scale = special ? ((x == 0.0f) ? 1.0f : limit) : 1.0f;
+    //negative bases need an integer exponent, odd ones keep the sign (every float above 2^24 is even)
+    float xi = fminf(fmaxf(x, -16777216.0f), 16777216.0f);
+    int32_t n = (int32_t) xi;
+    float odd = ((n & 1) != 0) ? -1.0f : 1.0f;
+    float sign = ((float) n == xi) ? odd : simd_as_float(SIMD_NAN_BITS);
+    return r * scale * ((a < 0.0f) ? sign : 1.0f);
+}
+
+//gcc with glibc on x86-64 already vectorizes expf, logf and powf under -ffast-math (libmvec), and
+//those vector versions are faster than the ones above, there the kernels keep calling libm
+#if defined(__GNUC__) && !defined(__clang__) && defined(__GLIBC__) && defined(__FAST_MATH__) && defined(__x86_64__)
+    #define lemur_expf expf
+    #define lemur_logf logf
+    #define lemur_powf powf
+#else
+    #define lemur_expf simd_expf
+    #define lemur_logf simd_logf
+    #define lemur_powf simd_powf
+#endif
+
+//e^-|x| never overflows, for x < 0 the result is e^x / (1 + e^x) down to the denormals
+SIMD_INLINE float lemur_sigmoidf(float x){
+    float e = lemur_expf(-fabsf(x));
+    float s = 1.0f / (1.0f + e);
+    return (x < 0.0f) ? e * s : s;
+}
+
+SIMD_INLINE float lemur_tanhf(float x){
+    float ax = fabsf(x);
+    //small |x|: odd polynomial, avoids the cancellation of 1 - 2 / (e^2x + 1)
+    float z = x * x;
+    float p = -5.70498872745e-3f;
+    p = p * z + 2.06390887954e-2f;
+    p = p * z - 5.37397155531e-2f;
+    p = p * z + 1.33314422036e-1f;
+    p = p * z - 3.33332819422e-1f;
+    float small = p * z * x + x;
+    float large = 1.0f - 2.0f / (lemur_expf(2.0f * ax) + 1.0f);
+    large = (x < 0.0f) ? -large : large;
+    return (ax < 0.625f) ? small : large;
+}
+
+#endif
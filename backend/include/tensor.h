@@ -8,42 +8,142 @@ typedef struct kernel_tensor {
     size_t length; 
     size_t shape[5]; 
     int64_t stride[5];
-    bool computed; 
+    bool computed; //false while the array of a lazily recorded result has not been computed
     bool shallow;
+    bool mapped; //array is an mmap of a file and is released with munmap
+    bool readonly; //array may not be written (LEMUR_MMAP_READ mapping and its views)
 } kernel_tensor;
 
+//iteration space of an elementwise kernel over up to 3 operands with the same shape (the first is the output)
+//size 1 dims are dropped and neighbouring dims are merged when every operand allows it
+#define STRIDED_LOOP_MAX_OPERANDS 3
+
+typedef struct strided_loop {
+    size_t ndim;
+    size_t length;
+    size_t shape[5];
+    int64_t stride[STRIDED_LOOP_MAX_OPERANDS][5];
+} strided_loop;
+
+void make_strided_loop(strided_loop *l, size_t shape[5], kernel_tensor **ks, size_t num);
+
+//offsets of each operand at the start of the outer (all dims but the innermost) index
+static inline void strided_loop_offsets(const strided_loop *l, size_t outer, size_t num, int64_t *offsets){
+    for (size_t j = 0; j < num; j++){
+        offsets[j] = 0;
+    }
+    for (size_t d = l->ndim - 1; d-- > 0;){
+        size_t c = outer % l->shape[d];
+        outer /= l->shape[d];
+        for (size_t j = 0; j < num; j++){
+            offsets[j] += (int64_t) c * l->stride[j][d];
+        }
+    }
+}
+
+enum {
+    LEMUR_MMAP_READ = 0,   //read only, shared with other processes
+    LEMUR_MMAP_READWRITE,  //writes go back to the file
+    LEMUR_MMAP_COPY,       //copy on write, the file is never modified
+};
+
 
 typedef struct expression expression; //ignore: forward declaration
+typedef struct fused_group fused_group;
+typedef struct memory_plan memory_plan;
 
 typedef struct tensor {
     kernel_tensor *k;
     expression *comes_from; 
     bool requires_grad;
     kernel_tensor *grad;
+    size_t version; //bumped by every in-place write, see tensor_version
 } tensor;
 
 typedef struct expression {
     tensor *t0;
     tensor *t1;
     int backward_func;
+    fused_group *fused; //set by compile() when this is the output of a fused region
+    memory_plan *plan;  //set by plan_memory() on the root of a planned graph
+    size_t saved_version[3]; //versions of t0, t1 and the result when it was recorded
+    lemur_float scalar; //immediate operand of the scalar ops (t1 is NULL)
 } expression;
 
 void init_seed(unsigned int seed);
 
-void backward(tensor * t);
+//one timed kernel dispatch, recorded between profile_start and profile_stop
+#define PROFILE_FUSED -1 //func of the generated kernels of a fused region
+
+typedef struct profile_event {
+    int func;            //op id or PROFILE_FUSED
+    bool backward;
+    int thread;          //omp thread that ran the kernel
+    int num_threads;     //threads it could use
+    double start;        //seconds since profile_start
+    double duration;
+    size_t shape[3][5];  //of the result, t0 and t1, zeros when absent
+    size_t bytes;        //read and written, 0 for views
+} profile_event;
+
+//the dispatch paths test this one flag and take their plain path when it is off
+extern bool profile_enabled;
+void profile_record(int func, bool backward, double start, kernel_tensor *kr, kernel_tensor *k0, kernel_tensor *k1, size_t bytes);
+
+//memory accounting (see allocator.c), arrays are attributed to an op, a fused region or other
+#define MEMORY_FUSED TOTAL_OPS
+#define MEMORY_OTHER (TOTAL_OPS + 1)
+#define TOTAL_MEMORY_ORIGINS (TOTAL_OPS + 2)
+
+typedef struct memory_counters {
+    size_t live_bytes;
+    size_t peak_bytes;
+    size_t allocated_bytes; //ever allocated
+    size_t num_allocs;
+} memory_counters;
+
+typedef struct memory_block {
+    size_t bytes;
+    size_t id; //allocation order
+    int origin;
+    bool backward;
+} memory_block;
+
+typedef struct alloc_context {
+    int origin;
+    bool backward;
+} alloc_context;
+
+//per thread, returns the previous context to restore
+alloc_context set_alloc_context(int origin, bool backward);
+void restore_alloc_context(alloc_context previous);
+
+lemur_float * lemur_alloc(size_t length);
+void lemur_free(lemur_float *array, size_t length);
+kernel_tensor * alloc_kernel_tensor(void);
+void release_kernel_tensor(kernel_tensor *k);
+
+bool backward(tensor * t);
+size_t tensor_version(tensor *t);
+bool mark_modified(tensor *t);
 
 expression * expression_from(int func, tensor *t0, tensor *t1);
+kernel_tensor * expression_k1(expression *e, kernel_tensor *scalar_k);
 
 tensor * empty_tensor(size_t shape[5], bool requires_grad, bool retains_grad);
 void memset_kernel_tensor(kernel_tensor * k, lemur_float val);
 void free_kernel_tensor(kernel_tensor **k);
 void free_tensor(tensor **t);
 
+size_t get_alleged_length(size_t shape[5]);
 kernel_tensor * empty_contiguous_kernel_tensor(size_t shape[5]);
 kernel_tensor * empty_contiguous_kernel_tensor_like(kernel_tensor *k);
+kernel_tensor * lazy_kernel_tensor(size_t shape[5]);
 kernel_tensor * empty_kernel_tensor_like(kernel_tensor *k);
 tensor * tensor_from(kernel_tensor *k, expression *comes_from, bool requires_grad, kernel_tensor* grad);
 kernel_tensor * kernel_tensor_shallow_copy(kernel_tensor *k);
+kernel_tensor * kernel_tensor_from_array(lemur_float *array, size_t shape[5]);
+kernel_tensor * mmap_kernel_tensor(const char *path, size_t shape[5], size_t offset, int mode);
 tensor * dim_tensor_from(size_t shape[5]);
 void inplace_contiguous_kernel_tensor(kernel_tensor *k); 
 kernel_tensor * contiguous_deepcopy_kernel_tensor(kernel_tensor *k); 
@@ -51,11 +151,15 @@ void init_random_uniform_kernel_tensor(kernel_tensor * k, lemur_float min, lemur
 void init_random_normal_kernel_tensor(kernel_tensor * k, lemur_float mean, lemur_float std);
 
 bool are_shapes_equal(size_t shape0[5], size_t shape1[5]);
+bool broadcast_shapes(size_t out_shape[5], size_t shape0[5], size_t shape1[5]);
+kernel_tensor * broadcast_kernel_tensor(kernel_tensor *k, size_t shape[5]);
 void set_reduced_shape(size_t reduced_shape[5], size_t original_shape[5], lemur_float dims[5]);
 bool is_contiguous(kernel_tensor *k);
 void set_contiguous_stride(kernel_tensor * k);
 bool is_tensor_scalar(tensor* t);
 
+void gather_kernel_tensor(kernel_tensor *k, const size_t *index, const size_t count[5], lemur_float *out);
+void set_print_options(size_t threshold, size_t edgeitems, int precision);
 void print_kernel_tensor(kernel_tensor *k);
 void print_expression(expression *e);
 void print_tensor(tensor *t);
@@ -0,0 +1,393 @@
+#include "../include/tensor.h"
+#include "../include/interface.h"
+
+//caching allocator behind lemur_alloc/lemur_free
+//freed arrays are kept in size binned free lists (4 bins per power of two, so at most 25% waste)
+//and handed back out to the next allocation of the same class, steady state training steps
+//then reuse the same (already faulted in) pages instead of going through libc every op.
+//kernel_tensor structs are recycled the same way.
+//the total live and peak bytes are always counted. with tracking on, every array is also recorded
+//in a table keyed by its address with the op (and phase) it was allocated for, so the bytes can be
+//broken down by op and listed by memory_snapshot. the op is a per thread context set around the
+//forward and backward of each node, scratch memory of the worker threads of a parallel kernel is
+//"other". arrays carry no header, with tracking off a free costs one check of the table size
+
+#define ALLOC_ALIGNMENT 64
+#define ALLOC_MIN_SHIFT 6 //smallest class is 64 bytes
+#define ALLOC_BINS_PER_POW2 4
+#define ALLOC_NUM_BINS (1 + (64 - ALLOC_MIN_SHIFT) * ALLOC_BINS_PER_POW2)
+#define STRUCT_CACHE_MAX 4096
+
+typedef struct free_block {
+    struct free_block *next;
+} free_block;
+
+typedef struct alloc_record {
+    void *array; //NULL for an empty slot
+    memory_block block;
+} alloc_record;
+
+static alloc_context context = {MEMORY_OTHER, false};
+#pragma omp threadprivate(context)
+
+static memory_counters total_counters;
+static memory_counters origin_counters[TOTAL_MEMORY_ORIGINS][2];
+static size_t num_allocations = 0;
+static bool tracking = false;
+static alloc_record *records = NULL; //open addressing, linear probing
+static size_t records_capacity = 0; //a power of two
+static size_t num_records = 0;
+
+static free_block *bins[ALLOC_NUM_BINS];
+static size_t cached_bytes = 0;
+static size_t cache_limit = (size_t) 1 << 30;
+
+static kernel_tensor *struct_cache[STRUCT_CACHE_MAX];
+static size_t num_cached_structs = 0;
+
+//rounds size_in_bytes up to its class, returns the class size and sets its bin
+static size_t size_class(size_t size_in_bytes, size_t *bin){
+    if (size_in_bytes <= ((size_t) 1 << ALLOC_MIN_SHIFT)){
+        *bin = 0;
+        return (size_t) 1 << ALLOC_MIN_SHIFT;
+    }
+    size_t e = 63 - (size_t) __builtin_clzll((unsigned long long) (size_in_bytes - 1)); //2^e < size <= 2^(e+1)
+    size_t step = (size_t) 1 << (e - 2); //classes are 5,6,7,8 steps
+    size_t rounded = (size_in_bytes + step - 1) & ~(step - 1);
+    *bin = 1 + (e - ALLOC_MIN_SHIFT) * ALLOC_BINS_PER_POW2 + (rounded >> (e - 2)) - 5;
+    return rounded;
+}
+
+alloc_context set_alloc_context(int origin, bool backward){
+    alloc_context previous = context;
+    context.origin = origin;
+    context.backward = backward;
+    return previous;
+}
+
+void restore_alloc_context(alloc_context previous){
+    context = previous;
+}
+
+static void count_alloc(memory_counters *c, size_t bytes){
+    c->live_bytes += bytes;
+    c->allocated_bytes += bytes;
+    c->num_allocs++;
+    if (c->live_bytes > c->peak_bytes){
+        c->peak_bytes = c->live_bytes;
+    }
+}
+
+static size_t record_slot(const void *array){
+    uintptr_t x = (uintptr_t) array >> ALLOC_MIN_SHIFT;
+    return (size_t) (x * 0x9E3779B97F4A7C15ULL) & (records_capacity - 1);
+}
+
+//the table is kept at most half full
+static bool insert_record(void *array, memory_block block){
+    if (2 * (num_records + 1) > records_capacity){
+        size_t old_capacity = records_capacity;
+        alloc_record *old = records;
+        size_t capacity = (old_capacity > 0) ? 2 * old_capacity : 1024;
+        alloc_record *grown = (alloc_record *) calloc(capacity, sizeof(alloc_record));
+        if (grown == NULL){
+            return false;
+        }
+        records = grown;
+        records_capacity = capacity;
+        for (size_t i = 0; i < old_capacity; i++){
+            if (old[i].array != NULL){
+                size_t j = record_slot(old[i].array);
+                while (records[j].array != NULL){
+                    j = (j + 1) & (records_capacity - 1);
+                }
+                records[j] = old[i];
+            }
+        }
+        free(old);
+    }
+    size_t i = record_slot(array);
+    while (records[i].array != NULL){
+        i = (i + 1) & (records_capacity - 1);
+    }
+    records[i] = (alloc_record) {array, block};
+    num_records++;
+    return true;
+}
+
+//removes the record of array into block, false if it was not recorded
+static bool remove_record(const void *array, memory_block *block){
+    size_t i = record_slot(array);
+    while (records[i].array != array){
+        if (records[i].array == NULL){
+            return false;
+        }
+        i = (i + 1) & (records_capacity - 1);
+    }
+    *block = records[i].block;
+    //shifts the rest of the run back so no lookup stops early at the hole
+    for (size_t j = (i + 1) & (records_capacity - 1); records[j].array != NULL; j = (j + 1) & (records_capacity - 1)){
+        size_t home = record_slot(records[j].array);
+        if (((j - home) & (records_capacity - 1)) >= ((j - i) & (records_capacity - 1))){
+            records[i] = records[j];
+            i = j;
+        }
+    }
+    records[i].array = NULL;
+    num_records--;
+    return true;
+}
+
+//both under lemur_alloc_cache
+static void account_alloc(void *array, size_t bytes){
+    count_alloc(&total_counters, bytes);
+    size_t id = num_allocations++;
+    if (tracking){
+        memory_block block = {bytes, id, context.origin, context.backward};
+        if (insert_record(array, block)){
+            count_alloc(&origin_counters[block.origin][block.backward], bytes);
+        }
+    }
+}
+
+static void account_free(void *array, size_t bytes){
+    total_counters.live_bytes -= bytes;
+    memory_block block;
+    if ((num_records > 0) && remove_record(array, &block)){
+        origin_counters[block.origin][block.backward].live_bytes -= block.bytes;
+    }
+}
+
+lemur_float * lemur_alloc(size_t length){
+    size_t bin;
+    size_t bytes = length * sizeof(lemur_float);
+    size_t class_size = size_class(bytes, &bin);
+    void *array = NULL;
+    #pragma omp critical(lemur_alloc_cache)
+    {
+        free_block *block = bins[bin];
+        if (block != NULL){
+            bins[bin] = block->next;
+            cached_bytes -= class_size;
+            array = block;
+            account_alloc(array, bytes);
+        }
+    }
+    if (array != NULL){
+        return (lemur_float *) array;
+    }
+    size_t aligned_size = (class_size + ALLOC_ALIGNMENT - 1) & ~((size_t) ALLOC_ALIGNMENT - 1);
+    array = aligned_alloc(ALLOC_ALIGNMENT, aligned_size);
+    if (array == NULL){
+        //memory may be sitting in the cache, give it back and try once more
+        empty_cache();
+        array = aligned_alloc(ALLOC_ALIGNMENT, aligned_size);
+        if (array == NULL){
+            perror("aligned_alloc failed");
+            return NULL;
+        }
+    }
+    #pragma omp critical(lemur_alloc_cache)
+    {
+        account_alloc(array, bytes);
+    }
+    return (lemur_float *) array;
+}
+
+void lemur_free(lemur_float *array, size_t length){
+    if (array == NULL){
+        return;
+    }
+    size_t bin;
+    size_t bytes = length * sizeof(lemur_float);
+    size_t class_size = size_class(bytes, &bin);
+    bool cached = false;
+    #pragma omp critical(lemur_alloc_cache)
+    {
+        account_free(array, bytes);
+        if (cached_bytes + class_size <= cache_limit){
+            free_block *block = (free_block *) array;
+            block->next = bins[bin];
+            bins[bin] = block;
+            cached_bytes += class_size;
+            cached = true;
+        }
+    }
+    if (cached == false){
+        free(array);
+    }
+}
+
+kernel_tensor * alloc_kernel_tensor(void){
+    kernel_tensor *k = NULL;
+    #pragma omp critical(lemur_struct_cache)
+    {
+        if (num_cached_structs > 0){
+            k = struct_cache[--num_cached_structs];
+        }
+    }
+    if (k == NULL){
+        k = (kernel_tensor *) malloc(sizeof(kernel_tensor));
+    }
+    return k;
+}
+
+void release_kernel_tensor(kernel_tensor *k){
+    bool cached = false;
+    #pragma omp critical(lemur_struct_cache)
+    {
+        if (num_cached_structs < STRUCT_CACHE_MAX){
+            struct_cache[num_cached_structs++] = k;
+            cached = true;
+        }
+    }
+    if (cached == false){
+        free(k);
+    }
+}
+
+void empty_cache(void){
+    #pragma omp critical(lemur_alloc_cache)
+    {
+        for (size_t b = 0; b < ALLOC_NUM_BINS; b++){
+            while (bins[b] != NULL){
+                free_block *next = bins[b]->next;
+                free(bins[b]);
+                bins[b] = next;
+            }
+        }
+        cached_bytes = 0;
+    }
+    #pragma omp critical(lemur_struct_cache)
+    {
+        while (num_cached_structs > 0){
+            free(struct_cache[--num_cached_structs]);
+        }
+    }
+}
+
+void set_cache_limit(size_t bytes){
+    #pragma omp critical(lemur_alloc_cache)
+    {
+        cache_limit = bytes;
+    }
+    if (get_cached_bytes() > bytes){
+        empty_cache();
+    }
+}
+
+size_t get_cache_limit(void){
+    return cache_limit;
+}
+
+size_t get_cached_bytes(void){
+    size_t bytes;
+    #pragma omp critical(lemur_alloc_cache)
+    {
+        bytes = cached_bytes;
+    }
+    return bytes;
+}
+
+//origin is an op id, MEMORY_FUSED or MEMORY_OTHER
+const char * get_memory_origin_name(int origin){
+    if (origin == MEMORY_FUSED){
+        return "fused";
+    }
+    if (origin == MEMORY_OTHER){
+        return "other";
+    }
+    return get_op_name(origin);
+}
+
+int get_num_memory_origins(void){
+    return TOTAL_MEMORY_ORIGINS;
+}
+
+memory_counters get_memory_counters(void){
+    memory_counters c;
+    #pragma omp critical(lemur_alloc_cache)
+    {
+        c = total_counters;
+    }
+    return c;
+}
+
+memory_counters get_origin_memory_counters(int origin, bool backward){
+    memory_counters c = {0};
+    if ((origin < 0) || (origin >= TOTAL_MEMORY_ORIGINS)){
+        fprintf(stderr, "Error: unknown memory origin %d.\n", origin);
+        return c;
+    }
+    #pragma omp critical(lemur_alloc_cache)
+    {
+        c = origin_counters[origin][backward];
+    }
+    return c;
+}
+
+//the peaks start again from what is live now
+void reset_peak_memory(void){
+    #pragma omp critical(lemur_alloc_cache)
+    {
+        total_counters.peak_bytes = total_counters.live_bytes;
+        for (int o = 0; o < TOTAL_MEMORY_ORIGINS; o++){
+            for (int b = 0; b < 2; b++){
+                origin_counters[o][b].peak_bytes = origin_counters[o][b].live_bytes;
+            }
+        }
+    }
+}
+
+//only arrays allocated while tracking is on count towards the ops and are listed by memory_snapshot,
+//turning it off forgets them
+void set_memory_tracking(bool enabled){
+    #pragma omp critical(lemur_alloc_cache)
+    {
+        if (enabled == false){
+            for (size_t i = 0; i < records_capacity; i++){
+                if (records[i].array != NULL){
+                    memory_block *b = &records[i].block;
+                    origin_counters[b->origin][b->backward].live_bytes -= b->bytes;
+                }
+            }
+            free(records);
+            records = NULL;
+            records_capacity = 0;
+            num_records = 0;
+        }
+        tracking = enabled;
+    }
+}
+
+bool get_memory_tracking(void){
+    return tracking;
+}
+
+static int compare_blocks(const void *a, const void *b){
+    size_t x = ((const memory_block *) a)->bytes;
+    size_t y = ((const memory_block *) b)->bytes;
+    return (x < y) - (x > y);
+}
+
+//writes the largest (at most max_blocks) tracked live arrays into out, largest first,
+//returns how many were written
+size_t memory_snapshot(memory_block *out, size_t max_blocks){
+    size_t count = 0;
+    #pragma omp critical(lemur_alloc_cache)
+    {
+        count = num_records;
+        memory_block *all = (memory_block *) malloc((count + 1) * sizeof(memory_block));
+        size_t n = 0;
+        for (size_t i = 0; i < records_capacity; i++){
+            if (records[i].array != NULL){
+                all[n++] = records[i].block;
+            }
+        }
+        qsort(all, count, sizeof(memory_block), compare_blocks);
+        count = (count < max_blocks) ? count : max_blocks;
+        memcpy(out, all, count * sizeof(memory_block));
+        free(all);
+    }
+    return count;
+}
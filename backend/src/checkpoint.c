@@ -0,0 +1,182 @@
+#include "../include/interface.h"
+
+#include <fcntl.h>
+#include <unistd.h>
+#include <sys/types.h>
+
+//checkpoint layout (native endianness)
+//  header   : char magic[8] "LEMURCKP", uint32 version, uint32 sizeof(lemur_float),
+//             uint64 count, uint64 payload_start, 32 reserved bytes          (64 bytes)
+//  entries  : uint64 name_length, char name[name_length], uint64 shape[5],
+//             int64 stride[5], uint64 offset, uint64 nbytes                   (count times)
+//  payloads : raw contiguous lemur_float arrays, each at a 64 byte aligned offset
+//             (same alignment as lemur_alloc) so they can be mmapped or read in one go
+
+#define CHECKPOINT_MAGIC "LEMURCKP"
+#define CHECKPOINT_VERSION 1
+#define CHECKPOINT_HEADER_SIZE 64
+#define CHECKPOINT_ALIGNMENT 64
+#define CHECKPOINT_CHUNK_SIZE ((size_t) 1 << 26) //bytes per parallel io task
+
+#define ALIGN_UP(x, a) (((x) + (a) - 1) & ~((size_t)(a) - 1))
+
+typedef struct io_chunk {
+    size_t tensor_idx;
+    size_t start; //bytes from the beginning of the payload
+    size_t nbytes;
+} io_chunk;
+
+static int write_all(int fd, const void *buf, size_t nbytes, size_t offset){
+    const char *p = (const char *) buf;
+    while (nbytes > 0){
+        ssize_t w = pwrite(fd, p, nbytes, (off_t) offset);
+        if (w <= 0){
+            return -1;
+        }
+        p += w; offset += (size_t) w; nbytes -= (size_t) w;
+    }
+    return 0;
+}
+
+static int read_all(int fd, void *buf, size_t nbytes, size_t offset){
+    char *p = (char *) buf;
+    while (nbytes > 0){
+        ssize_t r = pread(fd, p, nbytes, (off_t) offset);
+        if (r <= 0){
+            return -1;
+        }
+        p += r; offset += (size_t) r; nbytes -= (size_t) r;
+    }
+    return 0;
+}
+
+//splits every payload into chunks so big tensors are also written/read by several threads
+static io_chunk * make_io_chunks(kernel_tensor **ks, size_t n, size_t *num_chunks){
+    size_t total = 0;
+    for (size_t i = 0; i < n; i++){
+        size_t nbytes = ks[i]->length * sizeof(lemur_float);
+        total += (nbytes + CHECKPOINT_CHUNK_SIZE - 1) / CHECKPOINT_CHUNK_SIZE;
+    }
+    io_chunk *chunks = (io_chunk *) malloc((total + 1) * sizeof(io_chunk));
+    size_t c = 0;
+    for (size_t i = 0; i < n; i++){
+        size_t nbytes = ks[i]->length * sizeof(lemur_float);
+        for (size_t start = 0; start < nbytes; start += CHECKPOINT_CHUNK_SIZE){
+            chunks[c].tensor_idx = i;
+            chunks[c].start = start;
+            chunks[c].nbytes = (nbytes - start < CHECKPOINT_CHUNK_SIZE) ? nbytes - start : CHECKPOINT_CHUNK_SIZE;
+            c++;
+        }
+    }
+    *num_chunks = c;
+    return chunks;
+}
+
+int save_checkpoint(const char *path, char **names, kernel_tensor **ks, size_t n){
+    size_t entries_size = 0;
+    for (size_t i = 0; i < n; i++){
+        entries_size += sizeof(uint64_t) + strlen(names[i]) + 5 * sizeof(uint64_t) + 5 * sizeof(int64_t) + 2 * sizeof(uint64_t);
+    }
+    size_t payload_start = ALIGN_UP(CHECKPOINT_HEADER_SIZE + entries_size, CHECKPOINT_ALIGNMENT);
+
+    //payloads are always stored contiguous, non-contiguous tensors are gathered first
+    kernel_tensor **payloads = (kernel_tensor **) malloc((n + 1) * sizeof(kernel_tensor *));
+    size_t *offsets = (size_t *) malloc((n + 1) * sizeof(size_t));
+    size_t end = payload_start;
+    for (size_t i = 0; i < n; i++){
+        payloads[i] = is_contiguous(ks[i]) ? ks[i] : contiguous_deepcopy_kernel_tensor(ks[i]);
+        offsets[i] = end;
+        end = ALIGN_UP(end + payloads[i]->length * sizeof(lemur_float), CHECKPOINT_ALIGNMENT);
+    }
+
+    char *header = (char *) calloc(payload_start, 1);
+    char *p = header;
+    memcpy(p, CHECKPOINT_MAGIC, 8); p += 8;
+    uint32_t version = CHECKPOINT_VERSION, dtype_size = sizeof(lemur_float);
+    memcpy(p, &version, 4); p += 4;
+    memcpy(p, &dtype_size, 4); p += 4;
+    uint64_t count = n, start = payload_start;
+    memcpy(p, &count, 8); p += 8;
+    memcpy(p, &start, 8);
+    p = header + CHECKPOINT_HEADER_SIZE;
+    for (size_t i = 0; i < n; i++){
+        uint64_t name_length = strlen(names[i]);
+        memcpy(p, &name_length, 8); p += 8;
+        memcpy(p, names[i], name_length); p += name_length;
+        for (size_t d = 0; d < 5; d++){
+            uint64_t dim = payloads[i]->shape[d];
+            memcpy(p, &dim, 8); p += 8;
+        }
+        memcpy(p, payloads[i]->stride, 5 * sizeof(int64_t)); p += 5 * sizeof(int64_t);
+        uint64_t offset = offsets[i], nbytes = payloads[i]->length * sizeof(lemur_float);
+        memcpy(p, &offset, 8); p += 8;
+        memcpy(p, &nbytes, 8); p += 8;
+    }
+
+    int errorval = 0;
+    int fd = open(path, O_WRONLY | O_CREAT | O_TRUNC, 0644);
+    if (fd == -1){
+        perror("Error opening checkpoint for writing");
+        errorval = -1;
+    } else {
+        if ((ftruncate(fd, (off_t) end) != 0) || (write_all(fd, header, payload_start, 0) != 0)){
+            perror("Error writing checkpoint header");
+            errorval = -1;
+        }
+        size_t num_chunks;
+        io_chunk *chunks = make_io_chunks(payloads, n, &num_chunks);
+        #pragma omp parallel for schedule(dynamic)
+        for (size_t c = 0; c < num_chunks; c++){
+            io_chunk ch = chunks[c];
+            const char *src = (const char *) payloads[ch.tensor_idx]->array + ch.start;
+            if (write_all(fd, src, ch.nbytes, offsets[ch.tensor_idx] + ch.start) != 0){
+                #pragma omp atomic write
+                errorval = -1;
+            }
+        }
+        free(chunks);
+        if (close(fd) != 0){
+            errorval = -1;
+        }
+        if (errorval != 0){
+            fprintf(stderr, "Error: failed writing checkpoint '%s'.\n", path);
+        }
+    }
+
+    for (size_t i = 0; i < n; i++){
+        if (payloads[i] != ks[i]){
+            free_kernel_tensor(&payloads[i]);
+        }
+    }
+    free(payloads);
+    free(offsets);
+    free(header);
+    return errorval;
+}
+
+//reads payloads into already allocated contiguous kernel tensors, one pread per chunk in parallel
+int load_checkpoint_payloads(const char *path, kernel_tensor **ks, size_t *offsets, size_t n){
+    int fd = open(path, O_RDONLY);
+    if (fd == -1){
+        perror("Error opening checkpoint for reading");
+        return -1;
+    }
+    int errorval = 0;
+    size_t num_chunks;
+    io_chunk *chunks = make_io_chunks(ks, n, &num_chunks);
+    #pragma omp parallel for schedule(dynamic)
+    for (size_t c = 0; c < num_chunks; c++){
+        io_chunk ch = chunks[c];
+        char *dst = (char *) ks[ch.tensor_idx]->array + ch.start;
+        if (read_all(fd, dst, ch.nbytes, offsets[ch.tensor_idx] + ch.start) != 0){
+            #pragma omp atomic write
+            errorval = -1;
+        }
+    }
+    free(chunks);
+    close(fd);
+    if (errorval != 0){
+        fprintf(stderr, "Error: failed reading checkpoint '%s'.\n", path);
+    }
+    return errorval;
+}
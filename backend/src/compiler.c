@@ -1,4 +1,6 @@
 #include "../include/interface.h"
+#include "../include/graph.h"
+#include "../include/compiler.h"
 
 
 #include <sys/stat.h>
@@ -6,87 +8,1244 @@
 #include <errno.h>
 #include <unistd.h>
 #include <limits.h>
+#include <dlfcn.h>
+#include <pthread.h>
 
-//optimizations should happen at a graph level, 
-//there should be a struct with every tensor that is being used.
+//optimizations happen at a graph level: compile() fuses regions of the graph into generated
+//kernels and compute() (lazy mode) runs whole graphs
 
-//TODO move defs to header
+//lazy mode: kernel_forward only records the expression (shapes are checked and set, nothing is
+//allocated or run) and compute() realizes the graph below a tensor on demand, the frontend calls
+//it on data access, backward() on its root and eager ops on their inputs.
+//with the whole graph at hand compute():
+//  - only runs what the requested tensor depends on, recorded ops nobody reads never run
+//  - runs common subexpressions (same op on the same inputs) once
+//  - releases the intermediates it materialized after their last consumer ran, unless backward
+//    or a view needs them. they become uncomputed again and are recomputed if accessed later
 
-void write_forward(tensor *root_node, char *file_name){
-    (void) root_node; (void) file_name;
+static bool lazy_mode = false;
+
+void set_lazy_mode(bool lazy){
+    lazy_mode = lazy;
+}
+
+bool get_lazy_mode(void){
+    return lazy_mode;
+}
+
+static bool is_pending(tensor *t){
+    return (t->comes_from != NULL) && (t->k->computed == false);
+}
+
+//reduce dims, view shapes and pow exponents are new tiny leaf tensors on every call, they are compared by value
+static bool is_parameter(tensor *t){
+    return (t->comes_from == NULL) && (t->k->computed == true) && (t->k->length <= 5) && is_contiguous(t->k);
+}
+
+//fusion: compile() finds regions of elementwise ops over one shape (broadcast inputs are read
+//with stride 0), optionally closed by a sum or mean, whose intermediates nobody outside the region
+//reads. a region becomes one generated forward loop (every input read once, the output written
+//once) and one backward loop that recomputes the intermediates per element instead of keeping them.
+//the kernels are built into a shared object by the system compiler ($LEMUR_CC, cc by default) and
+//loaded into the process, if that fails the graph just keeps running node by node
+
+#define FUSED_MAX_NODES 64
+#define FUSED_DIR "lemurcompiled" //cache dir when there is no home
+
+static bool is_fusable_elementwise(tensor *t){
+    if ((t->comes_from == NULL) || (t->comes_from->fused != NULL)){
+        return false;
+    }
+    int func = t->comes_from->backward_func;
+    if (func == OP_POW){ //the exponent is baked into the kernels
+        return is_parameter(t->comes_from->t1) && (t->comes_from->t1->k->length == 1);
+    }
+    return (type_table[func] == TYPE_BINARY) || (type_table[func] == TYPE_UNARY);
+}
+
+static bool is_fusable_reduction(tensor *t){
+    if ((t->comes_from == NULL) || (t->comes_from->fused != NULL)){
+        return false;
+    }
+    return (t->comes_from->backward_func == OP_SUM) || (t->comes_from->backward_func == OP_MEAN);
+}
+
+tensor * fused_element_root(fused_group *f){
+    tensor *out = f->nodes[f->num_nodes - 1];
+    return (type_table[out->comes_from->backward_func] == TYPE_REDUCE) ? out->comes_from->t0 : out;
+}
+
+size_t fused_edges_to(fused_group *f, tensor *t, graph *g){
+    size_t count = 0;
+    for (size_t i = 0; i < f->num_nodes; i++){
+        if (graph_index(g, f->nodes[i]) != GRAPH_NOT_FOUND){
+            expression *e = f->nodes[i]->comes_from;
+            count += (size_t) (e->t0 == t) + (size_t) (e->t1 == t);
+        }
+    }
+    return count;
+}
+
+static size_t find_position(tensor **list, size_t n, tensor *t){
+    for (size_t i = 0; i < n; i++){
+        if (list[i] == t){
+            return i;
+        }
+    }
+    return GRAPH_NOT_FOUND;
+}
+
+//operands read per element, reduce dims and pow exponents are not
+static size_t element_operands(tensor *t, tensor *operands[2]){
+    expression *e = t->comes_from;
+    size_t n = 0;
+    if (type_table[e->backward_func] == TYPE_REDUCE){
+        return n;
+    }
+    operands[n++] = e->t0;
+    if (type_table[e->backward_func] == TYPE_BINARY){
+        operands[n++] = e->t1;
+    }
+    return n;
+}
+
+void free_fused_group(fused_group **f_ptr){
+    if ((f_ptr != NULL) && (*f_ptr != NULL)){
+        fused_group *f = *f_ptr;
+        free(f->nodes);
+        free(f->inputs);
+        free(f->input_grad);
+        free(f);
+        *f_ptr = NULL;
+    }
+}
+
+//grows a region from node out of g towards its inputs: an operand joins when it is elementwise,
+//has the region's shape and all of its consumers are already in the region
+static fused_group * find_region(graph *g, size_t *consumers, bool *claimed, size_t out){
+    tensor *t = g->nodes[out];
+    tensor *root = t;
+    if (is_fusable_reduction(t)){
+        root = t->comes_from->t0;
+        size_t r = graph_index(g, root);
+        if ((is_fusable_elementwise(root) == false) || (root->grad != NULL) || claimed[r] || (consumers[r] != 1)){
+            return NULL;
+        }
+    } else if (is_fusable_elementwise(t) == false){
+        return NULL;
+    }
+
+    fused_group *f = (fused_group *) calloc(1, sizeof(fused_group));
+    f->nodes = (tensor **) malloc(FUSED_MAX_NODES * sizeof(tensor *));
+    f->nodes[f->num_nodes++] = t;
+    if (root != t){
+        f->nodes[f->num_nodes++] = root;
+    }
+
+    bool grown = true;
+    while (grown && (f->num_nodes < FUSED_MAX_NODES)){
+        grown = false;
+        for (size_t m = 0; (m < f->num_nodes) && (f->num_nodes < FUSED_MAX_NODES); m++){
+            tensor *operands[2];
+            size_t num_operands = element_operands(f->nodes[m], operands);
+            for (size_t o = 0; (o < num_operands) && (f->num_nodes < FUSED_MAX_NODES); o++){
+                tensor *c = operands[o];
+                size_t idx = graph_index(g, c);
+                if (claimed[idx] || (find_position(f->nodes, f->num_nodes, c) != GRAPH_NOT_FOUND) ||
+                    (is_fusable_elementwise(c) == false) || (c->grad != NULL) ||
+                    (are_shapes_equal(c->k->shape, root->k->shape) == false) ||
+                    (fused_edges_to(f, c, g) != consumers[idx])){
+                    continue;
+                }
+                f->nodes[f->num_nodes++] = c;
+                grown = true;
+            }
+        }
+    }
+    if (f->num_nodes < 2){ //nothing to fuse
+        free_fused_group(&f);
+        return NULL;
+    }
+
+    //topological order
+    for (size_t i = 1; i < f->num_nodes; i++){
+        tensor *c = f->nodes[i];
+        size_t j = i;
+        while ((j > 0) && (graph_index(g, f->nodes[j - 1]) > graph_index(g, c))){
+            f->nodes[j] = f->nodes[j - 1];
+            j--;
+        }
+        f->nodes[j] = c;
+    }
+
+    f->inputs = (tensor **) malloc(2 * f->num_nodes * sizeof(tensor *));
+    f->input_grad = (bool *) malloc(2 * f->num_nodes * sizeof(bool));
+    for (size_t m = 0; m < f->num_nodes; m++){
+        claimed[graph_index(g, f->nodes[m])] = true;
+        tensor *operands[2];
+        size_t num_operands = element_operands(f->nodes[m], operands);
+        for (size_t o = 0; o < num_operands; o++){
+            tensor *c = operands[o];
+            if ((find_position(f->nodes, f->num_nodes, c) == GRAPH_NOT_FOUND) &&
+                (find_position(f->inputs, f->num_inputs, c) == GRAPH_NOT_FOUND)){
+                f->input_grad[f->num_inputs] = c->requires_grad;
+                f->inputs[f->num_inputs++] = c;
+            }
+        }
+    }
+    return f;
+}
+
+//codegen, node j of the region is v<j> (its adjoint g<j>), input k is x<k> (its adjoint gx<k>)
+
+static void operand_name(fused_group *f, tensor *t, bool adjoint, char *name, size_t size){
+    size_t j = find_position(f->nodes, f->num_nodes, t);
+    if (j != GRAPH_NOT_FOUND){
+        snprintf(name, size, "%s%zu", adjoint ? "g" : "v", j);
+    } else {
+        snprintf(name, size, "%s%zu", adjoint ? "gx" : "x", find_position(f->inputs, f->num_inputs, t));
+    }
+}
+
+//the threshold is baked into the source (and so into the cache key): small loops get no omp region
+static bool fused_parallel(size_t shape[5]){
+    return get_alleged_length(shape) > parallel_threshold_table[PARALLEL_FUSED];
+}
+
+static void write_element_loops(FILE *file, size_t shape[5]){
+    if (fused_parallel(shape)){
+        fprintf(file, "    #pragma omp parallel for collapse(4)\n");
+    }
+    for (size_t d = 0; d < 4; d++){
+        fprintf(file, "    for (size_t d%zu = 0; d%zu < %zu; d%zu++)%s\n", d, d, shape[d], d, (d == 3) ? "{" : "");
+    }
+    fprintf(file, "        #pragma omp simd\n");
+    fprintf(file, "        for (size_t d4 = 0; d4 < %zu; d4++){\n", shape[4]);
+    fprintf(file, "            const size_t o = (((d0 * %zu + d1) * %zu + d2) * %zu + d3) * %zu + d4;\n",
+            shape[1], shape[2], shape[3], shape[4]);
+}
+
+//offset into the output of a reduction, only its kept dims are walked
+static void write_reduced_offset(FILE *file, fused_group *f){
+    kernel_tensor *out = f->nodes[f->num_nodes - 1]->k;
+    for (size_t d = 0; d < 5; d++){
+        if (out->shape[d] > 1){
+            fprintf(file, "d%zu * %lld + ", d, (long long) out->stride[d]);
+        }
+    }
+    fprintf(file, "0");
+}
+
+static void write_loads_and_values(FILE *file, fused_group *f, size_t shape[5]){
+    for (size_t k = 0; k < f->num_inputs; k++){
+        kernel_tensor *in = f->inputs[k]->k;
+        fprintf(file, "            const lemur_float x%zu = in%zu[", k, k);
+        for (size_t d = 0; d < 5; d++){
+            if ((shape[d] > 1) && (in->shape[d] > 1)){ //broadcast dims are read with stride 0
+                fprintf(file, "d%zu * %lld + ", d, (long long) in->stride[d]);
+            }
+        }
+        fprintf(file, "0];\n");
+    }
+    for (size_t j = 0; j < f->num_nodes; j++){
+        expression *e = f->nodes[j]->comes_from;
+        char a[32], b[32];
+        tensor *operands[2];
+        size_t num_operands = element_operands(f->nodes[j], operands);
+        if (num_operands == 0){
+            continue;
+        }
+        operand_name(f, operands[0], false, a, sizeof(a));
+        if (num_operands == 2){
+            operand_name(f, operands[1], false, b, sizeof(b));
+        }
+        double c = (double) e->scalar;
+        fprintf(file, "            const lemur_float v%zu = ", j);
+        switch (e->backward_func){
+            case OP_ADD:        fprintf(file, "%s + %s", a, b); break;
+            case OP_SUB:        fprintf(file, "%s - %s", a, b); break;
+            case OP_MUL:        fprintf(file, "%s * %s", a, b); break;
+            case OP_DIVISION:   fprintf(file, "%s / %s", a, b); break;
+            case OP_EQ:         fprintf(file, "(%s == %s) ? 1.0f : 0.0f", a, b); break;
+            case OP_POW:        fprintf(file, "powf(%s, (lemur_float) %a)", a, (double) e->t1->k->array[0]); break;
+            case OP_RELU:       fprintf(file, "(%s > 0.0f) ? %s : 0.0f", a, a); break;
+            case OP_SIGMOID:    fprintf(file, "1.0f / (1.0f + expf(-%s))", a); break;
+            case OP_EXP:        fprintf(file, "expf(%s)", a); break;
+            case OP_LOG:        fprintf(file, "logf(%s)", a); break;
+            case OP_NEG:        fprintf(file, "-%s", a); break;
+            case OP_SQRT:       fprintf(file, "sqrtf(%s)", a); break;
+            case OP_ABS:        fprintf(file, "fabsf(%s)", a); break;
+            case OP_SIGN:       fprintf(file, "(lemur_float) ((%s > 0.0f) - (%s < 0.0f))", a, a); break;
+            case OP_RECIPROCAL: fprintf(file, "1.0f / %s", a); break;
+            case OP_ADD_SCALAR: fprintf(file, "%s + (lemur_float) %a", a, c); break;
+            case OP_MUL_SCALAR: fprintf(file, "%s * (lemur_float) %a", a, c); break;
+            case OP_DIV_SCALAR: fprintf(file, "%s / (lemur_float) %a", a, c); break;
+            case OP_RSUB_SCALAR: fprintf(file, "(lemur_float) %a - %s", c, a); break;
+            case OP_RDIV_SCALAR: fprintf(file, "(lemur_float) %a / %s", c, a); break;
+            case OP_POW_SCALAR: fprintf(file, "powf(%s, (lemur_float) %a)", a, c); break;
+            case OP_RPOW_SCALAR: fprintf(file, "powf((lemur_float) %a, %s)", c, a); break;
+            default:            fprintf(file, "%s", a); break; //contiguous
+        }
+        fprintf(file, ";\n");
+    }
 }
 
-void write_backward(tensor *root_node, char *file_name){
-    (void) root_node; (void) file_name;
+//adds the contribution of node j to the adjoints of its operands, same formulas as the kernels
+static void write_adjoint(FILE *file, fused_group *f, size_t j){
+    expression *e = f->nodes[j]->comes_from;
+    char a[32], b[32], ga[32], gb[32];
+    tensor *operands[2];
+    size_t num_operands = element_operands(f->nodes[j], operands);
+    if (num_operands == 0){
+        return;
+    }
+    operand_name(f, operands[0], false, a, sizeof(a));
+    operand_name(f, operands[0], true, ga, sizeof(ga));
+    if (num_operands == 2){
+        operand_name(f, operands[1], false, b, sizeof(b));
+        operand_name(f, operands[1], true, gb, sizeof(gb));
+    }
+    double x = (e->backward_func == OP_POW) ? (double) e->t1->k->array[0] : 0.0;
+    double c = (double) e->scalar;
+    fprintf(file, "            ");
+    switch (e->backward_func){
+        case OP_ADD:        fprintf(file, "%s += g%zu; %s += g%zu;", ga, j, gb, j); break;
+        case OP_SUB:        fprintf(file, "%s += g%zu; %s -= g%zu;", ga, j, gb, j); break;
+        case OP_MUL:        fprintf(file, "%s += g%zu * %s; %s += g%zu * %s;", ga, j, b, gb, j, a); break;
+        case OP_DIVISION:   fprintf(file, "%s += g%zu / %s; %s -= g%zu * v%zu / %s;", ga, j, b, gb, j, j, b); break;
+        case OP_POW:        fprintf(file, "%s += g%zu * (lemur_float) %a * powf(%s, (lemur_float) %a);", ga, j, x, a, x - 1.0); break;
+        case OP_RELU:       fprintf(file, "%s += (v%zu == 0.0f) ? 0.0f : g%zu;", ga, j, j); break;
+        case OP_SIGMOID:    fprintf(file, "%s += g%zu * v%zu * (1.0f - v%zu);", ga, j, j, j); break;
+        case OP_EXP:        fprintf(file, "%s += g%zu * v%zu;", ga, j, j); break;
+        case OP_LOG:        fprintf(file, "%s += g%zu / %s;", ga, j, a); break;
+        case OP_NEG:        fprintf(file, "%s -= g%zu;", ga, j); break;
+        case OP_SQRT:       fprintf(file, "%s += g%zu / (2.0f * v%zu);", ga, j, j); break;
+        case OP_ABS:        fprintf(file, "%s += g%zu * (%s / fabsf(%s));", ga, j, a, a); break;
+        case OP_RECIPROCAL: fprintf(file, "%s += g%zu * -(v%zu * v%zu);", ga, j, j, j); break;
+        case OP_CONTIGUOUS: fprintf(file, "%s += g%zu;", ga, j); break;
+        case OP_ADD_SCALAR: fprintf(file, "%s += g%zu;", ga, j); break;
+        case OP_MUL_SCALAR: fprintf(file, "%s += g%zu * (lemur_float) %a;", ga, j, c); break;
+        case OP_DIV_SCALAR: fprintf(file, "%s += g%zu / (lemur_float) %a;", ga, j, c); break;
+        case OP_RSUB_SCALAR: fprintf(file, "%s -= g%zu;", ga, j); break;
+        case OP_RDIV_SCALAR: fprintf(file, "%s -= g%zu * v%zu / %s;", ga, j, j, a); break;
+        case OP_POW_SCALAR: fprintf(file, "%s += g%zu * (lemur_float) %a * powf(%s, (lemur_float) %a);", ga, j, c, a, c - 1.0); break;
+        case OP_RPOW_SCALAR: fprintf(file, "%s += g%zu * v%zu * (lemur_float) %a;", ga, j, j, (double) logf(e->scalar)); break;
+        default:            break; //eq and sign have no gradient
+    }
+    fprintf(file, "\n");
+}
+
+static double reduction_scale(fused_group *f){
+    tensor *out = f->nodes[f->num_nodes - 1];
+    if (out->comes_from->backward_func != OP_MEAN){
+        return 1.0;
+    }
+    return 1.0 / (double) (get_alleged_length(fused_element_root(f)->k->shape) / out->k->length);
 }
 
-void dynamic_compile(char *file_name) {
-    char command[1024];
-    char cwd[PATH_MAX];
+static void write_forward(FILE *file, fused_group *f, size_t id){
+    tensor *out = f->nodes[f->num_nodes - 1];
+    tensor *root = fused_element_root(f);
+    size_t *shape = root->k->shape;
+    size_t r = find_position(f->nodes, f->num_nodes, root);
 
-    if (getcwd(cwd, sizeof(cwd)) == NULL) {
-        perror("Error getting current working directory");
+    fprintf(file, "\nvoid lemur_fused_forward_%zu(lemur_float *restrict out, lemur_float *const *restrict in){\n", id);
+    for (size_t k = 0; k < f->num_inputs; k++){
+        fprintf(file, "    const lemur_float *restrict in%zu = in[%zu];\n", k, k);
+    }
+    if (out == root){
+        write_element_loops(file, shape);
+        write_loads_and_values(file, f, shape);
+        fprintf(file, "            out[o] = v%zu;\n        }\n    }\n}\n", r);
         return;
     }
 
-    char abs_file_path[PATH_MAX];
-    snprintf(abs_file_path, sizeof(abs_file_path), "%s/%s", cwd, file_name);
+    //reductions accumulate in double, the kept dims are the parallel loops
+    lemur_float *dims = out->comes_from->t1->k->array;
+    bool parallel = fused_parallel(shape);
+    size_t kept[5], reduced[5], num_kept = 0, num_reduced = 0;
+    for (size_t d = 0; d < 5; d++){
+        if ((size_t) dims[d] == 1){
+            kept[num_kept++] = d;
+        } else {
+            reduced[num_reduced++] = d;
+        }
+    }
+    if (num_kept == 0){
+        fprintf(file, "    double acc = 0.0;\n");
+        fprintf(file, "    #pragma omp %ssimd collapse(5) reduction(+:acc)\n", parallel ? "parallel for " : "");
+        for (size_t d = 0; d < 5; d++){
+            fprintf(file, "    for (size_t d%zu = 0; d%zu < %zu; d%zu++)%s\n", d, d, shape[d], d, (d == 4) ? "{" : "");
+        }
+        write_loads_and_values(file, f, shape);
+        fprintf(file, "            acc += v%zu;\n    }\n", r);
+        fprintf(file, "    out[0] = (lemur_float) (acc * %a);\n}\n", reduction_scale(f));
+        return;
+    }
+    if (parallel){
+        fprintf(file, "    #pragma omp parallel for collapse(%zu)\n", num_kept);
+    }
+    for (size_t i = 0; i < num_kept; i++){
+        size_t d = kept[i];
+        fprintf(file, "    for (size_t d%zu = 0; d%zu < %zu; d%zu++)%s\n", d, d, shape[d], d, (i == num_kept - 1) ? "{" : "");
+    }
+    fprintf(file, "        double acc = 0.0;\n");
+    for (size_t i = 0; i < num_reduced; i++){
+        size_t d = reduced[i];
+        if (i == num_reduced - 1){
+            fprintf(file, "        #pragma omp simd reduction(+:acc)\n");
+        }
+        fprintf(file, "        for (size_t d%zu = 0; d%zu < %zu; d%zu++)%s\n", d, d, shape[d], d, (i == num_reduced - 1) ? "{" : "");
+    }
+    write_loads_and_values(file, f, shape);
+    fprintf(file, "            acc += v%zu;\n", r);
+    if (num_reduced > 0){
+        fprintf(file, "        }\n");
+    }
+    fprintf(file, "        out[");
+    write_reduced_offset(file, f);
+    fprintf(file, "] = (lemur_float) (acc * %a);\n    }\n}\n", reduction_scale(f));
+}
 
-    snprintf(command, sizeof(command),
-             "clang -o %s.out %s "
-             "-L%s/.. -llightlemur -lm "
-             "-L/opt/homebrew/opt/libomp/lib -lomp "
-             "-I/opt/homebrew/opt/libomp/include -I%s/backend/include",
-             abs_file_path, abs_file_path, cwd, cwd);
-    // printf("%s\n",command);
-    int result = system(command);
+//gradients are written for the element shape, broadcast inputs are reduced by the caller
+static void write_backward(FILE *file, fused_group *f, size_t id){
+    tensor *out = f->nodes[f->num_nodes - 1];
+    tensor *root = fused_element_root(f);
+    size_t *shape = root->k->shape;
+    size_t r = find_position(f->nodes, f->num_nodes, root);
 
-    if (result != 0) {
-        fprintf(stderr, "Error: Compilation failed for file '%s'.\n", file_name);
+    fprintf(file, "\nvoid lemur_fused_backward_%zu(const lemur_float *restrict seed, lemur_float *const *restrict in, "
+                  "lemur_float *const *restrict grad){\n", id);
+    for (size_t k = 0; k < f->num_inputs; k++){
+        fprintf(file, "    const lemur_float *restrict in%zu = in[%zu];\n", k, k);
+        if (f->input_grad[k] == true){
+            fprintf(file, "    lemur_float *restrict gr%zu = grad[%zu];\n", k, k);
+        }
+    }
+    write_element_loops(file, shape);
+    write_loads_and_values(file, f, shape);
+    for (size_t j = 0; j < r; j++){
+        fprintf(file, "            lemur_float g%zu = 0.0f;\n", j);
+    }
+    for (size_t k = 0; k < f->num_inputs; k++){
+        fprintf(file, "            lemur_float gx%zu = 0.0f;\n", k);
+    }
+    if (out == root){
+        fprintf(file, "            const lemur_float g%zu = seed[o];\n", r);
     } else {
-        printf("Compilation succeeded for file '%s'.\n", file_name);
+        fprintf(file, "            const lemur_float g%zu = seed[", r);
+        write_reduced_offset(file, f);
+        fprintf(file, "] * (lemur_float) %a;\n", reduction_scale(f));
+    }
+    for (size_t j = r + 1; j-- > 0;){
+        write_adjoint(file, f, j);
     }
+    for (size_t k = 0; k < f->num_inputs; k++){
+        if (f->input_grad[k] == true){
+            fprintf(file, "            gr%zu[o] = gx%zu;\n", k, k);
+        }
+    }
+    fprintf(file, "        }\n    }\n}\n");
+}
+
+//built kernels are cached on disk under a hash of the generated source, the compiler command and
+//the target cpu -march=native resolves to, so an identical graph (same ops, shapes, strides and constants) in this or any later process
+//reuses one shared object. a missing one is built on a background thread, until it is loaded the
+//regions run node by node
+
+enum {
+    LIBRARY_BUILDING = 0,
+    LIBRARY_READY,
+    LIBRARY_FAILED,
+};
+
+struct fused_library {
+    uint64_t key;
+    int state;
+    size_t num_regions;
+    fused_forward_func *forward;
+    fused_backward_func *backward;
+    char source[PATH_MAX];
+    char path[PATH_MAX];
+    struct fused_library *next;
+};
+
+static pthread_mutex_t library_lock = PTHREAD_MUTEX_INITIALIZER;
+static pthread_cond_t library_built = PTHREAD_COND_INITIALIZER;
+static fused_library *libraries = NULL; //loaded or building, never unloaded
+static size_t num_building = 0;
+static char cache_dir[PATH_MAX] = "";
+
+void set_kernel_cache_dir(const char *path){
+    pthread_mutex_lock(&library_lock);
+    snprintf(cache_dir, sizeof(cache_dir), "%s", (path != NULL) ? path : "");
+    pthread_mutex_unlock(&library_lock);
 }
 
-void create_directory_and_file(char *dir_name, char *file_name) {
-    struct stat st = {0};
-    if (stat(dir_name, &st) == -1) {
-        if (mkdir(dir_name, 0755) == 0) {
-            printf("Directory '%s' created successfully.\n", dir_name);
+//$LEMUR_CACHE_DIR, then $XDG_CACHE_HOME/lemur, then ~/.cache/lemur, called with library_lock held
+static const char * kernel_cache_dir(void){
+    if (cache_dir[0] == '\0'){
+        const char *env;
+        if ((env = getenv("LEMUR_CACHE_DIR")) != NULL){
+            snprintf(cache_dir, sizeof(cache_dir), "%s", env);
+        } else if ((env = getenv("XDG_CACHE_HOME")) != NULL){
+            snprintf(cache_dir, sizeof(cache_dir), "%s/lemur", env);
+        } else if ((env = getenv("HOME")) != NULL){
+            snprintf(cache_dir, sizeof(cache_dir), "%s/.cache/lemur", env);
         } else {
+            snprintf(cache_dir, sizeof(cache_dir), "%s", FUSED_DIR);
+        }
+    }
+    return cache_dir;
+}
+
+const char * get_kernel_cache_dir(void){
+    pthread_mutex_lock(&library_lock);
+    const char *dir = kernel_cache_dir();
+    pthread_mutex_unlock(&library_lock);
+    return dir;
+}
+
+bool create_directories(const char *dir_name){
+    char path[PATH_MAX];
+    snprintf(path, sizeof(path), "%s", dir_name);
+    for (char *p = path + 1; ; p++){
+        if ((*p != '/') && (*p != '\0')){
+            continue;
+        }
+        char c = *p;
+        *p = '\0';
+        if ((mkdir(path, 0755) != 0) && (errno != EEXIST)){
             perror("Error creating directory");
+            return false;
+        }
+        *p = c;
+        if (c == '\0'){
+            return true;
+        }
+    }
+}
+
+static void compile_command(char *command, size_t size, const char *library, const char *source){
+    const char *cc = getenv("LEMUR_CC");
+#ifdef __APPLE__
+    snprintf(command, size,
+             "%s -O3 -march=native -ffast-math -Xpreprocessor -fopenmp -I/opt/homebrew/opt/libomp/include "
+             "-fPIC -shared -o '%s' '%s' -L/opt/homebrew/opt/libomp/lib -lomp -lm",
+             (cc != NULL) ? cc : "cc", library, source);
+#else
+    snprintf(command, size,
+             "%s -O3 -march=native -ffast-math -fopenmp -fPIC -shared -o '%s' '%s' -lm",
+             (cc != NULL) ? cc : "cc", library, source);
+#endif
+}
+
+static uint64_t fnv1a(uint64_t h, const char *data, size_t length){
+    for (size_t i = 0; i < length; i++){
+        h ^= (unsigned char) data[i];
+        h *= 0x100000001B3ULL;
+    }
+    return h;
+}
+
+//the macros the compiler predefines under -march=native name the isa extensions of this cpu, a cache
+//shared between machines never hands one a library built for another
+static uint64_t target_hash = 0;
+
+static void hash_target(void){
+    const char *cc = getenv("LEMUR_CC");
+    char command[PATH_MAX];
+    snprintf(command, sizeof(command), "%s -march=native -dM -E -x c /dev/null 2>/dev/null", (cc != NULL) ? cc : "cc");
+    uint64_t h = 0xCBF29CE484222325ULL;
+    FILE *out = popen(command, "r");
+    if (out != NULL){
+        char line[512];
+        while (fgets(line, sizeof(line), out) != NULL){
+            h = fnv1a(h, line, strlen(line));
         }
+        pclose(out);
     }
-    FILE *file = fopen(file_name, "w");
-    if (file == NULL) {
+    target_hash = h;
+}
+
+static bool load_library(fused_library *lib){
+    void *handle = dlopen(lib->path, RTLD_NOW | RTLD_LOCAL);
+    if (handle == NULL){
+        fprintf(stderr, "Error: %s\n", dlerror());
+        return false;
+    }
+    for (size_t r = 0; r < lib->num_regions; r++){
+        char symbol[64];
+        snprintf(symbol, sizeof(symbol), "lemur_fused_forward_%zu", r);
+        lib->forward[r] = (fused_forward_func) dlsym(handle, symbol);
+        snprintf(symbol, sizeof(symbol), "lemur_fused_backward_%zu", r);
+        lib->backward[r] = (fused_backward_func) dlsym(handle, symbol);
+        if ((lib->forward[r] == NULL) || (lib->backward[r] == NULL)){
+            fprintf(stderr, "Error: %s\n", dlerror());
+            return false;
+        }
+    }
+    return true;
+}
+
+//builds into a private file and renames it, other processes never see a partial library
+static void * build_library(void *arg){
+    fused_library *lib = (fused_library *) arg;
+    char tmp[PATH_MAX + 32], command[3 * PATH_MAX];
+    snprintf(tmp, sizeof(tmp), "%s.%ld.tmp", lib->path, (long) getpid());
+    compile_command(command, sizeof(command), tmp, lib->source);
+
+    int state = LIBRARY_FAILED;
+    if (system(command) != 0){
+        fprintf(stderr, "Error: Compilation failed for file '%s'.\n", lib->source);
+    } else if (rename(tmp, lib->path) != 0){
+        perror("Error moving compiled library");
+    } else if (load_library(lib)){
+        state = LIBRARY_READY;
+    }
+    remove(tmp);
+
+    pthread_mutex_lock(&library_lock);
+    __atomic_store_n(&lib->state, state, __ATOMIC_RELEASE);
+    num_building--;
+    pthread_cond_broadcast(&library_built);
+    pthread_mutex_unlock(&library_lock);
+    return NULL;
+}
+
+static bool write_source(const char *path, const char *source, size_t length){
+    char tmp[PATH_MAX + 32];
+    snprintf(tmp, sizeof(tmp), "%s.%ld.tmp", path, (long) getpid());
+    FILE *file = fopen(tmp, "w");
+    if (file == NULL){
         perror("Error creating file");
-        return;
+        return false;
     }
-    fprintf(file, "#include \"../backend/include/interface.h\"\n");
-    fprintf(file, "\nint main(){\n\treturn 0;\n}\n");
-    if (fclose(file) == 0) {
-        printf("File '%s' created successfully.\n", file_name);
+    bool written = (fwrite(source, 1, length, file) == length);
+    if ((fclose(file) != 0) || (written == false) || (rename(tmp, path) != 0)){
+        perror("Error writing file");
+        remove(tmp);
+        return false;
+    }
+    return true;
+}
+
+//the library of the generated source, loaded from the cache or being built
+static fused_library * get_library(const char *source, size_t length, size_t num_regions){
+    char flags[3 * PATH_MAX];
+    compile_command(flags, sizeof(flags), "", "");
+    static pthread_once_t target_once = PTHREAD_ONCE_INIT;
+    pthread_once(&target_once, hash_target);
+    uint64_t key = fnv1a(fnv1a(target_hash, source, length), flags, strlen(flags));
+
+    pthread_mutex_lock(&library_lock);
+    fused_library *lib = libraries;
+    while ((lib != NULL) && ((lib->key != key) || (lib->num_regions != num_regions))){
+        lib = lib->next;
+    }
+    if (lib != NULL){
+        pthread_mutex_unlock(&library_lock);
+        return lib;
+    }
+
+    const char *dir = kernel_cache_dir();
+    if (create_directories(dir) == false){
+        pthread_mutex_unlock(&library_lock);
+        return NULL;
+    }
+    lib = (fused_library *) calloc(1, sizeof(fused_library));
+    lib->key = key;
+    lib->num_regions = num_regions;
+    lib->forward = (fused_forward_func *) calloc(num_regions, sizeof(fused_forward_func));
+    lib->backward = (fused_backward_func *) calloc(num_regions, sizeof(fused_backward_func));
+    snprintf(lib->source, sizeof(lib->source), "%s/%016llx.c", dir, (unsigned long long) key);
+    snprintf(lib->path, sizeof(lib->path), "%s/%016llx.so", dir, (unsigned long long) key);
+
+    if ((access(lib->path, R_OK) == 0) && load_library(lib)){
+        lib->state = LIBRARY_READY;
+    } else if (write_source(lib->source, source, length)){
+        pthread_t thread;
+        pthread_attr_t attr;
+        pthread_attr_init(&attr);
+        pthread_attr_setdetachstate(&attr, PTHREAD_CREATE_DETACHED);
+        static bool registered = false;
+        if (registered == false){ //builds in flight finish before exit, the next run finds them cached
+            atexit(compile_wait);
+            registered = true;
+        }
+        lib->state = LIBRARY_BUILDING;
+        num_building++;
+        if (pthread_create(&thread, &attr, build_library, lib) != 0){
+            fprintf(stderr, "Error: could not start the compiler thread\n");
+            lib->state = LIBRARY_FAILED;
+            num_building--;
+        }
+        pthread_attr_destroy(&attr);
     } else {
-        perror("Error closing file");
+        lib->state = LIBRARY_FAILED;
+    }
+    lib->next = libraries;
+    libraries = lib;
+    pthread_mutex_unlock(&library_lock);
+    return lib;
+}
+
+bool fused_kernels_ready(fused_group *f){
+    if (f->forward != NULL){
+        return true;
+    }
+    if (f->library == NULL){
+        return false;
+    }
+    int state = __atomic_load_n(&f->library->state, __ATOMIC_ACQUIRE);
+    if (state == LIBRARY_READY){
+        f->forward = f->library->forward[f->index];
+        f->backward = f->library->backward[f->index];
+    } else if (state == LIBRARY_FAILED){
+        f->library = NULL;
     }
+    return f->forward != NULL;
 }
 
+void compile_wait(void){
+    pthread_mutex_lock(&library_lock);
+    while (num_building > 0){
+        pthread_cond_wait(&library_built, &library_lock);
+    }
+    pthread_mutex_unlock(&library_lock);
+}
 
+//attaches fused kernels to the outputs of the regions below root_node, running the graph
+//(compute() in lazy mode, backward()) picks them up once they are loaded, compile_wait() blocks
+//until then. recompiling a graph keeps its regions
 void compile(tensor *root_node){
+    if (root_node == NULL){
+        return;
+    }
+    graph *g = build_graph(root_node, GRAPH_ALL);
+    size_t n = g->num_nodes;
+    size_t *consumers = (size_t *) malloc(n * sizeof(size_t));
+    bool *claimed = (bool *) calloc(n, sizeof(bool));
+    fused_group **regions = (fused_group **) malloc(n * sizeof(fused_group *));
+    size_t num_regions = 0;
+
+    graph_count_consumers(g, consumers);
+    for (size_t i = 0; i < n; i++){
+        fused_group *f = (g->nodes[i]->comes_from != NULL) ? g->nodes[i]->comes_from->fused : NULL;
+        for (size_t m = 0; (f != NULL) && (m < f->num_nodes); m++){
+            size_t idx = graph_index(g, f->nodes[m]);
+            if (idx != GRAPH_NOT_FOUND){
+                claimed[idx] = true;
+            }
+        }
+    }
+    //outputs first so regions are as large as possible
+    for (size_t i = n; i-- > 0;){
+        if (claimed[i] == false){
+            fused_group *f = find_region(g, consumers, claimed, i);
+            if (f != NULL){
+                regions[num_regions++] = f;
+            }
+        }
+    }
+
+    fused_library *lib = NULL;
+    if (num_regions > 0){
+        char *source = NULL;
+        size_t length = 0;
+        FILE *file = open_memstream(&source, &length);
+        fprintf(file, "//generated by lemur compile()\n#include <stddef.h>\n#include <math.h>\n\ntypedef float lemur_float;\n");
+        for (size_t r = 0; r < num_regions; r++){
+            write_forward(file, regions[r], r);
+            write_backward(file, regions[r], r);
+        }
+        fclose(file);
+        lib = get_library(source, length, num_regions);
+        free(source);
+    }
+    for (size_t r = 0; r < num_regions; r++){
+        if (lib == NULL){
+            free_fused_group(&regions[r]);
+            continue;
+        }
+        regions[r]->library = lib;
+        regions[r]->index = r;
+        fused_kernels_ready(regions[r]);
+        regions[r]->nodes[regions[r]->num_nodes - 1]->comes_from->fused = regions[r];
+    }
+    free(regions);
+    free(claimed);
+    free(consumers);
+    free_graph(&g);
+}
+
+static uint64_t hash_combine(uint64_t h, uint64_t x){
+    return h ^ (x + 0x9E3779B97F4A7C15ULL + (h << 6) + (h >> 2));
+}
+
+//operands of the graph are replaced by the representative of their common subexpression
+static tensor * cse_operand(graph *g, size_t *rep, tensor *t){
+    size_t idx = (t != NULL) ? graph_index(g, t) : GRAPH_NOT_FOUND;
+    return (idx == GRAPH_NOT_FOUND) ? t : g->nodes[rep[idx]];
+}
+
+static uint64_t operand_hash(tensor *t){
+    if (t == NULL){
+        return 0;
+    }
+    if (is_parameter(t) == false){
+        return (uint64_t) (uintptr_t) t;
+    }
+    uint64_t h = t->k->length;
+    for (size_t i = 0; i < t->k->length; i++){
+        uint32_t bits;
+        memcpy(&bits, &t->k->array[i], sizeof(bits));
+        h = hash_combine(h, bits);
+    }
+    return h;
+}
 
-    //gets root node and generates a file named <root_node ptr val>.c in the compiled folder
-    char *dir_name = "../lemurcompiled";
-    char file_name[1024];
-    snprintf(file_name, sizeof(file_name), "%s/%p.c", dir_name, (void *)root_node);
-    create_directory_and_file(dir_name, file_name);
+static bool operand_equal(tensor *a, tensor *b){
+    if (a == b){
+        return true;
+    }
+    if ((a == NULL) || (b == NULL) || (is_parameter(a) == false) || (is_parameter(b) == false)){
+        return false;
+    }
+    return are_shapes_equal(a->k->shape, b->k->shape) &&
+           (memcmp(a->k->array, b->k->array, a->k->length * sizeof(lemur_float)) == 0);
+}
 
-    write_forward(root_node, file_name);
+//rep[i] is the first node computing the same op on the same operands as node i (i itself if none)
+static void find_common_subexpressions(graph *g, size_t *rep, bool *exclude){
+    size_t n = g->num_nodes;
+    size_t capacity = 16;
+    while (capacity < 2 * n){
+        capacity *= 2;
+    }
+    size_t *table = (size_t *) calloc(capacity, sizeof(size_t)); //node index + 1, 0 is empty
 
-    write_backward(root_node, file_name);
+    for (size_t i = 0; i < n; i++){
+        rep[i] = i;
+        tensor *t = g->nodes[i];
+        if ((is_pending(t) == false) || exclude[i] || (type_table[t->comes_from->backward_func] == TYPE_SHAPE)){
+            continue; //views are free, fused regions are not single ops
+        }
+        int func = t->comes_from->backward_func;
+        tensor *t0 = cse_operand(g, rep, t->comes_from->t0);
+        tensor *t1 = cse_operand(g, rep, t->comes_from->t1);
+        uint32_t scalar;
+        memcpy(&scalar, &t->comes_from->scalar, sizeof(scalar));
+        uint64_t h = hash_combine(hash_combine(hash_combine((uint64_t) func, operand_hash(t0)), operand_hash(t1)), scalar);
+        size_t slot = (size_t) h & (capacity - 1);
+        while (table[slot] != 0){
+            tensor *c = g->nodes[table[slot] - 1];
+            if ((c->comes_from->backward_func == func) &&
+                (memcmp(&c->comes_from->scalar, &t->comes_from->scalar, sizeof(lemur_float)) == 0) &&
+                operand_equal(cse_operand(g, rep, c->comes_from->t0), t0) &&
+                operand_equal(cse_operand(g, rep, c->comes_from->t1), t1)){
+                rep[i] = table[slot] - 1;
+                break;
+            }
+            slot = (slot + 1) & (capacity - 1);
+        }
+        if (rep[i] == i){
+            table[slot] = i + 1;
+        }
+    }
+    free(table);
+}
 
-    dynamic_compile(file_name);
+static void release_node(tensor *t){
+    if (t->k->computed == false){
+        return;
+    }
+    if (t->k->shallow == false){ //otherwise borrowed from its representative
+        lemur_free(t->k->array, t->k->length);
+    }
+    t->k->array = NULL;
+    t->k->shallow = false;
+    t->k->computed = false;
 }
 
-void compute(){
+//the kernel of a fused region runs instead of its nodes when its inputs are available and no node
+//inside the region is read by anything else in this graph
+static bool use_fused_forward(graph *g, size_t *consumers, tensor *t){
+    fused_group *f = t->comes_from->fused;
+    if ((f == NULL) || (fused_kernels_ready(f) == false)){
+        return false;
+    }
+    for (size_t k = 0; k < f->num_inputs; k++){
+        if ((f->inputs[k]->k->computed == false) && (graph_index(g, f->inputs[k]) == GRAPH_NOT_FOUND)){
+            return false;
+        }
+    }
+    for (size_t m = 0; m + 1 < f->num_nodes; m++){
+        size_t idx = graph_index(g, f->nodes[m]);
+        if ((idx != GRAPH_NOT_FOUND) && (consumers[idx] != fused_edges_to(f, f->nodes[m], g))){
+            return false;
+        }
+    }
+    return true;
+}
+
+//what node t reads, the inputs of its region when it runs fused
+static size_t node_operands(tensor *t, bool fused, tensor ***operands, tensor *pair[2]){
+    if (fused == true){
+        *operands = t->comes_from->fused->inputs;
+        return t->comes_from->fused->num_inputs;
+    }
+    pair[0] = t->comes_from->t0;
+    pair[1] = t->comes_from->t1;
+    *operands = pair;
+    return 2;
+}
+
+static void run_fused_forward(tensor *t, lemur_float *out){
+    fused_group *f = t->comes_from->fused;
+    lemur_float **in = (lemur_float **) malloc(f->num_inputs * sizeof(lemur_float *));
+    for (size_t k = 0; k < f->num_inputs; k++){
+        in[k] = f->inputs[k]->k->array;
+    }
+    t->k->array = out;
+    if (profile_enabled){
+        double start = omp_get_wtime();
+        f->forward(t->k->array, in);
+        size_t bytes = t->k->length;
+        for (size_t k = 0; k < f->num_inputs; k++){
+            bytes += f->inputs[k]->k->length;
+        }
+        kernel_tensor *k1 = (f->num_inputs > 1) ? f->inputs[1]->k : NULL;
+        profile_record(PROFILE_FUSED, false, start, t->k, f->inputs[0]->k, k1, bytes * sizeof(lemur_float));
+    } else {
+        f->forward(t->k->array, in);
+    }
+    t->k->computed = true;
+    free(in);
+}
+
+//how compute() runs the graph below a tensor: which nodes run fused, which are skipped or
+//duplicates, and the liveness that decides when an intermediate is released
+typedef struct schedule {
+    graph *g;
+    size_t *rep;
+    size_t *last_use;
+    bool *keep;
+    bool *fused;
+    bool *skip; //inside a fused region, never materialized
+} schedule;
+
+static schedule make_schedule(tensor *t){
+    schedule s;
+    s.g = build_graph(t, GRAPH_UNCOMPUTED);
+    graph *g = s.g;
+    size_t n = g->num_nodes;
+    s.rep = (size_t *) malloc(n * sizeof(size_t));
+    s.last_use = (size_t *) calloc(n, sizeof(size_t));
+    s.keep = (bool *) calloc(n, sizeof(bool));
+    s.fused = (bool *) calloc(n, sizeof(bool));
+    s.skip = (bool *) calloc(n, sizeof(bool));
+    size_t *consumers = (size_t *) malloc(n * sizeof(size_t));
+    bool *exclude = (bool *) calloc(n, sizeof(bool));
+
+    graph_count_consumers(g, consumers);
+    for (size_t i = 0; i < n; i++){
+        if (is_pending(g->nodes[i]) && use_fused_forward(g, consumers, g->nodes[i])){
+            fused_group *f = g->nodes[i]->comes_from->fused;
+            s.fused[i] = true;
+            for (size_t m = 0; m + 1 < f->num_nodes; m++){
+                size_t idx = graph_index(g, f->nodes[m]);
+                if (idx != GRAPH_NOT_FOUND){
+                    s.skip[idx] = true;
+                }
+            }
+        }
+    }
+    for (size_t i = 0; i < n; i++){
+        exclude[i] = s.fused[i] || s.skip[i];
+    }
+
+    find_common_subexpressions(g, s.rep, exclude);
 
-}
\ No newline at end of file
+    //liveness, a duplicate is a use of its representative.
+    //backward reads the inputs of nodes that require grad and views share their input's memory
+    for (size_t i = 0; i < n; i++){
+        tensor *c = g->nodes[i];
+        if (is_pending(c) == false){
+            s.keep[i] = true;
+            continue;
+        }
+        if (s.skip[i] == true){
+            continue;
+        }
+        if ((c->requires_grad == true) || (c->grad != NULL) || (type_table[c->comes_from->backward_func] == TYPE_SHAPE)){
+            s.keep[i] = true; //views cost nothing to keep
+        }
+        bool pins = (c->requires_grad == true) || (type_table[c->comes_from->backward_func] == TYPE_SHAPE);
+        tensor *pair[2], **operands;
+        size_t num_operands = node_operands(c, s.fused[i], &operands, pair);
+        for (size_t o = 0; o < num_operands; o++){
+            size_t idx = (operands[o] != NULL) ? graph_index(g, operands[o]) : GRAPH_NOT_FOUND;
+            if (idx == GRAPH_NOT_FOUND){
+                continue;
+            }
+            s.last_use[idx] = i;
+            s.last_use[s.rep[idx]] = i;
+            s.keep[idx] = s.keep[idx] || pins;
+        }
+        s.last_use[s.rep[i]] = i;
+    }
+    s.keep[n - 1] = true; //root is last
+
+    free(consumers);
+    free(exclude);
+    return s;
+}
+
+static void free_schedule(schedule *s){
+    free(s->rep);
+    free(s->last_use);
+    free(s->keep);
+    free(s->fused);
+    free(s->skip);
+    free_graph(&s->g);
+}
+
+//node i of the schedule gets memory of its own (views and borrowed duplicates do not)
+static bool needs_buffer(schedule *s, size_t i){
+    tensor *c = s->g->nodes[i];
+    if ((is_pending(c) == false) || (s->skip[i] == true)){
+        return false;
+    }
+    if (s->rep[i] != i){
+        return s->keep[i];
+    }
+    return (type_table[c->comes_from->backward_func] != TYPE_SHAPE) || (c->k->shallow == false);
+}
+
+//static memory plan: the buffers compute() would allocate for a graph are laid out in one arena
+//ahead of time. a buffer lives from the step that writes it to its last use (to the end if it is
+//kept), buffers whose lifetimes do not overlap share memory. offsets are assigned greedily, largest
+//first, at the lowest offset free of every overlapping buffer already placed. once planned, running
+//the graph again (invalidate() then compute()) allocates nothing
+
+#define PLAN_ALIGN 16 //elements, 64 bytes
+#define PLAN_NONE SIZE_MAX
+
+typedef struct plan_buffer {
+    size_t node, start, end, length, offset;
+} plan_buffer;
+
+static int compare_buffers(const void *a, const void *b){
+    const plan_buffer *x = (const plan_buffer *) a;
+    const plan_buffer *y = (const plan_buffer *) b;
+    if (x->length != y->length){
+        return (x->length > y->length) ? -1 : 1;
+    }
+    return (x->start > y->start) - (x->start < y->start);
+}
+
+static memory_plan * make_memory_plan(schedule *s){
+    graph *g = s->g;
+    size_t n = g->num_nodes;
+    plan_buffer *buffers = (plan_buffer *) malloc(n * sizeof(plan_buffer));
+    size_t num_buffers = 0;
+    for (size_t i = 0; i < n; i++){
+        if (needs_buffer(s, i)){
+            plan_buffer *b = &buffers[num_buffers++];
+            b->node = i;
+            b->start = i;
+            b->end = s->keep[i] ? n : s->last_use[i];
+            b->length = (g->nodes[i]->k->length + PLAN_ALIGN - 1) / PLAN_ALIGN * PLAN_ALIGN;
+        }
+    }
+    qsort(buffers, num_buffers, sizeof(plan_buffer), compare_buffers);
+
+    memory_plan *p = (memory_plan *) malloc(sizeof(memory_plan));
+    p->num_nodes = n;
+    p->nodes = (tensor **) malloc(n * sizeof(tensor *));
+    p->offsets = (size_t *) malloc(n * sizeof(size_t));
+    p->arena_length = 0;
+    memcpy(p->nodes, g->nodes, n * sizeof(tensor *));
+    for (size_t i = 0; i < n; i++){
+        p->offsets[i] = PLAN_NONE;
+    }
+    for (size_t b = 0; b < num_buffers; b++){
+        size_t offset = 0;
+        bool moved = true;
+        while (moved){ //first gap that fits among the placed buffers alive at the same time
+            moved = false;
+            for (size_t o = 0; o < b; o++){
+                plan_buffer *other = &buffers[o];
+                bool overlap_time = (other->start <= buffers[b].end) && (buffers[b].start <= other->end);
+                bool overlap_space = (other->offset < offset + buffers[b].length) && (offset < other->offset + other->length);
+                if (overlap_time && overlap_space){
+                    offset = other->offset + other->length;
+                    moved = true;
+                }
+            }
+        }
+        buffers[b].offset = offset;
+        p->offsets[buffers[b].node] = offset;
+        if (offset + buffers[b].length > p->arena_length){
+            p->arena_length = offset + buffers[b].length;
+        }
+    }
+    p->arena = (p->arena_length > 0) ? lemur_alloc(p->arena_length) : NULL;
+    free(buffers);
+    return p;
+}
+
+//a plan is used only for the graph it was made for, in the same state
+static bool plan_matches(memory_plan *p, graph *g){
+    if ((p == NULL) || (p->num_nodes != g->num_nodes)){
+        return false;
+    }
+    return memcmp(p->nodes, g->nodes, g->num_nodes * sizeof(tensor *)) == 0;
+}
+
+static lemur_float * node_buffer(memory_plan *p, tensor *c, size_t i){
+    if (p == NULL){
+        return lemur_alloc(c->k->length);
+    }
+    c->k->shallow = true; //owned by the arena
+    return p->arena + p->offsets[i];
+}
+
+size_t plan_memory(tensor *root){
+    if ((root == NULL) || (root->comes_from == NULL)){
+        return 0;
+    }
+    free_memory_plan(&root->comes_from->plan);
+    if (is_pending(root) == false){
+        return 0;
+    }
+    schedule s = make_schedule(root);
+    root->comes_from->plan = make_memory_plan(&s);
+    free_schedule(&s);
+    return root->comes_from->plan->arena_length * sizeof(lemur_float);
+}
+
+//the nodes still in the arena get memory of their own (views follow their input), so they
+//survive the plan. like the expressions themselves, the planned nodes must outlive the root
+void free_memory_plan(memory_plan **p_ptr){
+    if ((p_ptr == NULL) || (*p_ptr == NULL)){
+        return;
+    }
+    memory_plan *p = *p_ptr;
+    lemur_float *end = p->arena + p->arena_length;
+    for (size_t i = 0; i < p->num_nodes; i++){
+        kernel_tensor *k = p->nodes[i]->k;
+        if ((k->array == NULL) || (k->array < p->arena) || (k->array >= end)){
+            continue;
+        }
+        expression *e = p->nodes[i]->comes_from;
+        if ((type_table[e->backward_func] == TYPE_SHAPE) && (p->offsets[i] == PLAN_NONE)){
+            k->array = e->t0->k->array;
+        } else {
+            lemur_float *own = lemur_alloc(k->length);
+            memcpy(own, k->array, k->length * sizeof(lemur_float));
+            k->array = own;
+            k->shallow = false;
+        }
+    }
+    if (p->arena != NULL){
+        lemur_free(p->arena, p->arena_length);
+    }
+    free(p->nodes);
+    free(p->offsets);
+    free(p);
+    *p_ptr = NULL;
+}
+
+//marks every intermediate below root as not computed, the next access, compute() or backward()
+//runs the graph again with the current values of the leaves (which are the recorded ones from now on)
+void invalidate(tensor *root){
+    if (root == NULL){
+        return;
+    }
+    graph *g = build_graph(root, GRAPH_ALL);
+    for (size_t i = 0; i < g->num_nodes; i++){
+        tensor *c = g->nodes[i];
+        if (c->comes_from == NULL){
+            continue;
+        }
+        save_versions(c);
+        if (c->k->computed == false){
+            continue;
+        }
+        if ((type_table[c->comes_from->backward_func] == TYPE_SHAPE) && (c->k->shallow == true)){
+            c->k->array = NULL; //stays a view, bound again when it runs
+            c->k->computed = false;
+        } else {
+            release_node(c);
+        }
+    }
+    free_graph(&g);
+}
+
+//false when an input of a node still to run was written in place after the node was recorded,
+//the graph is computed anyway (from the new values) so that its arrays exist, but the caller must
+//not use the result as the recorded one
+bool compute(tensor *t){
+    if ((t == NULL) || (is_pending(t) == false)){
+        return true;
+    }
+    schedule s = make_schedule(t);
+    graph *g = s.g;
+    size_t n = g->num_nodes;
+    bool unmodified = true;
+    for (size_t i = 0; i < n; i++){
+        if (is_pending(g->nodes[i]) && operands_modified(g->nodes[i])){
+            fprintf(stderr, "Error: an input of %s was modified by an in-place operation after it was recorded.\n",
+                    get_op_name(g->nodes[i]->comes_from->backward_func));
+            unmodified = false;
+            break;
+        }
+    }
+    memory_plan *plan = plan_matches(t->comes_from->plan, g) ? t->comes_from->plan : NULL;
+    alloc_context previous = set_alloc_context(MEMORY_OTHER, false);
+
+    for (size_t i = 0; i < n; i++){
+        tensor *c = g->nodes[i];
+        if ((is_pending(c) == false) || (s.skip[i] == true)){
+            continue;
+        }
+        expression *e = c->comes_from;
+        set_alloc_context(s.fused[i] ? MEMORY_FUSED : e->backward_func, false);
+        if (s.rep[i] != i){
+            kernel_tensor *kr = g->nodes[s.rep[i]]->k;
+            if (s.keep[i] == true){
+                c->k->array = node_buffer(plan, c, i);
+                memcpy(c->k->array, kr->array, c->k->length * sizeof(lemur_float));
+            } else { //borrowed until released below
+                c->k->array = kr->array;
+                c->k->shallow = true;
+            }
+            c->k->computed = true;
+        } else if (s.fused[i] == true){
+            run_fused_forward(c, node_buffer(plan, c, i));
+        } else {
+            if (needs_buffer(&s, i)){
+                c->k->array = node_buffer(plan, c, i);
+            }
+            kernel_tensor scalar_k;
+            forward_kernel(e->backward_func, c->k, e->t0->k, expression_k1(e, &scalar_k));
+        }
+
+        //releases what this node was the last consumer of
+        tensor *pair[2], **operands;
+        size_t num_operands = node_operands(c, s.fused[i], &operands, pair);
+        for (size_t o = 0; o <= num_operands; o++){
+            tensor *candidate = (o < num_operands) ? operands[o] : g->nodes[s.rep[i]];
+            size_t idx = (candidate != NULL) ? graph_index(g, candidate) : GRAPH_NOT_FOUND;
+            if ((idx != GRAPH_NOT_FOUND) && (idx != i) && (s.keep[idx] == false) && (s.last_use[idx] == i)){
+                release_node(g->nodes[idx]);
+            }
+        }
+    }
+
+    restore_alloc_context(previous);
+    free_schedule(&s);
+    return unmodified;
+}
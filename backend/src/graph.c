@@ -0,0 +1,145 @@
+#include "../include/graph.h"
+
+static size_t hash_ptr(tensor *t, size_t capacity){
+    uintptr_t x = (uintptr_t) t;
+    x ^= x >> 17;
+    x *= (uintptr_t) 0x9E3779B97F4A7C15ULL;
+    return (size_t) (x >> 7) & (capacity - 1);
+}
+
+static void graph_grow(graph *g);
+
+static size_t * graph_slot(graph *g, tensor *t, bool insert){
+    if (insert && (g->num_keys + 1) * 2 > g->capacity){
+        graph_grow(g);
+    }
+    size_t h = hash_ptr(t, g->capacity);
+    while (g->keys[h] != NULL){
+        if (g->keys[h] == t){
+            return &g->values[h];
+        }
+        h = (h + 1) & (g->capacity - 1);
+    }
+    if (insert == false){
+        return NULL;
+    }
+    g->keys[h] = t;
+    g->num_keys++;
+    return &g->values[h];
+}
+
+static void graph_grow(graph *g){
+    tensor **old_keys = g->keys;
+    size_t *old_values = g->values;
+    size_t old_capacity = g->capacity;
+    g->capacity *= 2;
+    g->keys = (tensor **) calloc(g->capacity, sizeof(tensor *));
+    g->values = (size_t *) malloc(g->capacity * sizeof(size_t));
+    g->num_keys = 0;
+    for (size_t i = 0; i < old_capacity; i++){
+        if (old_keys[i] != NULL){
+            *graph_slot(g, old_keys[i], true) = old_values[i];
+        }
+    }
+    free(old_keys);
+    free(old_values);
+}
+
+size_t graph_index(graph *g, tensor *t){
+    size_t *slot = graph_slot(g, t, false);
+    return (slot == NULL) ? GRAPH_NOT_FOUND : *slot;
+}
+
+static tensor * graph_child(tensor *t, int i, int mode){
+    if (t->comes_from == NULL){
+        return NULL;
+    }
+    if ((mode == GRAPH_UNCOMPUTED) && (t->k->computed == true)){
+        return NULL;
+    }
+    tensor *c = (i == 0) ? t->comes_from->t0 : t->comes_from->t1;
+    if ((c != NULL) && (mode == GRAPH_REQUIRES_GRAD) && (c->requires_grad == false)){
+        return NULL;
+    }
+    return c;
+}
+
+//iterative post order dfs, no recursion so deep graphs cannot overflow the C stack
+graph * build_graph(tensor *root, int mode){
+    graph *g = (graph *) malloc(sizeof(graph));
+    g->capacity = 64;
+    g->keys = (tensor **) calloc(g->capacity, sizeof(tensor *));
+    g->values = (size_t *) malloc(g->capacity * sizeof(size_t));
+    g->num_nodes = 0;
+    g->num_keys = 0;
+    size_t nodes_capacity = 64;
+    g->nodes = (tensor **) malloc(nodes_capacity * sizeof(tensor *));
+
+    if (root == NULL){
+        return g;
+    }
+
+    size_t stack_capacity = 64, top = 0;
+    tensor **stack = (tensor **) malloc(stack_capacity * sizeof(tensor *));
+    int *next_child = (int *) malloc(stack_capacity * sizeof(int));
+
+    //tensors on the stack are in the hash with GRAPH_NOT_FOUND until they are finished
+    *graph_slot(g, root, true) = GRAPH_NOT_FOUND; 
+    stack[top] = root; next_child[top] = 0; top++;
+
+    while (top > 0){
+        tensor *t = stack[top - 1];
+        if (next_child[top - 1] < 2){
+            tensor *c = graph_child(t, next_child[top - 1]++, mode);
+            if ((c == NULL) || (graph_slot(g, c, false) != NULL)){
+                continue;
+            }
+            *graph_slot(g, c, true) = GRAPH_NOT_FOUND;
+            if (top == stack_capacity){
+                stack_capacity *= 2;
+                stack = (tensor **) realloc(stack, stack_capacity * sizeof(tensor *));
+                next_child = (int *) realloc(next_child, stack_capacity * sizeof(int));
+            }
+            stack[top] = c; next_child[top] = 0; top++;
+        } else {
+            top--;
+            if (g->num_nodes == nodes_capacity){
+                nodes_capacity *= 2;
+                g->nodes = (tensor **) realloc(g->nodes, nodes_capacity * sizeof(tensor *));
+            }
+            *graph_slot(g, t, false) = g->num_nodes;
+            g->nodes[g->num_nodes++] = t;
+        }
+    }
+    free(stack);
+    free(next_child);
+    return g;
+}
+
+void graph_count_consumers(graph *g, size_t *consumers){
+    memset(consumers, 0, g->num_nodes * sizeof(size_t));
+    for (size_t i = 0; i < g->num_nodes; i++){
+        expression *e = g->nodes[i]->comes_from;
+        if (e == NULL){
+            continue;
+        }
+        tensor *operands[2] = {e->t0, e->t1};
+        for (size_t o = 0; o < 2; o++){
+            size_t idx = (operands[o] != NULL) ? graph_index(g, operands[o]) : GRAPH_NOT_FOUND;
+            if (idx != GRAPH_NOT_FOUND){
+                consumers[idx]++;
+            }
+        }
+    }
+}
+
+void free_graph(graph **g_ptr){
+    if ((g_ptr != NULL) && (*g_ptr != NULL)){
+        graph *g = *g_ptr;
+        free(g->nodes);
+        free(g->keys);
+        free(g->values);
+        free(g);
+        *g_ptr = NULL;
+    }
+}
@@ -26,10 +26,24 @@ char* op_map[TOTAL_OPS] ={
 [OP_ABS] = "abs",
 [OP_SIGN] = "sign",
 [OP_RECIPROCAL] = "reciprocal",
+[OP_CONTIGUOUS] = "contiguous",
+//scalar ops
+[OP_ADD_SCALAR] = "add_scalar",
+[OP_MUL_SCALAR] = "mul_scalar",
+[OP_DIV_SCALAR] = "div_scalar",
+[OP_RSUB_SCALAR] = "rsub_scalar",
+[OP_RDIV_SCALAR] = "rdiv_scalar",
+[OP_POW_SCALAR] = "pow_scalar",
+[OP_RPOW_SCALAR] = "rpow_scalar",
 //reduce ops
 [OP_SUM] = "sum",
 [OP_ALL] = "all",
 [OP_ANY] = "any",
+[OP_MAX] = "max",
+[OP_MIN] = "min",
+[OP_MEAN] = "mean",
+[OP_ARGMAX] = "argmax",
+[OP_ARGMIN] = "argmin",
 //shape ops
 [OP_VIEW] = "view",
 [OP_EXPAND] = "expand",
@@ -110,6 +124,114 @@ SINGLE_INPUT_FUNC_DEF(reciprocal){
     return kernel_forward(OP_RECIPROCAL, t0, NULL, retain_grad);  
 }
 
+SINGLE_INPUT_FUNC_DEF(contiguous){
+    return kernel_forward(OP_CONTIGUOUS, t0, NULL, retain_grad);  
+}
+
+//scalar ops, x - scalar is add_scalar(x, -scalar)
+
+SCALAR_INPUT_FUNC_DEF(add_scalar){
+    return kernel_forward_scalar(OP_ADD_SCALAR, t0, scalar, retain_grad);
+}
+
+SCALAR_INPUT_FUNC_DEF(mul_scalar){
+    return kernel_forward_scalar(OP_MUL_SCALAR, t0, scalar, retain_grad);
+}
+
+SCALAR_INPUT_FUNC_DEF(div_scalar){
+    return kernel_forward_scalar(OP_DIV_SCALAR, t0, scalar, retain_grad);
+}
+
+SCALAR_INPUT_FUNC_DEF(rsub_scalar){
+    return kernel_forward_scalar(OP_RSUB_SCALAR, t0, scalar, retain_grad);
+}
+
+SCALAR_INPUT_FUNC_DEF(rdiv_scalar){
+    return kernel_forward_scalar(OP_RDIV_SCALAR, t0, scalar, retain_grad);
+}
+
+SCALAR_INPUT_FUNC_DEF(pow_scalar){
+    return kernel_forward_scalar(OP_POW_SCALAR, t0, scalar, retain_grad);
+}
+
+SCALAR_INPUT_FUNC_DEF(rpow_scalar){
+    return kernel_forward_scalar(OP_RPOW_SCALAR, t0, scalar, retain_grad);
+}
+
+//in-place and out= ops
+
+DOUBLE_INPUT_INTO_DEF(add){
+    return kernel_forward_into(OP_ADD, out, t0, t1);
+}
+
+DOUBLE_INPUT_INTO_DEF(sub){
+    return kernel_forward_into(OP_SUB, out, t0, t1);
+}
+
+DOUBLE_INPUT_INTO_DEF(mul){
+    return kernel_forward_into(OP_MUL, out, t0, t1);
+}
+
+DOUBLE_INPUT_INTO_DEF(division){
+    return kernel_forward_into(OP_DIVISION, out, t0, t1);
+}
+
+DOUBLE_INPUT_INTO_DEF(power){
+    if (is_tensor_scalar(t1) == false){
+        fprintf(stderr, "Error: Exponent of tensor must be a scalar.\n");
+        return INTO_SHAPE_MISMATCH;
+    }
+    return kernel_forward_into(OP_POW, out, t0, t1);
+}
+
+SINGLE_INPUT_INTO_DEF(exponential){
+    return kernel_forward_into(OP_EXP, out, t0, NULL);
+}
+
+SINGLE_INPUT_INTO_DEF(relu){
+    return kernel_forward_into(OP_RELU, out, t0, NULL);
+}
+
+SINGLE_INPUT_INTO_DEF(sigmoid){
+    return kernel_forward_into(OP_SIGMOID, out, t0, NULL);
+}
+
+SINGLE_INPUT_INTO_DEF(logarithm){
+    return kernel_forward_into(OP_LOG, out, t0, NULL);
+}
+
+SINGLE_INPUT_INTO_DEF(neg){
+    return kernel_forward_into(OP_NEG, out, t0, NULL);
+}
+
+SINGLE_INPUT_INTO_DEF(square_root){
+    return kernel_forward_into(OP_SQRT, out, t0, NULL);
+}
+
+SINGLE_INPUT_INTO_DEF(absolute){
+    return kernel_forward_into(OP_ABS, out, t0, NULL);
+}
+
+SINGLE_INPUT_INTO_DEF(reciprocal){
+    return kernel_forward_into(OP_RECIPROCAL, out, t0, NULL);
+}
+
+SCALAR_INPUT_INTO_DEF(add_scalar){
+    return kernel_forward_scalar_into(OP_ADD_SCALAR, out, t0, scalar);
+}
+
+SCALAR_INPUT_INTO_DEF(mul_scalar){
+    return kernel_forward_scalar_into(OP_MUL_SCALAR, out, t0, scalar);
+}
+
+SCALAR_INPUT_INTO_DEF(div_scalar){
+    return kernel_forward_scalar_into(OP_DIV_SCALAR, out, t0, scalar);
+}
+
+SCALAR_INPUT_INTO_DEF(pow_scalar){
+    return kernel_forward_scalar_into(OP_POW_SCALAR, out, t0, scalar);
+}
+
 //reduce ops
 
 DOUBLE_INPUT_FUNC_DEF(sum){
@@ -124,6 +246,47 @@ tensor * any(tensor *t0, tensor *t1){
     return kernel_forward(OP_ANY, t0, t1, false);
 }
 
+DOUBLE_INPUT_FUNC_DEF(maximum){
+    return kernel_forward(OP_MAX, t0, t1, retain_grad);
+}
+
+DOUBLE_INPUT_FUNC_DEF(minimum){
+    return kernel_forward(OP_MIN, t0, t1, retain_grad);
+}
+
+DOUBLE_INPUT_FUNC_DEF(mean){
+    return kernel_forward(OP_MEAN, t0, t1, retain_grad);
+}
+
+//the indices are lemur_floats, exact only up to 2^24
+static bool arg_indices_exact(const char *name, tensor *t0, tensor *t1){
+    size_t reduced = 1;
+    for (size_t i = 0; i < 5; i++){
+        if (t1->k->array[i] == 0){
+            reduced *= t0->k->shape[i];
+        }
+    }
+    if (reduced > ((size_t) 1 << 24)){
+        fprintf(stderr, "Error: %s reduces over %zu elements, indices are only exact up to 2^24.\n", name, reduced);
+        return false;
+    }
+    return true;
+}
+
+tensor * argmax(tensor *t0, tensor *t1){
+    if (arg_indices_exact("argmax", t0, t1) == false){
+        return NULL;
+    }
+    return kernel_forward(OP_ARGMAX, t0, t1, false);
+}
+
+tensor * argmin(tensor *t0, tensor *t1){
+    if (arg_indices_exact("argmin", t0, t1) == false){
+        return NULL;
+    }
+    return kernel_forward(OP_ARGMIN, t0, t1, false);
+}
+
 //shape ops
 
 //todo add checks, like view positive dimensions, length is the same, etc
@@ -1,7 +1,7 @@
 #include "../../include/tensor.h"
 
 FORWARD_FUNC_DEF(b_op_add_forward){
-    BINARY_CONTIGUOUS_ELEMENTWISE_OP_SIMD(kr, k0, k1, _add);
+    BINARY_ELEMENTWISE_OP_SIMD(kr, k0, k1, _add);
 }
 
 BACKWARD_FUNC_DEF(b_op_add_backward){
@@ -10,7 +10,7 @@ BACKWARD_FUNC_DEF(b_op_add_backward){
 }
 
 FORWARD_FUNC_DEF(b_op_mul_forward){
-    BINARY_CONTIGUOUS_ELEMENTWISE_OP_SIMD(kr, k0, k1, _mul);
+    BINARY_ELEMENTWISE_OP_SIMD(kr, k0, k1, _mul);
 }
 
 BACKWARD_FUNC_DEF(b_op_mul_backward){
@@ -22,12 +22,12 @@ BACKWARD_FUNC_DEF(b_op_mul_backward){
     else{
         k = k0;
     }
-    BINARY_CONTIGUOUS_ELEMENTWISE_OP_SIMD(seed, seed, k, _mul);
+    BINARY_ELEMENTWISE_OP_SIMD(seed, seed, k, _mul);
     return seed;
 }
 
 FORWARD_FUNC_DEF(b_op_sub_forward){
-    BINARY_CONTIGUOUS_ELEMENTWISE_OP_SIMD(kr, k0, k1, _sub);
+    BINARY_ELEMENTWISE_OP_SIMD(kr, k0, k1, _sub);
 }
 
 BACKWARD_FUNC_DEF(b_op_sub_backward){
@@ -36,31 +36,32 @@ BACKWARD_FUNC_DEF(b_op_sub_backward){
         //nothing
     }
     else{
-       UNARY_CONTIGUOUS_ELEMENTWISE_OP_SIMD(seed, seed, _neg);
+       UNARY_ELEMENTWISE_OP_SIMD(seed, seed, _neg);
     }
     return seed;
 }
 
 
 FORWARD_FUNC_DEF(b_op_division_forward){
-    BINARY_CONTIGUOUS_ELEMENTWISE_OP_SIMD(kr, k0, k1, _div);
+    BINARY_ELEMENTWISE_OP_SIMD(kr, k0, k1, _div);
 }
 
 BACKWARD_FUNC_DEF(b_op_division_backward){
     (void) k0;
     if (idx == 0) {
-        BINARY_CONTIGUOUS_ELEMENTWISE_OP_SIMD(seed, seed, k1, _div);
+        BINARY_ELEMENTWISE_OP_SIMD(seed, seed, k1, _div);
     }
     else {
-        #pragma omp parallel for simd
-        for (size_t _i = 0; _i < kr->length; _i++) {                     
-          seed->array[_i] = -1.0 * seed->array[_i] * (kr->array[_i] / (k1->array[_i]));
-        }
+        //-seed * kr / k1
+        #define _neg_div(a, b) (-1.0 * (a) / (b))
+        BINARY_ELEMENTWISE_OP_SIMD(seed, seed, kr, _mul);
+        BINARY_ELEMENTWISE_OP_SIMD(seed, seed, k1, _neg_div);
+        #undef _neg_div
     }
     return seed;
 }
 
 
 FORWARD_FUNC_DEF(b_op_eq_forward){
-    BINARY_CONTIGUOUS_ELEMENTWISE_OP_SIMD(kr, k0, k1, _eq);
+    BINARY_ELEMENTWISE_OP_SIMD(kr, k0, k1, _eq);
 }
\ No newline at end of file
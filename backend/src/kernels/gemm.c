@@ -0,0 +1,218 @@
+#include "../../include/gemm.h"
+
+//blocked gemm (goto/blis style)
+//  C is split into MC x NC tiles, one task per (batch, tile) in a single parallel region
+//  for every KC slice of k the task packs an MC x KC block of A (row panels of MR, stays in L2)
+//  and a KC x NC block of B (column panels of NR, one panel streams through L1)
+//  the MR x NR micro-kernel keeps the whole C block in vector registers
+//packing reads any strides, edges are zero padded so the micro-kernel never branches
+
+#define GEMM_VEC 8
+#define GEMM_MR 6
+#define GEMM_NR (2 * GEMM_VEC)
+#define GEMM_MC 120
+#define GEMM_KC 256
+#define GEMM_NC 512
+
+typedef lemur_float gemm_vec __attribute__((vector_size(GEMM_VEC * sizeof(lemur_float))));
+
+#define MIN(a, b) ((a) < (b) ? (a) : (b))
+
+static inline gemm_vec load_vec(const lemur_float *p){
+    gemm_vec v;
+    memcpy(&v, p, sizeof(gemm_vec));
+    return v;
+}
+
+//c (mr x nr valid entries) += packed a (kc x MR) @ packed b (kc x NR)
+static void micro_kernel(size_t kc, const lemur_float *restrict a, const lemur_float *restrict b,
+                         lemur_float *restrict c, int64_t c_rs, size_t mr, size_t nr){
+    gemm_vec c0a = {0}, c0b = {0}, c1a = {0}, c1b = {0}, c2a = {0}, c2b = {0};
+    gemm_vec c3a = {0}, c3b = {0}, c4a = {0}, c4b = {0}, c5a = {0}, c5b = {0};
+
+    for (size_t p = 0; p < kc; p++){
+        gemm_vec b0 = load_vec(b);
+        gemm_vec b1 = load_vec(b + GEMM_VEC);
+        c0a += a[0] * b0; c0b += a[0] * b1;
+        c1a += a[1] * b0; c1b += a[1] * b1;
+        c2a += a[2] * b0; c2b += a[2] * b1;
+        c3a += a[3] * b0; c3b += a[3] * b1;
+        c4a += a[4] * b0; c4b += a[4] * b1;
+        c5a += a[5] * b0; c5b += a[5] * b1;
+        a += GEMM_MR;
+        b += GEMM_NR;
+    }
+
+    lemur_float acc[GEMM_MR][GEMM_NR];
+    memcpy(&acc[0][0], &c0a, sizeof(gemm_vec)); memcpy(&acc[0][GEMM_VEC], &c0b, sizeof(gemm_vec));
+    memcpy(&acc[1][0], &c1a, sizeof(gemm_vec)); memcpy(&acc[1][GEMM_VEC], &c1b, sizeof(gemm_vec));
+    memcpy(&acc[2][0], &c2a, sizeof(gemm_vec)); memcpy(&acc[2][GEMM_VEC], &c2b, sizeof(gemm_vec));
+    memcpy(&acc[3][0], &c3a, sizeof(gemm_vec)); memcpy(&acc[3][GEMM_VEC], &c3b, sizeof(gemm_vec));
+    memcpy(&acc[4][0], &c4a, sizeof(gemm_vec)); memcpy(&acc[4][GEMM_VEC], &c4b, sizeof(gemm_vec));
+    memcpy(&acc[5][0], &c5a, sizeof(gemm_vec)); memcpy(&acc[5][GEMM_VEC], &c5b, sizeof(gemm_vec));
+
+    if ((mr == GEMM_MR) && (nr == GEMM_NR)){
+        for (size_t i = 0; i < GEMM_MR; i++){
+            #pragma omp simd
+            for (size_t j = 0; j < GEMM_NR; j++){
+                c[i * c_rs + j] += acc[i][j];
+            }
+        }
+    } else {
+        for (size_t i = 0; i < mr; i++){
+            for (size_t j = 0; j < nr; j++){
+                c[i * c_rs + j] += acc[i][j];
+            }
+        }
+    }
+}
+
+//mc x kc block of A starting at (i0, p0) into row panels of MR: panel[p][i]
+static void pack_a(lemur_float *dst, const lemur_float *a, int64_t rs, int64_t cs,
+                   size_t i0, size_t p0, size_t mc, size_t kc){
+    for (size_t ir = 0; ir < mc; ir += GEMM_MR){
+        size_t mr = MIN(GEMM_MR, mc - ir);
+        for (size_t p = 0; p < kc; p++){
+            const lemur_float *src = a + (int64_t) (p0 + p) * cs + (int64_t) (i0 + ir) * rs;
+            for (size_t i = 0; i < mr; i++){
+                dst[i] = src[(int64_t) i * rs];
+            }
+            for (size_t i = mr; i < GEMM_MR; i++){
+                dst[i] = 0.0;
+            }
+            dst += GEMM_MR;
+        }
+    }
+}
+
+//kc x nc block of B starting at (p0, j0) into column panels of NR: panel[p][j]
+static void pack_b(lemur_float *dst, const lemur_float *b, int64_t rs, int64_t cs,
+                   size_t p0, size_t j0, size_t kc, size_t nc){
+    for (size_t jr = 0; jr < nc; jr += GEMM_NR){
+        size_t nr = MIN(GEMM_NR, nc - jr);
+        for (size_t p = 0; p < kc; p++){
+            const lemur_float *src = b + (int64_t) (p0 + p) * rs + (int64_t) (j0 + jr) * cs;
+            if ((cs == 1) && (nr == GEMM_NR)){
+                memcpy(dst, src, GEMM_NR * sizeof(lemur_float));
+            } else {
+                for (size_t j = 0; j < nr; j++){
+                    dst[j] = src[(int64_t) j * cs];
+                }
+                for (size_t j = nr; j < GEMM_NR; j++){
+                    dst[j] = 0.0;
+                }
+            }
+            dst += GEMM_NR;
+        }
+    }
+}
+
+//one MC x NC tile of C of one batch entry, a_pack and b_pack are the packing buffers of the thread
+static void gemm_task(size_t task, size_t m, size_t n, size_t k, gemm_matrix a, gemm_matrix b,
+                      lemur_float *c, int64_t c_batch_stride, int64_t c_row_stride, bool accumulate,
+                      size_t m_tiles, size_t n_tiles, lemur_float *a_pack, lemur_float *b_pack){
+    size_t bi = task / (m_tiles * n_tiles);
+    size_t ic = ((task / n_tiles) % m_tiles) * GEMM_MC;
+    size_t jc = (task % n_tiles) * GEMM_NC;
+    size_t mc = MIN(GEMM_MC, m - ic);
+    size_t nc = MIN(GEMM_NC, n - jc);
+
+    const lemur_float *ab = a.data + (int64_t) bi * a.batch_stride;
+    const lemur_float *bb = b.data + (int64_t) bi * b.batch_stride;
+    lemur_float *cb = c + (int64_t) bi * c_batch_stride + (int64_t) ic * c_row_stride + jc;
+
+    if (accumulate == false){
+        for (size_t i = 0; i < mc; i++){
+            memset(cb + (int64_t) i * c_row_stride, 0, nc * sizeof(lemur_float));
+        }
+    }
+
+    for (size_t pc = 0; pc < k; pc += GEMM_KC){
+        size_t kc = MIN(GEMM_KC, k - pc);
+        pack_a(a_pack, ab, a.row_stride, a.col_stride, ic, pc, mc, kc);
+        pack_b(b_pack, bb, b.row_stride, b.col_stride, pc, jc, kc, nc);
+
+        for (size_t jr = 0; jr < nc; jr += GEMM_NR){
+            size_t nr = MIN(GEMM_NR, nc - jr);
+            const lemur_float *bp = b_pack + jr * kc;
+            for (size_t ir = 0; ir < mc; ir += GEMM_MR){
+                size_t mr = MIN(GEMM_MR, mc - ir);
+                micro_kernel(kc, a_pack + ir * kc, bp,
+                             cb + (int64_t) ir * c_row_stride + jr, c_row_stride, mr, nr);
+            }
+        }
+    }
+}
+
+void gemm(size_t batch, size_t m, size_t n, size_t k,
+          gemm_matrix a, gemm_matrix b,
+          lemur_float *c, int64_t c_batch_stride, int64_t c_row_stride,
+          bool accumulate){
+
+    if ((batch == 0) || (m == 0) || (n == 0)){
+        return;
+    }
+
+    size_t m_tiles = (m + GEMM_MC - 1) / GEMM_MC;
+    size_t n_tiles = (n + GEMM_NC - 1) / GEMM_NC;
+    size_t num_tasks = batch * m_tiles * n_tiles;
+    bool parallel = USE_PARALLEL(PARALLEL_GEMM, (double) batch * m * n * k) && (num_tasks > 1);
+
+    //small products do not open a parallel region at all
+    if (parallel == false){
+        lemur_float *a_pack = lemur_alloc(GEMM_MC * GEMM_KC);
+        lemur_float *b_pack = lemur_alloc(GEMM_KC * (GEMM_NC + GEMM_NR));
+        for (size_t task = 0; task < num_tasks; task++){
+            gemm_task(task, m, n, k, a, b, c, c_batch_stride, c_row_stride, accumulate, m_tiles, n_tiles, a_pack, b_pack);
+        }
+        lemur_free(a_pack, GEMM_MC * GEMM_KC);
+        lemur_free(b_pack, GEMM_KC * (GEMM_NC + GEMM_NR));
+        return;
+    }
+
+    #pragma omp parallel
+    {
+        lemur_float *a_pack = lemur_alloc(GEMM_MC * GEMM_KC);
+        lemur_float *b_pack = lemur_alloc(GEMM_KC * (GEMM_NC + GEMM_NR));
+
+        #pragma omp for schedule(dynamic)
+        for (size_t task = 0; task < num_tasks; task++){
+            gemm_task(task, m, n, k, a, b, c, c_batch_stride, c_row_stride, accumulate, m_tiles, n_tiles, a_pack, b_pack);
+        }
+
+        lemur_free(a_pack, GEMM_MC * GEMM_KC);
+        lemur_free(b_pack, GEMM_KC * (GEMM_NC + GEMM_NR));
+    }
+}
+
+//upper bound for the benchmarks: every thread runs the micro-kernel on L1 resident panels
+double gemm_peak_gflops(void){
+    size_t reps = 2000;
+    double total = 0.0;
+
+    #pragma omp parallel reduction(+:total)
+    {
+        lemur_float *a = lemur_alloc(GEMM_KC * GEMM_MR);
+        lemur_float *b = lemur_alloc(GEMM_KC * GEMM_NR);
+        lemur_float c[GEMM_MR * GEMM_NR];
+        for (size_t i = 0; i < GEMM_KC * GEMM_MR; i++){
+            a[i] = 1e-3;
+        }
+        for (size_t i = 0; i < GEMM_KC * GEMM_NR; i++){
+            b[i] = 1e-3;
+        }
+        memset(c, 0, sizeof(c));
+        micro_kernel(GEMM_KC, a, b, c, GEMM_NR, GEMM_MR, GEMM_NR); //warm up
+
+        double start = omp_get_wtime();
+        for (size_t r = 0; r < reps; r++){
+            micro_kernel(GEMM_KC, a, b, c, GEMM_NR, GEMM_MR, GEMM_NR);
+        }
+        double elapsed = omp_get_wtime() - start;
+        total += 2.0 * GEMM_MR * GEMM_NR * GEMM_KC * reps / elapsed * 1e-9;
+
+        lemur_free(a, GEMM_KC * GEMM_MR);
+        lemur_free(b, GEMM_KC * GEMM_NR);
+    }
+    return total;
+}
@@ -1,85 +1,158 @@
-#include "../../include/tensor.h"
-
-#define TILE_SIZE 256
-#define MIN(a, b) ((a) < (b) ? (a) : (b))
+#include "../../include/gemm.h"
 
 //A --> i k
 //B --> k j
-//A @ B = C --> i j 
+//A @ B = C --> i j
 //grad wrt A --> C @ B^T
 //grad wrt B --> A^T @ C
+//the _fast variants take B already transposed (j k): C = A @ B^T
+//grad wrt A --> C @ B
+//grad wrt B --> C^T @ A
+//broadcast (bcmm) operands have batch dims of 1 and are read with batch stride 0,
+//their gradient is summed over the batch
+
+//the three leading (batch) dims must be walkable with one stride, 0 when they are all 1
+static bool get_batch_stride(kernel_tensor *k, int64_t *stride){
+    *stride = 0;
+    int64_t next = -1;
+    for (size_t d = 3; d-- > 0;){
+        if (k->shape[d] == 1){
+            continue;
+        }
+        if (next == -1){
+            *stride = k->stride[d];
+        } else if (k->stride[d] != next){
+            return false;
+        }
+        next = k->stride[d] * (int64_t) k->shape[d];
+    }
+    return true;
+}
 
-//TODO: NEED TWO more kernels with transpose A and transpose B
-//make this by adding FLAGS to forward/backward func def (also stored in graph)
-//or just make more kernels (prob better KISS)
+static bool is_batch_broadcast(kernel_tensor *k){
+    return (k->shape[0] == 1) && (k->shape[1] == 1) && (k->shape[2] == 1);
+}
 
-FORWARD_FUNC_DEF(m_op_bmm_forward){
+//describes k (or its transpose) for gemm without copying, returns a contiguous copy that
+//the caller must free when the batch dims of a view cannot be walked with one stride
+static kernel_tensor * as_gemm_matrix(kernel_tensor *k, bool transpose, gemm_matrix *mat){
+    kernel_tensor *gathered = NULL;
+    int64_t batch_stride;
+    if (get_batch_stride(k, &batch_stride) == false){
+        gathered = contiguous_deepcopy_kernel_tensor(k);
+        k = gathered;
+        get_batch_stride(k, &batch_stride);
+    }
+    mat->data = k->array;
+    mat->batch_stride = batch_stride;
+    mat->row_stride = transpose ? k->stride[4] : k->stride[3];
+    mat->col_stride = transpose ? k->stride[3] : k->stride[4];
+    return gathered;
+}
+
+//out = op(A) @ op(B) per batch, or summed over the batch when reduce_batch
+static void gemm_maybe_reduced(size_t batch, size_t m, size_t n, size_t k,
+                               gemm_matrix a, gemm_matrix b, lemur_float *out, bool reduce_batch){
+    if ((reduce_batch == false) || (batch == 1)){
+        gemm(batch, m, n, k, a, b, out, (int64_t) (m * n), (int64_t) n, false);
+        return;
+    }
+    //the batch continues the reduction dim of both operands: one gemm with batch * k
+    if ((a.batch_stride == (int64_t) k * a.col_stride) && (b.batch_stride == (int64_t) k * b.row_stride)){
+        gemm(1, m, n, k * batch, a, b, out, 0, (int64_t) n, false);
+        return;
+    }
+    for (size_t bi = 0; bi < batch; bi++){
+        gemm_matrix ab = a;
+        gemm_matrix bb = b;
+        ab.data += (int64_t) bi * a.batch_stride;
+        bb.data += (int64_t) bi * b.batch_stride;
+        gemm(1, m, n, k, ab, bb, out, 0, (int64_t) n, bi > 0);
+    }
+}
+
+static void matmul_forward(kernel_tensor *kr, kernel_tensor *k0, kernel_tensor *k1, bool transpose_b){
+    size_t batch = kr->shape[0] * kr->shape[1] * kr->shape[2];
+    gemm_matrix a, b;
+    kernel_tensor *ga = as_gemm_matrix(k0, false, &a);
+    kernel_tensor *gb = as_gemm_matrix(k1, transpose_b, &b);
+    gemm(batch, kr->shape[3], kr->shape[4], k0->shape[4], a, b,
+         kr->array, (int64_t) (kr->shape[3] * kr->shape[4]), (int64_t) kr->shape[4], false);
+    if (ga != NULL){
+        free_kernel_tensor(&ga);
+    }
+    if (gb != NULL){
+        free_kernel_tensor(&gb);
+    }
+}
+
+//seed is not modified, a new gradient is always returned
+static kernel_tensor * matmul_backward(kernel_tensor *kr, kernel_tensor *k0, kernel_tensor *k1,
+                                       kernel_tensor *seed, size_t idx, bool transpose_b){
+    size_t batch = kr->shape[0] * kr->shape[1] * kr->shape[2];
     size_t i = kr->shape[3];
     size_t j = kr->shape[4];
     size_t k = k0->shape[4];
-    size_t bs = kr->shape[0] * kr->shape[1] * kr->shape[2];
-   
-    // bs x (i x k) @ bs x (k x j) --> bs x (i x j)
-    lemur_float (*A)[i][k] = (lemur_float (*)[i][k]) k0->array;
-    lemur_float (*B)[k][j] = (lemur_float (*)[k][j]) k1->array;
-    lemur_float (*C)[i][j] = (lemur_float (*)[i][j]) kr->array;
-
-    //do ikj for better locality 
-    #pragma omp parallel for 
-    for (size_t _b = 0; _b < bs; _b++){
-
-        #pragma omp parallel for collapse(2) schedule(dynamic)
-        for (size_t _i = 0; _i < i; _i += TILE_SIZE){
-            for (size_t _k = 0; _k < k; _k += TILE_SIZE){
-                for (size_t _j = 0; _j < j; _j += TILE_SIZE){
-                    
-                    for (size_t ii = _i; ii < MIN(_i + TILE_SIZE, i); ii++) {
-                        for (size_t kk = _k; kk < MIN(_k + TILE_SIZE, k); kk++) {
-                            #pragma omp simd
-                            for (size_t jj = _j; jj < MIN(_j + TILE_SIZE, j); jj++) {
-                                C[_b][ii][jj] += A[_b][ii][kk] * B[_b][kk][jj];
-                            }
-                        }
-                    }
-
-                }
-            }
-        }
+    kernel_tensor *target = (idx == 0) ? k0 : k1;
+    kernel_tensor *next_seed = empty_contiguous_kernel_tensor(target->shape);
+    bool reduce_batch = is_batch_broadcast(target) && (batch > 1);
+
+    gemm_matrix a, b;
+    kernel_tensor *ga = NULL;
+    kernel_tensor *gb = NULL;
+    if (idx == 0){
+        //dA = G @ B^T (or G @ B for _fast): i x k, reduction over j
+        ga = as_gemm_matrix(seed, false, &a);
+        gb = as_gemm_matrix(k1, !transpose_b, &b);
+        gemm_maybe_reduced(batch, i, k, j, a, b, next_seed->array, reduce_batch);
+    } else if (transpose_b == false){
+        //dB = A^T @ G: k x j, reduction over i
+        ga = as_gemm_matrix(k0, true, &a);
+        gb = as_gemm_matrix(seed, false, &b);
+        gemm_maybe_reduced(batch, k, j, i, a, b, next_seed->array, reduce_batch);
+    } else {
+        //dB = G^T @ A: j x k, reduction over i
+        ga = as_gemm_matrix(seed, true, &a);
+        gb = as_gemm_matrix(k0, false, &b);
+        gemm_maybe_reduced(batch, j, k, i, a, b, next_seed->array, reduce_batch);
+    }
+    if (ga != NULL){
+        free_kernel_tensor(&ga);
     }
+    if (gb != NULL){
+        free_kernel_tensor(&gb);
+    }
+    return next_seed;
+}
 
+FORWARD_FUNC_DEF(m_op_bmm_forward){
+    matmul_forward(kr, k0, k1, false);
 }
 
 BACKWARD_FUNC_DEF(m_op_bmm_backward){
-    (void) kr; (void) k0; (void) k1; (void) seed; (void) idx;
-    return NULL;
+    return matmul_backward(kr, k0, k1, seed, idx, false);
 }
 
 FORWARD_FUNC_DEF(m_op_bcmm_forward){
-    (void) kr; (void) k0; (void) k1;
-
+    matmul_forward(kr, k0, k1, false);
 }
 
 BACKWARD_FUNC_DEF(m_op_bcmm_backward){
-    (void) kr; (void) k0; (void) k1; (void) seed; (void) idx;
-    return NULL;
+    return matmul_backward(kr, k0, k1, seed, idx, false);
 }
 
 FORWARD_FUNC_DEF(m_op_bmm_fast_forward){
-    (void) kr; (void) k0; (void) k1;
-
+    matmul_forward(kr, k0, k1, true);
 }
 
 BACKWARD_FUNC_DEF(m_op_bmm_fast_backward){
-    (void) kr; (void) k0; (void) k1; (void) seed; (void) idx;
-    return NULL;
+    return matmul_backward(kr, k0, k1, seed, idx, true);
 }
 
 FORWARD_FUNC_DEF(m_op_bcmm_fast_forward){
-    (void) kr; (void) k0; (void) k1;
-
+    matmul_forward(kr, k0, k1, true);
 }
 
 BACKWARD_FUNC_DEF(m_op_bcmm_fast_backward){
-    (void) kr; (void) k0; (void) k1; (void) seed; (void) idx;
-    return NULL;
+    return matmul_backward(kr, k0, k1, seed, idx, true);
 }
@@ -1,4 +1,4 @@
-#include "../../include/tensor.h"
+#include "../../include/interface.h"
 
 
 inline lemur_float is_close(lemur_float a, lemur_float b, lemur_float rtol, lemur_float atol) {
@@ -14,11 +14,6 @@ tensor *isclose(tensor *a, tensor *b, lemur_float rtol, lemur_float atol){
     fprintf(stderr, "Error: atol cannot be less than 0.\n");
         return NULL; 
     }
-    if (a->k->length != b->k->length){
-        fprintf(stderr, "Error: Tensors a and b must have the same memory length.\n");
-        return NULL;
-    }
-    
     if (a->k->shape[0] != b->k->shape[0] || 
         a->k->shape[1] != b->k->shape[1] ||
         a->k->shape[2] != b->k->shape[2] ||
@@ -27,21 +22,13 @@ tensor *isclose(tensor *a, tensor *b, lemur_float rtol, lemur_float atol){
         fprintf(stderr, "Error: Tensors a and b must have the same shape.\n");
         return NULL;
     }
+    compute(a);
+    compute(b);
     tensor *c = empty_tensor(a->k->shape, false, false);
     
-    if (a->k->length > 1<<17) {                                                 
-        #pragma omp parallel for simd                              
-        for (size_t _i = 0; _i < a->k->length; _i++) {                       
-            c->k->array[_i] = is_close(a->k->array[_i], b->k->array[_i], rtol, atol);   
-        }                                                                    
-    } else {         
-        #pragma omp simd                                                            
-        for (size_t _i = 0; _i < a->k->length; _i++) {                           
-            c->k->array[_i] = is_close(a->k->array[_i], b->k->array[_i], rtol, atol);   
-        }                                                                        
-    }          
-    
-    
+    #define _is_close(x, y) is_close((x), (y), rtol, atol)
+    BINARY_ELEMENTWISE_OP_SIMD(c->k, a->k, b->k, _is_close);
+    #undef _is_close
 
     return c;
 
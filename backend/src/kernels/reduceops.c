@@ -1,100 +1,461 @@
 #include "../../include/tensor.h"
 
+//reduction engine
+//no atomics: every output element is owned by exactly one thread, when there are too few outputs
+//to keep all threads busy the reduced range is split into chunks whose partial results are
+//combined with a tree. sums are pairwise (error grows with log n instead of n), kahan summation
+//is not used because -ffast-math is allowed to optimize the compensation away.
 
-FORWARD_FUNC_DEF(r_op_sum_forward){
+#define PAIRWISE_BLOCK 128
+#define REDUCE_CHUNK (1<<14)
+#define REDUCE_COLUMNS 256
+
+enum {
+    RED_SUM = 0,
+    RED_MAX,
+    RED_MIN,
+    RED_ALL,
+    RED_ANY,
+    RED_ARGMAX,
+    RED_ARGMIN,
+};
+
+#define _r_sum(a, b) ((a) + (b))
+#define _r_max(a, b) (((b) > (a)) ? (b) : (a))
+#define _r_min(a, b) (((b) < (a)) ? (b) : (a))
+#define _r_all(a, b) ((((a) != 0.0) && ((b) != 0.0)) ? 1.0 : 0.0)
+#define _r_any(a, b) ((((a) != 0.0) || ((b) != 0.0)) ? 1.0 : 0.0)
+
+//kept and reduced dimensions of the input, size 1 dims are dropped and
+//neighbouring dims of the same kind are merged when their strides allow it
+typedef struct reduce_plan {
+    size_t out_length;
+    size_t red_length;
+    size_t keep_ndim;
+    size_t red_ndim;
+    size_t keep_shape[5];
+    size_t red_shape[5];
+    int64_t keep_stride[5];
+    int64_t red_stride[5];
+} reduce_plan;
 
-   memset_kernel_tensor(kr, 0.0);
-
-   size_t rd0, rd1, rd2, rd3, rd4;
-   size_t is_rd0 = (size_t) k1->array[0];
-   size_t is_rd1 = (size_t) k1->array[1];
-   size_t is_rd2 = (size_t) k1->array[2];
-   size_t is_rd3 = (size_t) k1->array[3];
-   size_t is_rd4 = (size_t) k1->array[4];
-
-   KERNEL_TENSOR_5D_LOOP_START(k0){
-
-        size_t offset_k0 = KERNEL_TENSOR_GET_OFFSET(k0);
-    
-        rd0 = d0 * is_rd0;
-        rd1 = d1 * is_rd1;
-        rd2 = d2 * is_rd2;
-        rd3 = d3 * is_rd3;
-        rd4 = d4 * is_rd4;
-        size_t offset_kr = rd0*(kr)->stride[0] + rd1*(kr)->stride[1] 
-                         + rd2*(kr)->stride[2] + rd3*(kr)->stride[3] 
-                         + rd4*(kr)->stride[4];
-        #pragma omp atomic
-        kr->array[offset_kr] += k0->array[offset_k0];
-   }
-    
-   return;
+//dims follows the reduce op convention: 1 at the dimensions that stay put, 0 at the reduced ones
+static void make_reduce_plan(reduce_plan *p, size_t shape[5], int64_t stride[5], lemur_float *dims){
+    p->keep_ndim = 0;
+    p->red_ndim = 0;
+    p->out_length = 1;
+    p->red_length = 1;
+    int last_kind = -1;
+    for (size_t i = 0; i < 5; i++){
+        size_t n = shape[i];
+        bool keep = ((size_t) dims[i] == 1);
+        if (keep){
+            p->out_length *= n;
+        } else {
+            p->red_length *= n;
+        }
+        if (n == 1){
+            continue;
+        }
+        size_t *ndim = keep ? &p->keep_ndim : &p->red_ndim;
+        size_t *s = keep ? p->keep_shape : p->red_shape;
+        int64_t *st = keep ? p->keep_stride : p->red_stride;
+        if ((*ndim > 0) && (last_kind == (int) keep) && (st[*ndim - 1] == stride[i] * (int64_t) n)){
+            s[*ndim - 1] *= n;
+            st[*ndim - 1] = stride[i];
+        } else {
+            s[*ndim] = n;
+            st[*ndim] = stride[i];
+            (*ndim)++;
+        }
+        last_kind = (int) keep;
+    }
 }
 
-BACKWARD_FUNC_DEF(r_op_sum_backward){
-    (void) kr; (void) idx; 
+static inline int64_t decode_offset(size_t idx, size_t ndim, const size_t *shape, const int64_t *stride){
+    int64_t offset = 0;
+    for (size_t d = ndim; d-- > 0;){
+        offset += (int64_t) (idx % shape[d]) * stride[d];
+        idx /= shape[d];
+    }
+    return offset;
+}
+
+#define RED_OFFSET(p, r) decode_offset((r), (p)->red_ndim, (p)->red_shape, (p)->red_stride)
+
+static lemur_float sum_block(const lemur_float *x, const reduce_plan *p, size_t lo, size_t hi){
+    lemur_float acc = 0.0;
+    if (p->red_ndim <= 1){
+        int64_t s = (p->red_ndim == 1) ? p->red_stride[0] : 0;
+        if (s == 1){
+            #pragma omp simd reduction(+:acc)
+            for (size_t r = lo; r < hi; r++){
+                acc += x[r];
+            }
+        } else {
+            for (size_t r = lo; r < hi; r++){
+                acc += x[(int64_t) r * s];
+            }
+        }
+    } else {
+        for (size_t r = lo; r < hi; r++){
+            acc += x[RED_OFFSET(p, r)];
+        }
+    }
+    return acc;
+}
+
+static lemur_float pairwise_sum(const lemur_float *x, const reduce_plan *p, size_t lo, size_t hi){
+    if (hi - lo <= PAIRWISE_BLOCK){
+        return sum_block(x, p, lo, hi);
+    }
+    size_t mid = lo + ((hi - lo) / 2);
+    return pairwise_sum(x, p, lo, mid) + pairwise_sum(x, p, mid, hi);
+}
+
+#define DEFINE_REDUCE_RANGE(name, op)                                                      \
+static lemur_float name(const lemur_float *x, const reduce_plan *p, size_t lo, size_t hi){ \
+    lemur_float acc = x[RED_OFFSET(p, lo)];                                                \
+    acc = op(acc, acc);                                                                    \
+    if ((p->red_ndim == 1) && (p->red_stride[0] == 1)){                                    \
+        for (size_t r = lo + 1; r < hi; r++){                                              \
+            acc = op(acc, x[r]);                                                           \
+        }                                                                                  \
+    } else {                                                                               \
+        for (size_t r = lo + 1; r < hi; r++){                                              \
+            acc = op(acc, x[RED_OFFSET(p, r)]);                                            \
+        }                                                                                  \
+    }                                                                                      \
+    return acc;                                                                            \
+}
+
+DEFINE_REDUCE_RANGE(max_range, _r_max)
+DEFINE_REDUCE_RANGE(min_range, _r_min)
+DEFINE_REDUCE_RANGE(all_range, _r_all)
+DEFINE_REDUCE_RANGE(any_range, _r_any)
+
+//first index of the extreme value, sign is 1 for argmax and -1 for argmin
+static size_t arg_range(const lemur_float *x, const reduce_plan *p, size_t lo, size_t hi, lemur_float sign, lemur_float *best_val){
+    size_t best = lo;
+    lemur_float best_v = sign * x[RED_OFFSET(p, lo)];
+    for (size_t r = lo + 1; r < hi; r++){
+        lemur_float v = sign * x[RED_OFFSET(p, r)];
+        if (v > best_v){
+            best_v = v;
+            best = r;
+        }
+    }
+    *best_val = best_v;
+    return best;
+}
+
+static lemur_float reduce_range(int kind, const lemur_float *x, const reduce_plan *p, size_t lo, size_t hi){
+    lemur_float v;
+    switch (kind){
+        case RED_SUM: return pairwise_sum(x, p, lo, hi);
+        case RED_MAX: return max_range(x, p, lo, hi);
+        case RED_MIN: return min_range(x, p, lo, hi);
+        case RED_ALL: return all_range(x, p, lo, hi);
+        case RED_ANY: return any_range(x, p, lo, hi);
+        case RED_ARGMAX: return (lemur_float) arg_range(x, p, lo, hi, 1.0, &v);
+        case RED_ARGMIN: return (lemur_float) arg_range(x, p, lo, hi, -1.0, &v);
+        default: return 0.0;
+    }
+}
+
+static inline lemur_float combine(int kind, lemur_float a, lemur_float b){
+    switch (kind){
+        case RED_SUM: return _r_sum(a, b);
+        case RED_MAX: return _r_max(a, b);
+        case RED_MIN: return _r_min(a, b);
+        case RED_ALL: return _r_all(a, b);
+        case RED_ANY: return _r_any(a, b);
+        default: return a;
+    }
+}
+
+static lemur_float identity(int kind){
+    return ((kind == RED_ALL)) ? 1.0 : 0.0;
+}
+
+//kept dims are the contiguous innermost block and every reduced dim is outside of it:
+//accumulate whole rows with unit stride (vectorizes over the outputs)
+static void reduce_rows(int kind, kernel_tensor *kr, kernel_tensor *k0, const reduce_plan *p){
+    size_t M = p->out_length;
+    size_t R = p->red_length;
+    size_t num_col_chunks = (M + REDUCE_COLUMNS - 1) / REDUCE_COLUMNS;
+    size_t num_threads = (size_t) omp_get_max_threads();
+    bool parallel = USE_PARALLEL(PARALLEL_REDUCE, M * R);
+    //not enough column chunks for every thread: also split the rows, one partial row vector each
+    size_t num_parts = 1;
+    if (parallel && (num_col_chunks < num_threads)){
+        num_parts = (R + PAIRWISE_BLOCK - 1) / PAIRWISE_BLOCK;
+        num_parts = (num_parts < num_threads) ? num_parts : num_threads;
+    }
+    size_t rows_per_part = (R + num_parts - 1) / num_parts;
+    num_parts = (R + rows_per_part - 1) / rows_per_part; //no empty parts
+    lemur_float *partials = (num_parts > 1) ? lemur_alloc(num_parts * M) : NULL;
+
+    #pragma omp parallel for collapse(2) schedule(static) if(parallel)
+    for (size_t part = 0; part < num_parts; part++){
+        for (size_t chunk = 0; chunk < num_col_chunks; chunk++){
+            size_t c0 = chunk * REDUCE_COLUMNS;
+            size_t cn = ((M - c0) < REDUCE_COLUMNS) ? (M - c0) : REDUCE_COLUMNS;
+            size_t r0 = part * rows_per_part;
+            size_t r1 = ((r0 + rows_per_part) < R) ? (r0 + rows_per_part) : R;
+            lemur_float *dst = (num_parts > 1) ? partials + part * M + c0 : kr->array + c0;
+            lemur_float total[REDUCE_COLUMNS];
+            lemur_float block[REDUCE_COLUMNS];
+            for (size_t j = 0; j < cn; j++){
+                total[j] = identity(kind);
+            }
+            if (r0 < r1){
+                const lemur_float *first = k0->array + RED_OFFSET(p, r0) + c0;
+                for (size_t j = 0; j < cn; j++){
+                    total[j] = (kind == RED_SUM) ? 0.0 : combine(kind, first[j], first[j]);
+                }
+            }
+            for (size_t rb = r0; rb < r1; rb += PAIRWISE_BLOCK){
+                size_t rb_end = ((rb + PAIRWISE_BLOCK) < r1) ? (rb + PAIRWISE_BLOCK) : r1;
+                switch (kind){
+                    case RED_SUM:
+                        //two level: rows are summed in blocks, then block sums are added to the total
+                        for (size_t j = 0; j < cn; j++){
+                            block[j] = 0.0;
+                        }
+                        for (size_t r = rb; r < rb_end; r++){
+                            const lemur_float *row = k0->array + RED_OFFSET(p, r) + c0;
+                            #pragma omp simd
+                            for (size_t j = 0; j < cn; j++){
+                                block[j] += row[j];
+                            }
+                        }
+                        #pragma omp simd
+                        for (size_t j = 0; j < cn; j++){
+                            total[j] += block[j];
+                        }
+                        break;
+                    default:
+                        for (size_t r = rb; r < rb_end; r++){
+                            const lemur_float *row = k0->array + RED_OFFSET(p, r) + c0;
+                            for (size_t j = 0; j < cn; j++){
+                                total[j] = combine(kind, total[j], row[j]);
+                            }
+                        }
+                        break;
+                }
+            }
+            memcpy(dst, total, cn * sizeof(lemur_float));
+        }
+    }
+
+    if (num_parts > 1){
+        //tree combine of the partial rows
+        for (size_t step = 1; step < num_parts; step *= 2){
+            #pragma omp parallel for if(parallel)
+            for (size_t part = 0; part < num_parts - step; part += 2 * step){
+                lemur_float *a = partials + part * M;
+                lemur_float *b = partials + (part + step) * M;
+                for (size_t j = 0; j < M; j++){
+                    a[j] = combine(kind, a[j], b[j]);
+                }
+            }
+        }
+        memcpy(kr->array, partials, M * sizeof(lemur_float));
+        lemur_free(partials, num_parts * M);
+    }
+}
+
+static void reduce_forward(int kind, kernel_tensor *kr, kernel_tensor *k0, kernel_tensor *k1){
+    reduce_plan p;
+    make_reduce_plan(&p, k0->shape, k0->stride, k1->array);
+    size_t M = p.out_length;
+    size_t R = p.red_length;
+
+    if ((M == 0) || (R == 0)){
+        for (size_t o = 0; o < M; o++){
+            kr->array[o] = identity(kind);
+        }
+        return;
+    }
+
+    size_t work = M * R;
+    size_t num_threads = (size_t) omp_get_max_threads();
+    bool parallel = USE_PARALLEL(PARALLEL_REDUCE, work);
+
+    //contiguous innermost kept axis
+    if ((kind != RED_ARGMAX) && (kind != RED_ARGMIN) && (R > 1) &&
+        (p.keep_ndim == 1) && (p.keep_stride[0] == 1) && (M >= 64)){
+        bool reduced_outside = true;
+        for (size_t d = 0; d < p.red_ndim; d++){
+            if (p.red_stride[d] < (int64_t) M){
+                reduced_outside = false;
+            }
+        }
+        if (reduced_outside){
+            reduce_rows(kind, kr, k0, &p);
+            return;
+        }
+    }
+
+    //enough outputs: one thread per output element (full reduction of its range)
+    if (parallel == false){
+        for (size_t o = 0; o < M; o++){
+            const lemur_float *x = k0->array + decode_offset(o, p.keep_ndim, p.keep_shape, p.keep_stride);
+            kr->array[o] = reduce_range(kind, x, &p, 0, R);
+        }
+        return;
+    }
+    if (M >= num_threads){
+        #pragma omp parallel for schedule(static)
+        for (size_t o = 0; o < M; o++){
+            const lemur_float *x = k0->array + decode_offset(o, p.keep_ndim, p.keep_shape, p.keep_stride);
+            kr->array[o] = reduce_range(kind, x, &p, 0, R);
+        }
+        return;
+    }
+
+    //few outputs (e.g. full reduction to a scalar): per thread partials over chunks of the
+    //reduced range, combined with a tree in chunk order
+    size_t num_chunks = (R + REDUCE_CHUNK - 1) / REDUCE_CHUNK;
+    lemur_float *partials = lemur_alloc(M * num_chunks);
+    lemur_float *partial_vals = ((kind == RED_ARGMAX) || (kind == RED_ARGMIN)) ? lemur_alloc(M * num_chunks) : NULL;
+
+    #pragma omp parallel for collapse(2) schedule(static)
+    for (size_t o = 0; o < M; o++){
+        for (size_t c = 0; c < num_chunks; c++){
+            const lemur_float *x = k0->array + decode_offset(o, p.keep_ndim, p.keep_shape, p.keep_stride);
+            size_t lo = c * REDUCE_CHUNK;
+            size_t hi = ((lo + REDUCE_CHUNK) < R) ? (lo + REDUCE_CHUNK) : R;
+            if (partial_vals != NULL){
+                lemur_float v;
+                partials[o * num_chunks + c] = (lemur_float) arg_range(x, &p, lo, hi, (kind == RED_ARGMAX) ? 1.0 : -1.0, &v);
+                partial_vals[o * num_chunks + c] = v;
+            } else {
+                partials[o * num_chunks + c] = reduce_range(kind, x, &p, lo, hi);
+            }
+        }
+    }
+
+    for (size_t o = 0; o < M; o++){
+        lemur_float *part = partials + o * num_chunks;
+        lemur_float *vals = (partial_vals != NULL) ? partial_vals + o * num_chunks : NULL;
+        for (size_t step = 1; step < num_chunks; step *= 2){
+            for (size_t c = 0; c + step < num_chunks; c += 2 * step){
+                if (vals != NULL){
+                    if (vals[c + step] > vals[c]){ //ties keep the earlier index
+                        vals[c] = vals[c + step];
+                        part[c] = part[c + step];
+                    }
+                } else {
+                    part[c] = combine(kind, part[c], part[c + step]);
+                }
+            }
+        }
+        kr->array[o] = part[0];
+    }
+    lemur_free(partials, M * num_chunks);
+    if (partial_vals != NULL){
+        lemur_free(partial_vals, M * num_chunks);
+    }
+}
+
+//broadcasts seed (shape of kr) back to the shape of k0 with stride 0 on the reduced dims
+static kernel_tensor * expand_seed_to_input(kernel_tensor *k0, kernel_tensor *k1, kernel_tensor *seed){
     for (size_t i = 0; i < 5; i++) {
-        if ( (size_t) k1->array[i] == 0 ){ //todo this is an expand to the size of k0
+        if ( (size_t) k1->array[i] == 0 ){
             seed->stride[i] = 0;
             seed->shape[i] = k0->shape[i];
         }
-    } 
+    }
     return seed;
 }
 
-FORWARD_FUNC_DEF(r_op_all_forward){
-    memset_kernel_tensor(kr, 1.0);
+FORWARD_FUNC_DEF(r_op_sum_forward){
+    reduce_forward(RED_SUM, kr, k0, k1);
+}
+
+BACKWARD_FUNC_DEF(r_op_sum_backward){
+    (void) kr; (void) idx;
+    return expand_seed_to_input(k0, k1, seed);
+}
+
+FORWARD_FUNC_DEF(r_op_mean_forward){
+    reduce_forward(RED_SUM, kr, k0, k1);
+    size_t count = (kr->length > 0) ? (get_alleged_length(k0->shape) / kr->length) : 0;
+    lemur_float scale = (count > 0) ? 1.0 / (lemur_float) count : 0.0;
+    for (size_t o = 0; o < kr->length; o++){
+        kr->array[o] *= scale;
+    }
+}
+
+BACKWARD_FUNC_DEF(r_op_mean_backward){
+    (void) idx;
+    size_t count = get_alleged_length(k0->shape) / kr->length;
+    lemur_float scale = 1.0 / (lemur_float) count;
+    for (size_t o = 0; o < seed->length; o++){
+        seed->array[o] *= scale;
+    }
+    return expand_seed_to_input(k0, k1, seed);
+}
 
-    size_t rd0, rd1, rd2, rd3, rd4;
-    size_t is_rd0 = (size_t) k1->array[0];
-    size_t is_rd1 = (size_t) k1->array[1];
-    size_t is_rd2 = (size_t) k1->array[2];
-    size_t is_rd3 = (size_t) k1->array[3];
-    size_t is_rd4 = (size_t) k1->array[4];
+FORWARD_FUNC_DEF(r_op_max_forward){
+    reduce_forward(RED_MAX, kr, k0, k1);
+}
 
-    KERNEL_TENSOR_5D_LOOP_START(k0){
+FORWARD_FUNC_DEF(r_op_min_forward){
+    reduce_forward(RED_MIN, kr, k0, k1);
+}
 
-        size_t offset_k0 = KERNEL_TENSOR_GET_OFFSET(k0);
-        
-        rd0 = d0 * is_rd0;
-        rd1 = d1 * is_rd1;
-        rd2 = d2 * is_rd2;
-        rd3 = d3 * is_rd3;
-        rd4 = d4 * is_rd4;
-        size_t offset_kr = rd0*(kr)->stride[0] + rd1*(kr)->stride[1] 
-                        + rd2*(kr)->stride[2] + rd3*(kr)->stride[3] 
-                        + rd4*(kr)->stride[4];
+//the gradient goes to the elements equal to the extreme value, split evenly between ties
+static kernel_tensor * extreme_backward(kernel_tensor *kr, kernel_tensor *k0, kernel_tensor *k1, kernel_tensor *seed){
+    kernel_tensor *next_seed = empty_contiguous_kernel_tensor(k0->shape);
+    reduce_plan p, q;
+    make_reduce_plan(&p, k0->shape, k0->stride, k1->array);
+    make_reduce_plan(&q, next_seed->shape, next_seed->stride, k1->array);
+    size_t M = p.out_length;
+    size_t R = p.red_length;
 
-        lemur_float new_val = ((k0->array[offset_k0] == 0.0) || (kr->array[offset_kr] == 0.0)) ? 0.0 : 1.0;
-        #pragma omp atomic write
-        kr->array[offset_kr] = new_val;
+    #pragma omp parallel for schedule(static) if(USE_PARALLEL(PARALLEL_REDUCE, M * R))
+    for (size_t o = 0; o < M; o++){
+        const lemur_float *x = k0->array + decode_offset(o, p.keep_ndim, p.keep_shape, p.keep_stride);
+        lemur_float *g = next_seed->array + decode_offset(o, q.keep_ndim, q.keep_shape, q.keep_stride);
+        lemur_float m = kr->array[o];
+        size_t count = 0;
+        for (size_t r = 0; r < R; r++){
+            count += (x[RED_OFFSET(&p, r)] == m);
+        }
+        lemur_float share = seed->array[o] / (lemur_float) ((count > 0) ? count : 1);
+        for (size_t r = 0; r < R; r++){
+            g[RED_OFFSET(&q, r)] = (x[RED_OFFSET(&p, r)] == m) ? share : 0.0;
+        }
     }
+    return next_seed;
+}
+
+BACKWARD_FUNC_DEF(r_op_max_backward){
+    (void) idx;
+    return extreme_backward(kr, k0, k1, seed);
+}
+
+BACKWARD_FUNC_DEF(r_op_min_backward){
+    (void) idx;
+    return extreme_backward(kr, k0, k1, seed);
+}
+
+//argmax/argmin return the flat (row major) index inside the reduced dimensions
+FORWARD_FUNC_DEF(r_op_argmax_forward){
+    reduce_forward(RED_ARGMAX, kr, k0, k1);
+}
+
+FORWARD_FUNC_DEF(r_op_argmin_forward){
+    reduce_forward(RED_ARGMIN, kr, k0, k1);
+}
+
+FORWARD_FUNC_DEF(r_op_all_forward){
+    reduce_forward(RED_ALL, kr, k0, k1);
 }
 
 FORWARD_FUNC_DEF(r_op_any_forward){
-    memset_kernel_tensor(kr, 0.0);
-
-    size_t rd0, rd1, rd2, rd3, rd4;
-    size_t is_rd0 = (size_t) k1->array[0];
-    size_t is_rd1 = (size_t) k1->array[1];
-    size_t is_rd2 = (size_t) k1->array[2];
-    size_t is_rd3 = (size_t) k1->array[3];
-    size_t is_rd4 = (size_t) k1->array[4];
-
-    KERNEL_TENSOR_5D_LOOP_START(k0){
-
-        size_t offset_k0 = KERNEL_TENSOR_GET_OFFSET(k0);
-        
-        rd0 = d0 * is_rd0;
-        rd1 = d1 * is_rd1;
-        rd2 = d2 * is_rd2;
-        rd3 = d3 * is_rd3;
-        rd4 = d4 * is_rd4;
-        size_t offset_kr = rd0*(kr)->stride[0] + rd1*(kr)->stride[1] 
-                        + rd2*(kr)->stride[2] + rd3*(kr)->stride[3] 
-                        + rd4*(kr)->stride[4];
-        lemur_float new_val = (k0->array[offset_k0] != 0.0) ? 1.0 : kr->array[offset_kr];
-        #pragma omp atomic write
-        kr->array[offset_kr] = new_val;
-    }
-}
\ No newline at end of file
+    reduce_forward(RED_ANY, kr, k0, k1);
+}
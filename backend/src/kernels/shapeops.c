@@ -40,6 +40,8 @@ BACKWARD_FUNC_DEF(s_op_expand_backward){
     dims.array = dim_arr;
     dims.length = 5;
     dims.shallow = false;
+    dims.mapped = false;
+    dims.readonly = false;
 
     dims.shape[0] = 1;
     dims.shape[1] = 1;
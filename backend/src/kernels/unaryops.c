@@ -1,85 +1,64 @@
 #include "../../include/tensor.h"
 
+//k0 may be any strided view, kr and seed are contiguous
+//exp, log, pow and sigmoid go through simdmath.h, so their loops vectorize with any compiler
+
 FORWARD_FUNC_DEF(u_op_exp_forward){
     (void) k1;
-    UNARY_CONTIGUOUS_ELEMENTWISE_OP_SIMD(kr, k0, expf);
+    UNARY_ELEMENTWISE_OP_SIMD(kr, k0, lemur_expf);
 }
 
 BACKWARD_FUNC_DEF(u_op_exp_backward){
     (void) k0; (void) k1; (void) idx;
-    BINARY_CONTIGUOUS_ELEMENTWISE_OP_SIMD(seed, seed, kr, _mul);
+    BINARY_ELEMENTWISE_OP_SIMD(seed, seed, kr, _mul);
     return seed;
 }
 
 FORWARD_FUNC_DEF(u_op_pow_forward){
     lemur_float x = k1->array[0];
-    if (kr->length > 1<<17) {                                                 
-        #pragma omp parallel for simd                                     
-          for (size_t _i = 0; _i < kr->length; _i++) {                       
-            kr->array[_i] = powf(k0->array[_i], x);   
-          }                                                                    
-    } else {                                                                     
-        #pragma omp simd                                                  
-        for (size_t _i = 0; _i < kr->length; _i++) {                       
-            kr->array[_i] = powf(k0->array[_i], x);   
-        }                                                                        
-    }  
+    #define _pow_x(a) lemur_powf((a), x)
+    UNARY_ELEMENTWISE_OP_SIMD(kr, k0, _pow_x);
+    #undef _pow_x
 }
 
 BACKWARD_FUNC_DEF(u_op_pow_backward){
     (void) kr; (void) idx;
     lemur_float x = k1->array[0];
-    if (kr->length > 1<<17) {                                                 
-        #pragma omp parallel for simd                                     
-          for (size_t _i = 0; _i < kr->length; _i++) {
-            lemur_float val = x * powf(k0->array[_i], x-1.0);                       
-            seed->array[_i] *= val;
-          }                                                                    
-    } else {                                                                     
-        #pragma omp simd                                                  
-         for (size_t _i = 0; _i < kr->length; _i++) {
-            lemur_float val = x * powf(k0->array[_i], x-1.0);                       
-            seed->array[_i] *= val;
-          }                                                                          
-    }  
+    #define _pow_x_grad(s, a) ((s) * x * lemur_powf((a), x - 1.0f))
+    BINARY_ELEMENTWISE_OP_SIMD(seed, seed, k0, _pow_x_grad);
+    #undef _pow_x_grad
     return seed;
 }
 
 FORWARD_FUNC_DEF(u_op_relu_forward){
     (void) k1;
-    UNARY_CONTIGUOUS_ELEMENTWISE_OP_SIMD(kr, k0, _relu);
+    UNARY_ELEMENTWISE_OP_SIMD(kr, k0, _relu);
 }
 
 BACKWARD_FUNC_DEF(u_op_relu_backward){
     (void) k0; (void) k1; (void) idx;
-    KERNEL_TENSOR_5D_LOOP_START(seed){
-        size_t offset_seed = KERNEL_TENSOR_GET_OFFSET(seed);
-        size_t offset_kr = KERNEL_TENSOR_GET_OFFSET(kr);
-        lemur_float val= (kr->array[offset_kr] == 0.0) ? 0.0 : 1.0;  
-        seed->array[offset_seed] *= val;
-    }
+    #define _relu_grad(s, r) (((r) == 0.0) ? 0.0 : (s))
+    BINARY_ELEMENTWISE_OP_SIMD(seed, seed, kr, _relu_grad);
+    #undef _relu_grad
     return seed;
 }
 
 FORWARD_FUNC_DEF(u_op_sigmoid_forward){
     (void) k1;
-    UNARY_CONTIGUOUS_ELEMENTWISE_OP_SIMD(kr, k0, _sigmoid);
+    UNARY_ELEMENTWISE_OP_SIMD(kr, k0, _sigmoid);
 }
 
 BACKWARD_FUNC_DEF(u_op_sigmoid_backward){
     (void) k1; (void) k0; (void) idx;
-    KERNEL_TENSOR_5D_LOOP_START(seed){
-        size_t offset_seed = KERNEL_TENSOR_GET_OFFSET(seed);
-        size_t offset_kr = KERNEL_TENSOR_GET_OFFSET(kr);
-        lemur_float sigmoid_val = kr->array[offset_kr];
-        seed->array[offset_seed] *= sigmoid_val * (1.0 - sigmoid_val);
-    }
+    #define _sigmoid_seed_grad(s, r) ((s) * (r) * (1.0 - (r)))
+    BINARY_ELEMENTWISE_OP_SIMD(seed, seed, kr, _sigmoid_seed_grad);
+    #undef _sigmoid_seed_grad
     return seed;
 }
 
 FORWARD_FUNC_DEF(u_op_log_forward){
     (void) k1;
-    UNARY_CONTIGUOUS_ELEMENTWISE_OP_SIMD(kr, k0, logf);
+    UNARY_ELEMENTWISE_OP_SIMD(kr, k0, lemur_logf);
 }
 
 BACKWARD_FUNC_DEF(u_op_log_backward) {
@@ -90,80 +69,169 @@ BACKWARD_FUNC_DEF(u_op_log_backward) {
 
 FORWARD_FUNC_DEF(u_op_neg_forward){
     (void) k1;
-    KERNEL_TENSOR_5D_LOOP_START(kr){
-        size_t offset_k0 = KERNEL_TENSOR_GET_OFFSET(k0);
-        size_t offset_kr = KERNEL_TENSOR_GET_OFFSET(kr);
-        kr->array[offset_kr] = -1.0 * k0->array[offset_k0];
-    }
+    UNARY_ELEMENTWISE_OP_SIMD(kr, k0, _neg);
 }
 
 BACKWARD_FUNC_DEF(u_op_neg_backward){
     (void) k1; (void) k0; (void) kr; (void) idx;
-    KERNEL_TENSOR_5D_LOOP_START(seed){
-        size_t offset_seed = KERNEL_TENSOR_GET_OFFSET(seed);
-        seed->array[offset_seed] *= -1.0;
-    }
+    UNARY_ELEMENTWISE_OP_SIMD(seed, seed, _neg);
     return seed;
 }
 
 FORWARD_FUNC_DEF(u_op_sqrt_forward){
     (void) k1;
-    UNARY_CONTIGUOUS_ELEMENTWISE_OP_SIMD(kr, k0, sqrtf);
+    UNARY_ELEMENTWISE_OP_SIMD(kr, k0, sqrtf);
 }
 
 BACKWARD_FUNC_DEF(u_op_sqrt_backward){
-    (void) k1; (void) k0; (void) kr; (void) idx;
-    KERNEL_TENSOR_5D_LOOP_START(seed){
-        size_t offset_seed = KERNEL_TENSOR_GET_OFFSET(seed);
-        size_t offset_kr = KERNEL_TENSOR_GET_OFFSET(kr);
-        lemur_float sqrt_val = kr->array[offset_kr];
-        seed->array[offset_seed] *= 1.0 / (2 * sqrt_val);
-    }
+    (void) k1; (void) k0; (void) idx;
+    #define _sqrt_grad(s, r) ((s) * (1.0 / (2 * (r))))
+    BINARY_ELEMENTWISE_OP_SIMD(seed, seed, kr, _sqrt_grad);
+    #undef _sqrt_grad
     return seed;
 }
 
 FORWARD_FUNC_DEF(u_op_abs_forward){
     (void) k1;
-    UNARY_CONTIGUOUS_ELEMENTWISE_OP_SIMD(kr, k0, fabsf);
+    UNARY_ELEMENTWISE_OP_SIMD(kr, k0, fabsf);
 }
 
 BACKWARD_FUNC_DEF(u_op_abs_backward){
-    (void) k1; (void) idx;
-    KERNEL_TENSOR_5D_LOOP_START(seed){
-        size_t offset_seed = KERNEL_TENSOR_GET_OFFSET(seed);
-        size_t offset_k0 = KERNEL_TENSOR_GET_OFFSET(k0);
-        size_t offset_kr = KERNEL_TENSOR_GET_OFFSET(kr);
-        seed->array[offset_seed] *= k0->array[offset_k0] / kr->array[offset_kr];
-    }
+    (void) k1; (void) kr; (void) idx;
+    #define _abs_grad(s, a) ((s) * ((a) / fabsf(a)))
+    BINARY_ELEMENTWISE_OP_SIMD(seed, seed, k0, _abs_grad);
+    #undef _abs_grad
     return seed;
 }
 
 FORWARD_FUNC_DEF(u_op_sign_forward){
     (void) k1;
-    KERNEL_TENSOR_5D_LOOP_START(kr){
-        size_t offset_k0 = KERNEL_TENSOR_GET_OFFSET(k0);
-        size_t offset_kr = KERNEL_TENSOR_GET_OFFSET(kr);
-        lemur_float v = k0->array[offset_k0];
-        kr->array[offset_kr] = (v > 0) - (v < 0);
-    }
+    UNARY_ELEMENTWISE_OP_SIMD(kr, k0, _sign);
 }
 
 
 FORWARD_FUNC_DEF(u_op_reciprocal_forward){
     (void) k1;
-    KERNEL_TENSOR_5D_LOOP_START(kr){
-        size_t offset_k0 = KERNEL_TENSOR_GET_OFFSET(k0);
-        size_t offset_kr = KERNEL_TENSOR_GET_OFFSET(kr);
-        kr->array[offset_kr] = 1.0 / k0->array[offset_k0];
-    }
+    UNARY_ELEMENTWISE_OP_SIMD(kr, k0, _reciprocal);
 }
 
 BACKWARD_FUNC_DEF(u_op_reciprocal_backward){
     (void) k1; (void) k0; (void) idx;
-    KERNEL_TENSOR_5D_LOOP_START(seed){
-        size_t offset_seed = KERNEL_TENSOR_GET_OFFSET(seed);
-        size_t offset_kr = KERNEL_TENSOR_GET_OFFSET(kr);
-        seed->array[offset_seed] *= -1.0 * (kr->array[offset_kr] * kr->array[offset_kr]);
+    #define _reciprocal_grad(s, r) ((s) * (-1.0 * ((r) * (r))))
+    BINARY_ELEMENTWISE_OP_SIMD(seed, seed, kr, _reciprocal_grad);
+    #undef _reciprocal_grad
+    return seed;
+}
+
+//materializes any view into a new contiguous tensor, the gradient passes through unchanged
+FORWARD_FUNC_DEF(u_op_contiguous_forward){
+    (void) k1;
+    UNARY_ELEMENTWISE_OP_SIMD(kr, k0, _copy);
+}
+
+BACKWARD_FUNC_DEF(u_op_contiguous_backward){
+    (void) kr; (void) k0; (void) k1; (void) idx;
+    return seed;
+}
+
+//scalar ops: k1 is the one element immediate of the expression
+
+FORWARD_FUNC_DEF(u_op_add_scalar_forward){
+    lemur_float x = k1->array[0];
+    #define _add_x(a) ((a) + x)
+    UNARY_ELEMENTWISE_OP_SIMD(kr, k0, _add_x);
+    #undef _add_x
+}
+
+BACKWARD_FUNC_DEF(u_op_add_scalar_backward){
+    (void) kr; (void) k0; (void) k1; (void) idx;
+    return seed;
+}
+
+FORWARD_FUNC_DEF(u_op_mul_scalar_forward){
+    lemur_float x = k1->array[0];
+    #define _mul_x(a) ((a) * x)
+    UNARY_ELEMENTWISE_OP_SIMD(kr, k0, _mul_x);
+    #undef _mul_x
+}
+
+BACKWARD_FUNC_DEF(u_op_mul_scalar_backward){
+    (void) kr; (void) k0; (void) idx;
+    lemur_float x = k1->array[0];
+    #define _mul_x(s) ((s) * x)
+    UNARY_ELEMENTWISE_OP_SIMD(seed, seed, _mul_x);
+    #undef _mul_x
+    return seed;
+}
+
+FORWARD_FUNC_DEF(u_op_div_scalar_forward){
+    lemur_float x = k1->array[0];
+    #define _div_x(a) ((a) / x)
+    UNARY_ELEMENTWISE_OP_SIMD(kr, k0, _div_x);
+    #undef _div_x
+}
+
+BACKWARD_FUNC_DEF(u_op_div_scalar_backward){
+    (void) kr; (void) k0; (void) idx;
+    lemur_float x = k1->array[0];
+    #define _div_x(s) ((s) / x)
+    UNARY_ELEMENTWISE_OP_SIMD(seed, seed, _div_x);
+    #undef _div_x
+    return seed;
+}
+
+//x - a
+FORWARD_FUNC_DEF(u_op_rsub_scalar_forward){
+    lemur_float x = k1->array[0];
+    #define _rsub_x(a) (x - (a))
+    UNARY_ELEMENTWISE_OP_SIMD(kr, k0, _rsub_x);
+    #undef _rsub_x
+}
+
+BACKWARD_FUNC_DEF(u_op_rsub_scalar_backward){
+    (void) kr; (void) k0; (void) k1; (void) idx;
+    UNARY_ELEMENTWISE_OP_SIMD(seed, seed, _neg);
+    return seed;
+}
+
+//x / a
+FORWARD_FUNC_DEF(u_op_rdiv_scalar_forward){
+    lemur_float x = k1->array[0];
+    #define _rdiv_x(a) (x / (a))
+    UNARY_ELEMENTWISE_OP_SIMD(kr, k0, _rdiv_x);
+    #undef _rdiv_x
+}
+
+BACKWARD_FUNC_DEF(u_op_rdiv_scalar_backward){
+    (void) k1; (void) idx;
+    //-seed * kr / k0
+    #define _neg_div(a, b) (-1.0 * (a) / (b))
+    BINARY_ELEMENTWISE_OP_SIMD(seed, seed, kr, _mul);
+    BINARY_ELEMENTWISE_OP_SIMD(seed, seed, k0, _neg_div);
+    #undef _neg_div
+    return seed;
+}
+
+//x ** a
+FORWARD_FUNC_DEF(u_op_rpow_scalar_forward){
+    lemur_float x = k1->array[0];
+    if ((x > 0.0f) && (simd_as_uint(x) < SIMD_INF_BITS)){ //log x is finite and taken once
+        double log_x = simd_log_double((double) x);
+        #define _rpow_x(a) (lemur_float) simd_exp_double((double) (a) * log_x)
+        UNARY_ELEMENTWISE_OP_SIMD(kr, k0, _rpow_x);
+        #undef _rpow_x
+    } else {
+        #define _rpow_x(a) lemur_powf(x, (a))
+        UNARY_ELEMENTWISE_OP_SIMD(kr, k0, _rpow_x);
+        #undef _rpow_x
     }
+}
+
+BACKWARD_FUNC_DEF(u_op_rpow_scalar_backward){
+    (void) k0; (void) idx;
+    lemur_float log_x = lemur_logf(k1->array[0]);
+    #define _rpow_x_grad(s, r) ((s) * (r) * log_x)
+    BINARY_ELEMENTWISE_OP_SIMD(seed, seed, kr, _rpow_x_grad);
+    #undef _rpow_x_grad
     return seed;
 }
@@ -4,11 +4,18 @@ __attribute__((constructor))
 void library_init() {
     int num_cores = omp_get_num_procs();
     printf("(Alleged) physical cores: %d\n", num_cores);
-    int num_threads = num_cores;
-    omp_set_num_threads(num_threads); 
-    printf("Set num_threads to: %d\n", num_threads);
+    if (getenv("OMP_NUM_THREADS") == NULL){ //an explicit thread count wins
+        set_num_threads(num_cores);
+    }
+    printf("Set num_threads to: %d\n", get_num_threads());
+    load_parallel_thresholds(NULL); //saved by a previous calibrate_parallel_thresholds, if any
     init_random();
     omp_set_dynamic(1);
 
    
-}
\ No newline at end of file
+}
+
+__attribute__((destructor))
+void library_fini() {
+    empty_cache(); //returns the caching allocator's blocks so leak checks stay clean
+}
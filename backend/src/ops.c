@@ -1,57 +1,109 @@
 #include "../include/ops.h"
 #include "../include/tensor.h"
 #include "../include/interface.h"
+#include "../include/graph.h"
+#include "../include/compiler.h"
 
-tensor * kernel_forward(int func, tensor * t0, tensor * t1, bool retain_grad){
+static void run_forward_kernel(int func, kernel_tensor *k, kernel_tensor *k0, kernel_tensor *k1){
+    switch (type_table[func]){
+        case TYPE_BINARY:
+            if (are_shapes_equal(k0->shape, k1->shape)){
+                forward_func_table[func](k, k0, k1);
+            } else { //the smaller operand is read with stride 0, never expanded in memory
+                kernel_tensor *b0 = broadcast_kernel_tensor(k0, k->shape);
+                kernel_tensor *b1 = broadcast_kernel_tensor(k1, k->shape);
+                forward_func_table[func](k, b0, b1);
+                free_kernel_tensor(&b0);
+                free_kernel_tensor(&b1);
+            }
+            break;
+
+        case TYPE_SHAPE:
+            //the metadata was set when the op was recorded, only the memory is missing
+            if (k->shallow == true){
+                k->array = k0->array;
+            } else { //view of a non-contiguous tensor, copied with the parent's shape
+                kernel_tensor dst = *k;
+                memcpy(dst.shape, k0->shape, 5 * sizeof(size_t));
+                set_contiguous_stride(&dst);
+                UNARY_ELEMENTWISE_OP_SIMD(&dst, k0, _copy);
+            }
+            break;
+
+        default: //strided operands (e.g. permuted views) are read through their strides
+            forward_func_table[func](k, k0, k1);
+            break;
+    }
+    k->computed = true;
+}
+
+static size_t kernel_bytes(kernel_tensor *k){
+    return (k != NULL) ? k->length * sizeof(lemur_float) : 0;
+}
+
+//runs the kernel of func into k, whose shape and strides are already set (and array allocated, unless
+//k is a view that gets its parent's memory)
+void forward_kernel(int func, kernel_tensor *k, kernel_tensor *k0, kernel_tensor *k1){
+    if (profile_enabled){
+        double start = omp_get_wtime();
+        bool view = (type_table[func] == TYPE_SHAPE) && (k->shallow == true);
+        run_forward_kernel(func, k, k0, k1);
+        size_t bytes = view ? 0 : kernel_bytes(k) + kernel_bytes(k0) + kernel_bytes(k1);
+        profile_record(func, false, start, k, k0, k1, bytes);
+        return;
+    }
+    run_forward_kernel(func, k, k0, k1);
+}
+
+//contiguous result of a kernel, in lazy mode only its shape is recorded
+static kernel_tensor * result_kernel_tensor(size_t shape[5], bool lazy){
+    return lazy ? lazy_kernel_tensor(shape) : empty_contiguous_kernel_tensor(shape);
+}
+
+//records func(t0, t1) and runs it unless in lazy mode, scalar ops pass their immediate instead of t1
+static tensor * record_forward_op(int func, tensor * t0, tensor * t1, lemur_float scalar, bool retain_grad){
 
     kernel_tensor *k;
     bool requires_grad = false;
     kernel_tensor *grad = NULL;
+    bool lazy = get_lazy_mode();
 
-    if (is_contiguous(t0->k) == false){
-        fprintf(stderr, "Error: Attempted to operate on non-contiguous tensor t0.\n");
-        return NULL;
-    }
-    if (t1 != NULL){
-        if (is_contiguous(t1->k) == false){
-            fprintf(stderr, "Error: Attempted to operate on non-contiguous tensor t1.\n");
-        return NULL;
-    }
+    if (lazy == false){ //inputs recorded in lazy mode are computed on first eager use
+        compute(t0);
+        compute(t1);
     }
 
+    //inputs may be strided views (permute, expand), unary/binary/reduce kernels read them through
+    //their strides and always write a contiguous result
+
     switch (type_table[func]){
 
-        case TYPE_BINARY:
-            if (are_shapes_equal( t0->k->shape, t1->k->shape) != true){
-                fprintf(stderr, "Error: Shapes of tensors t0 and t1 are not equal.\n");
+        case TYPE_BINARY: {
+            size_t out_shape[5];
+            if (broadcast_shapes(out_shape, t0->k->shape, t1->k->shape) != true){
+                fprintf(stderr, "Error: Shapes of tensors t0 and t1 are not broadcastable.\n");
                 return NULL;
             }
             if ((t0->requires_grad == true) || (t1->requires_grad == true)){
                     requires_grad = true;
             }
-            k = empty_contiguous_kernel_tensor_like(t0->k);
+            k = result_kernel_tensor(out_shape, lazy);
             if (retain_grad == true){
                 grad = empty_contiguous_kernel_tensor_like(k);
                 memset_kernel_tensor(grad, 0.0);
             }
-            forward_func_table[func](k, t0->k, t1->k);
             break;
+        }
 
         case TYPE_UNARY:
             if (t0->requires_grad == true){
                     requires_grad = true;
             }
-            k = empty_contiguous_kernel_tensor_like(t0->k);
+            k = result_kernel_tensor(t0->k->shape, lazy);
             if (retain_grad == true){
                 grad = empty_contiguous_kernel_tensor_like(k); 
                 memset_kernel_tensor(grad, 0.0);
             }
-            if (t1 == NULL){ 
-                forward_func_table[func](k, t0->k, NULL);  
-            } else {
-                forward_func_table[func](k, t0->k, t1->k); //power is not REALLY unary (but sort of)
-            }
-
             break;
 
         case TYPE_REDUCE: 
@@ -68,12 +120,11 @@ tensor * kernel_forward(int func, tensor * t0, tensor * t1, bool retain_grad){
             }
             size_t reduced_shape[5];
             set_reduced_shape(reduced_shape, t0->k->shape, t1->k->array);
-            k = empty_contiguous_kernel_tensor(reduced_shape);
+            k = result_kernel_tensor(reduced_shape, lazy);
             if (retain_grad == true){
                 grad = empty_contiguous_kernel_tensor_like(k);
                 memset_kernel_tensor(grad, 0.0);
             }
-            forward_func_table[func](k, t0->k, t1->k);
             break;
 
         case TYPE_SHAPE:
@@ -81,19 +132,20 @@ tensor * kernel_forward(int func, tensor * t0, tensor * t1, bool retain_grad){
                     requires_grad = true;
             }
             
-            k = kernel_tensor_shallow_copy(t0->k); 
-            
             if (retain_grad == true){
                 fprintf(stderr, "Error: Shape operations cannot retain grad as they could point to parent's memory, call deepcopy instead.\n");
                 return NULL;
             }
-            forward_func_table[func](k, t0->k, t1->k);
-            if (func != OP_VIEW){   //view is the only one that keep the parent's memory
-                kernel_tensor *k_temp = contiguous_deepcopy_kernel_tensor(k);
-                free_kernel_tensor(&k); //will not free parent's array because k is a shallow copy
-                                       //look at free_kernel_tensor
-                k = k_temp;
+            
+            //shape ops return views of the parent's memory, only view of a non-contiguous
+            //tensor needs a copy (the new strides cannot be expressed over the old layout).
+            //a view of a computed tensor is complete right away, even in lazy mode
+            if ((func == OP_VIEW) && (is_contiguous(t0->k) == false)){
+                k = result_kernel_tensor(t0->k->shape, lazy);
+            } else {
+                k = kernel_tensor_shallow_copy(t0->k); 
             }
+            forward_func_table[func](k, t0->k, t1->k); //shape and strides only
             break;
 
         case TYPE_MATMUL:
@@ -102,21 +154,22 @@ tensor * kernel_forward(int func, tensor * t0, tensor * t1, bool retain_grad){
                 }
 
             switch (func){
-                case OP_BATCH_MATMUL: {
+                case OP_BATCH_MATMUL:
+                case OP_BROADCAST_MATMUL:
+                case OP_BATCH_MATMUL_FAST:
+                case OP_BROADCAST_MATMUL_FAST: {
+                    bool transposed = (func == OP_BATCH_MATMUL_FAST) || (func == OP_BROADCAST_MATMUL_FAST);
                     size_t bs0 = t0->k->shape[0];
                     size_t bs1 = t0->k->shape[1];
                     size_t bs2 = t0->k->shape[2];
                     size_t i = t0->k->shape[3];
-                    size_t j = t1->k->shape[4];
-                    k = empty_contiguous_kernel_tensor((size_t[5]){bs0, bs1, bs2, i, j});
-                    memset_kernel_tensor(k, 0.0);
+                    size_t j = transposed ? t1->k->shape[3] : t1->k->shape[4];
+                    k = result_kernel_tensor((size_t[5]){bs0, bs1, bs2, i, j}, lazy);
 
                     if (retain_grad == true){
                         grad = empty_contiguous_kernel_tensor_like(k);
                         memset_kernel_tensor(grad, 0.0);
                     }
-                    forward_func_table[func](k, t0->k, t1->k);
-
                     break;
                 }
                 
@@ -132,102 +185,574 @@ tensor * kernel_forward(int func, tensor * t0, tensor * t1, bool retain_grad){
             return NULL;
     }
 
+    expression *comes_from = expression_from(func, t0, t1);
+    comes_from->scalar = scalar;
+    if (lazy == false){
+        kernel_tensor scalar_k;
+        forward_kernel(func, k, t0->k, expression_k1(comes_from, &scalar_k));
+    }
+
     if (backward_func_table[func] == NULL){ //some operations are not diff
         requires_grad = false;
     }
 
-    if (is_contiguous(k) == false){
+    if ((type_table[func] != TYPE_SHAPE) && (is_contiguous(k) == false)){
         fprintf(stderr, "%s returned non-contiguous kernel tesnsor in forward\n", get_op_name(func));
+        free(comes_from);
         return NULL;
     }
 
-    expression *comes_from = expression_from(func, t0, t1);
     tensor *t = tensor_from(k, comes_from, requires_grad, grad);
+    save_versions(t); //when recorded, also in lazy mode: a later in-place write to an input is caught
 
     return t;
 }
 
+//the arrays allocated while recording (result, grad, scratch of the kernel) are attributed to func
+static tensor * record_forward(int func, tensor * t0, tensor * t1, lemur_float scalar, bool retain_grad){
+    alloc_context previous = set_alloc_context(func, false);
+    tensor *t = record_forward_op(func, t0, t1, scalar, retain_grad);
+    restore_alloc_context(previous);
+    return t;
+}
+
+tensor * kernel_forward(int func, tensor * t0, tensor * t1, bool retain_grad){
+    return record_forward(func, t0, t1, 0.0, retain_grad);
+}
+
+//func is a scalar op, its other operand is the immediate scalar (no tensor is made for it)
+tensor * kernel_forward_scalar(int func, tensor *t0, lemur_float scalar, bool retain_grad){
+    return record_forward(func, t0, NULL, scalar, retain_grad);
+}
 
-void kernel_backward(tensor *tr, kernel_tensor *seed){
-    //TODO: This can probably be multithread 
+//remembers the versions of the operands of t and of t itself, whatever is written into them in
+//place afterwards makes compute() and backward fail instead of using the new values
+void save_versions(tensor *t){
+    expression *e = t->comes_from;
+    e->saved_version[0] = tensor_version(e->t0);
+    e->saved_version[1] = tensor_version(e->t1);
+    e->saved_version[2] = tensor_version(t);
+}
+
+//true when an operand of t was written in place after t was recorded, computing t now would not
+//give the recorded result
+bool operands_modified(tensor *t){
+    expression *e = t->comes_from;
+    return (tensor_version(e->t0) != e->saved_version[0]) || (tensor_version(e->t1) != e->saved_version[1]);
+}
+
+//number of elements between the first and one past the last element of k
+static size_t memory_extent(kernel_tensor *k){
+    size_t extent = 1;
+    for (size_t i = 0; i < 5; i++){
+        if (k->shape[i] == 0){
+            return 0;
+        }
+        extent += (k->shape[i] - 1) * (size_t) k->stride[i];
+    }
+    return extent;
+}
+
+//an operand sharing memory with out under another layout would be overwritten before it is read
+static bool overlaps_differently(kernel_tensor *out, kernel_tensor *k){
+    if ((out->array == k->array) && are_shapes_equal(out->shape, k->shape) &&
+        (memcmp(out->stride, k->stride, sizeof(out->stride)) == 0)){
+        return false; //every element is read right before it is overwritten
+    }
+    return (out->array < k->array + memory_extent(k)) && (k->array < out->array + memory_extent(out));
+}
+
+//the status write_into returns for out and its operands (t1 is NULL for unary and scalar ops),
+//name is the op named in the error, NULL checks without printing anything
+static int check_into(const char *name, tensor *out, tensor *t0, tensor *t1){
+    if (out->k->readonly == true){
+        if (name != NULL){
+            fprintf(stderr, "Error: %s into a read only mapping of a file.\n", name);
+        }
+        return INTO_READ_ONLY;
+    }
+    if ((out->comes_from != NULL) && (out->requires_grad == true)){
+        if (name != NULL){
+            fprintf(stderr, "Error: in-place %s on a result that requires grad, its value is needed by autograd.\n", name);
+        }
+        return INTO_OUT_IN_GRAPH;
+    }
+    if (((t0 != out) && (t0->requires_grad == true)) || ((t1 != NULL) && (t1 != out) && (t1->requires_grad == true))){
+        if (name != NULL){
+            fprintf(stderr, "Error: %s into an existing tensor is not recorded for autograd, but an input requires grad.\n", name);
+        }
+        return INTO_INPUT_REQUIRES_GRAD;
+    }
+    size_t shape[5];
+    if (t1 != NULL){
+        if (broadcast_shapes(shape, t0->k->shape, t1->k->shape) != true){
+            if (name != NULL){
+                fprintf(stderr, "Error: Shapes of tensors t0 and t1 are not broadcastable.\n");
+            }
+            return INTO_SHAPE_MISMATCH;
+        }
+    } else {
+        memcpy(shape, t0->k->shape, 5 * sizeof(size_t));
+    }
+    if (are_shapes_equal(shape, out->k->shape) == false){
+        if (name != NULL){
+            fprintf(stderr, "Error: out does not have the shape of the result of %s.\n", name);
+        }
+        return INTO_SHAPE_MISMATCH;
+    }
+    if (is_contiguous(out->k) == false){
+        if (name != NULL){
+            fprintf(stderr, "Error: out must be contiguous.\n");
+        }
+        return INTO_NOT_CONTIGUOUS;
+    }
+    return INTO_OK;
+}
+
+//whether an in-place or out= form would write into out, without printing anything. the frontend's
+//augmented assignments (x += y) fall back to a new tensor when it would not
+bool can_write_into(tensor *out, tensor *t0, tensor *t1){
+    return check_into(NULL, out, t0, t1) == INTO_OK;
+}
+
+//runs func(t0, t1) into the memory of out instead of a new tensor (in place when out is t0),
+//nothing is recorded: out keeps its history and its version is bumped. the write is refused when
+//autograd could not account for it, out may only require grad as a leaf (e.g. a parameter update)
+static int write_into(int func, tensor *out, tensor *t0, tensor *t1, kernel_tensor *scalar_k){
+    if ((type_table[func] != TYPE_BINARY) && (type_table[func] != TYPE_UNARY)){
+        fprintf(stderr, "Error: %s has no in-place or out= form.\n", get_op_name(func));
+        return INTO_UNSUPPORTED_OP;
+    }
+    int status = check_into(get_op_name(func), out, t0, t1);
+    if (status != INTO_OK){
+        return status;
+    }
+
+    compute(out); //in-place ops run eagerly, also in lazy mode
+    compute(t0);
+    compute(t1);
+
+    kernel_tensor *k0 = t0->k;
+    kernel_tensor *k1 = (t1 != NULL) ? t1->k : scalar_k;
+    kernel_tensor *c0 = overlaps_differently(out->k, k0) ? contiguous_deepcopy_kernel_tensor(k0) : NULL;
+    kernel_tensor *c1 = ((k1 != NULL) && overlaps_differently(out->k, k1)) ? contiguous_deepcopy_kernel_tensor(k1) : NULL;
+    forward_kernel(func, out->k, (c0 != NULL) ? c0 : k0, (c1 != NULL) ? c1 : k1);
+    if (c0 != NULL){
+        free_kernel_tensor(&c0);
+    }
+    if (c1 != NULL){
+        free_kernel_tensor(&c1);
+    }
+    mark_modified(out);
+    return INTO_OK;
+}
+
+int kernel_forward_into(int func, tensor *out, tensor *t0, tensor *t1){
+    return write_into(func, out, t0, t1, NULL);
+}
+
+int kernel_forward_scalar_into(int func, tensor *out, tensor *t0, lemur_float scalar){
+    expression e = {.backward_func = func, .scalar = scalar};
+    kernel_tensor scalar_k;
+    return write_into(func, out, t0, NULL, expression_k1(&e, &scalar_k));
+}
+
+
+//sums a gradient with the broadcast output shape back to the shape of the operand, takes ownership of seed
+static kernel_tensor * unbroadcast_seed(kernel_tensor *seed, size_t shape[5]){
+    if ((seed == NULL) || are_shapes_equal(seed->shape, shape)){
+        return seed;
+    }
+    lemur_float dim_arr[5];
+    kernel_tensor dims;
+    dims.array = dim_arr;
+    dims.length = 5;
+    dims.shallow = false;
+    dims.mapped = false;
+    dims.readonly = false;
+    dims.shape[0] = 1;
+    dims.shape[1] = 1;
+    dims.shape[2] = 1;
+    dims.shape[3] = 1;
+    dims.shape[4] = 5;
+    set_contiguous_stride(&dims);
+    for (size_t i = 0; i < 5; i++){
+        dim_arr[i] = (seed->shape[i] == shape[i]) ? 1 : 0;
+    }
+    kernel_tensor *next_seed = empty_contiguous_kernel_tensor(shape);
+    forward_func_table[OP_SUM](next_seed, seed, &dims);
+    free_kernel_tensor(&seed);
+    return next_seed;
+}
+
+//runs the backward kernels of a single node, seed is consumed (reused as next_seed0 or freed)
+static void backward_node(tensor *tr, kernel_tensor *seed, kernel_tensor **next_seed0, kernel_tensor **next_seed1){
     tensor *t0 = tr->comes_from->t0;
     tensor *t1 = tr->comes_from->t1;
     kernel_tensor *kr = tr->k;
+    kernel_tensor scalar_k;
     kernel_tensor *k0 = t0->k;
-    kernel_tensor *k1 = (t1 != NULL) ? t1->k : NULL;
+    kernel_tensor *k1 = expression_k1(tr->comes_from, &scalar_k);
+    int func = tr->comes_from->backward_func;
 
-    if (seed == NULL){
-        fprintf(stderr, "seed is NULL, aborting backwards\n");
-        return;
+    //broadcast binary op: kernels see stride 0 views of the operands, gradients are summed back afterwards
+    bool broadcast = (type_table[func] == TYPE_BINARY) &&
+                     ((are_shapes_equal(k0->shape, kr->shape) == false) || (are_shapes_equal(k1->shape, kr->shape) == false));
+    if (broadcast){
+        k0 = broadcast_kernel_tensor(t0->k, kr->shape);
+        k1 = broadcast_kernel_tensor(t1->k, kr->shape);
     }
 
-    if (tr == NULL){
-        fprintf(stderr, "tensor tr is NULL, aborting backwards\n");
-        return;
-    }
-    
-    int func = tr->comes_from->backward_func;
-    if (is_contiguous(seed) == false){
-        fprintf(stderr, "seed (kernel_backward %s call) is non-contiguous, aborting backwards\n", get_op_name(func));
-        return;
-    }
+    *next_seed0 = NULL;
+    *next_seed1 = NULL;
 
-    kernel_tensor *next_seed1 = NULL;   
+    //next_seed1 must be calculated BEFORE next_seed0 since next_seed0 could be seed itself 
+    //(modified in place) making the calculation of next_seed1 incorrect 
     if ((type_table[func] == TYPE_BINARY) || (type_table[func] == TYPE_MATMUL)){ 
         if (t1->requires_grad == true){
-            kernel_tensor *deepcopy_seed = contiguous_deepcopy_kernel_tensor(seed);
-            //binary backward should return deepcopy_seed, therefore this is safe and there are no leaks
-            next_seed1 = backward_func_table[func](kr, k0, k1, deepcopy_seed, 1);
+            //matmul backward only reads the seed, binary backward may overwrite it
+            kernel_tensor *deepcopy_seed = (type_table[func] == TYPE_MATMUL) ? seed : contiguous_deepcopy_kernel_tensor(seed);
+            *next_seed1 = backward_func_table[func](kr, k0, k1, deepcopy_seed, 1);
+            if ((*next_seed1 != deepcopy_seed) && (deepcopy_seed != seed)){
+                free_kernel_tensor(&deepcopy_seed);
+            }
+            if (*next_seed1 == NULL){
+                fprintf(stderr, "%s backwards kernel returns null seed1\n", get_op_name(func));
+            } else {
+                inplace_contiguous_kernel_tensor(*next_seed1);
+            }
         }
     }
     
-    
-    //TODO fix this
-    //next_seed0 must be calculated AFTER next_seed1 since next_seed0 could be seed itself 
-    //making the calculation of next_seed1 incorrect 
-    kernel_tensor *next_seed0 = NULL;
     if (t0->requires_grad == true){
-        next_seed0 = backward_func_table[func](kr, k0, k1, seed, 0); 
-        inplace_contiguous_kernel_tensor(next_seed0);
+        *next_seed0 = backward_func_table[func](kr, k0, k1, seed, 0); 
+        if (*next_seed0 == NULL){
+            fprintf(stderr, "%s backwards kernel returns null seed0\n", get_op_name(func));
+        } else {
+            inplace_contiguous_kernel_tensor(*next_seed0);
+        }
     }
 
-    if (next_seed1 == seed){
-        fprintf(stderr, "next_seed1 cannot be seed\n");
+    if (*next_seed0 != seed){ //some ops do not make a new gradient for next_seed0. one is always made for next_seed1
+        free_kernel_tensor(&seed); 
+    } 
+
+    if (broadcast){
+        *next_seed0 = unbroadcast_seed(*next_seed0, t0->k->shape);
+        *next_seed1 = unbroadcast_seed(*next_seed1, t1->k->shape);
+        free_kernel_tensor(&k0);
+        free_kernel_tensor(&k1);
+    }
+}
+
+//runs the generated backward kernel of a fused region instead of the backward of its nodes,
+//seed is consumed. next_seeds follows the inputs of the region
+static void backward_fused_node(tensor *tr, kernel_tensor *seed, kernel_tensor **next_seeds){
+    fused_group *f = tr->comes_from->fused;
+    size_t *shape = fused_element_root(f)->k->shape;
+    lemur_float **in = (lemur_float **) malloc(f->num_inputs * sizeof(lemur_float *));
+    lemur_float **grad = (lemur_float **) calloc(f->num_inputs, sizeof(lemur_float *));
+    for (size_t k = 0; k < f->num_inputs; k++){
+        in[k] = f->inputs[k]->k->array;
+        if (f->input_grad[k] == true){
+            next_seeds[k] = empty_contiguous_kernel_tensor(shape);
+            grad[k] = next_seeds[k]->array;
+        }
+    }
+    f->backward(seed->array, in, grad);
+    free_kernel_tensor(&seed);
+    for (size_t k = 0; k < f->num_inputs; k++){
+        next_seeds[k] = unbroadcast_seed(next_seeds[k], f->inputs[k]->k->shape);
+    }
+    free(in);
+    free(grad);
+}
+
+static void run_backward_node(tensor *t, kernel_tensor *seed, bool fused, kernel_tensor **next_seeds){
+    if (fused){
+        backward_fused_node(t, seed, next_seeds);
+    } else {
+        backward_node(t, seed, &next_seeds[0], &next_seeds[1]);
+    }
+}
+
+//bytes are the seed, the gradients written and the operands the kernels read (all inputs of a fused region)
+static void profile_backward_node(tensor *t, bool fused, kernel_tensor **next_seeds, double start){
+    size_t bytes = kernel_bytes(t->k);
+    if (fused){
+        fused_group *f = t->comes_from->fused;
+        for (size_t k = 0; k < f->num_inputs; k++){
+            bytes += kernel_bytes(next_seeds[k]) + kernel_bytes(f->inputs[k]->k);
+        }
+        kernel_tensor *k1 = (f->num_inputs > 1) ? f->inputs[1]->k : NULL;
+        profile_record(PROFILE_FUSED, true, start, t->k, f->inputs[0]->k, k1, bytes);
         return;
     }
+    int func = t->comes_from->backward_func;
+    tensor *t0 = t->comes_from->t0;
+    tensor *t1 = t->comes_from->t1;
+    kernel_tensor *k1 = (t1 != NULL) ? t1->k : NULL;
+    bytes += kernel_bytes(next_seeds[0]) + kernel_bytes(next_seeds[1]);
+    bytes += (saved_table[func] & SAVES_T0) ? kernel_bytes(t0->k) : 0;
+    bytes += (saved_table[func] & SAVES_T1) ? kernel_bytes(k1) : 0;
+    bytes += (saved_table[func] & SAVES_RESULT) ? kernel_bytes(t->k) : 0;
+    profile_record(func, true, start, t->k, t0->k, k1, bytes);
+}
 
-    if (next_seed0 != seed){ //some ops do not make a new gradient for next_seed0. one is always made for next_seed1
-        free_kernel_tensor(&seed); 
-    } 
+//a fused backward replaces the backward of its whole region when it writes exactly the gradients
+//this graph needs and nothing else in the graph needs the gradient of a node inside the region
+static bool use_fused_backward(graph *g, size_t *consumers, tensor *t){
+    fused_group *f = (t->comes_from != NULL) ? t->comes_from->fused : NULL;
+    if ((f == NULL) || (fused_kernels_ready(f) == false)){
+        return false;
+    }
+    for (size_t k = 0; k < f->num_inputs; k++){
+        if (f->inputs[k]->requires_grad != f->input_grad[k]){
+            return false;
+        }
+    }
+    for (size_t m = 0; m + 1 < f->num_nodes; m++){
+        size_t idx = graph_index(g, f->nodes[m]);
+        if ((f->nodes[m]->grad != NULL) ||
+            ((idx != GRAPH_NOT_FOUND) && (consumers[idx] != fused_edges_to(f, f->nodes[m], g)))){
+            return false;
+        }
+    }
+    return true;
+}
+
+//adds a gradient contribution to the pending gradient of t, taking ownership of next_seed
+static void accumulate_seed(graph *g, kernel_tensor **pending, tensor *t, kernel_tensor *next_seed){
+    if (next_seed == NULL){
+        return;
+    }
+    size_t idx = (t != NULL) ? graph_index(g, t) : GRAPH_NOT_FOUND;
+    if (idx == GRAPH_NOT_FOUND){ //does not require grad
+        free_kernel_tensor(&next_seed);
+        return;
+    }
+    if (pending[idx] == NULL){
+        pending[idx] = next_seed;
+    } else {
+        b_op_add_forward(pending[idx], pending[idx], next_seed);
+        free_kernel_tensor(&next_seed);
+    }
+}
+
+//nodes up to the elementwise threshold run their backward kernels concurrently with other ready
+//nodes (their kernels are serial anyway), bigger ones run one at a time with parallel kernels
+#define BACKWARD_TASK_MAX_LENGTH (parallel_threshold_table[PARALLEL_ELEMENTWISE])
 
-    //derive(t0, next_seed0);
-    if (t0->grad != NULL){
-        b_op_add_forward(t0->grad, t0->grad, next_seed0);
+//derives a ready node and runs its backward kernels, the results are accumulated later
+//next_seeds has one entry per input of the region for fused nodes, two otherwise
+static void backward_ready_node(tensor *t, kernel_tensor *node_seed, bool fused, kernel_tensor **next_seeds){
+    size_t num_next_seeds = fused ? t->comes_from->fused->num_inputs : 2;
+    for (size_t k = 0; k < num_next_seeds; k++){
+        next_seeds[k] = NULL;
+    }
+    if (node_seed == NULL){ //an upstream backward kernel failed
+        return;
+    }
+    //derive(t, node_seed);
+    if (t->grad != NULL){
+        b_op_add_forward(t->grad, t->grad, node_seed);
     }
-    if ((t0->comes_from != NULL) && (t0->requires_grad == true)){
-        kernel_backward(t0, next_seed0);
+    if (t->comes_from == NULL){
+        free_kernel_tensor(&node_seed); //frees leaf gradients
+        return;
+    }
+    alloc_context previous = set_alloc_context(fused ? MEMORY_FUSED : t->comes_from->backward_func, true);
+    if (profile_enabled){
+        double start = omp_get_wtime();
+        run_backward_node(t, node_seed, fused, next_seeds);
+        profile_backward_node(t, fused, next_seeds, start);
     } else {
-        free_kernel_tensor(&next_seed0); //frees leaf gradients
+        run_backward_node(t, node_seed, fused, next_seeds);
+    }
+    restore_alloc_context(previous);
+}
+
+//false (and an error naming the op) when a tensor some backward kernel reads was written in place
+//after that op was recorded, or an op that is not computed (lazy or released) would be computed
+//from operands written in place since
+static bool saved_versions_match(graph *g){
+    for (size_t i = 0; i < g->num_nodes; i++){
+        tensor *t = g->nodes[i];
+        expression *e = t->comes_from;
+        if (e == NULL){
+            continue;
+        }
+        int saved = saved_table[e->backward_func];
+        if (((saved & SAVES_T0) && (tensor_version(e->t0) != e->saved_version[0])) ||
+            ((saved & SAVES_T1) && (tensor_version(e->t1) != e->saved_version[1])) ||
+            ((saved & SAVES_RESULT) && (tensor_version(t) != e->saved_version[2]))){
+            fprintf(stderr, "Error: a tensor needed for the gradient of %s was modified by an in-place operation, aborting backwards\n",
+                    get_op_name(e->backward_func));
+            return false;
+        }
+        if ((t->k->computed == false) && operands_modified(t)){
+            fprintf(stderr, "Error: an input of %s was modified by an in-place operation after it was recorded, aborting backwards\n",
+                    get_op_name(e->backward_func));
+            return false;
+        }
+    }
+    return true;
+}
+
+//propagates seed from tr to every tensor below it that requires grad.
+//every node runs once, after all of its consumers did, with the sum of its incoming gradients,
+//so the cost is linear in the graph size. the scheduler counts the pending consumers of each node
+//and processes the graph in waves of ready nodes: small independent nodes of a wave run concurrently,
+//then their gradients are accumulated serially in a fixed order (thread safe and deterministic).
+bool kernel_backward(tensor *tr, kernel_tensor *seed){
+    if (seed == NULL){
+        fprintf(stderr, "seed is NULL, aborting backwards\n");
+        return false;
+    }
+    if (tr == NULL){
+        fprintf(stderr, "tensor tr is NULL, aborting backwards\n");
+        free_kernel_tensor(&seed);
+        return false;
+    }
+    if (is_contiguous(seed) == false){
+        fprintf(stderr, "seed is non-contiguous, aborting backwards\n");
+        free_kernel_tensor(&seed);
+        return false;
     }
 
-    if (type_table[func] == TYPE_BINARY){
-        if (next_seed1 == NULL){
-            fprintf(stderr, "binary backwards kernel returns null seed1\n");
-            return;
+    graph *g = build_graph(tr, GRAPH_REQUIRES_GRAD);
+    if (saved_versions_match(g) == false){
+        free_kernel_tensor(&seed);
+        free_graph(&g);
+        return false;
+    }
+    size_t n = g->num_nodes;
+    kernel_tensor **pending = (kernel_tensor **) calloc(n, sizeof(kernel_tensor *));
+    size_t *remaining = (size_t *) calloc(n, sizeof(size_t)); //consumers that have not run yet
+    size_t *ready = (size_t *) malloc(n * sizeof(size_t));
+    size_t *next_ready = (size_t *) malloc(n * sizeof(size_t));
+    kernel_tensor **next_seeds = (kernel_tensor **) malloc(2 * n * sizeof(kernel_tensor *));
+    kernel_tensor ***fused_seeds = (kernel_tensor ***) calloc(n, sizeof(kernel_tensor **));
+    bool *fused = (bool *) calloc(n, sizeof(bool));
+    bool *inside = (bool *) calloc(n, sizeof(bool)); //in a fused region, its node never runs
+    size_t *consumers = (size_t *) malloc(n * sizeof(size_t));
+
+    //fused regions first, the gradient of their inputs comes from the output of the region
+    graph_count_consumers(g, consumers);
+    for (size_t i = 0; i < n; i++){
+        if (use_fused_backward(g, consumers, g->nodes[i])){
+            fused_group *f = g->nodes[i]->comes_from->fused;
+            fused[i] = true;
+            fused_seeds[i] = (kernel_tensor **) malloc(f->num_inputs * sizeof(kernel_tensor *));
+            for (size_t m = 0; m + 1 < f->num_nodes; m++){
+                size_t idx = graph_index(g, f->nodes[m]);
+                if (idx != GRAPH_NOT_FOUND){
+                    inside[idx] = true;
+                }
+            }
         }
+    }
+    free(consumers);
 
-        //derive(t1, next_seed1);
-        if (t1->grad != NULL){
-            b_op_add_forward(t1->grad, t1->grad, next_seed1);
+    for (size_t i = 0; i < n; i++){
+        expression *e = g->nodes[i]->comes_from;
+        if ((e == NULL) || (inside[i] == true)){
+            continue;
         }
-        if ((t1->comes_from != NULL) && (t1->requires_grad == true)){
-            kernel_backward(t1, next_seed1);
-        } else {
-            free_kernel_tensor(&next_seed1); //frees leaf gradients
+        if (fused[i] == true){
+            for (size_t k = 0; k < e->fused->num_inputs; k++){
+                compute(e->fused->inputs[k]); //lazy: released or never materialized
+                size_t idx = graph_index(g, e->fused->inputs[k]);
+                if (idx != GRAPH_NOT_FOUND){
+                    remaining[idx]++;
+                }
+            }
+            continue;
+        }
+        compute(g->nodes[i]);
+        compute(e->t0);
+        compute(e->t1);
+        tensor *children[2] = {e->t0, e->t1};
+        for (size_t c = 0; c < 2; c++){
+            size_t idx = (children[c] != NULL) ? graph_index(g, children[c]) : GRAPH_NOT_FOUND;
+            if (idx != GRAPH_NOT_FOUND){
+                remaining[idx]++;
+            }
         }
-        
     }
 
+    pending[n - 1] = seed; //root is last
+    ready[0] = n - 1;
+    size_t num_ready = 1;
+
+    while (num_ready > 0){
+        size_t num_small = 0;
+        for (size_t r = 0; r < num_ready; r++){ //small nodes first
+            if (g->nodes[ready[r]]->k->length <= BACKWARD_TASK_MAX_LENGTH){
+                size_t tmp = ready[num_small]; ready[num_small] = ready[r]; ready[r] = tmp;
+                num_small++;
+            }
+        }
+
+        #pragma omp parallel for schedule(dynamic) if(num_small > 1)
+        for (size_t r = 0; r < num_small; r++){
+            size_t i = ready[r];
+            backward_ready_node(g->nodes[i], pending[i], fused[i], fused[i] ? fused_seeds[i] : &next_seeds[2*i]);
+            pending[i] = NULL;
+        }
+        for (size_t r = num_small; r < num_ready; r++){
+            size_t i = ready[r];
+            backward_ready_node(g->nodes[i], pending[i], fused[i], fused[i] ? fused_seeds[i] : &next_seeds[2*i]);
+            pending[i] = NULL;
+        }
+
+        size_t num_next_ready = 0;
+        for (size_t r = 0; r < num_ready; r++){
+            size_t i = ready[r];
+            expression *e = g->nodes[i]->comes_from;
+            if (e == NULL){
+                continue;
+            }
+            if (fused[i] == true){
+                for (size_t k = 0; k < e->fused->num_inputs; k++){
+                    tensor *input = e->fused->inputs[k];
+                    accumulate_seed(g, pending, input, fused_seeds[i][k]);
+                    size_t idx = graph_index(g, input);
+                    if ((idx != GRAPH_NOT_FOUND) && (--remaining[idx] == 0)){
+                        next_ready[num_next_ready++] = idx;
+                    }
+                }
+                continue;
+            }
+            tensor *children[2] = {e->t0, e->t1};
+            for (size_t c = 0; c < 2; c++){
+                accumulate_seed(g, pending, children[c], next_seeds[2*i + c]);
+                size_t idx = (children[c] != NULL) ? graph_index(g, children[c]) : GRAPH_NOT_FOUND;
+                if ((idx != GRAPH_NOT_FOUND) && (--remaining[idx] == 0)){
+                    next_ready[num_next_ready++] = idx;
+                }
+            }
+        }
+        size_t *tmp = ready; ready = next_ready; next_ready = tmp;
+        num_ready = num_next_ready;
+    }
+
+    for (size_t i = 0; i < n; i++){ //only non NULL if a backward kernel failed
+        free_kernel_tensor(&pending[i]);
+    }
+    free(pending);
+    free(remaining);
+    free(ready);
+    free(next_ready);
+    free(next_seeds);
+    for (size_t i = 0; i < n; i++){
+        free(fused_seeds[i]);
+    }
+    free(fused_seeds);
+    free(fused);
+    free(inside);
+    free_graph(&g);
+    return true;
 }
 
 
@@ -250,11 +775,26 @@ forward_func forward_func_table[] = {
     [OP_ABS] = u_op_abs_forward,
     [OP_SIGN] = u_op_sign_forward,
     [OP_RECIPROCAL] = u_op_reciprocal_forward,
+    [OP_CONTIGUOUS] = u_op_contiguous_forward,
+
+    //scalar ops
+    [OP_ADD_SCALAR] = u_op_add_scalar_forward,
+    [OP_MUL_SCALAR] = u_op_mul_scalar_forward,
+    [OP_DIV_SCALAR] = u_op_div_scalar_forward,
+    [OP_RSUB_SCALAR] = u_op_rsub_scalar_forward,
+    [OP_RDIV_SCALAR] = u_op_rdiv_scalar_forward,
+    [OP_POW_SCALAR] = u_op_pow_forward,
+    [OP_RPOW_SCALAR] = u_op_rpow_scalar_forward,
 
     //reduce ops
     [OP_SUM] = r_op_sum_forward,
     [OP_ALL] = r_op_all_forward,
     [OP_ANY] = r_op_any_forward,
+    [OP_MAX] = r_op_max_forward,
+    [OP_MIN] = r_op_min_forward,
+    [OP_MEAN] = r_op_mean_forward,
+    [OP_ARGMAX] = r_op_argmax_forward,
+    [OP_ARGMIN] = r_op_argmin_forward,
 
     //shape ops
     [OP_VIEW] = s_op_view_forward,
@@ -288,11 +828,26 @@ backward_func backward_func_table[] = {
     [OP_ABS] = u_op_abs_backward,
     [OP_SIGN] = NULL,
     [OP_RECIPROCAL] = u_op_reciprocal_backward,
+    [OP_CONTIGUOUS] = u_op_contiguous_backward,
+
+    //scalar ops
+    [OP_ADD_SCALAR] = u_op_add_scalar_backward,
+    [OP_MUL_SCALAR] = u_op_mul_scalar_backward,
+    [OP_DIV_SCALAR] = u_op_div_scalar_backward,
+    [OP_RSUB_SCALAR] = u_op_rsub_scalar_backward,
+    [OP_RDIV_SCALAR] = u_op_rdiv_scalar_backward,
+    [OP_POW_SCALAR] = u_op_pow_backward,
+    [OP_RPOW_SCALAR] = u_op_rpow_scalar_backward,
 
     //reduce ops
     [OP_SUM] = r_op_sum_backward,
     [OP_ALL] = NULL,
     [OP_ANY] = NULL,
+    [OP_MAX] = r_op_max_backward,
+    [OP_MIN] = r_op_min_backward,
+    [OP_MEAN] = r_op_mean_backward,
+    [OP_ARGMAX] = NULL,
+    [OP_ARGMIN] = NULL,
 
     //shape ops
     [OP_VIEW] = s_op_view_backward,
@@ -325,11 +880,26 @@ int type_table[] = { //TODO ADD TO DOCS
     [OP_ABS] = TYPE_UNARY,
     [OP_SIGN] = TYPE_UNARY,
     [OP_RECIPROCAL] = TYPE_UNARY,
+    [OP_CONTIGUOUS] = TYPE_UNARY,
+
+    //scalar ops
+    [OP_ADD_SCALAR] = TYPE_UNARY,
+    [OP_MUL_SCALAR] = TYPE_UNARY,
+    [OP_DIV_SCALAR] = TYPE_UNARY,
+    [OP_RSUB_SCALAR] = TYPE_UNARY,
+    [OP_RDIV_SCALAR] = TYPE_UNARY,
+    [OP_POW_SCALAR] = TYPE_UNARY,
+    [OP_RPOW_SCALAR] = TYPE_UNARY,
 
     //reduce ops
     [OP_SUM] = TYPE_REDUCE, 
     [OP_ALL] = TYPE_REDUCE, 
     [OP_ANY] = TYPE_REDUCE, 
+    [OP_MAX] = TYPE_REDUCE, 
+    [OP_MIN] = TYPE_REDUCE, 
+    [OP_MEAN] = TYPE_REDUCE, 
+    [OP_ARGMAX] = TYPE_REDUCE, 
+    [OP_ARGMIN] = TYPE_REDUCE, 
 
     //shape ops
     [OP_VIEW] = TYPE_SHAPE, 
@@ -341,4 +911,35 @@ int type_table[] = { //TODO ADD TO DOCS
     [OP_BROADCAST_MATMUL] = TYPE_MATMUL,
     [OP_BATCH_MATMUL_FAST] = TYPE_MATMUL,
     [OP_BROADCAST_MATMUL_FAST] = TYPE_MATMUL,
-};
\ No newline at end of file
+};
+
+int saved_table[] = {
+    //binary ops
+    [OP_MUL] = SAVES_T0 | SAVES_T1,
+    [OP_DIVISION] = SAVES_T1 | SAVES_RESULT,
+
+    //unary ops
+    [OP_EXP] = SAVES_RESULT,
+    [OP_POW] = SAVES_T0 | SAVES_T1,
+    [OP_RELU] = SAVES_RESULT,
+    [OP_SIGMOID] = SAVES_RESULT,
+    [OP_LOG] = SAVES_T0,
+    [OP_SQRT] = SAVES_RESULT,
+    [OP_ABS] = SAVES_T0,
+    [OP_RECIPROCAL] = SAVES_RESULT,
+
+    //scalar ops
+    [OP_RDIV_SCALAR] = SAVES_T0 | SAVES_RESULT,
+    [OP_POW_SCALAR] = SAVES_T0,
+    [OP_RPOW_SCALAR] = SAVES_RESULT,
+
+    //reduce ops
+    [OP_MAX] = SAVES_T0 | SAVES_RESULT,
+    [OP_MIN] = SAVES_T0 | SAVES_RESULT,
+
+    //matmul ops
+    [OP_BATCH_MATMUL] = SAVES_T0 | SAVES_T1,
+    [OP_BROADCAST_MATMUL] = SAVES_T0 | SAVES_T1,
+    [OP_BATCH_MATMUL_FAST] = SAVES_T0 | SAVES_T1,
+    [OP_BROADCAST_MATMUL_FAST] = SAVES_T0 | SAVES_T1,
+};
@@ -0,0 +1,214 @@
+#include "../include/interface.h"
+#include "../include/compiler.h"
+
+#include <limits.h>
+
+//thread count and the parallel thresholds of the kernels (see USE_PARALLEL in ops.h)
+//the defaults are conservative, calibrate_parallel_thresholds measures where the parallel kernels
+//start to win on this machine and save_parallel_thresholds keeps the result next to the kernel
+//cache, from where every later process loads it at startup
+
+#define THRESHOLDS_FILE "parallel_thresholds"
+#define CALIBRATE_WORK (1<<24) //per timing, spread over as many calls as it takes
+#define CALIBRATE_REPEATS 3
+#define CALIBRATE_MIN_LOG2 10
+#define CALIBRATE_MAX_LOG2 22
+#define CALIBRATE_MIN_GEMM 8
+#define CALIBRATE_MAX_GEMM 256
+
+size_t parallel_threshold_table[TOTAL_PARALLEL_CLASSES] = {
+    [PARALLEL_ELEMENTWISE] = 1<<17,
+    [PARALLEL_REDUCE] = 1<<17,
+    [PARALLEL_GEMM] = 1<<17,
+    [PARALLEL_FUSED] = 1<<16,
+};
+
+static const char *parallel_class_names[TOTAL_PARALLEL_CLASSES] = {
+    [PARALLEL_ELEMENTWISE] = "elementwise",
+    [PARALLEL_REDUCE] = "reduce",
+    [PARALLEL_GEMM] = "gemm",
+    [PARALLEL_FUSED] = "fused",
+};
+
+void set_num_threads(int num_threads){
+    if (num_threads < 1){
+        fprintf(stderr, "Error: num_threads must be at least 1, got %d.\n", num_threads);
+        return;
+    }
+    omp_set_num_threads(num_threads);
+}
+
+int get_num_threads(void){
+    return omp_get_max_threads();
+}
+
+const char * get_parallel_class_name(int op_class){
+    if ((op_class < 0) || (op_class >= TOTAL_PARALLEL_CLASSES)){
+        return NULL;
+    }
+    return parallel_class_names[op_class];
+}
+
+bool set_parallel_threshold(int op_class, size_t threshold){
+    if ((op_class < 0) || (op_class >= TOTAL_PARALLEL_CLASSES)){
+        fprintf(stderr, "Error: unknown parallel class %d.\n", op_class);
+        return false;
+    }
+    parallel_threshold_table[op_class] = threshold;
+    return true;
+}
+
+size_t get_parallel_threshold(int op_class){
+    if ((op_class < 0) || (op_class >= TOTAL_PARALLEL_CLASSES)){
+        fprintf(stderr, "Error: unknown parallel class %d.\n", op_class);
+        return SIZE_MAX;
+    }
+    return parallel_threshold_table[op_class];
+}
+
+static void default_thresholds_path(char *path, size_t size){
+    snprintf(path, size, "%s/%s", get_kernel_cache_dir(), THRESHOLDS_FILE);
+}
+
+//one "class threshold" line per class, path NULL is the file in get_kernel_cache_dir()
+bool save_parallel_thresholds(const char *path){
+    char default_path[PATH_MAX];
+    if (path == NULL){
+        if (create_directories(get_kernel_cache_dir()) == false){
+            return false;
+        }
+        default_thresholds_path(default_path, sizeof(default_path));
+        path = default_path;
+    }
+    FILE *file = fopen(path, "w");
+    if (file == NULL){
+        perror("Error saving parallel thresholds");
+        return false;
+    }
+    for (int c = 0; c < TOTAL_PARALLEL_CLASSES; c++){
+        fprintf(file, "%s %zu\n", parallel_class_names[c], parallel_threshold_table[c]);
+    }
+    return fclose(file) == 0;
+}
+
+//a missing file is not an error (nothing was calibrated yet), unknown classes are skipped
+bool load_parallel_thresholds(const char *path){
+    char default_path[PATH_MAX];
+    if (path == NULL){
+        default_thresholds_path(default_path, sizeof(default_path));
+        path = default_path;
+    }
+    FILE *file = fopen(path, "r");
+    if (file == NULL){
+        return false;
+    }
+    char name[64];
+    size_t threshold;
+    while (fscanf(file, "%63s %zu", name, &threshold) == 2){
+        for (int c = 0; c < TOTAL_PARALLEL_CLASSES; c++){
+            if (strcmp(name, parallel_class_names[c]) == 0){
+                parallel_threshold_table[c] = threshold;
+            }
+        }
+    }
+    bool ok = (feof(file) != 0);
+    if (ok == false){
+        fprintf(stderr, "Warning: malformed parallel thresholds file %s.\n", path);
+    }
+    fclose(file);
+    return ok;
+}
+
+//operands of the kernel timed for op_class at one size, ks[0] is the result
+static size_t make_calibration_case(int op_class, size_t size, kernel_tensor *ks[3]){
+    size_t vector[5] = {1, 1, 1, 1, size};
+    size_t scalar[5] = {1, 1, 1, 1, 1};
+    size_t matrix[5] = {1, 1, 1, size, size};
+    switch (op_class){
+        case PARALLEL_REDUCE:
+            ks[0] = empty_contiguous_kernel_tensor(scalar);
+            ks[1] = empty_contiguous_kernel_tensor(vector);
+            ks[2] = empty_contiguous_kernel_tensor((size_t[5]) {1, 1, 1, 1, 5});
+            memset_kernel_tensor(ks[1], 1.0);
+            for (size_t d = 0; d < 5; d++){
+                ks[2]->array[d] = 0.0; //full reduction, the range is split over the threads
+            }
+            return size;
+        case PARALLEL_GEMM:
+            ks[0] = empty_contiguous_kernel_tensor(matrix);
+            ks[1] = empty_contiguous_kernel_tensor(matrix);
+            ks[2] = empty_contiguous_kernel_tensor(matrix);
+            memset_kernel_tensor(ks[1], 1.0);
+            memset_kernel_tensor(ks[2], 1.0);
+            return size * size * size;
+        default:
+            ks[0] = empty_contiguous_kernel_tensor(vector);
+            ks[1] = empty_contiguous_kernel_tensor(vector);
+            ks[2] = empty_contiguous_kernel_tensor(vector);
+            memset_kernel_tensor(ks[1], 1.0);
+            memset_kernel_tensor(ks[2], 1.0);
+            return size;
+    }
+}
+
+//best time of calls runs with the threshold of op_class forced to one side
+static double time_kernel(int op_class, forward_func kernel, kernel_tensor *ks[3], size_t calls, bool parallel){
+    size_t saved = parallel_threshold_table[op_class];
+    parallel_threshold_table[op_class] = parallel ? 0 : SIZE_MAX;
+    kernel(ks[0], ks[1], ks[2]); //warm up
+    double best = INFINITY;
+    for (size_t r = 0; r < CALIBRATE_REPEATS; r++){
+        double start = omp_get_wtime();
+        for (size_t i = 0; i < calls; i++){
+            kernel(ks[0], ks[1], ks[2]);
+        }
+        double elapsed = omp_get_wtime() - start;
+        best = (elapsed < best) ? elapsed : best;
+    }
+    parallel_threshold_table[op_class] = saved;
+    return best;
+}
+
+//walks the sizes down from the largest and stops at the first one the serial kernel wins,
+//the parallel kernel is then used from the smallest size it wins at along with every size above
+static size_t measure_threshold(int op_class, forward_func kernel, size_t *sizes, size_t num_sizes){
+    size_t threshold = SIZE_MAX;
+    for (size_t i = num_sizes; i-- > 0;){
+        kernel_tensor *ks[3];
+        size_t work = make_calibration_case(op_class, sizes[i], ks);
+        size_t calls = CALIBRATE_WORK / work + 1;
+        double serial = time_kernel(op_class, kernel, ks, calls, false);
+        double parallel = time_kernel(op_class, kernel, ks, calls, true);
+        for (size_t k = 0; k < 3; k++){
+            free_kernel_tensor(&ks[k]);
+        }
+        if (parallel >= serial){
+            return threshold;
+        }
+        threshold = work - 1;
+    }
+    return threshold;
+}
+
+//measures the elementwise, reduce and gemm thresholds with the current number of threads,
+//fused kernels would need the system compiler and keep their threshold
+bool calibrate_parallel_thresholds(void){
+    if (omp_get_max_threads() < 2){
+        fprintf(stderr, "Warning: one thread, there is no parallel kernel to calibrate.\n");
+        return false;
+    }
+    size_t lengths[CALIBRATE_MAX_LOG2 - CALIBRATE_MIN_LOG2 + 1];
+    size_t num_lengths = 0;
+    for (size_t e = CALIBRATE_MIN_LOG2; e <= CALIBRATE_MAX_LOG2; e += 2){
+        lengths[num_lengths++] = (size_t) 1 << e;
+    }
+    size_t sides[16];
+    size_t num_sides = 0;
+    for (size_t s = CALIBRATE_MIN_GEMM; s <= CALIBRATE_MAX_GEMM; s *= 2){
+        sides[num_sides++] = s;
+    }
+    parallel_threshold_table[PARALLEL_ELEMENTWISE] = measure_threshold(PARALLEL_ELEMENTWISE, b_op_add_forward, lengths, num_lengths);
+    parallel_threshold_table[PARALLEL_REDUCE] = measure_threshold(PARALLEL_REDUCE, r_op_sum_forward, lengths, num_lengths);
+    parallel_threshold_table[PARALLEL_GEMM] = measure_threshold(PARALLEL_GEMM, m_op_bmm_forward, sides, num_sides);
+    return true;
+}
@@ -0,0 +1,84 @@
+#include "../include/tensor.h"
+#include "../include/interface.h"
+
+//opt-in profiler: while it is on, forward_kernel, the backward of every node and the fused kernels
+//append one event each (op, shapes, bytes, timing, thread). the buffer is shared by the threads
+//that run backward nodes concurrently, appends are serialized. when it is off the only cost is
+//the test of profile_enabled in the dispatch paths
+
+#define PROFILE_INITIAL_CAPACITY 1024
+
+bool profile_enabled = false;
+
+static profile_event *events = NULL;
+static size_t num_events = 0;
+static size_t capacity = 0;
+static double profile_origin = 0.0;
+
+void profile_clear(void){
+    #pragma omp critical(lemur_profile)
+    {
+        free(events);
+        events = NULL;
+        num_events = 0;
+        capacity = 0;
+    }
+}
+
+//drops the events of the previous profile
+void profile_start(void){
+    profile_clear();
+    profile_origin = omp_get_wtime();
+    profile_enabled = true;
+}
+
+void profile_stop(void){
+    profile_enabled = false;
+}
+
+size_t get_profile_num_events(void){
+    return num_events;
+}
+
+//valid until the next profile_start or profile_clear
+profile_event * get_profile_events(void){
+    return events;
+}
+
+static void copy_shape(size_t shape[5], kernel_tensor *k){
+    for (size_t i = 0; i < 5; i++){
+        shape[i] = (k != NULL) ? k->shape[i] : 0;
+    }
+}
+
+void profile_record(int func, bool backward, double start, kernel_tensor *kr, kernel_tensor *k0, kernel_tensor *k1, size_t bytes){
+    double end = omp_get_wtime();
+    profile_event e;
+    e.func = func;
+    e.backward = backward;
+    e.thread = omp_get_thread_num();
+    e.num_threads = omp_get_max_threads();
+    e.start = start - profile_origin;
+    e.duration = end - start;
+    copy_shape(e.shape[0], kr);
+    copy_shape(e.shape[1], k0);
+    copy_shape(e.shape[2], k1);
+    e.bytes = bytes;
+
+    #pragma omp critical(lemur_profile)
+    {
+        if (num_events == capacity){
+            size_t new_capacity = (capacity == 0) ? PROFILE_INITIAL_CAPACITY : 2 * capacity;
+            profile_event *grown = (profile_event *) realloc(events, new_capacity * sizeof(profile_event));
+            if (grown != NULL){
+                events = grown;
+                capacity = new_capacity;
+            }
+        }
+        if (num_events < capacity){
+            events[num_events++] = e;
+        } else {
+            fprintf(stderr, "Warning: out of memory for profile events, dropping one.\n");
+        }
+    }
+}
@@ -0,0 +1,192 @@
+#include "../include/tensor.h"
+#include "../include/interface.h"
+
+//counter based generator (philox4x32-10): block n of the stream is a pure function of the seed and
+//n, each block gives 4 random words. a call reserves as many blocks as it needs from a global offset,
+//element i is made from block offset + i / 4 whichever thread computes it, so results only depend
+//on the seed and the calls before, never on the thread count. blocks are made RANDOM_BATCH at a
+//time in a loop the compiler vectorizes
+
+#define PHILOX_M0 0xD2511F53u
+#define PHILOX_M1 0xCD9E8D57u
+#define PHILOX_W0 0x9E3779B9u
+#define PHILOX_W1 0xBB67AE85u
+#define PHILOX_ROUNDS 10
+#define RANDOM_BATCH 16
+#define TO_UNIT (1.0f / 16777216.0f) //24 random bits to [0, 1)
+#define RANDOM_INT_MAX_RANGE ((int64_t) 1 << 24) //every integer up to 2^24 is a lemur_float
+
+typedef enum {
+    RANDOM_UNIFORM,
+    RANDOM_NORMAL,
+    RANDOM_DROPOUT,
+    RANDOM_INT,
+} random_distribution;
+
+static bool is_initialize_random = false;
+static unsigned int _seed = 0;
+static uint64_t random_offset = 0; //blocks used so far
+
+void init_seed(unsigned int seed){
+    if (seed == 0){
+            _seed = time(NULL);
+        } else {
+            _seed = seed;
+        }
+    random_offset = 0;
+    is_initialize_random = true;
+    printf("seed = %u\n", _seed);
+}
+
+void init_random(void) {
+    if (!is_initialize_random){
+        init_seed(0);
+    }
+}
+
+unsigned int get_seed(void){
+    return _seed;
+}
+
+uint64_t get_random_offset(void){
+    return random_offset;
+}
+
+//with the same seed, the next calls repeat what followed the call that left this offset
+void set_random_offset(uint64_t offset){
+    random_offset = offset;
+}
+
+//words[w][b] is word w of block first + b
+static void philox_batch(uint32_t seed, uint64_t first, uint32_t words[4][RANDOM_BATCH]){
+    #pragma omp simd
+    for (size_t b = 0; b < RANDOM_BATCH; b++){
+        uint64_t n = first + b;
+        uint32_t c0 = (uint32_t) n;
+        uint32_t c1 = (uint32_t) (n >> 32);
+        uint32_t c2 = 0;
+        uint32_t c3 = 0;
+        uint32_t k0 = seed;
+        uint32_t k1 = 0;
+        for (int r = 0; r < PHILOX_ROUNDS; r++){
+            uint64_t p0 = (uint64_t) PHILOX_M0 * c0;
+            uint64_t p1 = (uint64_t) PHILOX_M1 * c2;
+            uint32_t n0 = (uint32_t) (p1 >> 32) ^ c1 ^ k0;
+            uint32_t n2 = (uint32_t) (p0 >> 32) ^ c3 ^ k1;
+            c1 = (uint32_t) p1;
+            c3 = (uint32_t) p0;
+            c0 = n0;
+            c2 = n2;
+            k0 += PHILOX_W0;
+            k1 += PHILOX_W1;
+        }
+        words[0][b] = c0;
+        words[1][b] = c1;
+        words[2][b] = c2;
+        words[3][b] = c3;
+    }
+}
+
+//the 4 * RANDOM_BATCH values made from the blocks of one batch, in element order
+static void transform_batch(random_distribution d, uint32_t words[4][RANDOM_BATCH], lemur_float a, lemur_float b, lemur_float *out){
+    switch (d){
+        case RANDOM_NORMAL: //box-muller, each pair of words gives two values
+            #pragma omp simd
+            for (size_t i = 0; i < RANDOM_BATCH; i++){
+                for (size_t w = 0; w < 4; w += 2){
+                    float u1 = (float) ((words[w][i] >> 8) + 1) * TO_UNIT; //(0, 1], log stays finite
+                    float u2 = (float) (words[w + 1][i] >> 8) * TO_UNIT;
+                    float r = sqrtf(-2.0f * lemur_logf(u1));
+                    float theta = 2.0f * (float) M_PI * u2;
+                    out[4 * i + w] = a + b * r * cosf(theta);
+                    out[4 * i + w + 1] = a + b * r * sinf(theta);
+                }
+            }
+            break;
+
+        case RANDOM_DROPOUT: //a is the drop probability, b the scale of the kept elements
+            #pragma omp simd
+            for (size_t i = 0; i < RANDOM_BATCH; i++){
+                for (size_t w = 0; w < 4; w++){
+                    out[4 * i + w] = ((float) (words[w][i] >> 8) * TO_UNIT >= a) ? b : 0.0f;
+                }
+            }
+            break;
+
+        case RANDOM_INT: //[a, a + b), the range is scaled into the high bits of the word
+            #pragma omp simd
+            for (size_t i = 0; i < RANDOM_BATCH; i++){
+                for (size_t w = 0; w < 4; w++){
+                    out[4 * i + w] = a + (lemur_float) (((uint64_t) words[w][i] * (uint64_t) b) >> 32);
+                }
+            }
+            break;
+
+        default:
+            #pragma omp simd
+            for (size_t i = 0; i < RANDOM_BATCH; i++){
+                for (size_t w = 0; w < 4; w++){
+                    out[4 * i + w] = a + (float) (words[w][i] >> 8) * TO_UNIT * (b - a);
+                }
+            }
+            break;
+    }
+}
+
+static void fill_batch(kernel_tensor *k, random_distribution d, lemur_float a, lemur_float b, uint64_t first, size_t batch){
+    uint32_t words[4][RANDOM_BATCH];
+    lemur_float values[4 * RANDOM_BATCH];
+    philox_batch(_seed, first + batch * RANDOM_BATCH, words);
+    transform_batch(d, words, a, b, values);
+    size_t start = batch * 4 * RANDOM_BATCH;
+    size_t count = (k->length - start < 4 * RANDOM_BATCH) ? k->length - start : 4 * RANDOM_BATCH;
+    memcpy(k->array + start, values, count * sizeof(lemur_float));
+}
+
+static void fill_random(kernel_tensor *k, random_distribution d, lemur_float a, lemur_float b){
+    size_t num_batches = (k->length + 4 * RANDOM_BATCH - 1) / (4 * RANDOM_BATCH);
+    uint64_t first;
+    #pragma omp atomic capture
+    {
+        first = random_offset;
+        random_offset += (uint64_t) num_batches * RANDOM_BATCH;
+    }
+    if (USE_PARALLEL(PARALLEL_ELEMENTWISE, k->length)){
+        #pragma omp parallel for
+        for (size_t batch = 0; batch < num_batches; batch++){
+            fill_batch(k, d, a, b, first, batch);
+        }
+    } else {
+        for (size_t batch = 0; batch < num_batches; batch++){
+            fill_batch(k, d, a, b, first, batch);
+        }
+    }
+}
+
+void random_uniform_kernel_tensor(kernel_tensor *k, lemur_float min, lemur_float max) {
+    fill_random(k, RANDOM_UNIFORM, min, max);
+}
+
+void random_normal_kernel_tensor(kernel_tensor *k, lemur_float mean, lemur_float std) {
+    fill_random(k, RANDOM_NORMAL, mean, std);
+}
+
+//each element is dropped (0) with probability p, the others are 1 / (1 - p)
+bool random_dropout_mask_kernel_tensor(kernel_tensor *k, lemur_float p){
+    if ((p < 0.0) || (p > 1.0)){
+        fprintf(stderr, "Error: dropout probability must be in [0, 1], got %f.\n", (double) p);
+        return false;
+    }
+    fill_random(k, RANDOM_DROPOUT, p, (p < 1.0) ? 1.0 / (1.0 - p) : 0.0);
+    return true;
+}
+
+//integers in [low, high), exact while they fit the 24 bit mantissa of lemur_float
+bool random_int_kernel_tensor(kernel_tensor *k, int64_t low, int64_t high){
+    if ((high <= low) || (high - low > RANDOM_INT_MAX_RANGE) || (low < -RANDOM_INT_MAX_RANGE) || (high > RANDOM_INT_MAX_RANGE)){
+        fprintf(stderr, "Error: randint needs -2^24 <= low < high <= 2^24 and high - low <= 2^24, got [%ld, %ld).\n", (long) low, (long) high);
+        return false;
+    }
+    fill_random(k, RANDOM_INT, (lemur_float) low, (lemur_float) (high - low));
+    return true;
+}
@@ -1,5 +1,11 @@
 #include "../include/tensor.h"
 #include "../include/interface.h"
+#include "../include/compiler.h"
+
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <fcntl.h>
+#include <unistd.h>
 
 
 
@@ -11,21 +17,8 @@ void set_contiguous_stride(kernel_tensor * k){
     }
 }
 
-lemur_float * lemur_alloc(size_t length){
-    size_t size_in_bytes = length*sizeof(lemur_float);
-    size_t alignment = (size_in_bytes > 1024) ? 64 : 16;  
-    size_t aligned_size = (size_in_bytes + alignment - 1) & ~(alignment - 1);
-    lemur_float * arr;
-    arr = (lemur_float *)aligned_alloc(alignment, aligned_size);
-    if (arr == NULL){
-        perror("aligned_alloc failed");
-    }
-    return arr;
-}
-
-
 kernel_tensor * create_seed_kernel_tensor(void){
-    kernel_tensor *seed = (kernel_tensor *) malloc(sizeof(kernel_tensor));
+    kernel_tensor *seed = alloc_kernel_tensor();
     seed->array = lemur_alloc(1);
     seed->length = 1;
     for (size_t i = 0; i < 5; i++){
@@ -35,6 +28,8 @@ kernel_tensor * create_seed_kernel_tensor(void){
     seed->computed = true;
     seed->array[0] = 1.0;
     seed->shallow = false;
+    seed->mapped = false;
+    seed->readonly = false;
     return seed;
 }
 
@@ -50,34 +45,71 @@ bool is_tensor_scalar(tensor *t){
     return false;
 }
 
-void backward(tensor * t){     
+bool backward(tensor * t){     
     if (is_tensor_scalar(t) == true){
         if (t->requires_grad == false){
             fprintf(stderr, "backward can only be called on a tensors that require grad\n");
-            return;
-        }
-        kernel_tensor *seed = create_seed_kernel_tensor();
-        //derive(t, seed);
-        if (t->grad != NULL){
-            b_op_add_forward(t->grad, t->grad, seed);
+            return false;
         }
-        if (t->comes_from != NULL){
-            kernel_backward(t, seed);
-        } else {
-            free_kernel_tensor(&seed); //frees leaf gradients
+        if (compute(t) == false){ //the graph may have been recorded in lazy mode
+            return false;
         }
+        kernel_tensor *seed = create_seed_kernel_tensor();
+        return kernel_backward(t, seed); //also accumulates into t->grad and frees seed
     } else{
         fprintf(stderr, "backwards can only be called on a leaf (scalar) tensors\n");
+        return false;
+    }
+}
+
+//views share the memory of the tensor they were taken from, so a write through either one is
+//seen by both: the version of a view adds the versions of the tensors it views
+static bool is_view(tensor *t){
+    return (t->comes_from != NULL) && (type_table[t->comes_from->backward_func] == TYPE_SHAPE) && (t->k->shallow == true);
+}
+
+size_t tensor_version(tensor *t){
+    size_t version = 0;
+    for (; t != NULL; t = is_view(t) ? t->comes_from->t0 : NULL){
+        version += t->version;
     }
+    return version;
+}
+
+//called after the memory of t was written in place (in-place ops, out=, element assignment),
+//false for a read only tensor, whose memory must not be written
+bool mark_modified(tensor *t){
+    if (t->k->readonly == true){
+        fprintf(stderr, "Error: tensor is a read only mapping of a file.\n");
+        return false;
+    }
+    for (; t != NULL; t = is_view(t) ? t->comes_from->t0 : NULL){
+        t->version++;
+    }
+    return true;
+}
+
+static void free_kernel_tensor_array(kernel_tensor *k){
+    if ((k->array == NULL) || (k->shallow == true)){
+        return;
+    }
+    if (k->mapped == true){
+        size_t page_size = (size_t) sysconf(_SC_PAGESIZE);
+        uintptr_t start = (uintptr_t) k->array;
+        uintptr_t base = start & ~(uintptr_t)(page_size - 1);
+        if (munmap((void *) base, (start - base) + k->length * sizeof(lemur_float)) != 0){
+            perror("munmap failed");
+        }
+        return;
+    }
+    lemur_free(k->array, k->length);
 }
 
 void free_kernel_tensor(kernel_tensor **k_ptr){
     kernel_tensor *k = *k_ptr;
     if (k_ptr != NULL && k != NULL){
-        if ((k->array != NULL) && (k->shallow == false)){
-            free(k->array);
-        }
-        free(k);
+        free_kernel_tensor_array(k);
+        release_kernel_tensor(k);
         k = NULL; 
     }
 }
@@ -85,9 +117,13 @@ void free_kernel_tensor(kernel_tensor **k_ptr){
 void free_tensor(tensor **t_ptr){
     tensor *t = *t_ptr;
     if ((t_ptr != NULL) && (t != NULL)){ 
+        if (t->comes_from != NULL){ //moves the planned nodes (t included) out of the arena first
+            free_memory_plan(&t->comes_from->plan);
+        }
         free_kernel_tensor(&(t->k));
         free_kernel_tensor(&(t->grad));
         if (t->comes_from != NULL){
+            free_fused_group(&t->comes_from->fused);
             free(t->comes_from);
         }
         free(t);
@@ -104,13 +140,29 @@ size_t get_alleged_length(size_t shape[5]){
 } 
 
 kernel_tensor * empty_contiguous_kernel_tensor(size_t shape[5]){
-    kernel_tensor *k = (kernel_tensor *)malloc(sizeof(kernel_tensor));
+    kernel_tensor *k = alloc_kernel_tensor();
     memcpy(k->shape, shape, 5 * sizeof(size_t));
     k->length = get_alleged_length(shape);
     k->array = lemur_alloc(k->length);
     set_contiguous_stride(k);
+    k->computed = true;
+    k->shallow = false;
+    k->mapped = false;
+    k->readonly = false;
+    return k;
+}
+
+//shape and strides of a contiguous result recorded in lazy mode, the array is allocated when it is computed
+kernel_tensor * lazy_kernel_tensor(size_t shape[5]){
+    kernel_tensor *k = alloc_kernel_tensor();
+    memcpy(k->shape, shape, 5 * sizeof(size_t));
+    k->length = get_alleged_length(shape);
+    k->array = NULL;
+    set_contiguous_stride(k);
     k->computed = false;
     k->shallow = false;
+    k->mapped = false;
+    k->readonly = false;
     return k;
 }
 
@@ -120,25 +172,106 @@ kernel_tensor * empty_contiguous_kernel_tensor_like(kernel_tensor *k){
 }
 
 kernel_tensor * empty_kernel_tensor_like(kernel_tensor *k){
-    kernel_tensor *k1 = (kernel_tensor *)malloc(sizeof(kernel_tensor));
+    kernel_tensor *k1 = alloc_kernel_tensor();
     k1->array = lemur_alloc(k->length);
     k1->length = k->length;
     memcpy(k1->shape, k->shape, 5 * sizeof(size_t));
     memcpy(k1->stride, k->stride, 5 * sizeof(size_t));
+    k1->computed = true;
     k1->shallow = false;
+    k1->mapped = false;
+    k1->readonly = false;
     return k1;
 }
 
 kernel_tensor * kernel_tensor_shallow_copy(kernel_tensor *k){
-    kernel_tensor *k1 = (kernel_tensor *)malloc(sizeof(kernel_tensor));
+    kernel_tensor *k1 = alloc_kernel_tensor();
     k1->array = k->array;
     k1->length = k->length;
+    k1->computed = k->computed;
     k1->shallow = true;
+    k1->mapped = false;
+    k1->readonly = k->readonly; //views of a read only mapping are read only
     memcpy(k1->shape, k->shape, 5 * sizeof(size_t));
     memcpy(k1->stride, k->stride, 5 * sizeof(size_t));
     return k1;
 }
 
+//wraps memory owned by someone else (e.g. a python buffer), the array is never freed by lemur
+kernel_tensor * kernel_tensor_from_array(lemur_float *array, size_t shape[5]){
+    if (array == NULL){
+        fprintf(stderr, "Error: attempting to call kernel_tensor_from_array on NULL array.\n");
+        return NULL;
+    }
+    kernel_tensor *k = alloc_kernel_tensor();
+    memcpy(k->shape, shape, 5 * sizeof(size_t));
+    k->length = get_alleged_length(shape);
+    k->array = array;
+    set_contiguous_stride(k);
+    k->computed = true;
+    k->shallow = true;
+    k->mapped = false;
+    k->readonly = false;
+    return k;
+}
+
+//pages are only read from disk when touched, LEMUR_MMAP_READ mappings are shared between processes
+kernel_tensor * mmap_kernel_tensor(const char *path, size_t shape[5], size_t offset, int mode){
+    int open_flags, prot, map_flags;
+    switch (mode){
+        case LEMUR_MMAP_READ:
+            open_flags = O_RDONLY; prot = PROT_READ; map_flags = MAP_SHARED;
+            break;
+        case LEMUR_MMAP_READWRITE:
+            open_flags = O_RDWR; prot = PROT_READ | PROT_WRITE; map_flags = MAP_SHARED;
+            break;
+        case LEMUR_MMAP_COPY:
+            open_flags = O_RDONLY; prot = PROT_READ | PROT_WRITE; map_flags = MAP_PRIVATE;
+            break;
+        default:
+            fprintf(stderr, "Error: unknown mmap mode %d.\n", mode);
+            return NULL;
+    }
+    size_t length = get_alleged_length(shape);
+    size_t size_in_bytes = length * sizeof(lemur_float);
+    if (size_in_bytes == 0){
+        fprintf(stderr, "Error: cannot mmap an empty tensor.\n");
+        return NULL;
+    }
+    int fd = open(path, open_flags);
+    if (fd == -1){
+        perror("Error opening file for mmap");
+        return NULL;
+    }
+    struct stat st;
+    if ((fstat(fd, &st) == -1) || ((size_t) st.st_size < offset + size_in_bytes)){
+        fprintf(stderr, "Error: file '%s' is smaller than offset + tensor size.\n", path);
+        close(fd);
+        return NULL;
+    }
+    //mmap offsets must be page aligned
+    size_t page_size = (size_t) sysconf(_SC_PAGESIZE);
+    size_t aligned_offset = offset & ~(page_size - 1);
+    size_t delta = offset - aligned_offset;
+    void *base = mmap(NULL, size_in_bytes + delta, prot, map_flags, fd, (off_t) aligned_offset);
+    close(fd); //the mapping keeps its own reference to the file
+    if (base == MAP_FAILED){
+        perror("mmap failed");
+        return NULL;
+    }
+
+    kernel_tensor *k = alloc_kernel_tensor();
+    memcpy(k->shape, shape, 5 * sizeof(size_t));
+    k->length = length;
+    k->array = (lemur_float *)((char *) base + delta);
+    set_contiguous_stride(k);
+    k->computed = true;
+    k->shallow = false;
+    k->mapped = true;
+    k->readonly = (mode == LEMUR_MMAP_READ); //writes are refused instead of faulting on the mapping
+    return k;
+}
+
 void memset_kernel_tensor(kernel_tensor * k, lemur_float val){
     if (k == NULL){
         perror("Error: tried to memset NULL kernel tensor");
@@ -148,7 +281,14 @@ void memset_kernel_tensor(kernel_tensor * k, lemur_float val){
         memset(k->array, 0, k->length * sizeof(lemur_float));
         return;
     }
-    #pragma omp parallel for simd
+    if (USE_PARALLEL(PARALLEL_ELEMENTWISE, k->length)){
+        #pragma omp parallel for simd
+        for (size_t i = 0; i < k->length; i++){
+            k->array[i] = val;
+        }
+        return;
+    }
+    #pragma omp simd
     for (size_t i = 0; i < k->length; i++){
         k->array[i] = val;
     }
@@ -159,6 +299,7 @@ tensor * empty_tensor(size_t shape[5], bool requires_grad, bool retains_grad){
     t->comes_from = NULL;
     t->requires_grad = requires_grad;
     t->grad = NULL;
+    t->version = 0;
     if (retains_grad){
         if (requires_grad == false){
             fprintf(stderr, "Error. Requires_grad must be true if retains_grad is true.");
@@ -178,11 +319,12 @@ tensor * tensor_from(kernel_tensor *k, expression *comes_from, bool requires_gra
     t->requires_grad = requires_grad;
     t->grad = grad;
     t->k = k;
+    t->version = 0;
     return t;
 }
 
 kernel_tensor * dim_kernel_tensor_from(size_t shape[5]){
-    kernel_tensor *k = (kernel_tensor *)malloc(sizeof(kernel_tensor));
+    kernel_tensor *k = alloc_kernel_tensor();
     memcpy(k->shape, shape, 5 * sizeof(size_t));
     k->length = 0;
     k->array = NULL;
@@ -190,6 +332,9 @@ kernel_tensor * dim_kernel_tensor_from(size_t shape[5]){
         k->stride[i] = 0;
     }
     k->computed = false;
+    k->shallow = false;
+    k->mapped = false;
+    k->readonly = false;
     return k;
 }
 
@@ -204,9 +349,95 @@ expression * expression_from(int func, tensor *t0, tensor *t1){
     e->t0 = t0;
     e->t1 = t1;
     e->backward_func = func;
+    e->fused = NULL;
+    e->plan = NULL;
+    memset(e->saved_version, 0, sizeof(e->saved_version));
+    e->scalar = 0.0;
     return e;
 }
 
+//k1 of the kernels of e: t1, or for scalar ops the immediate wrapped in scalar_k (stack memory of
+//the caller, valid as long as e)
+kernel_tensor * expression_k1(expression *e, kernel_tensor *scalar_k){
+    if (IS_SCALAR_OP(e->backward_func) == false){
+        return (e->t1 != NULL) ? e->t1->k : NULL;
+    }
+    scalar_k->array = &e->scalar;
+    scalar_k->length = 1;
+    for (size_t i = 0; i < 5; i++){
+        scalar_k->shape[i] = 1;
+        scalar_k->stride[i] = 1;
+    }
+    scalar_k->computed = true;
+    scalar_k->shallow = true;
+    scalar_k->mapped = false;
+    scalar_k->readonly = false;
+    return scalar_k;
+}
+
+//copies the elements at the cartesian product of per dim index lists into out (row major)
+//index holds count[0] indices of dim 0, then count[1] of dim 1 and so on
+void gather_kernel_tensor(kernel_tensor *k, const size_t *index, const size_t count[5], lemur_float *out){
+    const size_t *i0 = index;
+    const size_t *i1 = i0 + count[0];
+    const size_t *i2 = i1 + count[1];
+    const size_t *i3 = i2 + count[2];
+    const size_t *i4 = i3 + count[3];
+    size_t n = 0;
+    for (size_t a = 0; a < count[0]; a++){
+        for (size_t b = 0; b < count[1]; b++){
+            for (size_t c = 0; c < count[2]; c++){
+                for (size_t d = 0; d < count[3]; d++){
+                    int64_t row = (int64_t) i0[a] * k->stride[0] + (int64_t) i1[b] * k->stride[1] +
+                                  (int64_t) i2[c] * k->stride[2] + (int64_t) i3[d] * k->stride[3];
+                    for (size_t e = 0; e < count[4]; e++){
+                        out[n++] = k->array[row + (int64_t) i4[e] * k->stride[4]];
+                    }
+                }
+            }
+        }
+    }
+}
+
+//same summarization as the python repr (see set_printoptions in frontend/reprutils.py), which
+//keeps these in sync: above threshold elements only edgeitems entries at both ends of a dim print
+static size_t print_threshold = 1000;
+static size_t print_edgeitems = 3;
+static int print_precision = 4;
+
+void set_print_options(size_t threshold, size_t edgeitems, int precision){
+    print_threshold = threshold;
+    print_edgeitems = edgeitems;
+    print_precision = precision;
+}
+
+static void print_dim(kernel_tensor *k, size_t idx[5], size_t d, bool summarize){
+    size_t n = k->shape[d];
+    bool skip = summarize && (n > 2 * print_edgeitems);
+    printf("[");
+    for (size_t i = 0; i < n; i++){
+        if (skip && (i == print_edgeitems)){
+            printf("...");
+            i = n - print_edgeitems;
+            printf((d == 4) ? ", " : ",");
+        }
+        idx[d] = i;
+        if (d == 4){
+            int64_t offset = 0;
+            for (size_t j = 0; j < 5; j++){
+                offset += (int64_t) idx[j] * k->stride[j];
+            }
+            printf("%.*f", print_precision, k->array[offset]);
+        } else {
+            print_dim(k, idx, d + 1, summarize);
+        }
+        if (i + 1 < n){
+            printf((d == 4) ? ", " : ",");
+        }
+    }
+    printf("]");
+}
+
 void print_kernel_tensor(kernel_tensor *k){
 if (!k) {
         printf("  [NULL kernel_tensor]\n");
@@ -233,56 +464,15 @@ if (!k) {
     //printf("    contiguous = %s\n", k->contiguous ? "true" : "false");
     printf("    computed   = %s\n", k->computed   ? "true" : "false");
 
-    // Print all elements in a 5D loop
-    // Be cautious, this can print a LOT of lines if shapes are large!
-    printf("    data:\n");
-    printf("tensor([");
-    for (size_t d0 = 0; d0 < k->shape[0]; d0++) {
-        printf("[");
-        for (size_t d1 = 0; d1 < k->shape[1]; d1++) {
-            printf("[");
-            for (size_t d2 = 0; d2 < k->shape[2]; d2++) {
-                printf("[");
-                for (size_t d3 = 0; d3 < k->shape[3]; d3++) {
-                    printf("[");
-                    for (size_t d4 = 0; d4 < k->shape[4]; d4++) {
-                        size_t idx = KERNEL_TENSOR_GET_OFFSET(k);
-                        printf("%.4f", k->array[idx]);
-                        if (d4 < k->shape[4] - 1) {
-                            printf(", ");
-                        }
-                    }
-                    printf("]");
-                    if (d3 < k->shape[3] - 1) {
-                        printf(",");
-                    } else {
-                        printf("");
-                    }
-                }
-                printf("]");
-                if (d2 < k->shape[2] - 1) {
-                    printf(",");
-                } else {
-                    printf("");
-                }
-            }
-            printf("]");
-            if (d1 < k->shape[1] - 1) {
-                printf(",");
-            } else {
-                printf("");
-            }
-        }
-        printf("]");
-        if (d0 < k->shape[0] - 1) {
-            printf(",");
-        } else {
-            printf("");
-        }
+    if ((k->computed == false) || (k->array == NULL)){
+        printf("    data: not computed\n"); //lazy, or released by compute()
+        return;
     }
-    printf("])\n");
-
-                
+    printf("    data:\n");
+    printf("tensor(");
+    size_t idx[5] = {0, 0, 0, 0, 0};
+    print_dim(k, idx, 0, get_alleged_length(k->shape) > print_threshold);
+    printf(")\n");
 }
 
 void print_expression(expression *e){
@@ -335,6 +525,69 @@ bool are_shapes_equal(size_t shape0[5], size_t shape1[5]) {
     return true; 
 }
 
+void make_strided_loop(strided_loop *l, size_t shape[5], kernel_tensor **ks, size_t num){
+    l->ndim = 0;
+    l->length = get_alleged_length(shape);
+    for (size_t i = 0; i < 5; i++){
+        if (shape[i] == 1){
+            continue;
+        }
+        if (l->ndim > 0){
+            bool mergeable = true;
+            for (size_t j = 0; j < num; j++){
+                if (l->stride[j][l->ndim - 1] != ks[j]->stride[i] * (int64_t) shape[i]){
+                    mergeable = false;
+                }
+            }
+            if (mergeable){
+                l->shape[l->ndim - 1] *= shape[i];
+                for (size_t j = 0; j < num; j++){
+                    l->stride[j][l->ndim - 1] = ks[j]->stride[i];
+                }
+                continue;
+            }
+        }
+        l->shape[l->ndim] = shape[i];
+        for (size_t j = 0; j < num; j++){
+            l->stride[j][l->ndim] = ks[j]->stride[i];
+        }
+        l->ndim++;
+    }
+    if (l->ndim == 0){ //single element
+        l->ndim = 1;
+        l->shape[0] = 1;
+        for (size_t j = 0; j < num; j++){
+            l->stride[j][0] = 1;
+        }
+    }
+}
+
+//numpy style: dimensions must be equal or one of them 1
+bool broadcast_shapes(size_t out_shape[5], size_t shape0[5], size_t shape1[5]) {
+    for (size_t i = 0; i < 5; i++) {
+        if ((shape0[i] != shape1[i]) && (shape0[i] != 1) && (shape1[i] != 1)) {
+            return false;
+        }
+        out_shape[i] = (shape0[i] > shape1[i]) ? shape0[i] : shape1[i];
+        if ((shape0[i] == 0) || (shape1[i] == 0)) {
+            out_shape[i] = 0;
+        }
+    }
+    return true;
+}
+
+//shallow view of k with the broadcast dimensions read with stride 0 (nothing is copied)
+kernel_tensor * broadcast_kernel_tensor(kernel_tensor *k, size_t shape[5]) {
+    kernel_tensor *k1 = kernel_tensor_shallow_copy(k);
+    for (size_t i = 0; i < 5; i++) {
+        if (k->shape[i] != shape[i]) {
+            k1->stride[i] = 0;
+            k1->shape[i] = shape[i];
+        }
+    }
+    return k1;
+}
+
 void set_reduced_shape(size_t reduced_shape[5], size_t original_shape[5], lemur_float dims[5]) {
     for (size_t i = 0; i < 5; i++) {
         size_t d = (size_t)dims[i];
@@ -368,33 +621,22 @@ void inplace_contiguous_kernel_tensor(kernel_tensor *k){
     if (is_contiguous(k)){
         return;
     }
-    lemur_float* prev_array = k->array;
-    int64_t prev_stride[5];
-    memcpy(prev_stride, k->stride, 5 * sizeof(int64_t));
+    kernel_tensor prev = *k;
     set_contiguous_stride(k);
     k->length = get_alleged_length(k->shape);
     k->array = lemur_alloc(k->length);
     
-    KERNEL_TENSOR_5D_LOOP_START(k){
-        size_t offset_k = KERNEL_TENSOR_GET_OFFSET(k);
-        size_t offset_prev_k = d0*prev_stride[0] + d1*prev_stride[1] 
-                             + d2*prev_stride[2] + d3*prev_stride[3] + d4*prev_stride[4];
-        k->array[offset_k] = prev_array[offset_prev_k];
-    }
-    if (k->shallow == false){
-        free(prev_array);
-    }
+    UNARY_ELEMENTWISE_OP_SIMD(k, &prev, _copy);
+    free_kernel_tensor_array(&prev);
     k->shallow = false;
+    k->mapped = false;
+    k->readonly = false;
 }
 
 kernel_tensor * contiguous_deepcopy_kernel_tensor(kernel_tensor *k){
     kernel_tensor *kc = empty_contiguous_kernel_tensor_like(k);
     if (is_contiguous(k) == false){
-        KERNEL_TENSOR_5D_LOOP_START(kc){
-            size_t offset_kc = KERNEL_TENSOR_GET_OFFSET(kc);
-            size_t offset_k= KERNEL_TENSOR_GET_OFFSET(k);
-            kc->array[offset_kc] =  k->array[offset_k];
-        }
+        UNARY_ELEMENTWISE_OP_SIMD(kc, k, _copy);
     } else {
         memcpy(kc->array, k->array, k->length * sizeof(lemur_float));
     }
@@ -402,41 +644,6 @@ kernel_tensor * contiguous_deepcopy_kernel_tensor(kernel_tensor *k){
 }
 
 
-bool is_initialize_random = false;
-unsigned int _seed = 0;
-void init_seed(unsigned int seed){
-    if (seed == 0){
-            _seed = time(NULL);
-        } else {
-            _seed = seed;
-        }
-    srand(_seed);
-    is_initialize_random = true;
-    printf("seed = %u\n", _seed);
-}
-
-void init_random(void) {
-    if (!is_initialize_random){
-        init_seed(0);
-    }
-}
-void random_uniform_kernel_tensor(kernel_tensor *k, lemur_float min, lemur_float max) {
-    #pragma omp parallel for
-    for (size_t i = 0; i < k->length; i++) {
-        k->array[i] = min + (lemur_float)rand() / (lemur_float)RAND_MAX * (max - min);
-    }
-}
-
-void random_normal_kernel_tensor(kernel_tensor *k, lemur_float mean, lemur_float std) {
-    #pragma omp parallel for
-    for (size_t i = 0; i < k->length; i++) {
-        lemur_float u1 = (lemur_float)rand() / (lemur_float)RAND_MAX;
-        lemur_float u2 = (lemur_float)rand() / (lemur_float)RAND_MAX;
-        k->array[i] = mean + std * sqrt(-2.0 * log(u1)) * cos(2.0 * M_PI * u2);
-    }
-}
-
-
 void linspace_kernel_tensor(kernel_tensor *k, lemur_float start, lemur_float end){
     if (k->length == 1){
         k->array[0] = start;
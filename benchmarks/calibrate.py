@@ -0,0 +1,17 @@
+# measures the parallel thresholds of this machine and saves them for every later process
+# run from the repository root: python -m benchmarks.calibrate [num_threads]
+
+import sys
+import lemur
+
+def main(num_threads : int = None) -> None:
+    if num_threads is not None:
+        lemur.set_num_threads(num_threads)
+    before = lemur.get_parallel_thresholds()
+    after = lemur.calibrate_parallel_thresholds(save=True)
+    print(f"{'class':>12} {'before':>22} {'after':>22}   ({lemur.get_num_threads()} threads)")
+    for name in after:
+        print(f"{name:>12} {before[name]:>22} {after[name]:>22}")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else None)
@@ -0,0 +1,49 @@
+# per-op overhead of the python frontend on tiny tensors, where the kernels cost next to nothing
+# run from the repository root: python -m benchmarks.dispatch
+# python -m benchmarks.suite run records the same cases as dispatch rows, which compare checks for regressions
+
+import time
+import lemur
+
+def _best_ns(fn, number : int, repeat : int) -> float:
+    # best average over repeat runs of number calls, in nanoseconds per call
+    for _ in range(number // 10 + 1): # warm up
+        fn()
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        for _ in range(number):
+            fn()
+        best = min(best, (time.perf_counter_ns() - start) / number)
+    return best
+
+def cases() -> dict:
+    x = lemur.tensor([[1.0, 2.0], [3.0, 4.0]])
+    y = lemur.tensor([[0.5, 0.5], [0.5, 0.5]])
+    out = lemur.tensor([[0.0, 0.0], [0.0, 0.0]])
+    return {
+        "shape":         lambda: x.shape,
+        "stride":        lambda: x.stride(),
+        "numel":         lambda: x.numel(),
+        "add":           lambda: x + y,
+        "mul scalar":    lambda: x * 0.5,
+        "rsub scalar":   lambda: 1.0 - x,
+        "pow scalar":    lambda: x ** 2,
+        "relu":          lambda: x.relu(),
+        "sum":           lambda: x.sum(),
+        "sum dim":       lambda: x.sum(4),
+        "add out=":      lambda: lemur.add(x, y, out=out),
+        "add_":          lambda: out.add_(y),
+        "matmul":        lambda: x @ y,
+    }
+
+def run(number : int = 20000, repeat : int = 5) -> dict:
+    return {name: _best_ns(fn, number, repeat) for name, fn in cases().items()}
+
+def main(number : int = 20000, repeat : int = 5) -> None:
+    print(f"{'op (2x2 tensors)':>20} {'ns/call':>10}")
+    for name, ns in run(number, repeat).items():
+        print(f"{name:>20} {ns:>10.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+# GFLOP/s of bmm against the micro-kernel peak of this machine
+# run from the repository root: python -m benchmarks.matmul
+
+import time
+import lemur
+from frontend.bindings import lib
+
+SIZES = [(1, 64, 64, 64), (1, 256, 256, 256), (1, 512, 512, 512), (1, 1024, 1024, 1024),
+         (8, 128, 128, 128), (1, 1024, 64, 1024), (1, 64, 4096, 64)]
+
+def _best_time(fn, repeat : int) -> float:
+    fn() # warm up
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def _gflops(b : int, m : int, k : int, n : int, seconds : float) -> float:
+    return 2.0 * b * m * n * k / seconds * 1e-9
+
+def main(repeat : int = 5) -> None:
+    peak = lib.gemm_peak_gflops()
+    print(f"micro-kernel peak: {peak:.1f} GFLOP/s")
+    print(f"{'b x m x k x n':>24} {'a @ b':>12} {'a @ b.T':>12} {'fwd+bwd':>12}")
+    for (b, m, k, n) in SIZES:
+        x = lemur.rand((1, 1, b, m, k))
+        y = lemur.rand((1, 1, b, k, n))
+        yt = lemur.rand((1, 1, b, n, k)).permute(0, 1, 2, 4, 3) # transposed view, read in place
+
+        t_nn = _best_time(lambda: x @ y, repeat)
+        t_nt = _best_time(lambda: x @ yt, repeat)
+
+        def fwd_bwd():
+            xg = lemur.rand((1, 1, b, m, k), requires_grad=True)
+            (xg @ y).sum().backward()
+        t_fb = _best_time(fwd_bwd, repeat)
+
+        f_nn = _gflops(b, m, k, n, t_nn)
+        f_nt = _gflops(b, m, k, n, t_nt)
+        f_fb = 2.0 * _gflops(b, m, k, n, t_fb) # forward + grad wrt x
+        label = f"{b}x{m}x{k}x{n}"
+        print(f"{label:>24} {f_nn:>8.1f} ({f_nn / peak:>3.0%}) {f_nt:>7.1f} ({f_nt / peak:>3.0%}) {f_fb:>7.1f}")
+
+if __name__ == "__main__":
+    main()
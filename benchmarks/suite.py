@@ -0,0 +1,378 @@
+# throughput of every op (forward and forward + backward) and of a few full graphs, swept over
+# tensor sizes, contiguous / permuted inputs and thread counts, with regressions against a baseline
+# run from the repository root:
+#   python -m benchmarks.suite run [--quick] [--threads 1,4] [--ops add,sum] [--out results.json]
+#   python -m benchmarks.suite compare baseline.json results.json [--tolerance 0.15]
+# elementwise and reduce rows report GB/s (bytes every operand is read or written once),
+# matmul rows GFLOP/s, shape ops (views) and forward + backward rows of the other ops only time,
+# dispatch rows time the per-call overhead of the frontend on 2x2 tensors (benchmarks/dispatch.py)
+
+import sys
+import json
+import time
+import argparse
+import platform
+import importlib.util
+import lemur
+from frontend.ptensor import LemurTensor
+from frontend.bindings import lib
+from frontend.version import __version__
+from benchmarks import dispatch as dispatch_cases
+
+HAS_NUMPY = importlib.util.find_spec("numpy") is not None
+if HAS_NUMPY:
+    import numpy as np
+
+LAYOUTS = ("contiguous", "permuted")
+
+### timing ###
+
+def _best_seconds(fn, min_time : float, repeat : int) -> float:
+    # best seconds per call over repeat batches, a batch being as many calls as last min_time
+    fn() # warm up
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or number >= 1 << 20:
+            break
+        number *= 2
+    best = elapsed / number
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+### sizes ###
+
+def _llc_bytes() -> int:
+    # size of the last level cache, 32 MiB when it cannot be read
+    best = 0
+    try:
+        import glob
+        for path in glob.glob("/sys/devices/system/cpu/cpu0/cache/index*/size"):
+            with open(path) as f:
+                text = f.read().strip()
+            scale = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}.get(text[-1], 1)
+            best = max(best, int(text.rstrip("KMG")) * scale)
+    except (OSError, ValueError):
+        pass
+    return best or 32 << 20
+
+def sizes(quick : bool) -> dict:
+    # (rows, cols) of the elementwise / reduce operands and the side of the square matmuls per size,
+    # "large" operands are twice the last level cache so every pass streams from memory
+    side = int((2 * _llc_bytes() / 4) ** 0.5) // 64 * 64
+    table = {
+        "tiny":   ((2, 2), 2),
+        "small":  ((64, 64), 64),
+        "medium": ((512, 512), 256),
+        "large":  ((side, side), 1024),
+    }
+    if quick:
+        del table["large"]
+    return table
+
+### cases ###
+
+# op name (as in op_map) -> (kind, forward on operands, number of operands)
+# the operands of a case are the same shape, positive and away from 0 so that log, sqrt, pow and
+# the divisions stay finite
+def _binary(fn):
+    return ("binary", fn, 2)
+
+def _unary(fn):
+    return ("unary", fn, 1)
+
+def _reduce(fn):
+    return ("reduce", fn, 1)
+
+def _view(fn):
+    return ("shape", fn, 1)
+
+def _matmul(fn, batch_a, batch_b, transposed_b):
+    return ("matmul", fn, (batch_a, batch_b, transposed_b))
+
+_EXPONENT = lemur.tensor([3.0]) # pow takes a scalar tensor exponent
+
+OPS = {
+    "add": _binary(lambda a, b: a + b),
+    "sub": _binary(lambda a, b: a - b),
+    "mul": _binary(lambda a, b: a * b),
+    "div": _binary(lambda a, b: a / b),
+    "pow": _unary(lambda a: a ** _EXPONENT),
+    "eq": _binary(lambda a, b: a == b),
+    "exp": _unary(lambda a: a.exp()),
+    "relu": _unary(lambda a: a.relu()),
+    "sigmoid": _unary(lambda a: a.sigmoid()),
+    "log": _unary(lambda a: a.log()),
+    "neg": _unary(lambda a: a.neg()),
+    "sqrt": _unary(lambda a: a.sqrt()),
+    "abs": _unary(lambda a: a.abs()),
+    "sign": _unary(lambda a: a.sign()),
+    "reciprocal": _unary(lambda a: a.reciprocal()),
+    "contiguous": _unary(lambda a: a.contiguous()),
+    "add_scalar": _unary(lambda a: a + 0.5),
+    "mul_scalar": _unary(lambda a: a * 0.5),
+    "div_scalar": _unary(lambda a: a / 3.0),
+    "rsub_scalar": _unary(lambda a: 1.0 - a),
+    "rdiv_scalar": _unary(lambda a: 1.0 / a),
+    "pow_scalar": _unary(lambda a: a ** 3.0),
+    "rpow_scalar": _unary(lambda a: 2.0 ** a),
+    "sum": _reduce(lambda a: a.sum(4)),
+    "all": _reduce(lambda a: a.all(4)),
+    "any": _reduce(lambda a: a.any(4)),
+    "max": _reduce(lambda a: a.max(4)),
+    "min": _reduce(lambda a: a.min(4)),
+    "mean": _reduce(lambda a: a.mean(4)),
+    "argmax": _reduce(lambda a: a.argmax(4)),
+    "argmin": _reduce(lambda a: a.argmin(4)),
+    "view": _view(lambda a: a.view(1, 1, 1, 1, a.numel())),
+    "expand": _view(lambda a: a.expand(1, 1, 4, *a.shape[3:])),
+    "permute": _view(lambda a: a.permute(0, 1, 2, 4, 3)),
+    "bmm": _matmul(lambda a, b: LemurTensor(_ptr=lib.bmm(a._ptr, b._ptr, False), _parents=(a, b)), 2, 2, False),
+    "bcmm": _matmul(lambda a, b: LemurTensor(_ptr=lib.bcmm(a._ptr, b._ptr, False), _parents=(a, b)), 2, 1, False),
+    "bmm_fast": _matmul(lambda a, b: LemurTensor(_ptr=lib.bmm_fast(a._ptr, b._ptr, False), _parents=(a, b)), 2, 2, True),
+    "bcmm_fast": _matmul(lambda a, b: LemurTensor(_ptr=lib.bcmm_fast(a._ptr, b._ptr, False), _parents=(a, b)), 2, 1, True),
+}
+
+# ops without a gradient only get a forward row, views need contiguous inputs
+NO_BACKWARD = {"eq", "sign", "all", "any", "argmax", "argmin"}
+CONTIGUOUS_ONLY = {"view"}
+
+if HAS_NUMPY:
+    NUMPY_OPS = {
+        "add": np.add, "sub": np.subtract, "mul": np.multiply, "div": np.divide, "pow": lambda a: a ** 3.0,
+        "eq": np.equal, "exp": np.exp, "relu": lambda a: np.maximum(a, 0.0),
+        "sigmoid": lambda a: 1.0 / (1.0 + np.exp(-a)), "log": np.log, "neg": np.negative,
+        "sqrt": np.sqrt, "abs": np.abs, "sign": np.sign, "reciprocal": np.reciprocal,
+        "contiguous": np.ascontiguousarray,
+        "add_scalar": lambda a: a + 0.5, "mul_scalar": lambda a: a * 0.5, "div_scalar": lambda a: a / 3.0,
+        "rsub_scalar": lambda a: 1.0 - a, "rdiv_scalar": lambda a: 1.0 / a,
+        "pow_scalar": lambda a: a ** 3.0, "rpow_scalar": lambda a: 2.0 ** a,
+        "sum": lambda a: a.sum(-1, keepdims=True), "all": lambda a: a.all(-1, keepdims=True),
+        "any": lambda a: a.any(-1, keepdims=True), "max": lambda a: a.max(-1, keepdims=True),
+        "min": lambda a: a.min(-1, keepdims=True), "mean": lambda a: a.mean(-1, keepdims=True),
+        "argmax": lambda a: a.argmax(-1), "argmin": lambda a: a.argmin(-1),
+        "bmm": np.matmul, "bcmm": np.matmul,
+        "bmm_fast": lambda a, b: np.matmul(a, np.swapaxes(b, -1, -2)),
+        "bcmm_fast": lambda a, b: np.matmul(a, np.swapaxes(b, -1, -2)),
+    }
+else:
+    NUMPY_OPS = {}
+
+def uncovered_ops() -> list:
+    # ops of the forward table that the suite does not time, should stay empty
+    names = []
+    i = 0
+    while True:
+        name = lib.get_op_name(i)
+        if name == b"unknown_op":
+            break
+        if name:
+            names.append(name.decode("utf-8"))
+        i += 1
+    return [n for n in names if n not in OPS]
+
+def _operand(shape : tuple, layout : str, requires_grad : bool) -> LemurTensor:
+    # values in [0.5, 1.5), a permuted operand is the transposed view of a tensor of the swapped shape
+    if layout == "contiguous":
+        return lemur.rand(shape, 0.5, 1.5, requires_grad=requires_grad)
+    swapped = shape[:3] + (shape[4], shape[3])
+    return lemur.rand(swapped, 0.5, 1.5, requires_grad=requires_grad).permute(0, 1, 2, 4, 3)
+
+def _numpy_operand(shape : tuple, layout : str):
+    if layout == "contiguous":
+        return np.random.uniform(0.5, 1.5, shape).astype(np.float32)
+    swapped = shape[:3] + (shape[4], shape[3])
+    return np.random.uniform(0.5, 1.5, swapped).astype(np.float32).swapaxes(3, 4)
+
+def _operand_shapes(kind : str, arity, rows_cols : tuple, side : int) -> list:
+    if kind != "matmul":
+        return [(1, 1, 1) + rows_cols] * (arity if kind == "binary" else 1)
+    batch_a, batch_b, transposed_b = arity
+    return [(1, 1, batch_a, side, side), (1, 1, batch_b, side, side)]
+
+def _forward_throughput(kind : str, shapes : list, seconds : float) -> tuple:
+    # (value, unit) of one forward call
+    if kind == "matmul":
+        b, m, k = shapes[0][2], shapes[0][3], shapes[0][4]
+        return 2.0 * b * m * k * shapes[1][4] / seconds * 1e-9, "GFLOP/s"
+    numel = shapes[0][3] * shapes[0][4]
+    if kind == "shape":
+        return None, None
+    if kind == "reduce":
+        return 4.0 * numel / seconds * 1e-9, "GB/s"
+    return 4.0 * numel * (len(shapes) + 1) / seconds * 1e-9, "GB/s"
+
+def _graphs(size : str, rows_cols : tuple, layout : str) -> dict:
+    # full forward + backward graphs
+    rows, cols = rows_cols
+    x = _operand((1, 1, 1, rows, cols), layout, False)
+    y = _operand((1, 1, 1, rows, cols), layout, True)
+    hidden = min(cols, 256)
+    w1 = lemur.rand((1, 1, 1, cols, hidden), -0.1, 0.1, requires_grad=True)
+    b1 = lemur.rand((1, 1, 1, 1, hidden), -0.1, 0.1, requires_grad=True).expand(1, 1, 1, rows, hidden)
+    w2 = lemur.rand((1, 1, 1, hidden, 1), -0.1, 0.1, requires_grad=True)
+    return {
+        "elementwise chain": lambda: ((x * y + x).exp() * y).sigmoid().sum().backward(),
+        "mlp": lambda: ((x @ w1 + b1).relu() @ w2).sigmoid().mean().backward(),
+    }
+
+### run ###
+
+def run(quick : bool = False, threads : list = None, ops : list = None,
+        min_time : float = 0.05, repeat : int = 3, log = print, dispatch : bool = None) -> dict:
+    # dispatch rows are timed by default only when every op is
+    dispatch = (ops is None) if dispatch is None else dispatch
+    threads = threads or sorted({1, lemur.get_num_threads()})
+    names = ops or list(OPS)
+    unknown = [n for n in names if n not in OPS]
+    if unknown:
+        raise ValueError(f"Unknown ops {unknown}, expected names of {list(OPS)}.")
+    previous_threads = lemur.get_num_threads()
+    results = []
+
+    def record(op, kind, size, layout, num_threads, seconds, throughput=None, unit=None, numpy_seconds=None):
+        row = {"op": op, "kind": kind, "size": size, "layout": layout, "threads": num_threads,
+               "seconds": seconds, "throughput": throughput, "unit": unit, "numpy_seconds": numpy_seconds}
+        results.append(row)
+        log(_format_row(row))
+
+    try:
+        for num_threads in threads:
+            lemur.set_num_threads(num_threads)
+            for size, (rows_cols, side) in sizes(quick).items():
+                for layout in LAYOUTS:
+                    for name in names:
+                        kind, fn, arity = OPS[name]
+                        if name in CONTIGUOUS_ONLY and layout != "contiguous":
+                            continue
+                        shapes = _operand_shapes(kind, arity, rows_cols, side)
+                        args = [_operand(s, layout, False) for s in shapes]
+                        seconds = _best_seconds(lambda: fn(*args), min_time, repeat)
+                        throughput, unit = _forward_throughput(kind, shapes, seconds)
+                        numpy_seconds = None
+                        if name in NUMPY_OPS and num_threads == threads[0]:
+                            np_args = [_numpy_operand(s, layout) for s in shapes]
+                            numpy_seconds = _best_seconds(lambda: NUMPY_OPS[name](*np_args), min_time, repeat)
+                        record(name, "forward", size, layout, num_threads, seconds, throughput, unit, numpy_seconds)
+
+                        if name in NO_BACKWARD or kind == "shape":
+                            continue
+                        grad_args = [_operand(s, layout, True) for s in shapes]
+                        seconds = _best_seconds(lambda: fn(*grad_args).sum().backward(), min_time, repeat)
+                        throughput, unit = (None, None)
+                        if kind == "matmul": # forward and both gradients
+                            throughput, unit = _forward_throughput(kind, shapes, seconds / 3.0)
+                        record(name, "forward+backward", size, layout, num_threads, seconds, throughput, unit)
+
+                    if ops is None:
+                        for graph, fn in _graphs(size, rows_cols, layout).items():
+                            record(graph, "graph", size, layout, num_threads, _best_seconds(fn, min_time, repeat))
+
+            if dispatch:
+                for name, fn in dispatch_cases.cases().items():
+                    record(name, "dispatch", "2x2", "contiguous", num_threads, _best_seconds(fn, min_time, repeat))
+    finally:
+        lemur.set_num_threads(previous_threads)
+
+    return {
+        "meta": {
+            "version": __version__,
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "python": platform.python_version(),
+            "llc_bytes": _llc_bytes(),
+            "numpy": np.__version__ if HAS_NUMPY else None,
+            "threads": threads,
+            "quick": quick,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+
+def _format_row(row : dict) -> str:
+    label = f"{row['op']} {row['kind']} {row['size']} {row['layout']} x{row['threads']}"
+    text = f"{label:>52} {row['seconds'] * 1e6:>12.2f} us"
+    if row["throughput"] is not None:
+        text += f" {row['throughput']:>9.2f} {row['unit']}"
+    if row["numpy_seconds"] is not None:
+        text += f"   numpy {row['seconds'] / row['numpy_seconds']:>6.2f}x time"
+    return text
+
+### compare ###
+
+def _key(row : dict) -> tuple:
+    return (row["op"], row["kind"], row["size"], row["layout"], row["threads"])
+
+def compare(baseline : dict, current : dict, tolerance : float = 0.15) -> dict:
+    # rows slower than baseline * (1 + tolerance) are regressions, faster than
+    # baseline / (1 + tolerance) improvements, rows only in one of the runs are listed apart
+    base = {_key(r): r for r in baseline["results"]}
+    cur = {_key(r): r for r in current["results"]}
+    regressions, improvements = [], []
+    for key in base.keys() & cur.keys():
+        ratio = cur[key]["seconds"] / base[key]["seconds"]
+        if ratio > 1.0 + tolerance:
+            regressions.append((key, ratio))
+        elif ratio < 1.0 / (1.0 + tolerance):
+            improvements.append((key, ratio))
+    return {
+        "regressions": sorted(regressions, key=lambda kr: -kr[1]),
+        "improvements": sorted(improvements, key=lambda kr: kr[1]),
+        "missing": sorted(base.keys() - cur.keys()),
+        "new": sorted(cur.keys() - base.keys()),
+    }
+
+def _print_comparison(diff : dict, tolerance : float) -> None:
+    for title, rows in (("regressions", diff["regressions"]), ("improvements", diff["improvements"])):
+        print(f"{len(rows)} {title} (tolerance {tolerance:.0%})")
+        for key, ratio in rows:
+            print(f"{' '.join(str(k) for k in key[:4]) + ' x' + str(key[4]):>52} {ratio:>6.2f}x time")
+    if diff["missing"] or diff["new"]:
+        print(f"{len(diff['missing'])} rows only in the baseline, {len(diff['new'])} only in the new run")
+
+### command line ###
+
+def main(argv : list = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.suite")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="time every op and write the results as json")
+    run_parser.add_argument("--quick", action="store_true", help="skip the sizes larger than the last level cache")
+    run_parser.add_argument("--threads", default=None, help="comma separated thread counts, default 1 and all")
+    run_parser.add_argument("--ops", default=None, help="comma separated op names, default every op and the graphs")
+    run_parser.add_argument("--min-time", type=float, default=0.05, help="seconds per timed batch")
+    run_parser.add_argument("--out", default="benchmark_results.json")
+    compare_parser = commands.add_parser("compare", help="diff a run against a saved baseline")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--tolerance", type=float, default=0.15)
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        missing = uncovered_ops()
+        if missing:
+            print(f"ops without a benchmark: {', '.join(missing)}")
+        threads = [int(t) for t in args.threads.split(",")] if args.threads else None
+        ops = args.ops.split(",") if args.ops else None
+        results = run(args.quick, threads, ops, args.min_time)
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=1)
+        print(f"wrote {len(results['results'])} rows to {args.out}")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    diff = compare(baseline, current, args.tolerance)
+    _print_comparison(diff, args.tolerance)
+    return 1 if diff["regressions"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -30,6 +30,8 @@ class KernelTensor(ctypes.Structure):
         ("stride",   ctypes.c_int64  * 5),            
         ("computed", ctypes.c_bool),
         ("shallow",       ctypes.c_bool),  
+        ("mapped",   ctypes.c_bool),
+        ("readonly", ctypes.c_bool),
     ]
 
 KernelTensorPtr = ctypes.POINTER(KernelTensor)
@@ -42,6 +44,9 @@ class Expression(ctypes.Structure):
         ("t0",    ctypes.POINTER(Tensor)),  
         ("t1",    ctypes.POINTER(Tensor)),
         ("backward_func", ctypes.c_int),            
+        ("fused",         ctypes.c_void_p),
+        ("plan",          ctypes.c_void_p),
+        ("saved_version", ctypes.c_size_t * 3),
     ] 
 
 ExpressionPtr = ctypes.POINTER(Expression)
@@ -52,20 +57,120 @@ class Tensor(ctypes.Structure):
         ("comes_from",    ctypes.POINTER(Expression)),    
         ("requires_grad", ctypes.c_bool),
         ("grad",          ctypes.POINTER(KernelTensor)),  
+        ("version",       ctypes.c_size_t),
     ]
 
 TensorPtr = ctypes.POINTER(Tensor)
 
+class MemoryCounters(ctypes.Structure):
+    _fields_ = [
+        ("live_bytes",      ctypes.c_size_t),
+        ("peak_bytes",      ctypes.c_size_t),
+        ("allocated_bytes", ctypes.c_size_t),
+        ("num_allocs",      ctypes.c_size_t),
+    ]
+
+class MemoryBlock(ctypes.Structure):
+    _fields_ = [
+        ("bytes",    ctypes.c_size_t),
+        ("id",       ctypes.c_size_t),
+        ("origin",   ctypes.c_int),
+        ("backward", ctypes.c_bool),
+    ]
+
+class ProfileEvent(ctypes.Structure):
+    _fields_ = [
+        ("func",        ctypes.c_int),
+        ("backward",    ctypes.c_bool),
+        ("thread",      ctypes.c_int),
+        ("num_threads", ctypes.c_int),
+        ("start",       ctypes.c_double),
+        ("duration",    ctypes.c_double),
+        ("shape",       (ctypes.c_size_t * 5) * 3),
+        ("bytes",       ctypes.c_size_t),
+    ]
+
 #from interface.h
 lib.compile.argtypes = [ctypes.POINTER(Tensor)] 
 lib.compile.restype = None
 
+lib.compile_wait.argtypes = []
+lib.compile_wait.restype = None
+
+lib.set_kernel_cache_dir.argtypes = [ctypes.c_char_p]
+lib.set_kernel_cache_dir.restype = None
+
+lib.get_kernel_cache_dir.argtypes = []
+lib.get_kernel_cache_dir.restype = ctypes.c_char_p
+
+lib.compute.argtypes = [ctypes.POINTER(Tensor)] 
+lib.compute.restype = ctypes.c_bool
+
+lib.plan_memory.argtypes = [ctypes.POINTER(Tensor)] 
+lib.plan_memory.restype = ctypes.c_size_t
+
+lib.invalidate.argtypes = [ctypes.POINTER(Tensor)] 
+lib.invalidate.restype = None
+
+lib.set_lazy_mode.argtypes = [ctypes.c_bool] 
+lib.set_lazy_mode.restype = None
+
+lib.get_lazy_mode.argtypes = [] 
+lib.get_lazy_mode.restype = ctypes.c_bool
+
+lib.profile_start.argtypes = []
+lib.profile_start.restype = None
+
+lib.profile_stop.argtypes = []
+lib.profile_stop.restype = None
+
+lib.profile_clear.argtypes = []
+lib.profile_clear.restype = None
+
+lib.get_profile_num_events.argtypes = []
+lib.get_profile_num_events.restype = ctypes.c_size_t
+
+lib.get_profile_events.argtypes = []
+lib.get_profile_events.restype = ctypes.POINTER(ProfileEvent)
+
+lib.set_num_threads.argtypes = [ctypes.c_int]
+lib.set_num_threads.restype = None
+
+lib.get_num_threads.argtypes = []
+lib.get_num_threads.restype = ctypes.c_int
+
+lib.get_parallel_class_name.argtypes = [ctypes.c_int]
+lib.get_parallel_class_name.restype = ctypes.c_char_p
+
+lib.set_parallel_threshold.argtypes = [ctypes.c_int, ctypes.c_size_t]
+lib.set_parallel_threshold.restype = ctypes.c_bool
+
+lib.get_parallel_threshold.argtypes = [ctypes.c_int]
+lib.get_parallel_threshold.restype = ctypes.c_size_t
+
+lib.save_parallel_thresholds.argtypes = [ctypes.c_char_p]
+lib.save_parallel_thresholds.restype = ctypes.c_bool
+
+lib.load_parallel_thresholds.argtypes = [ctypes.c_char_p]
+lib.load_parallel_thresholds.restype = ctypes.c_bool
+
+lib.calibrate_parallel_thresholds.argtypes = []
+lib.calibrate_parallel_thresholds.restype = ctypes.c_bool
+
 lib.tensor_from.argtypes = [ctypes.POINTER(KernelTensor), ctypes.POINTER(Expression), ctypes.c_bool, ctypes.POINTER(KernelTensor)] 
 lib.tensor_from.restype = ctypes.POINTER(Tensor)
 
 lib.contiguous_deepcopy_kernel_tensor.argtypes = [ctypes.POINTER(KernelTensor)] 
 lib.contiguous_deepcopy_kernel_tensor.restype = ctypes.POINTER(KernelTensor)
 
+# void set_print_options(size_t threshold, size_t edgeitems, int precision);
+lib.set_print_options.argtypes = [ctypes.c_size_t, ctypes.c_size_t, ctypes.c_int]
+lib.set_print_options.restype = None
+
+# void gather_kernel_tensor(kernel_tensor *k, const size_t *index, const size_t count[5], lemur_float *out);
+lib.gather_kernel_tensor.argtypes = [ctypes.POINTER(KernelTensor), ctypes.POINTER(ctypes.c_size_t), (ctypes.c_size_t * 5), ctypes.POINTER(lemur_float)]
+lib.gather_kernel_tensor.restype = None
+
 lib.is_contiguous.argtypes = [ctypes.POINTER(KernelTensor)] 
 lib.is_contiguous.restype = ctypes.c_bool 
 
@@ -75,6 +180,12 @@ lib.random_uniform_kernel_tensor.restype = None
 lib.random_normal_kernel_tensor.argtypes = [ctypes.POINTER(KernelTensor), ctypes.c_float, ctypes.c_float] #lemur_float
 lib.random_normal_kernel_tensor.restype = None
 
+lib.random_dropout_mask_kernel_tensor.argtypes = [ctypes.POINTER(KernelTensor), ctypes.c_float] #lemur_float
+lib.random_dropout_mask_kernel_tensor.restype = ctypes.c_bool
+
+lib.random_int_kernel_tensor.argtypes = [ctypes.POINTER(KernelTensor), ctypes.c_int64, ctypes.c_int64]
+lib.random_int_kernel_tensor.restype = ctypes.c_bool
+
 lib.linspace_kernel_tensor.argtypes = [ctypes.POINTER(KernelTensor), ctypes.c_float, ctypes.c_float] #lemur_float
 lib.linspace_kernel_tensor.restype = None
 
@@ -82,6 +193,15 @@ lib.linspace_kernel_tensor.restype = None
 lib.init_seed.argtypes = [ctypes.c_uint]
 lib.init_seed.restype = None
 
+lib.get_seed.argtypes = []
+lib.get_seed.restype = ctypes.c_uint
+
+lib.get_random_offset.argtypes = []
+lib.get_random_offset.restype = ctypes.c_uint64
+
+lib.set_random_offset.argtypes = [ctypes.c_uint64]
+lib.set_random_offset.restype = None
+
 lib.memset_kernel_tensor.argtypes = [ctypes.POINTER(KernelTensor), ctypes.c_float] #lemur_float
 lib.memset_kernel_tensor.restype = None 
 
@@ -96,9 +216,21 @@ lib.empty_tensor.restype  = ctypes.POINTER(Tensor)
 lib.free_tensor.argtypes = [ctypes.POINTER(ctypes.POINTER(Tensor))]
 lib.free_tensor.restype  = None
 
-# void backward(tensor* t);
+# bool backward(tensor* t);
 lib.backward.argtypes = [ctypes.POINTER(Tensor)]
-lib.backward.restype  = None
+lib.backward.restype  = ctypes.c_bool
+
+# size_t tensor_version(tensor *t);
+lib.tensor_version.argtypes = [ctypes.POINTER(Tensor)]
+lib.tensor_version.restype  = ctypes.c_size_t
+
+# bool mark_modified(tensor *t);
+lib.mark_modified.argtypes = [ctypes.POINTER(Tensor)]
+lib.mark_modified.restype  = ctypes.c_bool
+
+# bool can_write_into(tensor *out, tensor *t0, tensor *t1);
+lib.can_write_into.argtypes = [ctypes.POINTER(Tensor), ctypes.POINTER(Tensor), ctypes.POINTER(Tensor)]
+lib.can_write_into.restype  = ctypes.c_bool
 
 # tensor* sub(tensor* t0, tensor* t1, bool retain_grad);
 lib.sub.argtypes = [ctypes.POINTER(Tensor), ctypes.POINTER(Tensor), ctypes.c_bool]
@@ -148,18 +280,118 @@ lib.neg.restype  = ctypes.POINTER(Tensor)
 lib.square_root.argtypes = [ctypes.POINTER(Tensor), ctypes.c_bool]
 lib.square_root.restype  = ctypes.POINTER(Tensor)
 
-# tensor* abs(tensor* t0, bool retain_grad);
-lib.abs.argtypes = [ctypes.POINTER(Tensor), ctypes.c_bool]
-lib.abs.restype  = ctypes.POINTER(Tensor)
+# tensor* absolute(tensor* t0, bool retain_grad); (abs would be the libc one)
+lib.absolute.argtypes = [ctypes.POINTER(Tensor), ctypes.c_bool]
+lib.absolute.restype  = ctypes.POINTER(Tensor)
 
-# tensor* sign(tensor* t0, bool retain_grad);
-lib.sign.argtypes = [ctypes.POINTER(Tensor), ctypes.c_bool]
+# tensor* sign(tensor* t0);
+lib.sign.argtypes = [ctypes.POINTER(Tensor)]
 lib.sign.restype  = ctypes.POINTER(Tensor)
 
 # tensor* reciprocal(tensor* t0, bool retain_grad);
 lib.reciprocal.argtypes = [ctypes.POINTER(Tensor), ctypes.c_bool]
 lib.reciprocal.restype  = ctypes.POINTER(Tensor)
 
+# tensor* contiguous(tensor* t0, bool retain_grad);
+lib.contiguous.argtypes = [ctypes.POINTER(Tensor), ctypes.c_bool]
+lib.contiguous.restype  = ctypes.POINTER(Tensor)
+
+# tensor* add_scalar(tensor* t0, lemur_float scalar, bool retain_grad);
+lib.add_scalar.argtypes = [ctypes.POINTER(Tensor), ctypes.c_float, ctypes.c_bool] #lemur_float
+lib.add_scalar.restype  = ctypes.POINTER(Tensor)
+
+# tensor* mul_scalar(tensor* t0, lemur_float scalar, bool retain_grad);
+lib.mul_scalar.argtypes = [ctypes.POINTER(Tensor), ctypes.c_float, ctypes.c_bool] #lemur_float
+lib.mul_scalar.restype  = ctypes.POINTER(Tensor)
+
+# tensor* div_scalar(tensor* t0, lemur_float scalar, bool retain_grad);
+lib.div_scalar.argtypes = [ctypes.POINTER(Tensor), ctypes.c_float, ctypes.c_bool] #lemur_float
+lib.div_scalar.restype  = ctypes.POINTER(Tensor)
+
+# tensor* rsub_scalar(tensor* t0, lemur_float scalar, bool retain_grad);
+lib.rsub_scalar.argtypes = [ctypes.POINTER(Tensor), ctypes.c_float, ctypes.c_bool] #lemur_float
+lib.rsub_scalar.restype  = ctypes.POINTER(Tensor)
+
+# tensor* rdiv_scalar(tensor* t0, lemur_float scalar, bool retain_grad);
+lib.rdiv_scalar.argtypes = [ctypes.POINTER(Tensor), ctypes.c_float, ctypes.c_bool] #lemur_float
+lib.rdiv_scalar.restype  = ctypes.POINTER(Tensor)
+
+# tensor* pow_scalar(tensor* t0, lemur_float scalar, bool retain_grad);
+lib.pow_scalar.argtypes = [ctypes.POINTER(Tensor), ctypes.c_float, ctypes.c_bool] #lemur_float
+lib.pow_scalar.restype  = ctypes.POINTER(Tensor)
+
+# tensor* rpow_scalar(tensor* t0, lemur_float scalar, bool retain_grad);
+lib.rpow_scalar.argtypes = [ctypes.POINTER(Tensor), ctypes.c_float, ctypes.c_bool] #lemur_float
+lib.rpow_scalar.restype  = ctypes.POINTER(Tensor)
+
+# int add_scalar_into(tensor *out, tensor *t0, lemur_float scalar);
+lib.add_scalar_into.argtypes = [ctypes.POINTER(Tensor), ctypes.POINTER(Tensor), ctypes.c_float] #lemur_float
+lib.add_scalar_into.restype  = ctypes.c_int
+
+# int mul_scalar_into(tensor *out, tensor *t0, lemur_float scalar);
+lib.mul_scalar_into.argtypes = [ctypes.POINTER(Tensor), ctypes.POINTER(Tensor), ctypes.c_float] #lemur_float
+lib.mul_scalar_into.restype  = ctypes.c_int
+
+# int div_scalar_into(tensor *out, tensor *t0, lemur_float scalar);
+lib.div_scalar_into.argtypes = [ctypes.POINTER(Tensor), ctypes.POINTER(Tensor), ctypes.c_float] #lemur_float
+lib.div_scalar_into.restype  = ctypes.c_int
+
+# int pow_scalar_into(tensor *out, tensor *t0, lemur_float scalar);
+lib.pow_scalar_into.argtypes = [ctypes.POINTER(Tensor), ctypes.POINTER(Tensor), ctypes.c_float] #lemur_float
+lib.pow_scalar_into.restype  = ctypes.c_int
+
+# int add_into(tensor *out, tensor *t0, tensor *t1);
+lib.add_into.argtypes = [ctypes.POINTER(Tensor), ctypes.POINTER(Tensor), ctypes.POINTER(Tensor)]
+lib.add_into.restype  = ctypes.c_int
+
+# int sub_into(tensor *out, tensor *t0, tensor *t1);
+lib.sub_into.argtypes = [ctypes.POINTER(Tensor), ctypes.POINTER(Tensor), ctypes.POINTER(Tensor)]
+lib.sub_into.restype  = ctypes.c_int
+
+# int mul_into(tensor *out, tensor *t0, tensor *t1);
+lib.mul_into.argtypes = [ctypes.POINTER(Tensor), ctypes.POINTER(Tensor), ctypes.POINTER(Tensor)]
+lib.mul_into.restype  = ctypes.c_int
+
+# int division_into(tensor *out, tensor *t0, tensor *t1);
+lib.division_into.argtypes = [ctypes.POINTER(Tensor), ctypes.POINTER(Tensor), ctypes.POINTER(Tensor)]
+lib.division_into.restype  = ctypes.c_int
+
+# int power_into(tensor *out, tensor *t0, tensor *t1);
+lib.power_into.argtypes = [ctypes.POINTER(Tensor), ctypes.POINTER(Tensor), ctypes.POINTER(Tensor)]
+lib.power_into.restype  = ctypes.c_int
+
+# int exponential_into(tensor *out, tensor *t0);
+lib.exponential_into.argtypes = [ctypes.POINTER(Tensor), ctypes.POINTER(Tensor)]
+lib.exponential_into.restype  = ctypes.c_int
+
+# int relu_into(tensor *out, tensor *t0);
+lib.relu_into.argtypes = [ctypes.POINTER(Tensor), ctypes.POINTER(Tensor)]
+lib.relu_into.restype  = ctypes.c_int
+
+# int sigmoid_into(tensor *out, tensor *t0);
+lib.sigmoid_into.argtypes = [ctypes.POINTER(Tensor), ctypes.POINTER(Tensor)]
+lib.sigmoid_into.restype  = ctypes.c_int
+
+# int logarithm_into(tensor *out, tensor *t0);
+lib.logarithm_into.argtypes = [ctypes.POINTER(Tensor), ctypes.POINTER(Tensor)]
+lib.logarithm_into.restype  = ctypes.c_int
+
+# int neg_into(tensor *out, tensor *t0);
+lib.neg_into.argtypes = [ctypes.POINTER(Tensor), ctypes.POINTER(Tensor)]
+lib.neg_into.restype  = ctypes.c_int
+
+# int square_root_into(tensor *out, tensor *t0);
+lib.square_root_into.argtypes = [ctypes.POINTER(Tensor), ctypes.POINTER(Tensor)]
+lib.square_root_into.restype  = ctypes.c_int
+
+# int absolute_into(tensor *out, tensor *t0);
+lib.absolute_into.argtypes = [ctypes.POINTER(Tensor), ctypes.POINTER(Tensor)]
+lib.absolute_into.restype  = ctypes.c_int
+
+# int reciprocal_into(tensor *out, tensor *t0);
+lib.reciprocal_into.argtypes = [ctypes.POINTER(Tensor), ctypes.POINTER(Tensor)]
+lib.reciprocal_into.restype  = ctypes.c_int
+
 #tensor * sum(tensor *t0, tensor *dim_data, bool retain_grad)
 lib.sum.argtypes = [ctypes.POINTER(Tensor), ctypes.POINTER(Tensor), ctypes.c_bool]
 lib.sum.restype  = ctypes.POINTER(Tensor)
@@ -192,6 +424,10 @@ lib.bmm_fast.restype  = ctypes.POINTER(Tensor)
 lib.bcmm_fast.argtypes = [ctypes.POINTER(Tensor), ctypes.POINTER(Tensor), ctypes.c_bool]
 lib.bcmm_fast.restype  = ctypes.POINTER(Tensor)
 
+#double gemm_peak_gflops(void)
+lib.gemm_peak_gflops.argtypes = []
+lib.gemm_peak_gflops.restype  = ctypes.c_double
+
 #tensor *isclose(tensor *a, tensor *b, lemur_float rtol, lemur_float atol){
 lib.isclose.argtypes = [ctypes.POINTER(Tensor), ctypes.POINTER(Tensor), ctypes.c_float,  ctypes.c_float]
 lib.isclose.restype = ctypes.POINTER(Tensor)
@@ -202,6 +438,26 @@ lib.all.restype  = ctypes.POINTER(Tensor)
 lib.any.argtypes = [ctypes.POINTER(Tensor), ctypes.POINTER(Tensor)]
 lib.any.restype  = ctypes.POINTER(Tensor)
 
+#tensor * maximum(tensor *t0, tensor *dim_data, bool retain_grad)
+lib.maximum.argtypes = [ctypes.POINTER(Tensor), ctypes.POINTER(Tensor), ctypes.c_bool]
+lib.maximum.restype  = ctypes.POINTER(Tensor)
+
+#tensor * minimum(tensor *t0, tensor *dim_data, bool retain_grad)
+lib.minimum.argtypes = [ctypes.POINTER(Tensor), ctypes.POINTER(Tensor), ctypes.c_bool]
+lib.minimum.restype  = ctypes.POINTER(Tensor)
+
+#tensor * mean(tensor *t0, tensor *dim_data, bool retain_grad)
+lib.mean.argtypes = [ctypes.POINTER(Tensor), ctypes.POINTER(Tensor), ctypes.c_bool]
+lib.mean.restype  = ctypes.POINTER(Tensor)
+
+#tensor * argmax(tensor *t0, tensor *dim_data)
+lib.argmax.argtypes = [ctypes.POINTER(Tensor), ctypes.POINTER(Tensor)]
+lib.argmax.restype  = ctypes.POINTER(Tensor)
+
+#tensor * argmin(tensor *t0, tensor *dim_data)
+lib.argmin.argtypes = [ctypes.POINTER(Tensor), ctypes.POINTER(Tensor)]
+lib.argmin.restype  = ctypes.POINTER(Tensor)
+
 #kernel_tensor * empty_contiguous_kernel_tensor_like(kernel_tensor *k);
 lib.empty_contiguous_kernel_tensor_like.argtypes = [ctypes.POINTER(KernelTensor)]
 lib.empty_contiguous_kernel_tensor_like.restype  = ctypes.POINTER(KernelTensor)
@@ -209,3 +465,56 @@ lib.empty_contiguous_kernel_tensor_like.restype  = ctypes.POINTER(KernelTensor)
 #void free_kernel_tensor(kernel_tensor **k);
 lib.free_kernel_tensor.argtypes = [ctypes.POINTER(ctypes.POINTER(KernelTensor))]
 lib.free_kernel_tensor.restype  = None
+
+#kernel_tensor * kernel_tensor_from_array(lemur_float *array, size_t shape[5]);
+lib.kernel_tensor_from_array.argtypes = [ctypes.c_void_p, (ctypes.c_size_t * 5)]
+lib.kernel_tensor_from_array.restype  = ctypes.POINTER(KernelTensor)
+
+#kernel_tensor * mmap_kernel_tensor(const char *path, size_t shape[5], size_t offset, int mode);
+lib.mmap_kernel_tensor.argtypes = [ctypes.c_char_p, (ctypes.c_size_t * 5), ctypes.c_size_t, ctypes.c_int]
+lib.mmap_kernel_tensor.restype  = ctypes.POINTER(KernelTensor)
+
+#int save_checkpoint(const char *path, char **names, kernel_tensor **ks, size_t n);
+lib.save_checkpoint.argtypes = [ctypes.c_char_p, ctypes.POINTER(ctypes.c_char_p), ctypes.POINTER(ctypes.POINTER(KernelTensor)), ctypes.c_size_t]
+lib.save_checkpoint.restype  = ctypes.c_int
+
+#int load_checkpoint_payloads(const char *path, kernel_tensor **ks, size_t *offsets, size_t n);
+lib.load_checkpoint_payloads.argtypes = [ctypes.c_char_p, ctypes.POINTER(ctypes.POINTER(KernelTensor)), ctypes.POINTER(ctypes.c_size_t), ctypes.c_size_t]
+lib.load_checkpoint_payloads.restype  = ctypes.c_int
+
+#caching allocator
+lib.empty_cache.argtypes = []
+lib.empty_cache.restype  = None
+
+lib.set_cache_limit.argtypes = [ctypes.c_size_t]
+lib.set_cache_limit.restype  = None
+
+lib.get_cache_limit.argtypes = []
+lib.get_cache_limit.restype  = ctypes.c_size_t
+
+lib.get_cached_bytes.argtypes = []
+lib.get_cached_bytes.restype  = ctypes.c_size_t
+
+lib.get_memory_origin_name.argtypes = [ctypes.c_int]
+lib.get_memory_origin_name.restype  = ctypes.c_char_p
+
+lib.get_num_memory_origins.argtypes = []
+lib.get_num_memory_origins.restype  = ctypes.c_int
+
+lib.get_memory_counters.argtypes = []
+lib.get_memory_counters.restype  = MemoryCounters
+
+lib.get_origin_memory_counters.argtypes = [ctypes.c_int, ctypes.c_bool]
+lib.get_origin_memory_counters.restype  = MemoryCounters
+
+lib.reset_peak_memory.argtypes = []
+lib.reset_peak_memory.restype  = None
+
+lib.set_memory_tracking.argtypes = [ctypes.c_bool]
+lib.set_memory_tracking.restype  = None
+
+lib.get_memory_tracking.argtypes = []
+lib.get_memory_tracking.restype  = ctypes.c_bool
+
+lib.memory_snapshot.argtypes = [ctypes.POINTER(MemoryBlock), ctypes.c_size_t]
+lib.memory_snapshot.restype  = ctypes.c_size_t
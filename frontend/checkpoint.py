@@ -0,0 +1,61 @@
+import ctypes
+import os
+import struct
+from frontend.bindings import lib, lemur_float, KernelTensor
+from frontend.ptensor import LemurTensor, empty
+from frontend.tensor_creation import from_file
+
+# layout is documented in backend/src/checkpoint.c
+_MAGIC = b"LEMURCKP"
+_VERSION = 1
+_HEADER = struct.Struct("=8sIIQQ32x")
+_ENTRY = struct.Struct("=5Q5qQQ")
+
+def save(tensors : dict[str, LemurTensor], path : str) -> None:
+    names = list(tensors)
+    n = len(names)
+    for name in names:
+        tensors[name].compute()
+    c_names = (ctypes.c_char_p * max(n, 1))(*[name.encode("utf-8") for name in names])
+    c_ks = (ctypes.POINTER(KernelTensor) * max(n, 1))(*[tensors[name]._ptr.contents.k for name in names])
+    if lib.save_checkpoint(os.fsencode(path), c_names, c_ks, n) != 0:
+        raise RuntimeError(f"save_checkpoint failed for '{path}'.")
+
+def _read_entries(path : str) -> list[tuple[str, list[int], list[int], int, int]]:
+    with open(path, "rb") as f:
+        magic, version, dtype_size, count, payload_start = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != _MAGIC:
+            raise ValueError(f"'{path}' is not a lemur checkpoint.")
+        if version != _VERSION or dtype_size != ctypes.sizeof(lemur_float):
+            raise ValueError(f"Unsupported checkpoint version {version} (dtype size {dtype_size}).")
+        header = f.read(payload_start - _HEADER.size)
+    entries = []
+    pos = 0
+    for _ in range(count):
+        (name_length,) = struct.unpack_from("=Q", header, pos)
+        pos += 8
+        name = header[pos:pos + name_length].decode("utf-8")
+        pos += name_length
+        fields = _ENTRY.unpack_from(header, pos)
+        pos += _ENTRY.size
+        entries.append((name, list(fields[0:5]), list(fields[5:10]), fields[10], fields[11]))
+    return entries
+
+def load(path : str, 
+         mmap : bool = True, 
+         mode : str = "c") -> dict[str, LemurTensor]:
+    # mmap=True maps every payload in place (copy on write by default), otherwise
+    # all payloads are read in parallel into freshly allocated tensors. empty tensors have no
+    # payload to map and are always allocated
+    entries = _read_entries(path)
+    if mmap:
+        return {name: from_file(path, shape, mode=mode, offset=offset) if 0 not in shape else empty(shape)
+                for name, shape, _, offset, _ in entries}
+
+    out = {name: empty(shape) for name, shape, _, _, _ in entries}
+    n = len(entries)
+    c_ks = (ctypes.POINTER(KernelTensor) * max(n, 1))(*[out[e[0]]._ptr.contents.k for e in entries])
+    c_offsets = (ctypes.c_size_t * max(n, 1))(*[e[3] for e in entries])
+    if lib.load_checkpoint_payloads(os.fsencode(path), c_ks, c_offsets, n) != 0:
+        raise RuntimeError(f"load_checkpoint_payloads failed for '{path}'.")
+    return out
@@ -0,0 +1,15 @@
+import os
+from frontend.bindings import lib
+
+### compiled kernel cache ###
+
+def set_kernel_cache_dir(path : str) -> None:
+    # where compile() keeps generated kernels, shared by every process using the same directory
+    lib.set_kernel_cache_dir(os.fsencode(path))
+
+def get_kernel_cache_dir() -> str:
+    return os.fsdecode(lib.get_kernel_cache_dir())
+
+def compile_wait() -> None:
+    # blocks until every kernel being built in the background is loaded (or failed)
+    lib.compile_wait()
@@ -0,0 +1,18 @@
+from contextlib import contextmanager
+from frontend.bindings import lib
+
+### lazy evaluation ###
+
+@contextmanager
+def lazy(enabled : bool = True):
+    # ops inside the block only record the graph, nothing runs or is allocated until the
+    # data is accessed, compute() or backward() is called, or the tensor feeds an eager op
+    previous = lib.get_lazy_mode()
+    lib.set_lazy_mode(enabled)
+    try:
+        yield
+    finally:
+        lib.set_lazy_mode(previous)
+
+def is_lazy() -> bool:
+    return lib.get_lazy_mode()
@@ -0,0 +1,60 @@
+from frontend.bindings import lib, MemoryBlock
+
+### caching allocator ###
+
+def empty_cache() -> None:
+    # releases every cached (currently unused) block back to the system
+    lib.empty_cache()
+
+def set_cache_limit(nbytes : int) -> None:
+    # maximum number of bytes kept in the free lists, 0 disables caching
+    if nbytes < 0:
+        raise ValueError("Cache limit must be non-negative.")
+    lib.set_cache_limit(nbytes)
+
+def get_cache_limit() -> int:
+    return lib.get_cache_limit()
+
+def cached_bytes() -> int:
+    return lib.get_cached_bytes()
+
+### memory accounting ###
+
+def _counters(c) -> dict:
+    return {"live_bytes": c.live_bytes, "peak_bytes": c.peak_bytes,
+            "allocated_bytes": c.allocated_bytes, "num_allocs": c.num_allocs}
+
+def memory_stats() -> dict:
+    # bytes of tensor data held by lemur (cached blocks excluded), by_op breaks the arrays allocated
+    # while memory tracking is on down by the op (or "fused" region) that allocated them in its
+    # forward or backward, "other" is everything allocated outside an op: tensor creation, copies,
+    # memory plans
+    stats = _counters(lib.get_memory_counters())
+    stats["cached_bytes"] = lib.get_cached_bytes()
+    by_op = {}
+    for origin in range(lib.get_num_memory_origins()):
+        for phase, backward in (("forward", False), ("backward", True)):
+            c = lib.get_origin_memory_counters(origin, backward)
+            if c.num_allocs > 0:
+                by_op.setdefault(lib.get_memory_origin_name(origin).decode(), {})[phase] = _counters(c)
+    stats["by_op"] = by_op
+    return stats
+
+def reset_peak() -> None:
+    lib.reset_peak_memory()
+
+def set_memory_tracking(enabled : bool = True) -> None:
+    # tracked arrays (those allocated while it is on) are counted by op in memory_stats and can be
+    # listed by memory_snapshot, turning it off forgets them
+    lib.set_memory_tracking(enabled)
+
+def memory_snapshot(top : int = 10) -> list:
+    # the largest live tracked arrays with the op that allocated them, largest first
+    if not lib.get_memory_tracking():
+        raise RuntimeError("Memory tracking is off, call set_memory_tracking() first.")
+    if top < 0:
+        raise ValueError("top must be non-negative.")
+    blocks = (MemoryBlock * top)()
+    n = lib.memory_snapshot(blocks, top)
+    return [{"bytes": b.bytes, "op": lib.get_memory_origin_name(b.origin).decode(),
+             "phase": "backward" if b.backward else "forward", "id": b.id} for b in blocks[:n]]
@@ -2,4 +2,34 @@ from frontend.ptensor import *
 
 def isclose(a, b, rtol=1e-05, atol=1e-08):
     _ptr = lib.isclose(a._ptr, b._ptr, rtol, atol)
-    return LemurTensor(_ptr=_ptr, _parents=(a, b))
\ No newline at end of file
+    return LemurTensor(_ptr=_ptr, _parents=(a, b))
+
+# functional forms of the binary ops, b may be a python number. out= writes the result into an
+# existing contiguous tensor of the result's shape instead of allocating one (out may be a or b)
+def add(a, b, out=None):
+    if out is None:
+        return a + b
+    if isinstance(b, (float, int)):
+        return out._into(lib.add_scalar_into(out._ptr, a._ptr, b), "add")
+    return out._into(lib.add_into(out._ptr, a._ptr, b._ptr), "add")
+
+def sub(a, b, out=None):
+    if out is None:
+        return a - b
+    if isinstance(b, (float, int)):
+        return out._into(lib.add_scalar_into(out._ptr, a._ptr, -b), "sub")
+    return out._into(lib.sub_into(out._ptr, a._ptr, b._ptr), "sub")
+
+def mul(a, b, out=None):
+    if out is None:
+        return a * b
+    if isinstance(b, (float, int)):
+        return out._into(lib.mul_scalar_into(out._ptr, a._ptr, b), "mul")
+    return out._into(lib.mul_into(out._ptr, a._ptr, b._ptr), "mul")
+
+def div(a, b, out=None):
+    if out is None:
+        return a / b
+    if isinstance(b, (float, int)):
+        return out._into(lib.div_scalar_into(out._ptr, a._ptr, b), "div")
+    return out._into(lib.division_into(out._ptr, a._ptr, b._ptr), "div")
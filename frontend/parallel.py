@@ -0,0 +1,45 @@
+import os
+from frontend.bindings import lib
+
+### threads and parallel thresholds ###
+
+# kernels of a class only open a parallel region above its threshold:
+# elements for elementwise and fused kernels, elements read for reductions, multiply-adds for gemm
+PARALLEL_CLASSES = ("elementwise", "reduce", "gemm", "fused")
+
+def set_num_threads(num_threads : int) -> None:
+    if num_threads < 1:
+        raise ValueError(f"num_threads must be at least 1, got {num_threads}.")
+    lib.set_num_threads(num_threads)
+
+def get_num_threads() -> int:
+    return lib.get_num_threads()
+
+def _class_id(op_class : str) -> int:
+    if op_class not in PARALLEL_CLASSES:
+        raise ValueError(f"Unknown parallel class {op_class!r}, expected one of {PARALLEL_CLASSES}.")
+    return PARALLEL_CLASSES.index(op_class)
+
+def set_parallel_threshold(op_class : str, threshold : int) -> None:
+    if threshold < 0:
+        raise ValueError("Threshold must be non-negative.")
+    lib.set_parallel_threshold(_class_id(op_class), threshold)
+
+def get_parallel_thresholds() -> dict:
+    return {name: lib.get_parallel_threshold(i) for i, name in enumerate(PARALLEL_CLASSES)}
+
+def save_parallel_thresholds(path : str = None) -> None:
+    # path None is the file next to the kernel cache that is loaded when the library starts
+    if not lib.save_parallel_thresholds(None if path is None else os.fsencode(path)):
+        raise RuntimeError("Could not save the parallel thresholds.")
+
+def load_parallel_thresholds(path : str = None) -> bool:
+    # False if there is no such file
+    return lib.load_parallel_thresholds(None if path is None else os.fsencode(path))
+
+def calibrate_parallel_thresholds(save : bool = True) -> dict:
+    # measures where the parallel kernels start to win with the current number of threads,
+    # with save the result is used by every later process on this machine
+    if lib.calibrate_parallel_thresholds() and save:
+        save_parallel_thresholds()
+    return get_parallel_thresholds()
@@ -0,0 +1,86 @@
+import json
+from contextlib import contextmanager
+from frontend.bindings import lib
+
+### per-op profiler ###
+
+PROFILE_FUSED = -1
+
+def _op_name(func : int, backward : bool) -> str:
+    name = "fused" if func == PROFILE_FUSED else lib.get_op_name(func).decode()
+    return f"{name} backward" if backward else name
+
+def _shapes(event) -> list:
+    # result, t0 and t1 as the 5d shapes of the backend, absent operands are dropped
+    return [list(s) for s in event.shape if any(s)]
+
+class Profile:
+    # every kernel dispatched between enter and exit: forward kernels, backward of each node and
+    # the generated kernels of fused regions (named "fused"). times are in seconds from the start
+    def __init__(self):
+        self.events = []
+
+    def _collect(self) -> None:
+        n = lib.get_profile_num_events()
+        raw = lib.get_profile_events()
+        self.events = [{
+            "name": _op_name(raw[i].func, raw[i].backward),
+            "phase": "backward" if raw[i].backward else "forward",
+            "start": raw[i].start,
+            "duration": raw[i].duration,
+            "shapes": _shapes(raw[i]),
+            "bytes": raw[i].bytes,
+            "thread": raw[i].thread,
+            "num_threads": raw[i].num_threads,
+        } for i in range(n)]
+        lib.profile_clear()
+
+    def totals(self) -> dict:
+        # name -> calls, total seconds and bytes
+        out = {}
+        for e in self.events:
+            t = out.setdefault(e["name"], {"calls": 0, "time": 0.0, "bytes": 0})
+            t["calls"] += 1
+            t["time"] += e["duration"]
+            t["bytes"] += e["bytes"]
+        return out
+
+    def table(self, sort_by : str = "time") -> str:
+        if sort_by not in ("calls", "time", "bytes"):
+            raise ValueError(f"Cannot sort by {sort_by!r}, expected calls, time or bytes.")
+        rows = sorted(self.totals().items(), key=lambda kv: kv[1][sort_by], reverse=True)
+        lines = [f"{'op':>20} {'calls':>8} {'total ms':>10} {'avg us':>10} {'GB/s':>8}"]
+        for name, t in rows:
+            gbs = t["bytes"] / t["time"] / 1e9 if t["time"] > 0 else 0.0
+            lines.append(f"{name:>20} {t['calls']:>8} {t['time'] * 1e3:>10.3f} "
+                         f"{t['time'] / t['calls'] * 1e6:>10.2f} {gbs:>8.2f}")
+        return "\n".join(lines)
+
+    def chrome_trace(self) -> dict:
+        # trace event format, opens in chrome://tracing and ui.perfetto.dev
+        return {"traceEvents": [{
+            "name": e["name"],
+            "cat": e["phase"],
+            "ph": "X",
+            "ts": e["start"] * 1e6,
+            "dur": e["duration"] * 1e6,
+            "pid": 0,
+            "tid": e["thread"],
+            "args": {"shapes": e["shapes"], "bytes": e["bytes"], "num_threads": e["num_threads"]},
+        } for e in self.events], "displayTimeUnit": "ns"}
+
+    def export_chrome_trace(self, path : str) -> None:
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f)
+
+@contextmanager
+def profile():
+    # with lemur.profile() as p: ... then p.table() or p.export_chrome_trace("trace.json")
+    # outside the block the kernels only pay for one test of a flag
+    p = Profile()
+    lib.profile_start()
+    try:
+        yield p
+    finally:
+        lib.profile_stop()
+        p._collect()
@@ -1,22 +1,42 @@
 from __future__ import annotations
 from typing import Optional, Union
 import ctypes
+import sys
+from array import array
 from frontend.bindings import lib, lemur_float, KernelTensorPtr, TensorPtr, ExpressionPtr
 import frontend.reprutils as reprutils
 
+# status codes of the in-place and out= forms (see kernel_forward_into)
+_INTO_ERRORS = {
+    1: "op has no in-place or out= form",
+    2: "out does not have the shape of the result",
+    3: "out must be contiguous",
+    4: "can't write in place into a result that requires grad, autograd needs its value",
+    5: "can't write into an existing tensor when an input requires grad, the write is not recorded for autograd",
+    6: "can't write into a read only mapping of a file, open it with mode \"c\" or \"r+\"",
+}
+
+# dims tensors of the reductions by their python arguments, see _reduce_dims
+_REDUCE_DIMS = {}
+
 class LemurTensor:
-    __slots__ = ("_ptr", "_parents")
+    __slots__ = ("_ptr", "_parents", "_base", "_shape", "_stride")
     #TODO make note that _parents is needed so that when doing w = w.relu() or similar, GC doesnt mess us up
+    #_base keeps alive a foreign object whose memory the tensor borrows (see from_buffer)
+    #_shape and _stride cache the metadata of the kernel tensor, which never changes after creation
 
     def __init__(self, 
              shape: Optional[list[int]] = None, 
              requires_grad: Optional[bool] = False, 
              _ptr : TensorPtr = None, 
-             _parents : tuple[TensorPtr, ...] = None):
+             _parents : tuple[LemurTensor, ...] = ()):
         
-        if _ptr is not None:
+        self._base = None
+        self._shape = None
+        self._stride = None
+        if _ptr is not None: # every op result comes through here, keep it short
             self._ptr = _ptr
-            self._parents = tuple(p for p in _parents) if _parents else tuple()
+            self._parents = _parents if _parents else ()
 
         else:
             self._parents = tuple()
@@ -53,6 +73,9 @@ class LemurTensor:
 
     def detach(self) -> LemurTensor:
         # manually detaches parent references to allow garbage collection.
+        # views (permute, expand, view) keep the tensor that owns their memory.
+        if self.is_shallow() and self._base is None and self._parents:
+            self._base = self._parents[0]
         self._parents = ()
         return self
     
@@ -63,6 +86,7 @@ class LemurTensor:
     
     ### print ###
     def __repr__(self):
+        self.compute()
         return reprutils._tensor_repr(self._ptr)
     
     ### properties/utility methods ###
@@ -74,6 +98,7 @@ class LemurTensor:
         return LemurTensor(_ptr=lib.tensor_from(lib.contiguous_deepcopy_kernel_tensor(kt_ptr), None, None, None))
 
     def __getitem__(self, index): #Add slicing  
+        self.compute()
         if index >= self.memory_length:
             raise ValueError("Invalid memory access.")
             return None
@@ -81,10 +106,14 @@ class LemurTensor:
             return float(self._ptr.contents.k.contents.array[index % self.memory_length].value)
         
     def __setitem__(self, index, value):
+        self.compute()
         if index >= self.memory_length:
             raise ValueError("Invalid memory access.")
+        elif self.is_readonly():
+            raise RuntimeError(f"__setitem__: {_INTO_ERRORS[6]}.")
         else:
             self._ptr.contents.k.contents.array[index] = lemur_float(value)
+            lib.mark_modified(self._ptr)
         return self
     
     @property
@@ -124,16 +153,53 @@ class LemurTensor:
                 self._ptr.contents.grad = None
             return self
     
+    ### zero-copy export ###
+    @property
+    def __array_interface__(self) -> dict:
+        # exposes kernel_tensor.array with its real shape and stride, numpy keeps self alive as base
+        self.compute()
+        k = self._ptr.contents.k.contents
+        itemsize = ctypes.sizeof(lemur_float)
+        return {
+            "version": 3,
+            "shape": tuple(k.shape),
+            "typestr": ("<f" if sys.byteorder == "little" else ">f") + str(itemsize),
+            "data": (ctypes.cast(k.array, ctypes.c_void_p).value, bool(k.readonly)),
+            "strides": tuple(s * itemsize for s in k.stride),
+        }
+
+    def numpy(self):
+        import numpy as np #optional dependency, only needed for this method
+        return np.asarray(self)
+
+    def memoryview(self) -> memoryview:
+        if not self.is_contiguous():
+            raise BufferError("memoryview() requires a contiguous tensor, use numpy() for strided tensors.")
+        self.compute()
+        k = self._ptr.contents.k.contents
+        buf = (lemur_float * k.length).from_address(ctypes.cast(k.array, ctypes.c_void_p).value)
+        buf._owner = self #keeps the tensor (and through _parents the owner of a shallow tensor) alive
+        mv = memoryview(buf).cast("B").cast("f", tuple(k.shape))
+        return mv.toreadonly() if k.readonly else mv
+
+    def __buffer__(self, flags : int) -> memoryview: #python >= 3.12 buffer protocol
+        return self.memoryview()
+
     @property
     def graph(self):
         reprutils.plot_tensor_graph_parents(self)
     
-    def stride(self) -> LemurTensor:
-        return tensor([self._ptr.contents.k.contents.stride[i] for i in range(5)])
+    def stride(self) -> tuple[int, int, int, int, int]:
+        if self._stride is None:
+            self._stride = tuple(self._ptr.contents.k.contents.stride)
+        return self._stride
     
     def is_shallow(self) -> bool:
         return self._ptr.contents.k.contents.shallow
 
+    def is_readonly(self) -> bool:
+        return self._ptr.contents.k.contents.readonly
+
     def is_contiguous(self) -> bool:
         return lib.is_contiguous(self._ptr.contents.k)
         
@@ -142,12 +208,14 @@ class LemurTensor:
         return self._ptr.contents.k.contents.length
     
     @property
-    def shape(self) -> LemurTensor:
-        return tensor([self._ptr.contents.k.contents.shape[i] for i in range(5)])
+    def shape(self) -> tuple[int, int, int, int, int]:
+        if self._shape is None:
+            self._shape = tuple(self._ptr.contents.k.contents.shape)
+        return self._shape
 
     def numel(self) -> int:
-        shape = self.shape
-        return shape[0] * shape[1] * shape[2] * shape[3] * shape[4]
+        s0, s1, s2, s3, s4 = self.shape
+        return s0 * s1 * s2 * s3 * s4
     
     def ndimension(self) -> int:  
         return 5
@@ -160,35 +228,89 @@ class LemurTensor:
     
     ### grad/compile ops###
     def backward(self):
-        lib.backward(self._ptr)
+        if not lib.backward(self._ptr):
+            raise RuntimeError("backward failed, see the error printed above.")
     
-    def compile(self):
+    def compile(self, wait : bool = False) -> LemurTensor:
+        # fuses elementwise regions of the graph below self into generated kernels. uncached kernels
+        # are built in the background and the graph runs unfused until they are loaded, unless wait
         lib.compile(self._ptr)
+        if wait:
+            lib.compile_wait()
+        return self
+
+    def compute(self) -> LemurTensor:
+        # realizes a tensor recorded in lazy mode (and what it depends on), no-op otherwise
+        if not self._ptr.contents.k.contents.computed and not lib.compute(self._ptr):
+            raise RuntimeError("compute: an input of the lazy graph was modified in place after it was recorded.")
+        return self
+
+    def is_computed(self) -> bool:
+        return self._ptr.contents.k.contents.computed
+
+    def plan_memory(self) -> int:
+        # lays out the intermediates of the lazy graph below self in one preallocated arena,
+        # returns its size in bytes. reruns of the graph (see invalidate) then allocate nothing
+        return lib.plan_memory(self._ptr)
+
+    def invalidate(self) -> LemurTensor:
+        # marks the graph below self as not computed, it runs again with the current leaf values
+        lib.invalidate(self._ptr)
+        return self
 
     ### Binary ops ###
-    def __add__(self, other : LemurTensor) -> LemurTensor:
+    # python numbers go to the scalar ops, no tensor is made for them
+    def __add__(self, other : Union[LemurTensor, float, int]) -> LemurTensor:
+        if isinstance(other, (float, int)):
+            return LemurTensor(_ptr=lib.add_scalar(self._ptr, other, False), _parents=(self,))
         if not isinstance(other, LemurTensor):
             raise TypeError("Can't add LemurTensor with non-LemurTensor.")
         c_result = lib.add(self._ptr, other._ptr, False)
         return LemurTensor(_ptr=c_result, _parents=(self, other))
     
-    def __sub__(self, other : LemurTensor) -> LemurTensor:
+    def __sub__(self, other : Union[LemurTensor, float, int]) -> LemurTensor:
+        if isinstance(other, (float, int)):
+            return LemurTensor(_ptr=lib.add_scalar(self._ptr, -other, False), _parents=(self,))
         if not isinstance(other, LemurTensor):
             raise TypeError("Can't subtract LemurTensor with non-LemurTensor.")
         c_result = lib.sub(self._ptr, other._ptr, False)
         return LemurTensor(_ptr=c_result, _parents=(self, other))
 
-    def __mul__(self, other : LemurTensor) -> LemurTensor:
+    def __mul__(self, other : Union[LemurTensor, float, int]) -> LemurTensor:
+        if isinstance(other, (float, int)):
+            return LemurTensor(_ptr=lib.mul_scalar(self._ptr, other, False), _parents=(self,))
         if not isinstance(other, LemurTensor):
             raise TypeError("Can't multiply LemurTensor with non-LemurTensor.")
         c_result = lib.mul(self._ptr, other._ptr, False)
         return LemurTensor(_ptr=c_result, _parents=(self, other))
     
-    def __truediv__(self, other : LemurTensor) -> LemurTensor:
+    def __truediv__(self, other : Union[LemurTensor, float, int]) -> LemurTensor:
+        if isinstance(other, (float, int)):
+            return LemurTensor(_ptr=lib.div_scalar(self._ptr, other, False), _parents=(self,))
         if not isinstance(other, LemurTensor):
             raise TypeError("Can't divide LemurTensor with non-LemurTensor.")
         c_result = lib.division(self._ptr, other._ptr, False)
         return LemurTensor(_ptr=c_result, _parents=(self, other))
+
+    def __radd__(self, other : Union[float, int]) -> LemurTensor:
+        if not isinstance(other, (float, int)):
+            return NotImplemented
+        return LemurTensor(_ptr=lib.add_scalar(self._ptr, other, False), _parents=(self,))
+
+    def __rsub__(self, other : Union[float, int]) -> LemurTensor:
+        if not isinstance(other, (float, int)):
+            return NotImplemented
+        return LemurTensor(_ptr=lib.rsub_scalar(self._ptr, other, False), _parents=(self,))
+
+    def __rmul__(self, other : Union[float, int]) -> LemurTensor:
+        if not isinstance(other, (float, int)):
+            return NotImplemented
+        return LemurTensor(_ptr=lib.mul_scalar(self._ptr, other, False), _parents=(self,))
+
+    def __rtruediv__(self, other : Union[float, int]) -> LemurTensor:
+        if not isinstance(other, (float, int)):
+            return NotImplemented
+        return LemurTensor(_ptr=lib.rdiv_scalar(self._ptr, other, False), _parents=(self,))
     
     def __eq__(self, other : Union[LemurTensor, bool]) -> Union[LemurTensor, bool]:
         if isinstance(other, bool):
@@ -198,87 +320,239 @@ class LemurTensor:
         c_result = lib.eq(self._ptr, other._ptr)
         return LemurTensor(_ptr=c_result, _parents=(self, other))
 
+    ### In-place ops ###
+    # write into the memory of self without recording an op, see also the out= forms
+    def _into(self, status : int, name : str) -> LemurTensor:
+        if status != 0:
+            raise RuntimeError(f"{name}: {_INTO_ERRORS.get(status, 'failed')}.")
+        return self
+
+    @property
+    def version(self) -> int:
+        # number of in-place writes to the memory of self, backward fails if it changed since a
+        # value it needs was saved
+        return lib.tensor_version(self._ptr)
+
+    def add_(self, other : Union[LemurTensor, float, int]) -> LemurTensor:
+        if isinstance(other, (float, int)):
+            return self._into(lib.add_scalar_into(self._ptr, self._ptr, other), "add_")
+        if not isinstance(other, LemurTensor):
+            raise TypeError("Can't add LemurTensor with non-LemurTensor.")
+        return self._into(lib.add_into(self._ptr, self._ptr, other._ptr), "add_")
+
+    def sub_(self, other : Union[LemurTensor, float, int]) -> LemurTensor:
+        if isinstance(other, (float, int)):
+            return self._into(lib.add_scalar_into(self._ptr, self._ptr, -other), "sub_")
+        if not isinstance(other, LemurTensor):
+            raise TypeError("Can't subtract LemurTensor with non-LemurTensor.")
+        return self._into(lib.sub_into(self._ptr, self._ptr, other._ptr), "sub_")
+
+    def mul_(self, other : Union[LemurTensor, float, int]) -> LemurTensor:
+        if isinstance(other, (float, int)):
+            return self._into(lib.mul_scalar_into(self._ptr, self._ptr, other), "mul_")
+        if not isinstance(other, LemurTensor):
+            raise TypeError("Can't multiply LemurTensor with non-LemurTensor.")
+        return self._into(lib.mul_into(self._ptr, self._ptr, other._ptr), "mul_")
+
+    def div_(self, other : Union[LemurTensor, float, int]) -> LemurTensor:
+        if isinstance(other, (float, int)):
+            return self._into(lib.div_scalar_into(self._ptr, self._ptr, other), "div_")
+        if not isinstance(other, LemurTensor):
+            raise TypeError("Can't divide LemurTensor with non-LemurTensor.")
+        return self._into(lib.division_into(self._ptr, self._ptr, other._ptr), "div_")
+
+    def pow_(self, other : Union[lemur_float, int, LemurTensor]) -> LemurTensor:
+        if isinstance(other, (float, int)):
+            return self._into(lib.pow_scalar_into(self._ptr, self._ptr, other), "pow_")
+        if not isinstance(other, LemurTensor):
+            raise TypeError("Can't take LemurTensor to non-float or non-LemurTensor exponent.")
+        return self._into(lib.power_into(self._ptr, self._ptr, other._ptr), "pow_")
+
+    def exp_(self) -> LemurTensor:
+        return self._into(lib.exponential_into(self._ptr, self._ptr), "exp_")
+
+    def relu_(self) -> LemurTensor:
+        return self._into(lib.relu_into(self._ptr, self._ptr), "relu_")
+
+    def sigmoid_(self) -> LemurTensor:
+        return self._into(lib.sigmoid_into(self._ptr, self._ptr), "sigmoid_")
+
+    def log_(self) -> LemurTensor:
+        return self._into(lib.logarithm_into(self._ptr, self._ptr), "log_")
+
+    def neg_(self) -> LemurTensor:
+        return self._into(lib.neg_into(self._ptr, self._ptr), "neg_")
+
+    def sqrt_(self) -> LemurTensor:
+        return self._into(lib.square_root_into(self._ptr, self._ptr), "sqrt_")
+
+    def abs_(self) -> LemurTensor:
+        return self._into(lib.absolute_into(self._ptr, self._ptr), "abs_")
+
+    def reciprocal_(self) -> LemurTensor:
+        return self._into(lib.reciprocal_into(self._ptr, self._ptr), "reciprocal_")
+
+    # x += y writes into x when the in-place form may, otherwise x is rebound to x + y as it would
+    # be without __iadd__ (e.g. a result autograd needs, or y requires grad)
+    def _can_write_into(self, other) -> bool:
+        if isinstance(other, (float, int)):
+            return lib.can_write_into(self._ptr, self._ptr, None)
+        return isinstance(other, LemurTensor) and lib.can_write_into(self._ptr, self._ptr, other._ptr)
+
+    def __iadd__(self, other : Union[LemurTensor, float, int]) -> LemurTensor:
+        return self.add_(other) if self._can_write_into(other) else self + other
+
+    def __isub__(self, other : Union[LemurTensor, float, int]) -> LemurTensor:
+        return self.sub_(other) if self._can_write_into(other) else self - other
+
+    def __imul__(self, other : Union[LemurTensor, float, int]) -> LemurTensor:
+        return self.mul_(other) if self._can_write_into(other) else self * other
+
+    def __itruediv__(self, other : Union[LemurTensor, float, int]) -> LemurTensor:
+        return self.div_(other) if self._can_write_into(other) else self / other
+
     ### Reduce ops ###
+    def _reduce_dims(self, args) -> LemurTensor:
+        # 1 keeps a dimension, 0 reduces it, no dims given reduces everything.
+        # there are only 32 of them, each is made once and shared by every graph
+        dims_tensor = _REDUCE_DIMS.get(args)
+        if dims_tensor is None:
+            if not args: 
+                dims = [0,0,0,0,0]
+            else:
+                dims = [1,1,1,1,1]
+            for d in args:
+                dims[d] = 0
+            dims_tensor = self._convert_to_tensor(dims)
+            _REDUCE_DIMS[args] = dims_tensor
+        return dims_tensor
+
     def sum(self, *args) -> LemurTensor: #TODO type check here and you can input a lemur tensor or other 
-        if not args: 
-            dims = [0,0,0,0,0]
-        else:
-            dims = [1,1,1,1,1]
-        for d in args:
-            dims[d] = 0
-        other = self._convert_to_tensor(dims)
+        other = self._reduce_dims(args)
         c_result = lib.sum(self._ptr, other._ptr, False)
         return LemurTensor(_ptr=c_result, _parents=(self,other))
     
+    def mean(self, *args) -> LemurTensor:
+        other = self._reduce_dims(args)
+        c_result = lib.mean(self._ptr, other._ptr, False)
+        return LemurTensor(_ptr=c_result, _parents=(self,other))
+
+    def max(self, *args) -> LemurTensor:
+        other = self._reduce_dims(args)
+        c_result = lib.maximum(self._ptr, other._ptr, False)
+        return LemurTensor(_ptr=c_result, _parents=(self,other))
+
+    def min(self, *args) -> LemurTensor:
+        other = self._reduce_dims(args)
+        c_result = lib.minimum(self._ptr, other._ptr, False)
+        return LemurTensor(_ptr=c_result, _parents=(self,other))
+
+    def _check_arg_indices(self, args) -> None:
+        # the indices are float32, exact only up to 2^24
+        reduced = 1
+        for d in ({d % 5 for d in args} or range(5)):
+            reduced *= self.shape[d]
+        if reduced > 1 << 24:
+            raise ValueError(f"Reduced dims hold {reduced} elements, argmax/argmin indices are only exact up to 2^24.")
+
+    def argmax(self, *args) -> LemurTensor:
+        """Flat (row major) index of the first maximum inside the reduced dims."""
+        other = self._reduce_dims(args)
+        self._check_arg_indices(args)
+        c_result = lib.argmax(self._ptr, other._ptr)
+        return LemurTensor(_ptr=c_result, _parents=(self,other))
+
+    def argmin(self, *args) -> LemurTensor:
+        """Flat (row major) index of the first minimum inside the reduced dims."""
+        other = self._reduce_dims(args)
+        self._check_arg_indices(args)
+        c_result = lib.argmin(self._ptr, other._ptr)
+        return LemurTensor(_ptr=c_result, _parents=(self,other))
+
     def all(self, *args) -> LemurTensor:  #TODO type check here and you can input a lemur tensor or other
-        if not args: 
-            dims = [0,0,0,0,0]
-        else:
-            dims = [1,1,1,1,1]
-        for d in args:
-            dims[d] = 0
-        other = self._convert_to_tensor(dims)
-        c_result = lib.all(self._ptr, other._ptr, False)
+        other = self._reduce_dims(args)
+        c_result = lib.all(self._ptr, other._ptr)
         return LemurTensor(_ptr=c_result, _parents=(self,other))
     
     def any(self, *args) -> LemurTensor:  #TODO type check here and you can input a lemur tensor or other
-        if not args: 
-            dims = [0,0,0,0,0]
-        else:
-            dims = [1,1,1,1,1]
-        for d in args:
-            dims[d] = 0
-        other = self._convert_to_tensor(dims)
-        c_result = lib.any(self._ptr, other._ptr, False)
+        other = self._reduce_dims(args)
+        c_result = lib.any(self._ptr, other._ptr)
         return LemurTensor(_ptr=c_result, _parents=(self,other))
     
     ### Unary ops ###
     def __pow__(self, other : Union[lemur_float, int , LemurTensor]) -> LemurTensor:
+        if isinstance(other, (float, int)):
+            return LemurTensor(_ptr=lib.pow_scalar(self._ptr, other, False), _parents=(self,))
         if not isinstance(other, LemurTensor):
-            if isinstance(other, float) or isinstance(other, int):
-                other = tensor([float(other)])
-            else:
-                raise TypeError("Can't take LemurTensor to non-float or non-LemurTensor exponent.")
+            raise TypeError("Can't take LemurTensor to non-float or non-LemurTensor exponent.")
         c_result = lib.power(self._ptr, other._ptr, False)
         return LemurTensor(_ptr=c_result, _parents=(self, other))
+
+    def __rpow__(self, other : Union[float, int]) -> LemurTensor:
+        if not isinstance(other, (float, int)):
+            return NotImplemented
+        return LemurTensor(_ptr=lib.rpow_scalar(self._ptr, other, False), _parents=(self,))
+
+    def __neg__(self) -> LemurTensor:
+        return self.neg()
     
-    def exp(self) -> LemurTensor:
+    def exp(self, out : Optional[LemurTensor] = None) -> LemurTensor:
+        if out is not None:
+            return out._into(lib.exponential_into(out._ptr, self._ptr), "exp")
         c_result = lib.exponential(self._ptr, False)
         return LemurTensor(_ptr=c_result, _parents=(self,))
     
-    def relu(self) -> LemurTensor:
+    def relu(self, out : Optional[LemurTensor] = None) -> LemurTensor:
+        if out is not None:
+            return out._into(lib.relu_into(out._ptr, self._ptr), "relu")
         c_result = lib.relu(self._ptr, False)
         return LemurTensor(_ptr=c_result, _parents=(self,))
     
-    def sigmoid(self) -> LemurTensor:
+    def sigmoid(self, out : Optional[LemurTensor] = None) -> LemurTensor:
+        if out is not None:
+            return out._into(lib.sigmoid_into(out._ptr, self._ptr), "sigmoid")
         c_result = lib.sigmoid(self._ptr, False)
         return LemurTensor(_ptr=c_result, _parents=(self,))
             
-    def log(self) -> LemurTensor:
+    def log(self, out : Optional[LemurTensor] = None) -> LemurTensor:
+        if out is not None:
+            return out._into(lib.logarithm_into(out._ptr, self._ptr), "log")
         c_result = lib.logarithm(self._ptr, False)
         return LemurTensor(_ptr=c_result, _parents=(self,))
     
-    def neg(self) -> LemurTensor:
+    def neg(self, out : Optional[LemurTensor] = None) -> LemurTensor:
+        if out is not None:
+            return out._into(lib.neg_into(out._ptr, self._ptr), "neg")
         c_result = lib.neg(self._ptr, False)
         return LemurTensor(_ptr=c_result, _parents=(self,))
     
-    def sqrt(self) -> LemurTensor:
+    def sqrt(self, out : Optional[LemurTensor] = None) -> LemurTensor:
+        if out is not None:
+            return out._into(lib.square_root_into(out._ptr, self._ptr), "sqrt")
         c_result = lib.square_root(self._ptr, False)
         return LemurTensor(_ptr=c_result, _parents=(self,))
     
     def abs(self) -> LemurTensor:
-        c_result = lib.abs(self._ptr, False)
+        c_result = lib.absolute(self._ptr, False)
         return LemurTensor(_ptr=c_result, _parents=(self,))
     
     def sign(self) -> LemurTensor:
-        c_result = lib.sign(self._ptr, False)
+        c_result = lib.sign(self._ptr)
         return LemurTensor(_ptr=c_result, _parents=(self,))
     
-    def reciprocal(self) -> LemurTensor:
+    def reciprocal(self, out : Optional[LemurTensor] = None) -> LemurTensor:
+        if out is not None:
+            return out._into(lib.reciprocal_into(out._ptr, self._ptr), "reciprocal")
         c_result = lib.reciprocal(self._ptr, False)
         return LemurTensor(_ptr=c_result, _parents=(self,))
     
     ### Shape ops ###
+    def contiguous(self) -> LemurTensor:
+        if self.is_contiguous():
+            return self
+        c_result = lib.contiguous(self._ptr, False)
+        return LemurTensor(_ptr=c_result, _parents=(self,))
+
     def flatten(self, dim : int = 4) -> LemurTensor:
         total_elements = self.numel()
         view_dim = [1,1,1,1,1]
@@ -302,7 +576,7 @@ class LemurTensor:
 
     ### matmul ###
     def __matmul__(self, other):
-        if (other.shape[0] == self.shape[0] and other.shape[1] == self.shape[1] and other.shape[2] == self.shape[2]):
+        if other.shape[:3] == self.shape[:3]:
             c_result = lib.bmm(self._ptr, other._ptr, False)
         else:
             c_result = lib.bcmm(self._ptr, other._ptr, False)
@@ -315,7 +589,7 @@ def empty(shape : tuple[int, int, int, int, int],
     return t
 
 def _infer_shape(data):
-    if not isinstance(data, list):
+    if not isinstance(data, (list, tuple)):
         return []
     
     if len(data) == 0:
@@ -332,28 +606,86 @@ def _infer_shape(data):
     return top_shape
 
 def _flatten_data(data):
-    if not isinstance(data, list):
+    if not isinstance(data, (list, tuple)):
         return [data]
     flat = []
     for sub in data:
         flat.extend(_flatten_data(sub))
     return flat
 
-def tensor(data, requires_grad=False):
-    
-    inferred_shape = _infer_shape(data)  # e.g. [2, 3, 4]
-    if len(inferred_shape) > 5:
+def _padded_shape(shape) -> list[int]:
+    shape = list(shape)
+    if len(shape) > 5:
         raise ValueError("Data has more than 5 dimensions, which is not supported.")
-    
-    pad_length = 5 - len(inferred_shape)
-    final_shape = [1] * pad_length + inferred_shape 
+    return [1] * (5 - len(shape)) + shape
+
+def _float32_view(obj) -> tuple[memoryview, tuple[int, ...]]:
+    # returns a flat float32 byte view of obj and its shape, converting (copying) only if needed
+    mv = memoryview(obj)
+    fmt = mv.format.lstrip("@=<")
+    if fmt == "f" and mv.c_contiguous:
+        return mv.cast("B"), mv.shape
+    flat = memoryview(mv.tobytes()).cast(fmt) #C order, handles strided exporters
+    return memoryview(array("f", flat.tolist())).cast("B"), mv.shape
+
+def from_buffer(obj, 
+                shape : Optional[tuple[int, ...]] = None, 
+                requires_grad : bool = False, 
+                copy : bool = True) -> LemurTensor:
+    # builds a tensor from any object exposing the buffer protocol (array.array, numpy, bytearray, ...)
+    # copy=True does a single memcpy into lemur_alloc'ed memory, copy=False adopts the buffer with no copy
+    if isinstance(obj, LemurTensor):
+        obj = obj.memoryview() #read only for a read only mapping, which copy=False refuses below
+    if copy:
+        mv, buffer_shape = _float32_view(obj)
+    else:
+        mv = memoryview(obj)
+        if mv.format.lstrip("@=<") != "f" or not mv.c_contiguous or mv.readonly:
+            raise ValueError("copy=False requires a writable C-contiguous float32 buffer.")
+        buffer_shape = mv.shape
+        mv = mv.cast("B")
+    final_shape = _padded_shape(buffer_shape if shape is None else shape)
+    numel = final_shape[0] * final_shape[1] * final_shape[2] * final_shape[3] * final_shape[4]
+    if mv.nbytes != numel * ctypes.sizeof(lemur_float):
+        raise ValueError("Number of elements in buffer does not match the tensor's shape.")
+
+    if copy:
+        t = empty(shape=final_shape, requires_grad=requires_grad)
+        if numel > 0:
+            t.memoryview().cast("B")[:] = mv
+        return t
+
+    raw = (ctypes.c_char * mv.nbytes).from_buffer(mv)
+    k_ptr = lib.kernel_tensor_from_array(ctypes.addressof(raw), (ctypes.c_size_t * 5)(*final_shape))
+    if not k_ptr:
+        raise RuntimeError("kernel_tensor_from_array returned NULL.")
+    t = LemurTensor(_ptr=lib.tensor_from(k_ptr, None, False, None))
+    t._base = raw #holds the buffer export so obj can neither be freed nor resized
+    if requires_grad:
+        t.retain_grad_(True)
+    return t
+
+def tensor(data, requires_grad=False):
+    if not isinstance(data, (list, tuple)):
+        try:
+            memoryview(data)
+        except TypeError:
+            data = [data]
+        else:
+            return from_buffer(data, requires_grad=requires_grad)
+
+    if data and not isinstance(data[0], (list, tuple)): #flat list, skip the recursive walks
+        inferred_shape = [len(data)]
+        flat_data = data
+    else:
+        inferred_shape = _infer_shape(data)  # e.g. [2, 3, 4]
+        flat_data = None
+    final_shape = _padded_shape(inferred_shape)
     
     t = empty(shape=final_shape, requires_grad=requires_grad)
 
-    flat_data = _flatten_data(data)
-
-    k_ptr = t._ptr.contents.k
-    c_arr = k_ptr.contents.array
+    if flat_data is None:
+        flat_data = _flatten_data(data)
 
     if len(flat_data) != (final_shape[0] * 
                           final_shape[1] * 
@@ -362,7 +694,14 @@ def tensor(data, requires_grad=False):
                           final_shape[4]):
         raise ValueError("Number of elements in `data` does not match the tensor's shape.")
     
-    for i, val in enumerate(flat_data):
-        c_arr[i] = val
+    if flat_data:
+        #array("f", ...) converts the whole list in C, then a single memcpy into the tensor
+        try:
+            converted = array("f", flat_data)
+        except TypeError:
+            if flat_data is data and any(isinstance(x, (list, tuple)) for x in data): #ragged, missed by the flat path
+                raise ValueError("Inconsistent dimensions encountered in nested list.") from None
+            raise
+        t.memoryview().cast("B")[:] = memoryview(converted).cast("B")
 
     return t
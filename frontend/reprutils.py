@@ -1,5 +1,5 @@
 import ctypes
-from frontend.bindings import lib, KernelTensorPtr, TensorPtr, ExpressionPtr
+from frontend.bindings import lib, lemur_float, KernelTensorPtr, TensorPtr, ExpressionPtr
 from frontend.version import __version__
 
 LEMUR_VERBOSE = False
@@ -13,9 +13,45 @@ def set_sci_print(value : bool) -> None:
     global LEMUR_SCI_PRINT
     LEMUR_SCI_PRINT = value
 
+_PRINT_OPTIONS = {"threshold": 1000, "edgeitems": 3, "precision": 4}
+
+def set_printoptions(threshold : int = None, edgeitems : int = None, precision : int = None) -> None:
+    # tensors with more than threshold elements only print edgeitems entries at both ends of every dim
+    # precision is the number of decimals, or of significant digits with set_sci_print(True)
+    for name, value in (("threshold", threshold), ("edgeitems", edgeitems), ("precision", precision)):
+        if value is None:
+            continue
+        if not isinstance(value, int) or value < 0:
+            raise ValueError(f"{name} must be a non negative int, got {value!r}")
+        _PRINT_OPTIONS[name] = value
+    lib.set_print_options(_PRINT_OPTIONS["threshold"], _PRINT_OPTIONS["edgeitems"], _PRINT_OPTIONS["precision"]) # print_tensor in C
+
+def get_printoptions() -> dict:
+    return dict(_PRINT_OPTIONS)
+
 def get_op_name(i : int) -> str:
     return lib.get_op_name(i)
 
+# separators between the entries of dims 0..4, the inner dims stay on one line
+_SEPARATORS = (",\n\n\n\n\t", ",\n\n\n\t ", ",\n\n\t  ", ",\n\t   ", ", ")
+
+def _shown_indices(size : int, summarize : bool) -> tuple:
+    edgeitems = _PRINT_OPTIONS["edgeitems"]
+    if summarize and size > 2 * edgeitems:
+        return list(range(edgeitems)) + list(range(size - edgeitems, size)), True
+    return list(range(size)), False
+
+def _gather(k_ptr : KernelTensorPtr, indices : list) -> list:
+    # one copy of the shown elements instead of one ctypes access each
+    count = [len(i) for i in indices]
+    total = count[0] * count[1] * count[2] * count[3] * count[4]
+    if total == 0:
+        return []
+    flat = [i for dim in indices for i in dim]
+    out = (lemur_float * total)()
+    lib.gather_kernel_tensor(k_ptr, (ctypes.c_size_t * len(flat))(*flat), (ctypes.c_size_t * 5)(*count), out)
+    return memoryview(out).cast("B").cast("f").tolist()
+
 def _format_kernel_tensor(k_ptr : KernelTensorPtr, 
                           postfix : str = ""):
     if not k_ptr:
@@ -33,45 +69,34 @@ def _format_kernel_tensor(k_ptr : KernelTensorPtr,
         vlines.append(f", computed={str(k.computed).lower()}")
         vlines.append(f", shallow={str(k.shallow).lower()}")
 
-    data_str = []
-    data_str.append("tensor([")
-    arr = k.array  
-    for d0 in range(shape[0]):
-        data_str.append("[")
-        for d1 in range(shape[1]):
-            data_str.append("[")
-            for d2 in range(shape[2]):
-                data_str.append("[")
-                for d3 in range(shape[3]):
-                    data_str.append("[")
-                    for d4 in range(shape[4]):
-                        idx = (d0 * stride[0] +
-                               d1 * stride[1] +
-                               d2 * stride[2] +
-                               d3 * stride[3] +
-                               d4 * stride[4])
-                        val = float(arr[idx].value)  # a lemur_float
-                        if LEMUR_SCI_PRINT:
-                            data_str.append(f"{val:6.3e}")
-                        else:
-                            data_str.append(f"{val:6.4f}")
-                        if d4 < shape[4] - 1:
-                            data_str.append(", ")
-                    data_str.append("]")
-                    if d3 < shape[3] - 1:
-                        data_str.append(",\n\t   ")
-                data_str.append("]")
-                if d2 < shape[2] - 1:
-                    data_str.append(",\n\n\t  ")
-            data_str.append("]")
-            if d1 < shape[1] - 1:
-                data_str.append(",\n\n\n\t ")
-        data_str.append("]")
-        if d0 < shape[0] - 1:
-            data_str.append(",\n\n\n\n\t")
-
-    data_str.append("], shape=[" + ", ".join(str(s) for s in shape) + "]"+ "".join(vlines) + postfix + ")")
-    data_str = "".join(data_str)
+    numel = shape[0] * shape[1] * shape[2] * shape[3] * shape[4]
+    summarize = numel > _PRINT_OPTIONS["threshold"]
+    shown = [_shown_indices(size, summarize) for size in shape]
+    indices = [i for i, _ in shown]
+
+    precision = _PRINT_OPTIONS["precision"]
+    spec = f"6.{max(precision - 1, 0)}e" if LEMUR_SCI_PRINT else f"6.{precision}f"
+    values = [format(v, spec) for v in _gather(k_ptr, indices)]
+
+    # entries of the gathered grid that one step along each dim skips
+    steps = [1] * 5
+    for d in range(3, -1, -1):
+        steps[d] = steps[d + 1] * len(indices[d + 1])
+
+    def format_dim(d : int, offset : int) -> str:
+        entries = []
+        n = len(indices[d])
+        for j in range(n):
+            if shown[d][1] and j == n // 2:
+                entries.append("...")
+            if d == 4:
+                entries.append(values[offset + j])
+            else:
+                entries.append(format_dim(d + 1, offset + j * steps[d]))
+        return "[" + _SEPARATORS[d].join(entries) + "]"
+
+    data_str = "tensor(" + format_dim(0, 0)
+    data_str += ", shape=[" + ", ".join(str(s) for s in shape) + "]"+ "".join(vlines) + postfix + ")"
     lines.append(data_str)
 
     return "".join(lines)
@@ -1,4 +1,6 @@
+import os
 from frontend.ptensor import *
+from frontend.ptensor import _padded_shape
 ### Tensor Creation ###
 
 def full(shape : tuple[int, int, int, int, int], 
@@ -40,11 +42,47 @@ def ones(shape : tuple[int, int, int, int, int],
     
     return full(shape, 1.0, requires_grad=requires_grad)
 
+def frombytes(data : bytes, 
+              shape : tuple[int, ...], 
+              requires_grad : bool = False) -> LemurTensor:
+    # data holds raw native-endian float32 values, copied with a single memcpy
+    return from_buffer(memoryview(data).cast("B").cast("f"), shape=shape, requires_grad=requires_grad)
+
+_MMAP_MODES = {"r": 0, "r+": 1, "c": 2} #LEMUR_MMAP_READ, LEMUR_MMAP_READWRITE, LEMUR_MMAP_COPY
+
+def from_file(path : str, 
+              shape : tuple[int, ...], 
+              mode : str = "r", 
+              offset : int = 0, 
+              requires_grad : bool = False) -> LemurTensor:
+    # kernel_tensor.array is an mmap of raw native-endian float32 values at offset in path
+    # mode "r" is read only (in-place writes raise), "r+" writes through to the file, "c" is copy on write
+    if mode not in _MMAP_MODES:
+        raise ValueError(f"mode must be one of {tuple(_MMAP_MODES)}.")
+    final_shape = _padded_shape(shape)
+    k_ptr = lib.mmap_kernel_tensor(os.fsencode(path), (ctypes.c_size_t * 5)(*final_shape), offset, _MMAP_MODES[mode])
+    if not k_ptr:
+        raise RuntimeError(f"mmap_kernel_tensor failed for '{path}'.")
+    t = LemurTensor(_ptr=lib.tensor_from(k_ptr, None, False, None))
+    if requires_grad:
+        t.retain_grad_(True)
+    return t
+
 ### Tensor Creation ###
 
 def init_seed(seed : int) -> None: #TODO should this be moved?
     lib.init_seed(ctypes.c_uint(seed))
 
+def get_rng_state() -> tuple[int, int]:
+    # (seed, offset): the random functions are a pure function of both, whatever the thread count
+    return (lib.get_seed(), lib.get_random_offset())
+
+def set_rng_state(state : tuple[int, int]) -> None:
+    seed, offset = state
+    if seed != lib.get_seed():
+        lib.init_seed(ctypes.c_uint(seed))
+    lib.set_random_offset(offset)
+
 def rand(shape : tuple[int, int, int, int, int], 
          low : lemur_float = 0.0, 
          high : lemur_float = 1.0, 
@@ -63,4 +101,24 @@ def randn(shape : tuple[int, int, int, int, int],
     lib.random_normal_kernel_tensor(t._ptr.contents.k, ctypes.c_float(mean), ctypes.c_float(std))
     return t
 
+def randint(low : int, 
+            high : int, 
+            shape : tuple[int, int, int, int, int], 
+            requires_grad : bool = False) -> LemurTensor:
+    # integers in [low, high) stored as lemur_float, which holds every integer up to 2**24 exactly
+    if not (-(1 << 24) <= low < high <= 1 << 24 and high - low <= 1 << 24):
+        raise ValueError(f"randint needs -2**24 <= low < high <= 2**24 and high - low <= 2**24, got [{low}, {high}).")
+    t = empty(shape, requires_grad=requires_grad)
+    lib.random_int_kernel_tensor(t._ptr.contents.k, low, high)
+    return t
+
+def dropout_mask(shape : tuple[int, int, int, int, int], 
+                 p : float = 0.5) -> LemurTensor:
+    # 0 with probability p, 1 / (1 - p) otherwise, so x * mask keeps the expectation of x
+    if not 0.0 <= p <= 1.0:
+        raise ValueError(f"Dropout probability must be in [0, 1], got {p}.")
+    t = empty(shape)
+    lib.random_dropout_mask_kernel_tensor(t._ptr.contents.k, ctypes.c_float(p))
+    return t
+
     
\ No newline at end of file
@@ -1,9 +1,17 @@
 from frontend.ptensor import tensor, empty
-from frontend.reprutils import set_verbose_print, set_sci_print, print_lemur_version
+from frontend.reprutils import set_verbose_print, set_sci_print, set_printoptions, get_printoptions, print_lemur_version
 from frontend.version import __version__
 from frontend.loss import *
 from frontend.ops import *
 from frontend.tensor_creation import *
+from frontend.checkpoint import save, load
+from frontend.memory import empty_cache, set_cache_limit, get_cache_limit, cached_bytes, memory_stats, reset_peak, \
+    set_memory_tracking, memory_snapshot
+from frontend.lazy import lazy, is_lazy
+from frontend.compiler import set_kernel_cache_dir, get_kernel_cache_dir, compile_wait
+from frontend.profiler import profile
+from frontend.parallel import set_num_threads, get_num_threads, set_parallel_threshold, get_parallel_thresholds, \
+    save_parallel_thresholds, load_parallel_thresholds, calibrate_parallel_thresholds
 
 def main():
     print_lemur_version()
@@ -1,6 +1,11 @@
 import unittest
+import math
+import array
+import tempfile
+import importlib.util
 import sys
 import os
+import json
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 import lemur
 
@@ -46,5 +51,534 @@ class TestLightLemur(unittest.TestCase):
         real_grad = lemur.full((1,2,3,48,512), 3)
         self.assertTrue((real_grad == a.grad).all(), "Grad check failed")
 
+    def test_reduce_ops(self):
+        values = lambda t: t.memoryview().cast("B").cast("f").tolist()
+        a = lemur.tensor([[1.0, 5.0, 5.0], [-2.0, 0.0, 3.0]], requires_grad=True)
+        self.assertEqual(values(a.max()), [5.0])
+        self.assertEqual(values(a.min()), [-2.0])
+        self.assertAlmostEqual(values(a.mean())[0], 2.0, places=5)
+        self.assertEqual(values(a.argmax()), [1.0])
+        self.assertEqual(values(a.argmin()), [3.0])
+        self.assertEqual(values(a.argmax(4)), [1.0, 2.0])
+        big = lemur.zeros((1, 1, 1, 4097, 4097))
+        with self.assertRaises(ValueError):
+            big.argmax() # 4097 * 4097 > 2^24, the float indices would be rounded
+        self.assertEqual(len(values(big.argmin(4))), 4097)
+        del big
+
+        a.max().backward()
+        self.assertEqual(values(a.grad), [0.0, 0.5, 0.5, 0.0, 0.0, 0.0])
+
+        b = lemur.tensor([[1.0, 2.0], [3.0, 4.0]], requires_grad=True)
+        b.mean(3).sum().backward()
+        self.assertEqual(values(b.grad), [0.5, 0.5, 0.5, 0.5])
+
+    def test_broadcast(self):
+        values = lambda t: t.memoryview().cast("B").cast("f").tolist()
+        x = lemur.full((1,1,1,2,3), 2.0, requires_grad=True)
+        b = lemur.tensor([1.0, 2.0, 4.0], requires_grad=True)
+        y = x / b - b
+        self.assertEqual(values(y), [1.0, -1.0, -3.5] * 2)
+        y.sum().backward()
+        self.assertEqual(values(b.grad), [-6.0, -3.0, -2.25])
+        self.assertEqual(values(x.grad), [1.0, 0.5, 0.25] * 2)
+
+    def test_lazy(self):
+        values = lambda t: t.memoryview().cast("B").cast("f").tolist()
+        x = lemur.tensor([1.0, 2.0, 3.0], requires_grad=True)
+        a = lemur.tensor([0.5, 1.0, 2.0])
+        with lemur.lazy():
+            self.assertTrue(lemur.is_lazy())
+            y = (x * x).sum()
+            e = a.exp() - a.exp() # common subexpression
+            s = (e + a).sum()
+            unused = a.relu()
+            p = (a * a).permute(0, 1, 2, 4, 3)
+        self.assertFalse(lemur.is_lazy())
+        self.assertFalse(y.is_computed())
+        self.assertFalse(s.is_computed())
+
+        y.backward() # realizes the graph first
+        self.assertEqual(values(y), [14.0])
+        self.assertEqual(values(x.grad), [2.0, 4.0, 6.0])
+
+        self.assertEqual(values(s), [3.5])
+        self.assertFalse(e.is_computed()) # released, nobody read it
+        self.assertFalse(unused.is_computed())
+        self.assertEqual(values(e), [0.0, 0.0, 0.0]) # recomputed on access
+        self.assertEqual(values(p.contiguous()), [0.25, 1.0, 4.0])
+        self.assertTrue(((unused + a) == lemur.tensor([1.0, 2.0, 4.0])).all()) # eager op on a lazy input
+
+        # an in-place write to an input of a pending graph is caught, invalidate() accepts the new values
+        b = lemur.tensor([1.0, 2.0, 3.0])
+        with lemur.lazy():
+            z = (b * 2.0).sum()
+        b.add_(1.0)
+        with self.assertRaises(RuntimeError):
+            z.compute()
+        z.invalidate()
+        self.assertEqual(values(z), [18.0])
+        with lemur.lazy():
+            z = (b * x).sum()
+        b.mul_(2.0)
+        with self.assertRaises(RuntimeError):
+            z.backward()
+
+    def test_compile(self):
+        values = lambda t: t.memoryview().cast("B").cast("f").tolist()
+        def loss(x, b):
+            return ((x - b) ** 2).sigmoid().log().mean(4).sum()
+        def leaves():
+            return (lemur.tensor([[1.0, -2.0, 3.0], [0.5, 0.0, -1.0]], requires_grad=True),
+                    lemur.tensor([0.5, 1.0, -0.5], requires_grad=True))
+
+        x, b = leaves()
+        ref = loss(x, b)
+        ref.backward()
+
+        cache = tempfile.mkdtemp()
+        previous = lemur.get_kernel_cache_dir()
+        lemur.set_kernel_cache_dir(cache)
+        try: # every kernel of the test goes to the temporary cache, not the developer's
+            self.assertEqual(lemur.get_kernel_cache_dir(), cache)
+            x2, b2 = leaves()
+            with lemur.lazy():
+                out = loss(x2, b2)
+            out.compile(wait=True).backward()
+            self.assertTrue(any(name.endswith(".so") for name in os.listdir(cache)))
+            self.assertAlmostEqual(values(out)[0], values(ref)[0], places=5)
+            for got, want in zip(values(x2.grad) + values(b2.grad), values(x.grad) + values(b.grad)):
+                self.assertAlmostEqual(got, want, places=5)
+
+            x3, b3 = leaves() # eager graph, only backward runs fused
+            y = ((x3 * b3).relu() + x3).sum().compile()
+            y.backward()
+            self.assertEqual(values(x3.grad), [1.5, 1.0, 1.0, 1.5, 1.0, 0.5])
+            self.assertEqual(values(b3.grad), [1.5, 0.0, -1.0])
+        finally:
+            lemur.compile_wait()
+            lemur.set_kernel_cache_dir(previous)
+
+    def test_memory_plan(self):
+        values = lambda t: t.memoryview().cast("B").cast("f").tolist()
+        w = lemur.tensor([1.0, 2.0, 3.0, 4.0], requires_grad=True)
+        a = lemur.tensor([0.0, 1.0, 2.0, 3.0])
+        with lemur.lazy():
+            y = ((a.exp().log() + lemur.tensor([1.0])) * w).sum()
+        self.assertGreater(y.plan_memory(), 0)
+        y.backward()
+        self.assertAlmostEqual(values(y)[0], 30.0, places=4)
+        for got, want in zip(values(w.grad), [1.0, 2.0, 3.0, 4.0]):
+            self.assertAlmostEqual(got, want, places=5)
+
+        w[0] = 5.0 # next step, same graph and memory
+        y.invalidate()
+        self.assertFalse(y.is_computed())
+        self.assertAlmostEqual(values(y)[0], 34.0, places=4)
+
+    def test_inplace_ops(self):
+        values = lambda t: t.memoryview().cast("B").cast("f").tolist()
+        x = lemur.tensor([1.0, -2.0, 3.0, -4.0])
+        y = lemur.tensor([2.0, 2.0, 2.0, 2.0])
+        same = x
+        x += y
+        x *= y
+        x.relu_()
+        self.assertIs(x, same)
+        self.assertEqual(values(x), [6.0, 0.0, 10.0, 0.0])
+        self.assertEqual(x.version, 3)
+
+        out = lemur.tensor([0.0, 0.0, 0.0, 0.0])
+        self.assertIs(lemur.sub(x, y, out=out), out)
+        self.assertEqual(values(out), [4.0, -2.0, 8.0, -2.0])
+        self.assertIs(y.neg(out=out), out)
+        self.assertEqual(values(out), [-2.0, -2.0, -2.0, -2.0])
+        with self.assertRaises(RuntimeError):
+            lemur.add(x, y, out=lemur.tensor([0.0]))
+
+        w = lemur.tensor([1.0, 2.0, 3.0, 4.0], requires_grad=True)
+        h = x * w
+        with self.assertRaises(RuntimeError):
+            h.exp_() # h is needed to differentiate through
+        loss = h.sum()
+        x.div_(y) # but mul saved x for the gradient of w
+        with self.assertRaises(RuntimeError):
+            loss.backward()
+
+        (x * w).sum().backward()
+        self.assertEqual(values(w.grad), [3.0, 0.0, 5.0, 0.0])
+        w -= w.grad # parameter update on a leaf
+        self.assertEqual(values(w), [-2.0, 2.0, -2.0, 4.0])
+
+        # augmented assignments the write would be refused for make a new tensor instead
+        loss = (w * w).sum()
+        before = loss
+        loss += (w * 2).sum()
+        self.assertIsNot(loss, before)
+        acc = lemur.tensor([0.0, 0.0, 0.0, 0.0])
+        acc += w
+        acc *= 2
+        loss = loss + acc.sum()
+        loss.backward()
+        self.assertEqual(values(w.grad), [3.0, 8.0, 5.0, 12.0]) # accumulated 2w + 4
+
+    def test_scalar_ops(self):
+        values = lambda t: t.memoryview().cast("B").cast("f").tolist()
+        x = lemur.tensor([1.0, 2.0, 4.0], requires_grad=True)
+        y = (1 - x * 0.5) / 2 + 2 ** x + 8 / x + x ** 2 - x / 4 + (-x)
+        self.assertEqual(len(y._parents), 2) # no tensors were made for the numbers
+        for got, want in zip(values(y), [10.0, 9.5, 28.5]):
+            self.assertAlmostEqual(got, want, places=4)
+        y.sum().backward()
+        for got, v in zip(values(x.grad), [1.0, 2.0, 4.0]):
+            self.assertAlmostEqual(got, -0.25 + 2 ** v * math.log(2) - 8 / v ** 2 + 2 * v - 0.25 - 1, places=4)
+
+        z = lemur.tensor([1.0, 2.0])
+        z *= 3
+        z -= 1
+        z /= 2
+        self.assertEqual(values(z), [1.0, 2.5])
+        self.assertEqual(values(lemur.sub(z, 0.5, out=z)), [0.5, 2.0])
+        with self.assertRaises(TypeError):
+            x + "1"
+
+    def test_abs_sign(self):
+        values = lambda t: t.memoryview().cast("B").cast("f").tolist()
+        x = lemur.tensor([-2.0, 0.5, 3.0], requires_grad=True)
+        a = x.abs()
+        self.assertEqual(values(a), [2.0, 0.5, 3.0])
+        a.sum().backward()
+        self.assertEqual(values(x.grad), [-1.0, 1.0, 1.0])
+        self.assertEqual(values(lemur.tensor([-2.0, 0.0, 3.0]).sign()), [-1.0, 0.0, 1.0])
+        del a # freeing the result of abs used to crash
+
+    def test_benchmark_suite(self):
+        from benchmarks import suite, dispatch
+        self.assertEqual(suite.uncovered_ops(), []) # every op of the forward table is benchmarked
+        results = suite.run(quick=True, threads=[1], ops=["add", "sum", "bcmm_fast"], min_time=1e-4, repeat=1, log=lambda row: None)
+        rows = results["results"]
+        self.assertTrue(all(r["seconds"] > 0 for r in rows))
+        self.assertEqual({r["unit"] for r in rows if r["kind"] == "forward"}, {"GB/s", "GFLOP/s"})
+        self.assertEqual(len(rows), 3 * 2 * 3 * 2) # sizes, layouts, ops, forward and backward
+        self.assertEqual(suite.compare(results, results)["regressions"], [])
+        slower = {"results": [dict(r, seconds=r["seconds"] * 2) for r in rows[:4]]}
+        diff = suite.compare(results, slower)
+        self.assertEqual(len(diff["regressions"]), 4)
+        self.assertEqual(len(diff["missing"]), len(rows) - 4)
+        overhead = suite.run(quick=True, threads=[1], ops=["add"], min_time=1e-4, repeat=1, log=lambda row: None, dispatch=True)
+        rows = [r for r in overhead["results"] if r["kind"] == "dispatch"]
+        self.assertEqual({r["op"] for r in rows}, set(dispatch.cases()))
+        slower = {"results": [dict(r, seconds=r["seconds"] * 2) for r in rows]}
+        self.assertEqual(len(suite.compare(overhead, slower)["regressions"]), len(rows))
+
+    def test_random(self):
+        values = lambda t: t.memoryview().cast("B").cast("f").tolist()
+        shape = (1, 1, 1, 100, 1000)
+        threads = lemur.get_num_threads()
+        old = lemur.get_parallel_thresholds()["elementwise"]
+        try:
+            lemur.init_seed(1234)
+            lemur.set_num_threads(1)
+            serial = (values(lemur.rand(shape)), values(lemur.randn(shape)))
+            lemur.init_seed(1234)
+            lemur.set_num_threads(3)
+            lemur.set_parallel_threshold("elementwise", 0)
+            parallel = (values(lemur.rand(shape)), values(lemur.randn(shape)))
+            self.assertEqual(serial, parallel)
+        finally:
+            lemur.set_num_threads(threads)
+            lemur.set_parallel_threshold("elementwise", old)
+
+        u, z = serial
+        n = len(z)
+        self.assertTrue(all(0.0 <= x < 1.0 for x in u))
+        mean = sum(z) / n
+        std = math.sqrt(sum((x - mean) ** 2 for x in z) / n)
+        self.assertLess(abs(mean), 0.01)
+        self.assertLess(abs(std - 1.0), 0.01)
+
+        state = lemur.get_rng_state()
+        first = values(lemur.rand((3, 5)))
+        self.assertNotEqual(first, values(lemur.rand((3, 5))))
+        lemur.set_rng_state(state)
+        self.assertEqual(first, values(lemur.rand((3, 5))))
+
+        ints = values(lemur.randint(-3, 4, (10, 100)))
+        self.assertEqual(set(ints), set(float(i) for i in range(-3, 4)))
+        mask = values(lemur.dropout_mask((100, 100), p=0.25))
+        self.assertEqual(len(set(mask)), 2)
+        self.assertAlmostEqual(max(mask), 1.0 / 0.75, places=6)
+        self.assertLess(abs(mask.count(0.0) / len(mask) - 0.25), 0.02)
+        with self.assertRaises(ValueError):
+            lemur.randint(2, 2, (3,))
+        with self.assertRaises(ValueError):
+            lemur.randint(1 << 24, (1 << 24) + 2, (3,)) # not exact as floats
+        with self.assertRaises(ValueError):
+            lemur.dropout_mask((3,), p=1.5)
+
+    def test_memory_stats(self):
+        lemur.set_memory_tracking(True)
+        try:
+            before = lemur.memory_stats()
+            a = lemur.randn((32, 32), requires_grad=True)
+            b = lemur.randn((32, 32), requires_grad=True)
+            y = (a @ b).relu()
+            after = lemur.memory_stats()
+            self.assertGreaterEqual(after["live_bytes"] - before["live_bytes"], 4 * 32 * 32 * 4)
+            self.assertGreaterEqual(after["by_op"]["relu"]["forward"]["live_bytes"], 32 * 32 * 4)
+            self.assertGreaterEqual(after["peak_bytes"], after["live_bytes"])
+            snapshot = lemur.memory_snapshot(top=3)
+            self.assertEqual(len(snapshot), 3)
+            self.assertEqual(snapshot[0]["bytes"], 32 * 32 * 4)
+            self.assertIn("relu", [s["op"] for s in lemur.memory_snapshot(top=100)])
+
+            y.sum().backward()
+            self.assertIn("backward", lemur.memory_stats()["by_op"]["bmm"])
+            live = lemur.memory_stats()["live_bytes"]
+            lemur.reset_peak()
+            self.assertEqual(lemur.memory_stats()["peak_bytes"], live)
+            del y
+            self.assertLess(lemur.memory_stats()["live_bytes"], live)
+        finally:
+            lemur.set_memory_tracking(False)
+        with self.assertRaises(RuntimeError):
+            lemur.memory_snapshot()
+        relu = lambda: lemur.memory_stats()["by_op"].get("relu", {}).get("forward", {}).get("num_allocs", 0)
+        count = relu()
+        live = lemur.memory_stats()["live_bytes"]
+        z = a.relu()
+        self.assertEqual(relu(), count) # untracked arrays only count towards the totals
+        self.assertGreaterEqual(lemur.memory_stats()["live_bytes"] - live, 32 * 32 * 4)
+        del z
+
+    def test_profiler(self):
+        a = lemur.tensor([[1.0, 2.0], [3.0, 4.0]], requires_grad=True)
+        b = lemur.tensor([[0.5, 0.5], [0.5, 0.5]], requires_grad=True)
+        with lemur.profile() as p:
+            loss = ((a * b) + a).sum()
+            loss.backward()
+        names = [e["name"] for e in p.events]
+        for name in ("mul", "add", "sum", "mul backward", "add backward", "sum backward"):
+            self.assertIn(name, names)
+        mul = next(e for e in p.events if e["name"] == "mul")
+        self.assertEqual(mul["shapes"], [[1, 1, 1, 2, 2]] * 3)
+        self.assertEqual(mul["bytes"], 3 * 4 * 4)
+        self.assertEqual(p.totals()["add"]["calls"], 1)
+        self.assertIn("mul backward", p.table())
+
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "trace.json")
+            p.export_chrome_trace(path)
+            with open(path) as f:
+                trace = json.load(f)
+        self.assertEqual(len(trace["traceEvents"]), len(p.events))
+        self.assertTrue(all(e["ph"] == "X" and e["dur"] >= 0 for e in trace["traceEvents"]))
+
+        with lemur.profile() as q:
+            pass
+        a + b # outside of any profile
+        self.assertEqual(q.events, [])
+
+    def test_parallel_thresholds(self):
+        values = lambda t: t.memoryview().cast("B").cast("f").tolist()
+        threads = lemur.get_num_threads()
+        old = lemur.get_parallel_thresholds()
+        try:
+            lemur.set_num_threads(2)
+            self.assertEqual(lemur.get_num_threads(), 2)
+            a = lemur.arange(3000).view(lemur.tensor([1, 1, 1, 50, 60]))
+            b = a * 0.5
+            serial = (values(a + b), values(a.sum()), values(a @ b.permute(0, 1, 2, 4, 3)))
+            for name in ("elementwise", "reduce", "gemm"):
+                lemur.set_parallel_threshold(name, 0) # every kernel opens a parallel region
+            parallel = (values(a + b), values(a.sum()), values(a @ b.permute(0, 1, 2, 4, 3)))
+            self.assertEqual(serial[0], parallel[0])
+            self.assertTrue(math.isclose(serial[1][0], parallel[1][0], rel_tol=1e-6))
+            self.assertTrue(all(math.isclose(x, y, rel_tol=1e-6) for x, y in zip(serial[2], parallel[2])))
+
+            with tempfile.TemporaryDirectory() as d:
+                path = os.path.join(d, "thresholds")
+                lemur.set_parallel_threshold("gemm", 12345)
+                lemur.save_parallel_thresholds(path)
+                lemur.set_parallel_threshold("gemm", 1)
+                self.assertTrue(lemur.load_parallel_thresholds(path))
+                self.assertEqual(lemur.get_parallel_thresholds()["gemm"], 12345)
+                self.assertFalse(lemur.load_parallel_thresholds(path + ".missing"))
+            with self.assertRaises(ValueError):
+                lemur.set_parallel_threshold("conv", 1)
+            with self.assertRaises(ValueError):
+                lemur.set_num_threads(0)
+        finally:
+            lemur.set_num_threads(threads)
+            for name, threshold in old.items():
+                lemur.set_parallel_threshold(name, threshold)
+
+    def test_printoptions(self):
+        old = lemur.get_printoptions()
+        try:
+            a = lemur.tensor([[float(i * 40 + j) for j in range(40)] for i in range(30)])
+            r = repr(a)
+            self.assertIn("...", r)
+            self.assertIn("1199.0000", r) # last element
+            self.assertNotIn(" 20.0000", r)
+            self.assertIn("shape=[1, 1, 1, 30, 40]", r)
+            lemur.set_printoptions(edgeitems=1, precision=1)
+            self.assertEqual(repr(a).count(", "), 5 + 4) # two edges and ... per row, shape
+            lemur.set_printoptions(threshold=2000)
+            self.assertNotIn("...", repr(a))
+            p = a.permute(0, 1, 2, 4, 3) # strided views gather the right elements
+            lemur.set_printoptions(threshold=10, edgeitems=1)
+            self.assertIn("[  39.0, ..., 1199.0]", repr(p))
+            with self.assertRaises(ValueError):
+                lemur.set_printoptions(precision=-1)
+        finally:
+            lemur.set_printoptions(**old)
+
+    def test_metadata(self):
+        a = lemur.tensor([[1.0, 2.0, 3.0], [4.0, 5.0, 6.0]])
+        self.assertEqual(a.shape, (1, 1, 1, 2, 3))
+        self.assertIs(a.shape, a.shape) # cached
+        self.assertEqual(a.numel(), 6)
+        self.assertEqual(a.stride(), (6, 6, 6, 3, 1))
+        p = a.permute(0, 1, 2, 4, 3)
+        self.assertEqual(p.shape, (1, 1, 1, 3, 2))
+        self.assertEqual(p.stride(), (6, 6, 6, 1, 3))
+        self.assertIs(a.sum(4)._parents[1], a.sum(4)._parents[1]) # dims tensors are shared
+
+    def test_strided_views(self):
+        values = lambda t: t.memoryview().cast("B").cast("f").tolist()
+        a = lemur.tensor([[1.0, 2.0, 3.0], [4.0, 5.0, 6.0]], requires_grad=True)
+        p = a.permute(0,1,2,4,3)
+        self.assertTrue(p.is_shallow())
+        self.assertFalse(p.is_contiguous())
+        self.assertEqual(values((p * p).sum(4)), [17.0, 29.0, 45.0])
+        self.assertEqual(values(p.contiguous()), [1.0, 4.0, 2.0, 5.0, 3.0, 6.0])
+        a[1] = 10.0 # views share memory with their parent
+        self.assertEqual(values(p.contiguous())[2], 10.0)
+
+        e = lemur.tensor([1.0, 2.0], requires_grad=True)
+        x = e.view(1,1,1,2,1).expand(1,1,1,2,3)
+        self.assertTrue(x.is_shallow())
+        w = p.permute(0,1,2,4,3) # view of a view, same layout as a
+        (x.exp() * w).sum().backward()
+        self.assertTrue(lemur.isclose(e.grad, lemur.tensor([2.71828183 * 14.0, 7.3890561 * 15.0])).all())
+        self.assertTrue(lemur.isclose(a.grad, lemur.tensor([[2.71828183] * 3, [7.3890561] * 3])).all())
+
+    def test_matmul(self):
+        a = lemur.tensor([[1.0, 2.0], [3.0, 4.0], [5.0, 6.0]], requires_grad=True)
+        b = lemur.tensor([[1.0, 0.0, 2.0], [0.0, 1.0, 3.0]], requires_grad=True)
+        c = a @ b
+        self.assertTrue((c == lemur.tensor([[1.0, 2.0, 8.0], [3.0, 4.0, 18.0], [5.0, 6.0, 28.0]])).all())
+        c.sum().backward()
+        self.assertTrue((a.grad == lemur.tensor([[3.0, 4.0]] * 3)).all())
+        self.assertTrue((b.grad == lemur.tensor([[9.0] * 3, [12.0] * 3])).all())
+
+        # a transposed view is packed as is, no copy
+        at = a.permute(0,1,2,4,3)
+        self.assertTrue(((at @ a) == lemur.tensor([[35.0, 44.0], [44.0, 56.0]])).all())
+
+    def test_memoryview_export(self):
+        a = lemur.arange(32)
+        m = a.view([1,1,2,4,4]).memoryview()
+        del a
+        self.assertEqual(m.shape, (1,1,2,4,4))
+        self.assertEqual(m[0,0,1,3,3], 31.0)
+        self.assertEqual(m[0,0,0,1,2], 6.0)
+
+    def test_from_buffer(self):
+        data = array.array("f", range(24))
+        a = lemur.from_buffer(data, (2,3,4))
+        b = lemur.from_buffer(data, (2,3,4), copy=False)
+        data[5] = -1.0
+        self.assertEqual(a[5], 5.0)
+        self.assertEqual(b[5], -1.0)
+        self.assertTrue(b.is_shallow())
+        c = lemur.tensor(array.array("d", [1.5, 2.5]))
+        self.assertEqual((c[0], c[1]), (1.5, 2.5))
+        d = lemur.frombytes(array.array("f", [3.0, 4.0]).tobytes(), (2,))
+        self.assertEqual((d[0], d[1]), (3.0, 4.0))
+        self.assertTrue((lemur.tensor([[0.0, 1.0], [2.0, 3.0]]) == lemur.arange(4).view([1,1,1,2,2])).all())
+        for ragged in ([1.0, [2.0]], [[1.0], 2.0], [[1.0, 2.0], [3.0]]):
+            with self.assertRaises(ValueError):
+                lemur.tensor(ragged)
+        with self.assertRaises(TypeError):
+            lemur.tensor(["a"])
+
+    def test_from_file(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "data.bin")
+            with open(path, "wb") as f:
+                f.write(b"\0" * 8)
+                array.array("f", range(64)).tofile(f)
+            a = lemur.from_file(path, (4,16), offset=8)
+            self.assertTrue((a.sum() == lemur.full((1,), 2016)).all())
+            self.assertEqual(a.view([1,1,2,2,16])[33], 33.0)
+            # mode "r" is read only, writes raise instead of faulting on the mapping
+            self.assertTrue(a.is_readonly() and a.memoryview().readonly)
+            with self.assertRaises(RuntimeError):
+                a.add_(1.0)
+            with self.assertRaises(RuntimeError):
+                a.view([1,1,2,2,16]).mul_(2.0)
+            with self.assertRaises(RuntimeError):
+                a[0] = 1.0
+            with self.assertRaises(ValueError):
+                lemur.from_buffer(a, copy=False)
+            self.assertEqual(a[0], 0.0)
+            c = lemur.from_file(path, (64,), mode="c", offset=8)
+            c[0] = 7.0
+            w = lemur.from_file(path, (64,), mode="r+", offset=8)
+            w[1] = 9.0
+            del a, c, w
+            with open(path, "rb") as f:
+                f.seek(8)
+                values = array.array("f", f.read(8))
+            self.assertEqual(list(values), [0.0, 9.0])
+
+    def test_checkpoint(self):
+        state = {"w": lemur.rand((3,5,7)), "b": lemur.arange(10), "p": lemur.arange(6).view([1,1,1,2,3]).permute([0,1,2,4,3]),
+                 "z": lemur.zeros((1,1,1,1,0))}
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "state.lemur")
+            lemur.save(state, path)
+            for use_mmap in (True, False):
+                loaded = lemur.load(path, mmap=use_mmap)
+                self.assertEqual(sorted(loaded), ["b", "p", "w", "z"])
+                self.assertEqual(tuple(loaded["z"].shape), (1,1,1,1,0))
+                for name in state:
+                    self.assertTrue((loaded[name] == state[name]).all(), f"{name} mismatch (mmap={use_mmap})")
+
+    def test_caching_allocator(self):
+        lemur.empty_cache()
+        a = lemur.rand((64,1024))
+        del a
+        self.assertGreaterEqual(lemur.cached_bytes(), 64*1024*4)
+        b = lemur.rand((64,1024))
+        self.assertLess(lemur.cached_bytes(), 64*1024*4)
+        del b
+        lemur.empty_cache()
+        self.assertEqual(lemur.cached_bytes(), 0)
+        limit = lemur.get_cache_limit()
+        lemur.set_cache_limit(0)
+        c = lemur.rand((16,))
+        del c
+        self.assertEqual(lemur.cached_bytes(), 0)
+        lemur.set_cache_limit(limit)
+
+    def test_shared_subexpression_backward(self):
+        a = lemur.full((2,3), 1, requires_grad=True)
+        b = a
+        for _ in range(40):
+            b = b + b
+        b.sum().backward()
+        self.assertTrue((a.grad == lemur.full((2,3), 2.0**40)).all(), "Grad check failed")
+
+    @unittest.skipUnless(importlib.util.find_spec("numpy"), "numpy not installed")
+    def test_numpy_export(self):
+        a = lemur.arange(32).view([1,1,2,4,4])
+        b = a.permute([0,1,2,4,3])
+        n = b.numpy()
+        self.assertEqual(n.shape, (1,1,2,4,4))
+        self.assertEqual(float(n[0,0,1,3,2]), 27.0)
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -1,6 +1,8 @@
 #include <stdio.h>
 #include <stdbool.h>
+#include <unistd.h>
 #include "../backend/include/interface.h"
+#include "../backend/include/compiler.h"
 
 #define RESET "\033[0m"
 #define RED "\033[31m"
@@ -264,6 +266,737 @@ int test_permute(){
     return errorval;
 }
 
+int test_diamond_backward(){
+    int errorval = 0;
+
+    //x_{i+1} = x_i + x_i repeated, every node is shared by both inputs of its consumer
+    size_t depth = 64;
+    size_t shape[5] = {1,1,1,1,4};
+    size_t shape_dim[5] = {1,1,1,1,5};
+    tensor *dim_s = empty_tensor(shape_dim, false, false);
+    memset_kernel_tensor(dim_s->k, 0.0);
+    tensor *a = empty_tensor(shape, true, true);
+    memset_kernel_tensor(a->k, 1.0);
+
+    tensor **xs = malloc(depth * sizeof(tensor *));
+    tensor *prev = a;
+    for (size_t i = 0; i < depth; i++){
+        xs[i] = add(prev, prev, false);
+        prev = xs[i];
+    }
+    tensor *s = sum(prev, dim_s, false);
+    backward(s);
+
+    for (size_t i = 0; i < 4; i++){
+        if (a->grad->array[i] != ldexpf(1.0, (int) depth)) errorval += 1<<i;
+    }
+
+    free_tensor(&s);
+    for (size_t i = 0; i < depth; i++){
+        free_tensor(&xs[i]);
+    }
+    free(xs);
+    free_tensor(&a);
+    free_tensor(&dim_s);
+    return errorval;
+}
+
+int test_parallel_branches_backward(){
+    int errorval = 0;
+    int prev_threads = omp_get_max_threads();
+    omp_set_num_threads(4);
+
+    //sum_i (a * b_i) with many small independent branches that share a
+    size_t num_branches = 32;
+    size_t shape[5] = {1,1,1,2,8};
+    size_t shape_dim[5] = {1,1,1,1,5};
+    tensor *dim_s = empty_tensor(shape_dim, false, false);
+    memset_kernel_tensor(dim_s->k, 0.0);
+    tensor *a = empty_tensor(shape, true, true);
+    memset_kernel_tensor(a->k, 2.0);
+
+    tensor **bs = malloc(num_branches * sizeof(tensor *));
+    tensor **ms = malloc(num_branches * sizeof(tensor *));
+    tensor **ss = malloc(num_branches * sizeof(tensor *));
+    tensor **acc = malloc(num_branches * sizeof(tensor *));
+    for (size_t i = 0; i < num_branches; i++){
+        bs[i] = empty_tensor(shape, true, true);
+        memset_kernel_tensor(bs[i]->k, (lemur_float) i);
+        ms[i] = mul(a, bs[i], false);
+        ss[i] = sum(ms[i], dim_s, false);
+        acc[i] = (i == 0) ? NULL : add((i == 1) ? ss[0] : acc[i-1], ss[i], false);
+    }
+    backward(acc[num_branches - 1]);
+
+    lemur_float expected = (lemur_float) (num_branches * (num_branches - 1) / 2);
+    for (size_t j = 0; j < 16; j++){
+        if (a->grad->array[j] != expected) errorval |= 1;
+    }
+    for (size_t i = 0; i < num_branches; i++){
+        if (bs[i]->grad->array[0] != 2.0) errorval |= 2;
+    }
+
+    for (size_t i = 0; i < num_branches; i++){
+        free_tensor(&acc[i]);
+        free_tensor(&ss[i]);
+        free_tensor(&ms[i]);
+        free_tensor(&bs[i]);
+    }
+    free(bs); free(ms); free(ss); free(acc);
+    free_tensor(&a);
+    free_tensor(&dim_s);
+    omp_set_num_threads(prev_threads);
+    return errorval;
+}
+
+int test_reduce_engine(){
+    int errorval = 0;
+    int prev_threads = omp_get_max_threads();
+    omp_set_num_threads(4);
+
+    //full reduction of many small values, a running float sum drifts far from the answer
+    size_t shape[5] = {1,1,1,1024,4096};
+    size_t shape_dim[5] = {1,1,1,1,5};
+    tensor *dim_all = empty_tensor(shape_dim, false, false);
+    memset_kernel_tensor(dim_all->k, 0.0);
+    tensor *dim_rows = empty_tensor(shape_dim, false, false);
+    memset_kernel_tensor(dim_rows->k, 1.0);
+    dim_rows->k->array[3] = 0.0;
+
+    tensor *a = empty_tensor(shape, false, false);
+    memset_kernel_tensor(a->k, 0.1);
+    a->k->array[12345] = 7.0;
+    a->k->array[777] = -3.0;
+
+    tensor *s = sum(a, dim_all, false);
+    lemur_float expected = 0.1 * (1024.0 * 4096.0 - 2.0) + 4.0;
+    if (fabsf(s->k->array[0] - expected) > 1.0) errorval |= 1;
+
+    //leading dims reduced, contiguous innermost axis kept
+    tensor *r = sum(a, dim_rows, false);
+    if (r->k->length != 4096) errorval |= 2;
+    if (fabsf(r->k->array[100] - 102.4) > 1e-3) errorval |= 2;
+
+    tensor *mx = maximum(a, dim_all, false);
+    tensor *mn = minimum(a, dim_all, false);
+    tensor *amx = argmax(a, dim_all);
+    tensor *amn = argmin(a, dim_all);
+    if (mx->k->array[0] != 7.0 || mn->k->array[0] != -3.0) errorval |= 4;
+    if (amx->k->array[0] != 12345.0 || amn->k->array[0] != 777.0) errorval |= 8;
+
+    free_tensor(&amn);
+    free_tensor(&amx);
+    free_tensor(&mn);
+    free_tensor(&mx);
+    free_tensor(&r);
+    free_tensor(&s);
+    free_tensor(&a);
+    free_tensor(&dim_rows);
+    free_tensor(&dim_all);
+    omp_set_num_threads(prev_threads);
+    return errorval;
+}
+
+int test_broadcast_binary(){
+    int errorval = 0;
+
+    //(B,1,1,M,N) * (1,1,1,1,N) bias, gradient of the bias is summed over B and M
+    size_t shape[5] = {2,1,1,3,4};
+    size_t shape_bias[5] = {1,1,1,1,4};
+    size_t shape_dim[5] = {1,1,1,1,5};
+    tensor *dim_all = empty_tensor(shape_dim, false, false);
+    memset_kernel_tensor(dim_all->k, 0.0);
+
+    tensor *x = empty_tensor(shape, true, true);
+    memset_kernel_tensor(x->k, 3.0);
+    tensor *b = empty_tensor(shape_bias, true, true);
+    for (size_t i = 0; i < 4; i++){
+        b->k->array[i] = (lemur_float) i;
+    }
+
+    tensor *y = mul(x, b, false);
+    tensor *z = add(y, b, false);
+    tensor *s = sum(z, dim_all, false);
+    if (are_shapes_equal(z->k->shape, shape) == false) errorval |= 1;
+    if (z->k->array[5] != 3.0 * 1.0 + 1.0) errorval |= 2;
+    backward(s);
+
+    //dz/db = x + 1 summed over 6 rows
+    if (are_shapes_equal(b->grad->shape, shape_bias) == false) errorval |= 4;
+    for (size_t i = 0; i < 4; i++){
+        if (b->grad->array[i] != 6.0 * 4.0) errorval |= 8;
+    }
+    for (size_t i = 0; i < x->k->length; i++){
+        if (x->grad->array[i] != (lemur_float) (i % 4)) errorval |= 16;
+    }
+
+    free_tensor(&s);
+    free_tensor(&z);
+    free_tensor(&y);
+    free_tensor(&b);
+    free_tensor(&x);
+    free_tensor(&dim_all);
+    return errorval;
+}
+
+int test_strided_elementwise(){
+    int errorval = 0;
+    int prev_threads = omp_get_max_threads();
+    omp_set_num_threads(4);
+
+    //elementwise and reduce kernels reading a transposed view directly (no copy)
+    size_t shape[5] = {1,1,3,256,512};
+    size_t shape_dim[5] = {1,1,1,1,5};
+    tensor *dim_perm = empty_tensor(shape_dim, false, false);
+    dim_perm->k->array[0] = 0;
+    dim_perm->k->array[1] = 1;
+    dim_perm->k->array[2] = 2;
+    dim_perm->k->array[3] = 4;
+    dim_perm->k->array[4] = 3;
+    tensor *dim_all = empty_tensor(shape_dim, false, false);
+    memset_kernel_tensor(dim_all->k, 0.0);
+
+    tensor *a = empty_tensor(shape, false, false);
+    linspace_kernel_tensor(a->k, 0.0, 1.0);
+    tensor *p = permute(a, dim_perm, false);
+    if (p->k->shallow == false || p->k->array != a->k->array) errorval |= 1;
+
+    tensor *q = add(p, p, false);
+    for (size_t b = 0; b < 3; b++){
+        for (size_t i = 0; i < 512; i += 37){
+            for (size_t j = 0; j < 256; j += 29){
+                lemur_float expected = 2.0 * a->k->array[b * 256 * 512 + j * 512 + i];
+                if (q->k->array[b * 512 * 256 + i * 256 + j] != expected) errorval |= 2;
+            }
+        }
+    }
+
+    tensor *sp = sum(p, dim_all, false);
+    tensor *sa = sum(a, dim_all, false);
+    lemur_float expected_sum = 0.5 * (lemur_float) a->k->length;
+    if (fabsf(sp->k->array[0] - expected_sum) > 1e-5 * expected_sum) errorval |= 4;
+    if (fabsf(sa->k->array[0] - expected_sum) > 1e-5 * expected_sum) errorval |= 4;
+
+    free_tensor(&sa);
+    free_tensor(&sp);
+    free_tensor(&q);
+    free_tensor(&p);
+    free_tensor(&a);
+    free_tensor(&dim_all);
+    free_tensor(&dim_perm);
+    omp_set_num_threads(prev_threads);
+    return errorval;
+}
+
+int test_matmul_gemm(){
+    int errorval = 0;
+    int prev_threads = omp_get_max_threads();
+    omp_set_num_threads(4);
+
+    //odd sizes so every edge of the packed panels is exercised, k spans several KC blocks
+    size_t B = 2, I = 13, K = 300, J = 37;
+    size_t shape_dim[5] = {1,1,1,1,5};
+    tensor *dim_all = empty_tensor(shape_dim, false, false);
+    memset_kernel_tensor(dim_all->k, 0.0);
+
+    tensor *a = empty_tensor((size_t[5]){1,1,B,I,K}, true, true);
+    tensor *b = empty_tensor((size_t[5]){1,1,B,K,J}, true, true);
+    tensor *bc = empty_tensor((size_t[5]){1,1,1,K,J}, true, true);
+    tensor *bt = empty_tensor((size_t[5]){1,1,B,J,K}, true, true);
+    tensor *bct = empty_tensor((size_t[5]){1,1,1,J,K}, true, true);
+    random_uniform_kernel_tensor(a->k, -1.0, 1.0);
+    random_uniform_kernel_tensor(b->k, -1.0, 1.0);
+    random_uniform_kernel_tensor(bc->k, -1.0, 1.0);
+    for (size_t n = 0; n < B; n++){
+        for (size_t p = 0; p < K; p++){
+            for (size_t j = 0; j < J; j++){
+                bt->k->array[n*J*K + j*K + p] = b->k->array[n*K*J + p*J + j];
+                if (n == 0) bct->k->array[j*K + p] = bc->k->array[p*J + j];
+            }
+        }
+    }
+
+    tensor *c0 = bmm(a, b, false);
+    tensor *c1 = bcmm(a, bc, false);
+    tensor *c2 = bmm_fast(a, bt, false);
+    tensor *c3 = bcmm_fast(a, bct, false);
+    for (size_t n = 0; n < B; n++){
+        for (size_t i = 0; i < I; i++){
+            for (size_t j = 0; j < J; j++){
+                lemur_float ref0 = 0.0, ref1 = 0.0;
+                for (size_t p = 0; p < K; p++){
+                    ref0 += a->k->array[n*I*K + i*K + p] * b->k->array[n*K*J + p*J + j];
+                    ref1 += a->k->array[n*I*K + i*K + p] * bc->k->array[p*J + j];
+                }
+                size_t o = n*I*J + i*J + j;
+                if (fabsf(c0->k->array[o] - ref0) > 1e-3) errorval |= 1;
+                if (fabsf(c1->k->array[o] - ref1) > 1e-3) errorval |= 2;
+                if (fabsf(c2->k->array[o] - ref0) > 1e-3) errorval |= 4;
+                if (fabsf(c3->k->array[o] - ref1) > 1e-3) errorval |= 8;
+            }
+        }
+    }
+
+    //d sum(A @ Bc) / dA = row sums of Bc, d / dBc = column sums of A over batch and rows
+    tensor *s1 = sum(c1, dim_all, false);
+    backward(s1);
+    for (size_t p = 0; p < K; p++){
+        lemur_float row = 0.0, col = 0.0;
+        for (size_t j = 0; j < J; j++){
+            row += bc->k->array[p*J + j];
+        }
+        for (size_t n = 0; n < B * I; n++){
+            col += a->k->array[n*K + p];
+        }
+        if (fabsf(a->grad->array[(B*I - 1)*K + p] - row) > 1e-3) errorval |= 16;
+        if (fabsf(bc->grad->array[p*J + J - 1] - col) > 1e-3) errorval |= 32;
+    }
+
+    //same gradient through the transposed variant
+    tensor *s3 = sum(c3, dim_all, false);
+    backward(s3);
+    for (size_t p = 0; p < K; p++){
+        lemur_float col = 0.0;
+        for (size_t n = 0; n < B * I; n++){
+            col += a->k->array[n*K + p];
+        }
+        if (fabsf(bct->grad->array[(J - 1)*K + p] - col) > 1e-3) errorval |= 64;
+    }
+
+    free_tensor(&s3);
+    free_tensor(&s1);
+    free_tensor(&c3);
+    free_tensor(&c2);
+    free_tensor(&c1);
+    free_tensor(&c0);
+    free_tensor(&bct);
+    free_tensor(&bt);
+    free_tensor(&bc);
+    free_tensor(&b);
+    free_tensor(&a);
+    free_tensor(&dim_all);
+    omp_set_num_threads(prev_threads);
+    return errorval;
+}
+
+int test_lazy_compute(){
+    int errorval = 0;
+
+    size_t shape[5] = {1,1,1,4,8};
+    size_t shape_dim[5] = {1,1,1,1,5};
+    tensor *dim_all = empty_tensor(shape_dim, false, false);
+    memset_kernel_tensor(dim_all->k, 0.0);
+    tensor *a = empty_tensor(shape, false, false);
+    linspace_kernel_tensor(a->k, -1.0, 1.0);
+    tensor *w = empty_tensor(shape, true, true);
+    linspace_kernel_tensor(w->k, 0.0, 1.0);
+
+    set_lazy_mode(true);
+    tensor *e0 = exponential(a, false);
+    tensor *e1 = exponential(a, false); //common subexpression of e0
+    tensor *d = sub(e0, e1, false);
+    tensor *s = sum(d, dim_all, false);
+    tensor *unused = relu(a, false);
+    tensor *y = mul(w, w, false);
+    tensor *z = sum(y, dim_all, false);
+    tensor *q = exponential(a, false);
+    set_lazy_mode(false);
+
+    //nothing ran or was allocated
+    if ((s->k->computed == true) || (e0->k->array != NULL) || (y->k->array != NULL)) errorval |= 1;
+
+    compute(s);
+    if ((s->k->computed == false) || (s->k->array[0] != 0.0)) errorval |= 2;
+    //intermediates nobody holds on to are released, dead code never ran
+    if ((e0->k->computed == true) || (d->k->computed == true) || (unused->k->computed == true)) errorval |= 4;
+
+    compute(e1); //recomputed on access
+    for (size_t i = 0; i < a->k->length; i++){
+        if (fabsf(e1->k->array[i] - expf(a->k->array[i])) > 1e-6) errorval |= 8;
+    }
+
+    backward(z); //computes the graph first, y is kept for backward
+    for (size_t i = 0; i < w->k->length; i++){
+        if (fabsf(w->grad->array[i] - 2.0 * w->k->array[i]) > 1e-6) errorval |= 16;
+    }
+
+    tensor *r = add(q, a, false); //eager op on a lazy input
+    if ((q->k->computed == false) || (fabsf(r->k->array[3] - (expf(a->k->array[3]) + a->k->array[3])) > 1e-6)) errorval |= 32;
+
+    free_tensor(&r);
+    free_tensor(&q);
+    free_tensor(&z);
+    free_tensor(&y);
+    free_tensor(&unused);
+    free_tensor(&s);
+    free_tensor(&d);
+    free_tensor(&e1);
+    free_tensor(&e0);
+    free_tensor(&w);
+    free_tensor(&a);
+    free_tensor(&dim_all);
+    return errorval;
+}
+
+//mean(log(sigmoid((x - y) ** 2))) over the last dim, then summed: one fused region
+static tensor * fusion_graph(tensor *x, tensor *y, tensor *two, tensor *dim_last, tensor *dim_all, tensor **nodes){
+    nodes[0] = sub(x, y, false);
+    nodes[1] = power(nodes[0], two, false);
+    nodes[2] = sigmoid(nodes[1], false);
+    nodes[3] = logarithm(nodes[2], false);
+    nodes[4] = mean(nodes[3], dim_last, false);
+    return sum(nodes[4], dim_all, false);
+}
+
+int test_fused_compile(){
+    int errorval = 0;
+
+    size_t shape_x[5] = {1,1,1,4,8};
+    size_t shape_y[5] = {1,1,1,1,8};
+    size_t shape_dim[5] = {1,1,1,1,5};
+    size_t shape_scalar[5] = {1,1,1,1,1};
+    tensor *dim_all = empty_tensor(shape_dim, false, false);
+    memset_kernel_tensor(dim_all->k, 0.0);
+    tensor *dim_last = empty_tensor(shape_dim, false, false);
+    memset_kernel_tensor(dim_last->k, 1.0);
+    dim_last->k->array[4] = 0.0;
+    tensor *two = empty_tensor(shape_scalar, false, false);
+    two->k->array[0] = 2.0;
+
+    tensor *x = empty_tensor(shape_x, true, true);
+    tensor *y = empty_tensor(shape_y, true, true);
+    tensor *x_ref = empty_tensor(shape_x, true, true);
+    tensor *y_ref = empty_tensor(shape_y, true, true);
+    linspace_kernel_tensor(x->k, -1.0, 1.0);
+    linspace_kernel_tensor(y->k, 0.5, 1.5);
+    linspace_kernel_tensor(x_ref->k, -1.0, 1.0);
+    linspace_kernel_tensor(y_ref->k, 0.5, 1.5);
+
+    tensor *ref_nodes[5];
+    tensor *ref = fusion_graph(x_ref, y_ref, two, dim_last, dim_all, ref_nodes);
+    backward(ref);
+
+    tensor *nodes[5];
+    set_lazy_mode(true);
+    tensor *out = fusion_graph(x, y, two, dim_last, dim_all, nodes);
+    set_lazy_mode(false);
+    compile(out);
+    compile_wait();
+    if ((nodes[4]->comes_from->fused == NULL) || (nodes[4]->comes_from->fused->num_nodes != 5)) errorval |= 1;
+
+    compute(out);
+    if (fabsf(out->k->array[0] - ref->k->array[0]) > 1e-5) errorval |= 2;
+    //the intermediates of the region are never materialized
+    if ((nodes[3]->k->array != NULL) || (nodes[1]->k->array != NULL)) errorval |= 4;
+
+    backward(out);
+    for (size_t i = 0; i < x->k->length; i++){
+        if (fabsf(x->grad->array[i] - x_ref->grad->array[i]) > 1e-5) errorval |= 8;
+    }
+    for (size_t i = 0; i < y->k->length; i++){
+        if (fabsf(y->grad->array[i] - y_ref->grad->array[i]) > 1e-5) errorval |= 16;
+    }
+    if (nodes[2]->k->array != NULL) errorval |= 32;
+
+    //an identical graph reuses the loaded kernels, nothing is built
+    tensor *again_nodes[5];
+    tensor *again = fusion_graph(x, y, two, dim_last, dim_all, again_nodes);
+    compile(again);
+    fused_group *f0 = nodes[4]->comes_from->fused;
+    fused_group *f1 = again_nodes[4]->comes_from->fused;
+    if ((f1 == NULL) || (f1->library != f0->library) || (fused_kernels_ready(f1) == false)) errorval |= 64;
+    free_tensor(&again);
+    for (size_t i = 5; i-- > 0;){
+        free_tensor(&again_nodes[i]);
+    }
+
+    free_tensor(&out);
+    free_tensor(&ref);
+    for (size_t i = 5; i-- > 0;){
+        free_tensor(&nodes[i]);
+        free_tensor(&ref_nodes[i]);
+    }
+    free_tensor(&y_ref);
+    free_tensor(&x_ref);
+    free_tensor(&y);
+    free_tensor(&x);
+    free_tensor(&two);
+    free_tensor(&dim_last);
+    free_tensor(&dim_all);
+    return errorval;
+}
+
+int test_memory_plan(){
+    int errorval = 0;
+
+    size_t shape[5] = {1,1,1,16,16};
+    size_t shape_dim[5] = {1,1,1,1,5};
+    tensor *dim_all = empty_tensor(shape_dim, false, false);
+    memset_kernel_tensor(dim_all->k, 0.0);
+    tensor *k = empty_tensor(shape, false, false);
+    linspace_kernel_tensor(k->k, 0.1, 1.0);
+    tensor *w = empty_tensor(shape, true, true);
+    linspace_kernel_tensor(w->k, -1.0, 1.0);
+
+    set_lazy_mode(true);
+    tensor *u = exponential(k, false);
+    tensor *v = neg(u, false);
+    tensor *a = absolute(v, false);
+    tensor *r = square_root(a, false);
+    tensor *h = mul(r, w, false);
+    tensor *s = sum(h, dim_all, false);
+    set_lazy_mode(false);
+
+    //u, v and a die early and share memory, r and h are kept for backward
+    size_t bytes = plan_memory(s);
+    size_t unplanned = 5 * k->k->length * sizeof(lemur_float);
+    if ((bytes == 0) || (bytes >= unplanned)) errorval |= 1;
+
+    lemur_float expected = 0.0;
+    for (size_t i = 0; i < k->k->length; i++){
+        expected += sqrtf(expf(k->k->array[i])) * w->k->array[i];
+    }
+    backward(s);
+    lemur_float *arena = s->comes_from->plan->arena;
+    lemur_float *result = s->k->array;
+    if ((result < arena) || (result >= arena + s->comes_from->plan->arena_length)) errorval |= 2;
+    if (fabsf(s->k->array[0] - expected) > 1e-3) errorval |= 4;
+
+    //second step: new parameters, same graph, same memory
+    w->k->array[0] += 1.0;
+    expected += sqrtf(expf(k->k->array[0]));
+    memset_kernel_tensor(w->grad, 0.0);
+    invalidate(s);
+    if ((s->k->computed == true) || (r->k->computed == true)) errorval |= 8;
+    backward(s);
+    if ((s->k->array != result) || (fabsf(s->k->array[0] - expected) > 1e-3)) errorval |= 16;
+    for (size_t i = 0; i < w->k->length; i++){
+        if (fabsf(w->grad->array[i] - sqrtf(expf(k->k->array[i]))) > 1e-5) errorval |= 32;
+    }
+
+    //the kept nodes move out of the arena with the plan
+    free_tensor(&s);
+    if ((h->k->computed == false) || (fabsf(h->k->array[3] - r->k->array[3] * w->k->array[3]) > 1e-6)) errorval |= 64;
+
+    free_tensor(&h);
+    free_tensor(&r);
+    free_tensor(&a);
+    free_tensor(&v);
+    free_tensor(&u);
+    free_tensor(&w);
+    free_tensor(&k);
+    free_tensor(&dim_all);
+    return errorval;
+}
+
+int test_inplace_ops(){
+    int errorval = 0;
+
+    size_t shape[5] = {1,1,1,4,8};
+    size_t row_shape[5] = {1,1,1,1,8};
+    size_t shape_dim[5] = {1,1,1,1,5};
+    tensor *dim_all = empty_tensor(shape_dim, false, false);
+    memset_kernel_tensor(dim_all->k, 0.0);
+    tensor *x = empty_tensor(shape, false, false);
+    linspace_kernel_tensor(x->k, -1.0, 1.0);
+    tensor *row = empty_tensor(row_shape, false, false);
+    linspace_kernel_tensor(row->k, 0.5, 1.0);
+    tensor *out = empty_tensor(shape, false, false);
+
+    //in place with a broadcast operand, the array is not reallocated
+    lemur_float *array = x->k->array;
+    lemur_float before = x->k->array[13];
+    if (mul_into(x, x, row) != INTO_OK) errorval |= 1;
+    if ((x->k->array != array) || (fabsf(x->k->array[13] - before * row->k->array[5]) > 1e-6)) errorval |= 2;
+    if (x->version != 1) errorval |= 4;
+
+    //out= into another tensor
+    if (relu_into(out, x) != INTO_OK) errorval |= 8;
+    if (out->k->array[0] != 0.0 || fabsf(out->k->array[31] - x->k->array[31]) > 1e-6) errorval |= 16;
+    if (add_into(row, x, x) != INTO_SHAPE_MISMATCH) errorval |= 32;
+
+    //a value saved for backward was overwritten
+    tensor *w = empty_tensor(shape, true, true);
+    linspace_kernel_tensor(w->k, 0.0, 1.0);
+    tensor *h = mul(x, w, false);
+    tensor *s = sum(h, dim_all, false);
+    if (exponential_into(h, h) != INTO_OUT_IN_GRAPH) errorval |= 64;
+    if (add_into(out, w, x) != INTO_INPUT_REQUIRES_GRAD) errorval |= 128;
+    if (neg_into(x, x) != INTO_OK) errorval |= 256;
+    if (backward(s) == true) errorval |= 512;
+    if (w->grad->array[3] != 0.0) errorval |= 1024;
+
+    //a parameter update on a leaf that requires grad, then a fresh graph
+    tensor *h2 = mul(x, w, false);
+    tensor *s2 = sum(h2, dim_all, false);
+    if (backward(s2) == false) errorval |= 2048;
+    if (fabsf(w->grad->array[3] - x->k->array[3]) > 1e-6) errorval |= 4096;
+    if (sub_into(w, w, out) != INTO_OK) errorval |= 8192;
+
+    free_tensor(&s2);
+    free_tensor(&h2);
+    free_tensor(&s);
+    free_tensor(&h);
+    free_tensor(&w);
+    free_tensor(&out);
+    free_tensor(&row);
+    free_tensor(&x);
+    free_tensor(&dim_all);
+    return errorval;
+}
+
+int test_scalar_ops(){
+    int errorval = 0;
+
+    size_t shape[5] = {1,1,1,4,8};
+    size_t shape_dim[5] = {1,1,1,1,5};
+    tensor *dim_all = empty_tensor(shape_dim, false, false);
+    memset_kernel_tensor(dim_all->k, 0.0);
+    tensor *x = empty_tensor(shape, true, true);
+    linspace_kernel_tensor(x->k, 0.5, 2.0);
+
+    //(2 / x) ** 2 + 3 * x - 1, d/dx = -8 / x^3 + 3
+    tensor *a = rdiv_scalar(x, 2.0, false);
+    tensor *b = pow_scalar(a, 2.0, false);
+    tensor *c = mul_scalar(x, 3.0, false);
+    tensor *d = add(b, c, false);
+    tensor *e = add_scalar(d, -1.0, false);
+    tensor *s = sum(e, dim_all, false);
+    if (e->comes_from->t1 != NULL) errorval |= 1;
+    backward(s);
+    for (size_t i = 0; i < x->k->length; i++){
+        lemur_float v = x->k->array[i];
+        if (fabsf(e->k->array[i] - (4.0 / (v * v) + 3.0 * v - 1.0)) > 1e-4) errorval |= 2;
+        if (fabsf(x->grad->array[i] - (-8.0 / (v * v * v) + 3.0)) > 1e-3) errorval |= 4;
+    }
+
+    //same op on the same input with another immediate is not a common subexpression
+    set_lazy_mode(true);
+    tensor *h = mul_scalar(x, 2.0, false);
+    tensor *t = mul_scalar(x, 4.0, false);
+    tensor *u = sub(t, h, false);
+    set_lazy_mode(false);
+    compute(u);
+    if (fabsf(u->k->array[5] - 2.0 * x->k->array[5]) > 1e-5) errorval |= 8;
+
+    //in place with an immediate
+    tensor *y = empty_tensor(shape, false, false);
+    linspace_kernel_tensor(y->k, 1.0, 2.0);
+    lemur_float before = y->k->array[7];
+    if (mul_scalar_into(y, y, 0.5) != INTO_OK) errorval |= 16;
+    if (fabsf(y->k->array[7] - 0.5 * before) > 1e-6) errorval |= 32;
+
+    free_tensor(&y);
+    free_tensor(&u);
+    free_tensor(&t);
+    free_tensor(&h);
+    free_tensor(&s);
+    free_tensor(&e);
+    free_tensor(&d);
+    free_tensor(&c);
+    free_tensor(&b);
+    free_tensor(&a);
+    free_tensor(&x);
+    free_tensor(&dim_all);
+    return errorval;
+}
+
+//error of the simdmath.h functions in units of the last place of the float result, the reference is
+//libm in double. inputs are float bit patterns sampled over the range where the result is normal
+static double ulp_error(float got, double ref){
+    return fabs((double) got - ref) / ldexp(1.0, ilogb(ref) - 23);
+}
+
+static bool is_nan_bits(float f){
+    uint32_t u = simd_as_uint(f);
+    return ((u & SIMD_INF_BITS) == SIMD_INF_BITS) && ((u & 0x007fffff) != 0);
+}
+
+int test_simd_math(){
+    int errorval = 0;
+
+    double max_exp = 0.0, max_log = 0.0, max_pow = 0.0, max_sigmoid = 0.0, max_tanh = 0.0;
+    for (uint64_t u = 0; u < ((uint64_t) 1 << 32); u += 4099){
+        float x = simd_as_float((uint32_t) u);
+        if ((simd_as_uint(x) & SIMD_INF_BITS) == SIMD_INF_BITS) continue;
+        if ((x > -87.0f) && (x < 88.0f)){
+            max_exp = fmax(max_exp, ulp_error(simd_expf(x), exp((double) x)));
+            max_sigmoid = fmax(max_sigmoid, ulp_error(lemur_sigmoidf(x), 1.0 / (1.0 + exp(-(double) x))));
+        }
+        if ((x > 1e-30f) && (fabsf(x) < 10.0f)){
+            max_tanh = fmax(max_tanh, ulp_error(lemur_tanhf(x), tanh((double) x)));
+            max_tanh = fmax(max_tanh, ulp_error(lemur_tanhf(-x), tanh(-(double) x)));
+        }
+        if ((x > 0.0f) && (x != 1.0f)){
+            max_log = fmax(max_log, ulp_error(simd_logf(x), log((double) x)));
+        }
+        if ((x > 1e-3f) && (x < 1e3f)){
+            float e = (float) (u % 2001) * 0.01f - 10.0f;
+            max_pow = fmax(max_pow, ulp_error(simd_powf(x, e), pow((double) x, (double) e)));
+        }
+    }
+    if (max_exp > 1.0) errorval |= 1;
+    if (max_log > 2.0) errorval |= 2;
+    if (max_pow > 1.0) errorval |= 4;
+    if (max_sigmoid > 3.0) errorval |= 8;
+    if (max_tanh > 2.0) errorval |= 16;
+
+    //special cases
+    if (simd_as_uint(simd_expf(100.0f)) != SIMD_INF_BITS) errorval |= 32;
+    if (simd_expf(-200.0f) != 0.0f) errorval |= 32;
+    if (simd_as_uint(simd_logf(0.0f)) != (SIMD_INF_BITS | 0x80000000u)) errorval |= 64;
+    if (is_nan_bits(simd_logf(-1.0f)) == false) errorval |= 64;
+    if (simd_powf(-2.0f, 3.0f) != -8.0f) errorval |= 128;
+    if (simd_powf(-2.0f, 2.0f) != 4.0f) errorval |= 128;
+    if (is_nan_bits(simd_powf(-2.0f, 0.5f)) == false) errorval |= 128;
+    if (simd_as_uint(simd_powf(0.0f, -1.0f)) != SIMD_INF_BITS) errorval |= 256;
+    if ((simd_powf(0.0f, 2.0f) != 0.0f) || (simd_powf(0.0f, 0.0f) != 1.0f)) errorval |= 256;
+    if (lemur_sigmoidf(-100.0f) < 0.0f || lemur_sigmoidf(100.0f) != 1.0f) errorval |= 512;
+    return errorval;
+}
+
+//what print_kernel_tensor writes to stdout, read back from a temporary file
+static size_t capture_print(kernel_tensor *k, char *buffer, size_t size){
+    FILE *file = tmpfile();
+    fflush(stdout);
+    int saved = dup(fileno(stdout));
+    dup2(fileno(file), fileno(stdout));
+    print_kernel_tensor(k);
+    fflush(stdout);
+    dup2(saved, fileno(stdout));
+    close(saved);
+    rewind(file);
+    size_t n = fread(buffer, 1, size - 1, file);
+    buffer[n] = '\0';
+    fclose(file);
+    return n;
+}
+
+int test_print_summarized(){
+    int errorval = 0;
+    static char buffer[1 << 17];
+
+    size_t shape[5] = {1, 1, 1, 100, 100};
+    kernel_tensor *k = empty_contiguous_kernel_tensor(shape);
+    linspace_kernel_tensor(k, 0.0, 1.0);
+    size_t n = capture_print(k, buffer, sizeof(buffer));
+    if ((n == 0) || (n > 2000)) errorval |= 1; //7 rows of 7 entries, not 10000
+    if (strstr(buffer, "...") == NULL) errorval |= 2;
+
+    set_print_options(SIZE_MAX, 3, 4);
+    n = capture_print(k, buffer, sizeof(buffer));
+    if ((n < 10000 * 6) || (strstr(buffer, "...") != NULL)) errorval |= 4;
+    set_print_options(1000, 3, 4);
+
+    kernel_tensor *lazy = lazy_kernel_tensor(shape); //no array yet
+    capture_print(lazy, buffer, sizeof(buffer));
+    if (strstr(buffer, "not computed") == NULL) errorval |= 8;
+
+    free_kernel_tensor(&lazy);
+    free_kernel_tensor(&k);
+    return errorval;
+}
+
 test_func tests[] = {
     test_basic_add_mul,
     test_add,
@@ -276,6 +1009,19 @@ test_func tests[] = {
     test_expand_sum,
     test_permute,
     test_relu,
+    test_diamond_backward,
+    test_parallel_branches_backward,
+    test_reduce_engine,
+    test_broadcast_binary,
+    test_strided_elementwise,
+    test_matmul_gemm,
+    test_lazy_compute,
+    test_fused_compile,
+    test_memory_plan,
+    test_inplace_ops,
+    test_scalar_ops,
+    test_simd_math,
+    test_print_summarized,
 
 };
 